@@ -26,400 +26,95 @@ https://realpython.com/async-io-python/
 
 # Import the necessary libraries to run the program
 import asyncio
-import nest_asyncio
-from datetime import datetime
-import time
 import os
-import re
-from bleak import BleakScanner, BleakClient
-from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot, QThread
-
-# Define UUID's from the BLE periphrial
-FILE_TX_SERVICE_UUID = "550e8404-e29b-41d4-a716-446655440000"
-FILE_TX_REQUEST_UUID = "550e8405-e29b-41d4-a716-446655440001"
-FILE_TX_UUID = "550e8405-e29b-41d4-a716-446655440002"
-FILE_TX_COMPLETE_UUID = "550e8405-e29b-41d4-a716-446655440003"
-FILE_TX_NAME_UUID = "550e8405-e29b-41d4-a716-446655440004"
-
-CONFIG_SERVICE_UUID = "550e8400-e29b-41d4-a716-446655440000"
-DATETIME_UUID = "550e8401-e29b-41d4-a716-446655440001"
-PERSONNAME_UUID = "550e8401-e29b-41d4-a716-446655440002"
-ACTIVITY_TYPE_UUID = "550e8401-e29b-41d4-a716-446655440003"
-FILE_NAME_UUID = "550e8401-e29b-41d4-a716-446655440004"
-
-IMU_TX_SERVICE_UUID = "550e8402-e29b-41d4-a716-446655440000"
-IMU_REQUEST_UUID = "550e8403-e29b-41d4-a716-446655440001"
-IMU_DATA_UUID = "550e8403-e29b-41d4-a716-446655440002"
-
-# Define the date time format to be used in the program
-DT_FMT = "%Y_%m_%d_%H_%M_%S"
-TARGET_DEVICE = "SwIMU"
-
-nest_asyncio.apply()
-
-# Define the BLEClient class to handle the connection and communication with the
-# BLE periphrial. This class will inherit from the BleakClient class which is
-# provided by the bleak library. This class will have the following methods:
-#     - connect: to establish a connection with the periphrial
-#     - disconnect: to close the connection with the periphrial
-#     - monitor: to check the connection status and attempt to reconnect if
-#       disconnected
-#     - config_device: to configure the periphrial with user information
-#     - rx_IMU_readings_mode: to recieve IMU data from the periphrial
-#     - file_rx_mode: to recieve a file from the periphrial
-#     - write_to_file: to write the recieved file data to a file on the local
-#       machine
-
-# This will be hosted in a QT thread to run in the background of the main program. When the user prompts connect,
-# the program will spin up a qt thread. on connection, the program will emit a signal to the main program to update the UI
+import time
+from PyQt5.QtCore import QObject, pyqtSignal
+from SwIMU_qtloop import spawn
+# The BLE protocol lives in SwIMU_client so it can also run without Qt
+from SwIMU_client import (SwIMUClient, scan, TARGET_DEVICE, CONFIG_SERVICE_UUID,
+                          IMU_TX_SERVICE_UUID, FILE_TX_SERVICE_UUID)
+from SwIMU_replay import ReplayClient
+
+# Set SWIMU_PUBLISH_PORT to also publish live data to local subscribers
+# (see SwIMU_pubsub), e.g. for a coach view next to the GUI
+PUBLISH_PORT = os.environ.get("SWIMU_PUBLISH_PORT")
+# Set SWIMU_SHM_NAME to hand live data to analytics processes through shared
+# memory (see SwIMU_shm)
+SHM_NAME = os.environ.get("SWIMU_SHM_NAME")
+# Set SWIMU_REPLAY to a recorded session to stream it instead of connecting to
+# a device (see SwIMU_replay), at SWIMU_REPLAY_SPEED x real time
+REPLAY_PATH = os.environ.get("SWIMU_REPLAY")
+REPLAY_SPEED = float(os.environ.get("SWIMU_REPLAY_SPEED", "1"))
+# Set SWIMU_CLASSIFIER_MODEL to print the stroke type live (see SwIMU_classify)
+CLASSIFIER_MODEL = os.environ.get("SWIMU_CLASSIFIER_MODEL")
+
+# BLEClient adds the Qt signal used to pass live data to the main window on
+# top of the PyQt-free SwIMUClient.
+
+# The BLE coroutines run on the GUI thread, on the asyncio loop shared with Qt
+# (see SwIMU_qtloop). When the user prompts connect, the program starts a BLEWorker
+# task. On connection, the worker emits a signal to the main program to update the UI
 # based on the signal recieved, the program will configure the UI to perform the appropriate actions.
 
-def clean_csv_data(raw_data: str) -> str:
-    """
-    Cleans CSV data by removing lines that do not contain exactly 7 fields.
+class BLEClient(SwIMUClient, QObject):
+    # Sample block and the perf_counter time it was decoded
+    new_data = pyqtSignal(object, float)
 
-    :param raw_data: The raw CSV data as a string.
-    :return: A cleaned CSV string with only valid lines.
-    """
-    clean_start_time = time.perf_counter()
-    
-    cleaned_lines = []
-    
-    for line in raw_data.splitlines():
-        fields = line.split(',')
-        if len(fields) == 7:  # Ensure the line contains exactly 7 fields
-            # Check to see if data has been corrupted from adding multiple fields together
-            if (not any([len(re.findall(r"\.", field)) > 1 for field in fields]) or
-                not any([len(re.findall(r"\-", field)) > 1 for field in fields])):
-                cleaned_lines.append(line)
-            
-            
-    clean_time = (time.perf_counter() - clean_start_time) / 1000
-    print(f"file cleaned in {clean_time:.2f}s")
-
-    return '\n'.join(cleaned_lines)
-
-
-class BLEClient(BleakClient, QThread):
-    new_data = pyqtSignal(object)
-
-    def __init__(self, address, timeout=10):
-        self.connected = False
-        self.file_rx_setup_flag = False
+    def __init__(self, address, timeout=10, advertisement=None):
         QObject.__init__(self, parent=None)
         print("QObject initilzied in BLEClient")
-        # super(BleakClient, self).__init__(address, timeout=timeout)
-        BleakClient.__init__(self, address, timeout=timeout)
+        SwIMUClient.__init__(self, address, timeout=timeout, advertisement=advertisement)
 
-                # Start a loop to run for 10s to read  the IMU_DATA characteristic
-        self.times = []
-        self._config_entries = None
-        self.new_config_data = False
-        self._data_tx_is_active = False
-        self._file_tx_is_active = False
-        self.Ax = []
-        self.Ay = []
-        self.Az = []
-        self.Gx = []
-        self.Gy = []
-        self.Gz = []
-        self.sensor_list = [self.times, self.Ax, self.Ay, self.Az, self.Gx, self.Gy, self.Gz]
+        self.data_callbacks.append(self.emit_data)
         print("BleakClient initilzied in BLEClient")
 
-    @property
-    def config_entries(self):
-        return self._config_entries
-    
-    @config_entries.setter
-    def config_entries(self, entries: dict):
-        self._config_entries = entries
-        self.new_config_data = True
-        print(f"New Config Entries Received on BLE Client!: {self._config_entries}")
-        
-    @property
-    def data_tx_is_active(self):
-        return self._data_tx_is_active
-    
-    @data_tx_is_active.setter
-    def data_tx_is_active(self, status: bool):
-        self._data_tx_is_active = status
-        
-    @property
-    def file_tx_is_active(self):
-        return self._file_tx_is_active
-    
-    @file_tx_is_active.setter
-    def file_tx_is_active(self, status: bool):
-        self._file_tx_is_active = status
-        
-
-    async def handle_disconnect(self, client):
-        print("Disconnected from server!")
-        self.connected = False
-        # Optionally trigger a reconnection attempt here or wait for a server event.
-        
-    async def handle_connect(self, client):
-        print("Connected to Server!")
-        
-
-    # async def connect(self):
-    #     try:
-    #         print("Attempting to connect...")
-    #         # self.client.set_disconnected_callback(self.handle_disconnect)
-    #         await self.client.connect()
-    #     except Exception as e:
-    #         print(f"Failed to connect: {e}")
-    #         self.connected = False
-    #     else:
-    #         self.connected = True
-    #         print(f"Connected to server: {self.address}")
-    #         # await self.handle_modes()
-
-    # async def disconnect(self):
-    #     if self.connected:
-    #         print("Disconnecting...")
-    #         await self.client.disconnect()
-    #         self.connected = False
-
-    async def monitor(self):
-        while True:
-            if not self.connected:
-                print("Waiting for server to reconnect...")
-                await self.connect()
-            else:
-                print("Client is connected.")
-            await asyncio.sleep(5)  # Adjust the polling frequency as needed
-            
-    async def config_device(self):
-        # Hold the client in a loop until the new config data flag is tripped
-        # then read new data from the attribute and send to periphrial
-        while self.config_entries is None:
-            await asyncio.sleep(0.1)
-            
-        config_name = self.config_entries["Name"]
-        config_activity = self.config_entries["Activity"]
-        
-        print(f"Sending New Config Data to Periphrial: {self.config_entries}")
-        # Update the datetime characterisitc to ensure an accurate refrence value
-        datetime_str = datetime.now().strftime(DT_FMT)
-        await self.write_gatt_char(DATETIME_UUID, datetime_str.encode("utf-8"))
-        await self.write_gatt_char(PERSONNAME_UUID, config_name.encode("utf-8"))
-        await self.write_gatt_char(ACTIVITY_TYPE_UUID, config_activity.encode("utf-8"))
+    def emit_data(self, block):
+        # Pass a decoded sample block to the main window. Same thread, so the
+        # slot runs straight away. The stager hands over a fresh array every
+        # time. The timestamp lets the window measure how long until it's drawn
+        self.new_data.emit(block, time.perf_counter())
 
-        self.config_entries = None
-        
-    async def rx_IMU_readings_mode(self):
-        ### ------------------ BLE Notify Implementation ----------------- ### 
-        # The BLE Notify method involves setting up a callback function to
-        # run whenver new data is written to a characteristic on the perephrial
-        # because there is no call/reponse, there is shorter delay between
-        # instances of the program running
-         
-        # Start a loop to run for 10s to read  the IMU_DATA characteristic
-        # define a callback function to process data when it arrives
-        async def handle_IMU_notification(sender, data):            
-            # Decode bytes array into human readable string
-            imu_sensor_values = data.decode("utf-8") 
-            # process the data based on format "time, Ax, Ay, Az, Gx, Gy, Gz"
-            split_line = imu_sensor_values.split(",")
-            imu_data_line = [float(x) for x in split_line]
-            # Filter any erroneous data
-            if len(imu_data_line) != 7:
-                print(f"Length is not 7, measured length: {len(imu_data_line)}")
-                return
-            self.new_data.emit(imu_data_line)
-            
-        # Configure the notification
-        await self.start_notify(IMU_DATA_UUID, handle_IMU_notification)
-        # put in a wait loop until the request is recieved from the User
-        while not self.data_tx_is_active:
-            await asyncio.sleep(0.1)
-            
-        start_time = await self.start_IMU_readings()
 
-        # Hold thread in loop while waiting for user input to stop tx session
-        while self.data_tx_is_active:
-            await asyncio.sleep(0.1)
-            
-        await self.stop_IMU_readings(start_time)
-
-    async def start_IMU_readings(self):
-        start_time = time.perf_counter()
-        print("Sending Start command from Client")
-        await self.write_gatt_char(IMU_REQUEST_UUID, b"START")
-        return start_time
-
-    async def stop_IMU_readings(self, start_time):
-        await self.write_gatt_char(IMU_REQUEST_UUID, b"END")
-        self.tx_active = False
-
-        record_time = time.perf_counter() - start_time
-
-        print("----------------- BLE Notify Implementation ---------------")    
-        print(f"Number of data packets recieved in {record_time}s: {len(data_list)}")
-        print(f"Realized Frequency [Hz]: {len(data_list) / record_time}")
-        
-    
-    async def write_to_file(self, save_path, file_data):
-        # Clean data
-        
-        cleaned_data = clean_csv_data(file_data)
-        
-        with open(save_path, "w") as f:
-            f.write(cleaned_data)
-        print(f"Recieved Data Written to file: {save_path}")
-        
-                
-    async def file_rx_mode(self):
+class ReplayBLEClient(ReplayClient, QObject):
+    # Replayed session with the same Qt signal as BLEClient
+    new_data = pyqtSignal(object, float)
 
-        # Wait for user to prompt the file tx start
-        while not self.file_tx_is_active:
-            await asyncio.sleep(0.1)
-
-        await self.write_gatt_char(FILE_TX_REQUEST_UUID, b"SEND_FILES")
-        status = await self.read_gatt_char(FILE_TX_REQUEST_UUID)
-        status = status.decode("utf-8")
-        if (status == "READY"):
-            print("Periphrial Ready to Transmit Files")
-            first_file_flag = True
-
-        else:
-            print("Unhandled error case. Potentially no files available. Canceling transfer")
-            return   
-        
-        # define and assign notification callbacks on first file only
-        if not self.file_rx_setup_flag:
-            
-            # Callback to accumulate packets of file data from server
-            async def handle_file_data(sender, data):
-                if data:
-                    nonlocal file_data
-                    # packet = data.decode("utf-8")
-                    file_data += data.decode("utf-8")
-                    # print(f"Written to file data variable: {data}")
-                else:
-                    print("Received empty data packet!")
-               
-            # Setup the notificaiton handler
-            await self.start_notify(FILE_TX_UUID, handle_file_data)
-            
-                        # Callback to handle completion notificaiton
-            def handle_transfer_complete(sender, data):
-                if data.decode("utf-8") == "TRANSFER_COMPLETE":
-                    transfer_complete.set_result(True)
-                    print("Transfer Complete")
-            
-            # config file complete notificaiton manager
-            await self.start_notify(FILE_TX_COMPLETE_UUID, handle_transfer_complete)
-            self.file_rx_setup_flag = True
-
-        while True:
-            # Wait for server to send file name
-            file_name = await self.read_gatt_char(FILE_TX_NAME_UUID)
-            # Write an acknowledgement
-            await self.write_gatt_char(FILE_TX_NAME_UUID, b"ACK")
-
-            file_name = file_name.decode("utf-8")
-            if (file_name == "ERROR"):
-                print("Error on Server accessing file!")
-                return
-            else:
-                print(f"Recieved file name: {file_name}")
-            
-            # setup variable to recieve file data
-            file_data = ""      
-
-            # Initialize a Future event to hold until file transfer is complete
-            transfer_complete = asyncio.Future()
-            
-            # Acknowledge file name to indicate we're ready to recieve file data 
-            await self.write_gatt_char(FILE_TX_REQUEST_UUID, b"START")
-            print("Client Acknowledged File name. Beginning Transfer")
-            file_tx_start = time.perf_counter()
-        
-            # Wait for transfer compltete notification
-            await transfer_complete
-            print(f"File tx in {time.perf_counter() - file_tx_start:.2f} s")
-        
-            
-            # Write recieved contents to file
-            save_path = os.path.join(r"C:\Users\patri\Downloads", file_name)
-            await self.write_to_file(save_path, file_data)
-            
-            # Query periphrial for more files.
-            
-
-            await self.write_gatt_char(FILE_TX_REQUEST_UUID, b"MORE_FILES?")
-            status = await self.read_gatt_char(FILE_TX_REQUEST_UUID)
-            status = status.decode("utf-8")
-            if (status == "MORE_FILES"):
-                print("Ready to recieve another file.")
-                file_data = b""
-                
-            elif (status == "DONE"):
-                print("All files transmitted!")
-                break
-            
-
-async def prompt_connection():
-    input("Press Enter to Initiate Connection:")
-
-async def user_input(input_msg: str) -> str:
-    input_value = input(input_msg)
-    return input_value
-    
-async def scan(target_device_name: str):
-    # Scan for ble devices in our proximity
-    devices = await BleakScanner.discover(timeout=5, return_adv=True)
-    # print(devices)
-    address = ""
-    # When scanning is complete, see if our target device name was found
-    for device_addr, device_info in devices.items():
-        device = device_info[0]
-        print(f"{device_addr, device.name}")
-        # If so, extract the BLE address associated with the device. these
-        # adresses are unique to each device and is how we connect/
-        # communicate with them
-        if (device.name is not None) and (target_device_name in device.name):
-            device_metadata = device_info[1]
-            print(f"Target Device Metadata: {device_metadata}")
-            return device_info
+    def __init__(self, path, speed=1.0):
+        QObject.__init__(self, parent=None)
+        ReplayClient.__init__(self, path, speed=speed)
+        self.data_callbacks.append(self.emit_data)
 
-    if not address:
-        print("Target Device Not Found!")
-        return None
+    emit_data = BLEClient.emit_data
 
 
-class BLEWorker(QThread):
+class BLEWorker(QObject):
     finished = pyqtSignal()
     connected = pyqtSignal(str)
-    update_config_attribute = pyqtSignal(object)
-    update_data_tx_status = pyqtSignal(bool)
-    update_file_tx_status = pyqtSignal(bool)
 
     def __init__(self):
         super().__init__()
-        self._is_running = True
-        self.loop = None
-        self.update_config_attribute.connect(self.update_BLE_client_config_attribute)
-        self.update_data_tx_status.connect(self.update_BLE_client_data_tx_status)
-        self.update_file_tx_status.connect(self.update_BLE_client_file_tx_status)
-        self.async_tasks = set()  # collection of async tasks
+        self.client = None
+        self.task = None
 
-    @pyqtSlot()
-    def run(self):
-        self.loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(self.loop)
+    def start(self):
+        # Run the BLE session as a task on the loop shared with Qt
+        self.task = spawn(self.run())
+
+    async def run(self):
         try:
-            self.loop.run_until_complete(self.main_BLE_client())
+            await self.main_BLE_client()
+        except asyncio.CancelledError:
+            pass
         except Exception as e:
             print(f"Error in BLE Worker: {e}")
-
         finally:
-            self.loop.close()
             self.finished.emit()
 
     async def main_BLE_client(self):
+        if REPLAY_PATH:
+            await self.replay_session(REPLAY_PATH)
+            return
+
         # Scan for ble devices in our proximity    
     
         device = await scan(TARGET_DEVICE)
@@ -432,7 +127,9 @@ class BLEWorker(QThread):
         
         print(f"Connecting to address: {address}")
 
-        async with BLEClient(address, timeout=20) as client:
+        # Hand over the scanned device and advertisement so bleak doesn't scan
+        # again and the GATT cache can be checked
+        async with BLEClient(device[0], timeout=20, advertisement=device[1]) as client:
             self.client = client
             print(f"Device Connected!: Service: {adv_service}")
             if CONFIG_SERVICE_UUID in adv_service:
@@ -443,46 +140,64 @@ class BLEWorker(QThread):
                 
             elif IMU_TX_SERVICE_UUID in adv_service:
                 self.connected.emit('data_tx')
-                await self.client.rx_IMU_readings_mode()
-            
+                await self.stream_live_data()
+
             elif FILE_TX_SERVICE_UUID in adv_service:
                 self.connected.emit('file_tx')
                 await self.client.file_rx_mode()
               
             self.connected.emit('')
             
+    async def stream_live_data(self):
+        # Live data mode, shared by devices and replayed sessions
+        publisher = None
+        if PUBLISH_PORT:
+            from SwIMU_pubsub import IMUPublisher
+            publisher = await IMUPublisher(port=int(PUBLISH_PORT)).start()
+            self.client.data_callbacks.append(publisher.publish)
+        ring = None
+        if SHM_NAME:
+            from SwIMU_shm import SharedRing
+            ring = SharedRing.create(SHM_NAME)
+            self.client.data_callbacks.append(ring.write)
+        if CLASSIFIER_MODEL:
+            from SwIMU_classify import LiveClassifier, load_model, print_label
+            self.client.data_callbacks.append(LiveClassifier(load_model(CLASSIFIER_MODEL), on_label=print_label))
+        try:
+            await self.client.rx_IMU_readings_mode()
+        finally:
+            if publisher is not None:
+                await publisher.stop()
+            if ring is not None:
+                self.client.data_callbacks.remove(ring.write)
+                ring.close()
+                ring.unlink()
+
+    async def replay_session(self, path: str):
+        # Stand in for a device in live data mode by replaying a recording
+        print(f"Replaying session instead of connecting: {path}")
+        async with ReplayBLEClient(path, speed=REPLAY_SPEED) as client:
+            self.client = client
+            self.connected.emit('data_tx')
+            await self.stream_live_data()
+            self.connected.emit('')
+
+    # UI commands set client attributes directly, the client's coroutines are
+    # woken on the same loop
+
     def set_config_attribute(self, config_dict: dict):
-        # Function to be called by main thread to trigger signal/slot exchange
-        self.update_config_attribute.emit(config_dict)
-        
-    def update_BLE_client_config_attribute(self, config_dict: dict):
-        # function on this thread to update client attributes
         self.client.config_entries = config_dict
-    
+
     def set_data_tx_status(self, status: bool):
-        # Function to be called by main thread to trigger signal/slot exchange
-        print(f"Emitting data_tx status signal with value: {status}")
-        self.update_data_tx_status.emit(status)
-        
-    def update_BLE_client_data_tx_status(self, status: bool):
-        # function on this thread to update client attributes
         print(f"Setting data_tx_status client attribute to value: {status}")
         self.client.data_tx_is_active = status
-        
-    def set_file_tx_status(self, status: bool):
-        # Function to be called by main thread to trigger signal/slot exchange
-        self.update_file_tx_status.emit(status)
 
-    def update_BLE_client_file_tx_status(self, status: bool):
-        # function on this thread to update client attributes
+    def set_file_tx_status(self, status: bool):
         self.client.file_tx_is_active = status
-    
-    
+
     def stop(self):
         """
-        Stop the BLE loop by setting the running flag to False.
+        Cancel the BLE session, the client disconnects as the task unwinds.
         """
-        self._is_running = False
-        # If the asyncio loop is running, schedule it to stop.
-        if self.loop:
-            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.task is not None:
+            self.task.cancel()
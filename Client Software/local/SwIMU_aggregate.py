@@ -0,0 +1,404 @@
+# Cross-session aggregation of per-lap and per-session swim statistics.
+# This file is part of the SwIMU device tutorial series
+
+"""
+Coaches want to compare a swimmer's stroke metrics across weeks and across
+the team, which means summarising hundreds or thousands of sessions. Loading
+each session into a DataFrame like Quick_Viz does would need the whole
+archive in memory, so here every session is streamed with
+iter_session_chunks and reduced on the fly:
+
+    - SessionStats keeps running sums/min/max per channel
+    - LapSegmenter finds turns (gyro magnitude spikes) and accumulates
+      per-lap duration, acceleration and stroke cycles
+
+Only the small per-session and per-lap summaries leave the worker processes,
+so memory stays flat no matter how large the archive is. The results are
+returned as tidy pandas tables:
+
+    sessions, laps = aggregate_sessions(find_sessions(archive_dir))
+    weekly = compare_sessions(sessions, by="swimmer", period="W")
+
+Summaries are cached in .swimu_cache/summary next to the sessions, keyed by
+their contents, so running again over a growing archive only reads the new
+sessions.
+
+Swimmer, activity and date come from the file name the device gives each
+recording: "YYYY_MM_DD_HH_MM_SS-<name>-<activity>.csv".
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+
+import numpy as np
+
+from SwIMU_data import HEADERS, cached_hash, find_sessions, iter_session_chunks
+
+CHANNELS = HEADERS[1:]
+DT_FMT = "%Y_%m_%d_%H_%M_%S"
+CACHE_DIR_NAME = os.path.join(".swimu_cache", "summary")
+# Bump when the summary of the same data changes, so cached summaries are redone
+SUMMARY_VERSION = 2
+
+# Lap detection settings
+TURN_GYRO_THRESHOLD = 250.0     # smoothed gyro magnitude marking a turn [deg/s]
+TURN_SMOOTHING_S = 0.5          # moving average window for the gyro magnitude [s]
+MIN_LAP_DURATION_S = 12.0       # shortest plausible lap, also debounces a turn [s]
+STROKE_BASELINE_S = 2.0         # moving average removed before counting stroke cycles [s]
+STROKE_SMOOTHING_S = 0.2        # moving average applied before counting, removes sensor noise [s]
+STROKE_HYSTERESIS_G = 0.1       # acceleration must swing this far either side of the baseline [g]
+STROKE_MIN_PERIOD_S = 0.8       # shortest stroke cycle counted [s]
+
+
+def parse_session_name(path: str) -> dict:
+    """
+    Session metadata from a device generated file name.
+
+    :param path: Path to the session.
+    :return: Dictionary with session, start, swimmer and activity. Fields that
+        can't be parsed are None.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    parts = name.split("-")
+    info = {"session": name, "start": None, "swimmer": None, "activity": None}
+    try:
+        info["start"] = datetime.strptime(parts[0], DT_FMT)
+    except ValueError:
+        return info
+    if len(parts) > 1:
+        info["swimmer"] = parts[1]
+    if len(parts) > 2:
+        info["activity"] = "-".join(parts[2:])
+    return info
+
+
+def moving_average(x, window, history):
+    """
+    Trailing moving average of x that continues from the previous chunk.
+
+    :param x: Values of the current chunk.
+    :param window: Window length in samples.
+    :param history: Last window - 1 values of the previous chunk.
+    :return: (averaged values for x, history for the next chunk)
+    """
+    data = np.concatenate([history, x])
+    cumsum = np.concatenate([[0.0], np.cumsum(data)])
+    idx = np.arange(len(history), len(data)) + 1
+    lower = np.maximum(idx - window, 0)
+    averaged = (cumsum[idx] - cumsum[lower]) / (idx - lower)
+    return averaged, data[-(window - 1):] if window > 1 else data[:0]
+
+
+class SessionStats:
+    # Running per-channel statistics over a stream of chunks
+
+    def __init__(self):
+        self.count = 0
+        self.sum = np.zeros(len(CHANNELS) + 1)
+        self.sum_sq = np.zeros(len(CHANNELS) + 1)
+        self.min = np.full(len(CHANNELS) + 1, np.inf)
+        self.max = np.full(len(CHANNELS) + 1, -np.inf)
+        self.t_start = None
+        self.t_end = None
+
+    def feed(self, t, values):
+        # values holds the six channels plus the acceleration magnitude
+        if len(t) == 0:
+            return
+        if self.t_start is None:
+            self.t_start = float(t[0])
+        self.t_end = float(t[-1])
+        self.count += len(values)
+        self.sum += values.sum(axis=0)
+        self.sum_sq += (values**2).sum(axis=0)
+        self.min = np.minimum(self.min, values.min(axis=0))
+        self.max = np.maximum(self.max, values.max(axis=0))
+
+    def summary(self) -> dict:
+        row = {"num_samples": self.count}
+        duration = (self.t_end - self.t_start) if self.count else 0.0
+        row["duration_s"] = duration
+        row["sample_rate_hz"] = (self.count - 1) / duration if duration > 0 else np.nan
+        count = max(self.count, 1)
+        mean = self.sum / count
+        std = np.sqrt(np.maximum(self.sum_sq / count - mean**2, 0.0))
+        for i, channel in enumerate(CHANNELS + ["Amag"]):
+            row[f"{channel}_mean"] = mean[i] if self.count else np.nan
+            row[f"{channel}_std"] = std[i] if self.count else np.nan
+            row[f"{channel}_min"] = self.min[i] if self.count else np.nan
+            row[f"{channel}_max"] = self.max[i] if self.count else np.nan
+        return row
+
+
+class LapSegmenter:
+    """
+    Streaming lap detection. A turn is marked where the smoothed gyro
+    magnitude crosses TURN_GYRO_THRESHOLD, at least MIN_LAP_DURATION_S after
+    the previous turn. Stroke cycles are counted as upward crossings of the
+    smoothed acceleration magnitude through its moving average, with a
+    hysteresis band so noise at rest isn't counted, at most one per
+    STROKE_MIN_PERIOD_S.
+    """
+
+    def __init__(self, fs):
+        self.smooth_window = max(int(TURN_SMOOTHING_S * fs), 1)
+        self.baseline_window = max(int(STROKE_BASELINE_S * fs), 1)
+        self.stroke_smooth_window = max(int(STROKE_SMOOTHING_S * fs), 1)
+        self.gyro_history = np.empty(0)
+        self.accel_history = np.empty(0)
+        self.stroke_history = np.empty(0)
+        # Hysteresis state at the end of the previous chunk, starting high so
+        # a cycle is only counted after the acceleration first dipped
+        self.stroke_high = True
+        self.last_stroke_t = None
+        self.last_turn_t = None
+        self.laps = []
+        self._new_lap(None)
+
+    def _new_lap(self, t_start):
+        self.lap = {"start_s": t_start, "end_s": t_start, "num_samples": 0,
+                    "amag_sum": 0.0, "amag_max": -np.inf, "gmag_sum": 0.0, "stroke_cycles": 0}
+
+    def _accumulate(self, t, amag, gmag, crossings):
+        if len(t) == 0:
+            return
+        lap = self.lap
+        if lap["start_s"] is None:
+            lap["start_s"] = float(t[0])
+        lap["end_s"] = float(t[-1])
+        lap["num_samples"] += len(t)
+        lap["amag_sum"] += float(amag.sum())
+        lap["amag_max"] = max(lap["amag_max"], float(amag.max()))
+        lap["gmag_sum"] += float(gmag.sum())
+        lap["stroke_cycles"] += int(crossings.sum())
+
+    def _close_lap(self):
+        lap = self.lap
+        if lap["num_samples"]:
+            duration = lap["end_s"] - lap["start_s"]
+            self.laps.append({
+                "lap": len(self.laps) + 1,
+                "start_s": lap["start_s"],
+                "duration_s": duration,
+                "num_samples": lap["num_samples"],
+                "Amag_mean": lap["amag_sum"] / lap["num_samples"],
+                "Amag_max": lap["amag_max"],
+                "Gmag_mean": lap["gmag_sum"] / lap["num_samples"],
+                "stroke_cycles": lap["stroke_cycles"],
+                "stroke_rate_spm": lap["stroke_cycles"] / duration * 60 if duration > 0 else np.nan,
+            })
+
+    def feed(self, t, amag, gmag):
+        gyro_smooth, self.gyro_history = moving_average(gmag, self.smooth_window, self.gyro_history)
+        baseline, self.accel_history = moving_average(amag, self.baseline_window, self.accel_history)
+        smooth, self.stroke_history = moving_average(amag, self.stroke_smooth_window, self.stroke_history)
+
+        # Schmitt trigger on the deviation from the baseline: high above the
+        # band, low below it, inside it the last state holds. Continued from
+        # the state at the end of the previous chunk
+        deviation = smooth - baseline
+        level = np.where(deviation > STROKE_HYSTERESIS_G, 1, np.where(deviation < -STROKE_HYSTERESIS_G, 0, -1))
+        last_set = np.maximum.accumulate(np.where(level >= 0, np.arange(len(level)), -1))
+        high = np.where(last_set >= 0, level[last_set.clip(min=0)] == 1, self.stroke_high)
+        previous = np.concatenate([[self.stroke_high], high[:-1]])
+        self.stroke_high = bool(high[-1])
+
+        # Rising edges are stroke cycles, debounced by the minimum period
+        crossings = np.zeros(len(t), dtype=bool)
+        for i in np.flatnonzero(high & ~previous):
+            if self.last_stroke_t is None or t[i] - self.last_stroke_t >= STROKE_MIN_PERIOD_S:
+                crossings[i] = True
+                self.last_stroke_t = t[i]
+
+        # Turn candidates, debounced by the minimum lap duration
+        turn_idx = []
+        for i in np.flatnonzero(gyro_smooth > TURN_GYRO_THRESHOLD):
+            if self.last_turn_t is None or t[i] - self.last_turn_t >= MIN_LAP_DURATION_S:
+                turn_idx.append(i)
+                self.last_turn_t = t[i]
+
+        start = 0
+        for i in turn_idx:
+            self._accumulate(t[start:i], amag[start:i], gmag[start:i], crossings[start:i])
+            self._close_lap()
+            self._new_lap(float(t[i]))
+            start = i
+        self._accumulate(t[start:], amag[start:], gmag[start:], crossings[start:])
+
+    def finish(self) -> list:
+        self._close_lap()
+        return self.laps
+
+
+def summarise_session(path: str, chunk_rows: int = 200_000):
+    """
+    Stream one session and reduce it to a session row and a list of lap rows.
+    Runs in a worker process.
+    """
+    info = parse_session_name(path)
+    info["path"] = path
+    stats = SessionStats()
+    segmenter = None
+    try:
+        for chunk in iter_session_chunks(path, chunk_rows=chunk_rows):
+            if len(chunk) == 0:
+                continue
+            t = chunk[:, 0]
+            amag = np.sqrt((chunk[:, 1:4]**2).sum(axis=1))
+            gmag = np.sqrt((chunk[:, 4:7]**2).sum(axis=1))
+            stats.feed(t, np.column_stack([chunk[:, 1:], amag]))
+            if segmenter is None:
+                dt = np.diff(t)
+                dt = dt[dt > 0]
+                fs = 1.0 / np.median(dt) if len(dt) else 100.0
+                segmenter = LapSegmenter(fs)
+            segmenter.feed(t, amag, gmag)
+        info["error"] = None
+    except Exception as e:
+        info["error"] = f"{type(e).__name__}: {e}"
+
+    laps = segmenter.finish() if segmenter is not None else []
+    session_row = {**info, **stats.summary(), "num_laps": len(laps)}
+    lap_rows = [{"session": info["session"], "swimmer": info["swimmer"], "activity": info["activity"],
+                 "start": info["start"], **lap} for lap in laps]
+    return session_row, lap_rows
+
+
+def _to_json(value):
+    # numpy scalars and the session start time
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Can't cache {type(value).__name__}")
+
+
+def cached_summary(path: str, cache_dir: str = None, use_cache: bool = True, chunk_rows: int = 200_000):
+    """
+    summarise_session, cached on disk keyed by the session's content hash like
+    the spectra in SwIMU_spectral.
+
+    :param cache_dir: Cache directory, defaults to .swimu_cache/summary next
+        to the session.
+    :param chunk_rows: Samples per chunk when the session is summarised.
+    :return: (session row, lap rows)
+    """
+    cache_path = None
+    if use_cache:
+        cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR_NAME)
+        cache_path = os.path.join(cache_dir, f"{cached_hash(path, cache_dir)}_v{SUMMARY_VERSION}.json")
+        if os.path.exists(cache_path):
+            with open(cache_path, "r") as f:
+                cached = json.load(f)
+            session_row, lap_rows = cached["session"], cached["laps"]
+            # The path may have changed since, the contents haven't
+            session_row["path"] = path
+            start = datetime.fromisoformat(session_row["start"]) if session_row["start"] else None
+            session_row["start"] = start
+            for lap in lap_rows:
+                lap["start"] = start
+            return session_row, lap_rows
+
+    session_row, lap_rows = summarise_session(path, chunk_rows)
+    if cache_path and not session_row["error"]:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_path + ".part", "w") as f:
+            json.dump({"session": session_row, "laps": lap_rows}, f, default=_to_json)
+        os.replace(cache_path + ".part", cache_path)
+    return session_row, lap_rows
+
+
+def aggregate_sessions(paths, workers=None, chunk_rows: int = 200_000, use_cache: bool = True):
+    """
+    Per-session and per-lap statistics for many sessions, computed in
+    parallel with bounded memory per worker. Summaries are cached with
+    cached_summary, so sessions seen before aren't read again.
+
+    :param paths: Session files to summarise.
+    :param workers: Number of worker processes, defaults to the CPU count.
+    :param chunk_rows: Samples per chunk read by each worker.
+    :param use_cache: Read and write the summary cache.
+    :return: (sessions DataFrame, laps DataFrame)
+    """
+    import pandas as pd
+
+    paths = list(paths)
+    summarise = partial(cached_summary, use_cache=use_cache, chunk_rows=chunk_rows)
+    session_rows = []
+    lap_rows = []
+    start_time = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(summarise, paths, chunksize=4)
+        for i, (session_row, laps) in enumerate(results, start=1):
+            session_rows.append(session_row)
+            lap_rows.extend(laps)
+            if session_row["error"]:
+                print(f"Failed to summarise {session_row['path']}: {session_row['error']}")
+            if i % 100 == 0:
+                print(f"Summarised {i}/{len(paths)} sessions ({i / (time.perf_counter() - start_time):.1f}/s)")
+
+    sessions = pd.DataFrame(session_rows)
+    laps = pd.DataFrame(lap_rows)
+    return sessions, laps
+
+
+def compare_sessions(sessions, by="swimmer", period="W"):
+    """
+    Summarise sessions per group and time period, e.g. per swimmer per week.
+
+    :param sessions: Sessions table from aggregate_sessions.
+    :param by: Column (or list of columns) to group on.
+    :param period: pandas period alias for the time axis, None to ignore time.
+    :return: DataFrame with one row per group and period.
+    """
+    import pandas as pd
+
+    keys = [by] if isinstance(by, str) else list(by)
+    table = sessions.copy()
+    if period:
+        table["start"] = pd.to_datetime(table["start"])
+        table = table.dropna(subset=["start"])
+        table["period"] = table["start"].dt.to_period(period).dt.start_time
+        keys.append("period")
+
+    return (table.groupby(keys)
+            .agg(sessions=("session", "count"),
+                 total_duration_s=("duration_s", "sum"),
+                 laps=("num_laps", "sum"),
+                 Amag_mean=("Amag_mean", "mean"),
+                 Amag_max=("Amag_max", "max"))
+            .reset_index())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aggregate stroke statistics over many SwIMU sessions")
+    parser.add_argument("src_dir", help="directory containing recorded sessions")
+    parser.add_argument("out_dir", help="directory to write the summary tables to")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--by", default="swimmer", help="column to compare sessions by")
+    parser.add_argument("--period", default="W", help="pandas period for the comparison, e.g. W or M")
+    parser.add_argument("--no-cache", action="store_true", help="summarise every session again")
+    args = parser.parse_args(argv)
+
+    paths = find_sessions(args.src_dir)
+    print(f"Aggregating {len(paths)} sessions")
+    sessions, laps = aggregate_sessions(paths, workers=args.workers, use_cache=not args.no_cache)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    sessions.to_csv(os.path.join(args.out_dir, "sessions.csv"), index=False)
+    laps.to_csv(os.path.join(args.out_dir, "laps.csv"), index=False)
+    if len(sessions):
+        compare_sessions(sessions, by=args.by, period=args.period).to_csv(
+            os.path.join(args.out_dir, "comparison.csv"), index=False)
+    print(f"Summary tables written to {args.out_dir}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
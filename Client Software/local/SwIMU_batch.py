@@ -0,0 +1,368 @@
+# Command line batch processor to re-run cleaning, conversion and analytics
+# over a directory of recorded SwIMU sessions. This file is part of the SwIMU
+# device tutorial series
+
+"""
+Running clean_csv_data or the Quick_Viz analysis one file at a time is fine
+for a single swim, but re-processing a whole archive that way takes hours.
+This tool fans the work out over a process pool so every CPU core is kept
+busy:
+
+    python SwIMU_batch.py <session_dir> <output_dir> --task clean summary
+
+For each (task, session) pair the output is only rebuilt when the session
+contents have changed. A manifest per task in <output_dir>/.swimu_batch/
+records the content hash of every processed session, so an interrupted run
+picks up where it left off when started again.
+
+New analyses are added by decorating a function with @batch_task. The
+function receives the source session path and the path it should write its
+output to.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from SwIMU_data import (HEADERS, clean_csv_data, find_sessions, hash_file, is_binary_session, is_device_recording,
+                        load_session)
+
+MANIFEST_DIR = ".swimu_batch"
+# How often to print progress and flush the manifest to disk [s]
+PROGRESS_INTERVAL = 1.0
+
+# Registry of available tasks, populated by the @batch_task decorator
+TASKS = {}
+
+
+class BatchTask:
+    def __init__(self, name, func, suffix, version):
+        self.name = name
+        self.func = func
+        self.suffix = suffix
+        # Bump the version of a task when its output changes so existing
+        # outputs are rebuilt on the next run
+        self.version = version
+
+    def output_path(self, src_path, src_root, out_root):
+        # Mirror the session's location below the source root in the output
+        # root. The session's extension stays in the name, so the .csv, .swimu
+        # and .bin copies of one recording don't share outputs
+        rel_path = os.path.relpath(src_path, src_root)
+        return os.path.join(out_root, rel_path + self.suffix)
+
+
+def batch_task(name: str, suffix: str, version: int = 1):
+    """
+    Register a function as a batch task.
+
+    :param name: Name used to select the task on the command line.
+    :param suffix: Suffix (including extension) appended to the session file
+        name to build the output file name, e.g. <name>.csv.summary.json.
+    :param version: Version of the task's output format.
+    """
+    def register(func):
+        TASKS[name] = BatchTask(name, func, suffix, version)
+        return func
+    return register
+
+
+# ------------------------------- Tasks -------------------------------- #
+
+@batch_task("clean", ".clean.csv", version=2)
+def clean_task(src_path, dst_path):
+    # Same cleaning that BLEClient.write_to_file applies on receive
+    if is_binary_session(src_path) or is_device_recording(src_path):
+        # Binary sessions have no bad rows to drop, write them out as the
+        # same CSV text
+        import numpy as np
+        np.savetxt(dst_path, load_session(src_path).to_numpy(), fmt="%.3f", delimiter=", ")
+        return
+    with open(src_path, "r", errors="replace") as f:
+        cleaned_data = clean_csv_data(f.read(), verbose=False)
+    with open(dst_path, "w") as f:
+        f.write(cleaned_data)
+
+
+@batch_task("summary", ".summary.json", version=2)
+def summary_task(src_path, dst_path):
+    # Whole session statistics, based on the Quick_Viz analysis
+    import numpy as np
+
+    data = load_session(src_path)
+    data['Amag'] = np.sqrt(data['Ax']**2 + data['Ay']**2 + data['Az']**2)
+
+    num_samples = len(data)
+    duration = float(data['elapsed_time'].iloc[-1] - data['elapsed_time'].iloc[0]) if num_samples else 0.0
+    summary = {
+        "file": os.path.basename(src_path),
+        "num_samples": num_samples,
+        "duration_s": duration,
+        "sample_rate_hz": (num_samples - 1) / duration if duration > 0 else 0.0,
+        "channels": {},
+    }
+    for column in HEADERS[1:] + ['Amag']:
+        summary["channels"][column] = {
+            "mean": float(data[column].mean()),
+            "std": float(data[column].std()),
+            "min": float(data[column].min()),
+            "max": float(data[column].max()),
+        }
+
+    with open(dst_path, "w") as f:
+        json.dump(summary, f, indent=2)
+
+
+@batch_task("pyramid", ".pyramid.npz")
+def pyramid_task(src_path, dst_path):
+    # Multi-resolution min/max/mean summary for fast overview plots
+    from SwIMU_pyramid import build_session_pyramid
+    build_session_pyramid(src_path, dst_path)
+
+
+@batch_task("spectral", ".spectral.npz", version=2)
+def spectral_task(src_path, dst_path):
+    # Welch PSD, spectrogram and dominant stroke/kick frequencies
+    from SwIMU_spectral import session_spectra
+    session_spectra(src_path, use_cache=False).save(dst_path)
+
+
+@batch_task("classify", ".strokes.json")
+def classify_task(src_path, dst_path):
+    # Stroke type segments from the model in SWIMU_CLASSIFIER_MODEL
+    from SwIMU_classify import classify_session, load_model
+    result = classify_session(src_path, load_model())
+    with open(dst_path, "w") as f:
+        json.dump(result, f, indent=2)
+
+
+@batch_task("report", ".report.pdf", version=2)
+def report_task(src_path, dst_path):
+    # One page report for coaches, see SwIMU_report
+    from SwIMU_report import render_report
+    render_report(src_path, dst_path, "pdf")
+
+
+@batch_task("report_png", ".report.png", version=2)
+def report_png_task(src_path, dst_path):
+    from SwIMU_report import render_report
+    render_report(src_path, dst_path, "png")
+
+
+# ---------------------------- Manifest -------------------------------- #
+
+def manifest_path(out_root, task_name):
+    return os.path.join(out_root, MANIFEST_DIR, f"{task_name}.json")
+
+
+def load_manifest(out_root, task_name) -> dict:
+    path = manifest_path(out_root, task_name)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        # A damaged manifest only costs a re-hash of every session
+        print(f"Ignoring unreadable manifest {path}: {e}")
+        return {}
+
+
+def save_manifest(out_root, task_name, manifest: dict):
+    # Write to a temporary file and swap it in so an interrupted run never
+    # leaves a half written manifest behind
+    path = manifest_path(out_root, task_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def is_stat_current(record, stat, task, dst_path) -> bool:
+    # Cheap check done before hashing: if size and modification time are the
+    # ones recorded when the output was built, the content hasn't changed
+    return (record is not None
+            and record.get("version") == task.version
+            and record.get("size") == stat.st_size
+            and record.get("mtime") == stat.st_mtime
+            and os.path.exists(dst_path))
+
+
+# ----------------------------- Worker --------------------------------- #
+
+def run_job(task_name, src_path, dst_path, previous_hash, force):
+    """
+    Process one session in a worker process.
+
+    :return: Dictionary with the status of the job and the session's hash.
+    """
+    task = TASKS[task_name]
+    start_time = time.perf_counter()
+    result = {"src": src_path, "status": "done", "hash": None, "error": None}
+    try:
+        src_hash = hash_file(src_path)
+        result["hash"] = src_hash
+
+        if not force and src_hash == previous_hash and os.path.exists(dst_path):
+            result["status"] = "skipped"
+        else:
+            os.makedirs(os.path.dirname(dst_path) or ".", exist_ok=True)
+            # Build the output under a temporary name so a crash can't leave
+            # a truncated output that looks complete
+            tmp_path = dst_path + ".part"
+            task.func(src_path, tmp_path)
+            os.replace(tmp_path, dst_path)
+
+    except Exception as e:
+        result["status"] = "failed"
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    result["elapsed"] = time.perf_counter() - start_time
+    return result
+
+
+# ----------------------------- Driver --------------------------------- #
+
+def run_batch(src_root, out_root, task_names, workers=None, force=False, recursive=True):
+    """
+    Run one or more tasks over every session below src_root.
+
+    :param src_root: Directory containing recorded sessions.
+    :param out_root: Directory to write outputs and manifests to.
+    :param task_names: Names of registered tasks to run.
+    :param workers: Number of worker processes, defaults to the CPU count.
+    :param force: Rebuild outputs even when they are up to date.
+    :param recursive: Search sub-directories of src_root.
+    :return: Dictionary of counts per job status.
+    """
+    workers = workers or os.cpu_count() or 1
+    # Outputs of earlier runs may live below src_root, don't treat them as sessions
+    output_suffixes = tuple(task.suffix for task in TASKS.values())
+    sessions = [path for path in find_sessions(src_root, recursive=recursive)
+                if not path.endswith(output_suffixes)]
+    # Biggest files first so a long session doesn't start last and hold up
+    # the end of the run on a single core
+    sizes = {path: os.path.getsize(path) for path in sessions}
+    sessions.sort(key=lambda path: sizes[path], reverse=True)
+
+    manifests = {name: load_manifest(out_root, name) for name in task_names}
+    counts = {"done": 0, "skipped": 0, "failed": 0}
+
+    # Build the job list, dropping anything whose size and mtime still match
+    jobs = []
+    for task_name in task_names:
+        task = TASKS[task_name]
+        for src_path in sessions:
+            dst_path = task.output_path(src_path, src_root, out_root)
+            key = os.path.relpath(src_path, src_root)
+            record = manifests[task_name].get(key)
+            if not force and is_stat_current(record, os.stat(src_path), task, dst_path):
+                counts["skipped"] += 1
+                continue
+            previous_hash = record.get("hash") if record and record.get("version") == task.version else None
+            jobs.append((task_name, src_path, dst_path, previous_hash))
+
+    total_jobs = len(jobs) + counts["skipped"]
+    print(f"{len(sessions)} sessions, {total_jobs} jobs, {counts['skipped']} already up to date. "
+          f"Running {len(jobs)} jobs on {workers} workers")
+
+    start_time = time.perf_counter()
+    last_report = start_time
+    bytes_processed = 0
+    finished = counts["skipped"]
+    already_current = counts["skipped"]
+
+    def report():
+        elapsed = max(time.perf_counter() - start_time, 1e-9)
+        print(f"[{finished}/{total_jobs}] {(finished - already_current) / elapsed:.1f} jobs/s, "
+              f"{bytes_processed / elapsed / 1e6:.1f} MB/s, "
+              f"skipped: {counts['skipped']}, failed: {counts['failed']}")
+
+    job_iter = iter(jobs)
+    pending = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # Keep a couple of jobs queued per worker so no core sits idle,
+            # without submitting thousands of futures up front
+            def submit_next():
+                job = next(job_iter, None)
+                if job is not None:
+                    future = executor.submit(run_job, *job, force)
+                    pending[future] = job
+
+            for _ in range(workers * 2):
+                submit_next()
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    task_name, src_path, dst_path, _ = pending.pop(future)
+                    result = future.result()
+                    finished += 1
+                    counts[result["status"]] += 1
+                    bytes_processed += sizes[src_path]
+
+                    if result["status"] == "failed":
+                        print(f"{task_name} failed on {src_path}: {result['error']}")
+                    else:
+                        # Record the stat info that was current when the hash was taken
+                        stat = os.stat(src_path)
+                        manifests[task_name][os.path.relpath(src_path, src_root)] = {
+                            "hash": result["hash"],
+                            "size": stat.st_size,
+                            "mtime": stat.st_mtime,
+                            "version": TASKS[task_name].version,
+                            "output": os.path.relpath(dst_path, out_root),
+                        }
+                    submit_next()
+
+                if time.perf_counter() - last_report > PROGRESS_INTERVAL:
+                    last_report = time.perf_counter()
+                    report()
+                    # Flush manifests as we go so an interrupted run can resume
+                    for task_name in task_names:
+                        save_manifest(out_root, task_name, manifests[task_name])
+
+    except KeyboardInterrupt:
+        print("Interrupted! Saving progress, run again to resume.")
+        for future in pending:
+            future.cancel()
+        raise
+
+    finally:
+        for task_name in task_names:
+            save_manifest(out_root, task_name, manifests[task_name])
+
+    report()
+    print(f"Batch finished in {time.perf_counter() - start_time:.2f}s: {counts}")
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch process a directory of SwIMU sessions")
+    parser.add_argument("src_dir", help="directory containing recorded sessions")
+    parser.add_argument("out_dir", help="directory to write task outputs to")
+    parser.add_argument("--task", nargs="+", default=["clean"], choices=sorted(TASKS),
+                        help="task(s) to run on every session")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true",
+                        help="rebuild outputs even if they are up to date")
+    parser.add_argument("--no-recursive", action="store_true",
+                        help="only process sessions directly inside src_dir")
+    args = parser.parse_args(argv)
+
+    counts = run_batch(args.src_dir, args.out_dir, args.task, workers=args.workers,
+                       force=args.force, recursive=not args.no_recursive)
+    return 1 if counts["failed"] else 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        sys.exit(130)
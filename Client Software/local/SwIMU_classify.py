@@ -0,0 +1,443 @@
+# Stroke type classification of recorded and live SwIMU data with a small
+# NumPy model. This file is part of the SwIMU device tutorial series
+
+"""
+Every session gets a label per window of time: the four strokes, turns,
+wall pushes and rest. The data is cut into overlapping windows (2 s every
+0.5 s by default) and each window is summarised by features computed for
+all windows at once:
+
+    - mean, standard deviation, min, max and mean absolute slope of the six
+      IMU channels and of the acceleration and rotation magnitudes
+    - the dominant frequency of both magnitudes (stroke rate)
+
+Means and deviations come from running sums, min and max from strided
+views, so no Python code runs per window. A small multilayer perceptron
+(plain NumPy, no extra dependencies) turns batches of feature rows into
+label probabilities.
+
+Models are trained from sessions with hand made labels in a sidecar
+<session>.labels.json, a list of {"start": s, "end": s, "label": name}:
+
+    python SwIMU_classify.py train archive/ --model stroke_model.npz
+    python SwIMU_classify.py label session.swimu --model stroke_model.npz
+    python SwIMU_batch.py archive/ out/ --task classify
+
+Offline, sessions are streamed with iter_session_chunks and classified in
+large batches; the "classify" batch task writes the labelled segments to
+<session>.strokes.json. Outputs aren't rebuilt when only the model changes,
+run the task with --force after retraining. Live, a LiveClassifier added to
+a client's data_callbacks classifies each window as soon as its last hop
+of samples has arrived.
+"""
+
+import argparse
+import collections
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+import SwIMU_metrics as metrics
+from SwIMU_data import HEADERS, find_sessions, iter_session_chunks
+
+LABELS = ("freestyle", "backstroke", "breaststroke", "butterfly", "turn", "wall_push", "rest")
+LABELS_SUFFIX = ".labels.json"
+STROKES_SUFFIX = ".strokes.json"
+# Model used by the batch task and the live hooks
+DEFAULT_MODEL_PATH = os.environ.get(
+    "SWIMU_CLASSIFIER_MODEL", os.path.join(os.path.dirname(os.path.abspath(__file__)), "stroke_model.npz"))
+
+WINDOW_S = 2.0
+HOP_S = 0.5
+# Device rate, used until a stream's own rate is known
+DEFAULT_RATE = 100.0
+# Feature rows per model call
+PREDICT_BATCH = 8192
+# Windows classified per live block at most. After a stall only the newest
+# are classified so labels never lag further behind than this
+MAX_LIVE_WINDOWS = 4
+
+STAT_NAMES = ("mean", "std", "min", "max", "slope")
+FEATURE_CHANNELS = HEADERS[1:] + ["Amag", "Gmag"]
+FEATURE_NAMES = ([f"{channel}_{stat}" for channel in FEATURE_CHANNELS for stat in STAT_NAMES]
+                 + ["Amag_freq", "Gmag_freq"])
+
+WINDOWS_CLASSIFIED = metrics.counter("classifier_windows_total", "Windows labelled by the stroke classifier")
+LIVE_CLASSIFY_TIME = metrics.histogram("classifier_live_seconds", "Time to classify the windows completed by one live block")
+
+
+def window_features(data, window: int, hop: int, fs: float):
+    """
+    Features of every complete window of a sample block.
+
+    :param data: (n, 7) samples, time in the first column.
+    :param window: Samples per window.
+    :param hop: Samples between window starts.
+    :param fs: Sample rate [Hz].
+    :return: ((m, 2) window start and end times, (m, len(FEATURE_NAMES)) float32 features)
+    """
+    num_windows = (len(data) - window) // hop + 1 if len(data) >= window else 0
+    if num_windows <= 0:
+        return np.empty((0, 2)), np.empty((0, len(FEATURE_NAMES)), dtype=np.float32)
+    values = np.asarray(data[:, 1:], dtype=np.float64)
+    amag = np.sqrt((values[:, :3] ** 2).sum(axis=1))
+    gmag = np.sqrt((values[:, 3:] ** 2).sum(axis=1))
+    x = np.column_stack([values, amag, gmag])
+    starts = np.arange(num_windows) * hop
+    ends = starts + window
+
+    # Window sums from running sums, O(n) whatever the overlap
+    zero = np.zeros((1, x.shape[1]))
+    sums = np.concatenate([zero, np.cumsum(x, axis=0)])
+    squares = np.concatenate([zero, np.cumsum(x * x, axis=0)])
+    mean = (sums[ends] - sums[starts]) / window
+    std = np.sqrt(np.maximum((squares[ends] - squares[starts]) / window - mean ** 2, 0))
+    slopes = np.concatenate([zero, np.cumsum(np.abs(np.diff(x, axis=0)), axis=0)])
+    slope = (slopes[ends - 1] - slopes[starts]) / (window - 1) * fs
+    windows = np.lib.stride_tricks.sliding_window_view(x, window, axis=0)[::hop][:num_windows]
+    minimum = windows.min(axis=2)
+    maximum = windows.max(axis=2)
+
+    # Dominant frequency of the magnitudes, one batched FFT
+    magnitudes = windows[:, -2:, :]
+    spectrum = np.abs(np.fft.rfft(magnitudes - magnitudes.mean(axis=2, keepdims=True), axis=2))
+    peak = np.argmax(spectrum[:, :, 1:], axis=2) + 1
+    freq = peak * fs / window
+
+    stats = np.stack([mean, std, minimum, maximum, slope], axis=2).reshape(num_windows, -1)
+    times = np.column_stack([data[starts, 0], data[ends - 1, 0]])
+    return times, np.hstack([stats, freq]).astype(np.float32)
+
+
+class WindowFeaturizer:
+    """
+    Cuts a stream of sample blocks into windows and computes their features.
+
+    Samples that may still be part of a coming window are kept between
+    blocks, so windows line up the same way however the stream is split.
+
+    :param fs: Sample rate [Hz].
+    """
+
+    def __init__(self, fs: float = DEFAULT_RATE, window_s: float = WINDOW_S, hop_s: float = HOP_S):
+        self.fs = fs
+        self.window = max(2, int(round(window_s * fs)))
+        self.hop = max(1, int(round(hop_s * fs)))
+        self._tail = np.empty((0, len(HEADERS)), dtype=np.float32)
+
+    def feed(self, block):
+        data = np.concatenate([self._tail, block]) if len(self._tail) else np.asarray(block)
+        times, features = window_features(data, self.window, self.hop, self.fs)
+        # Keep everything from the start of the next window on
+        self._tail = data[len(times) * self.hop:]
+        return times, features
+
+
+class StrokeModel:
+    """
+    Multilayer perceptron mapping window features to label probabilities.
+
+    :param weights: Weight matrix of every layer.
+    :param biases: Bias vector of every layer.
+    :param mean: Feature means used for standardising.
+    :param scale: Feature standard deviations used for standardising.
+    :param labels: Label of every output.
+    :param params: Window settings the model was trained with.
+    """
+
+    def __init__(self, weights, biases, mean, scale, labels=LABELS, params=None):
+        self.weights = [np.asarray(w, dtype=np.float32) for w in weights]
+        self.biases = [np.asarray(b, dtype=np.float32) for b in biases]
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.scale = np.asarray(scale, dtype=np.float32)
+        self.labels = tuple(labels)
+        self.params = params or {"window_s": WINDOW_S, "hop_s": HOP_S}
+
+    def _forward(self, x):
+        # Returns the activations of every layer, the last one as logits
+        activations = [x]
+        for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+            x = x @ w + b
+            if i < len(self.weights) - 1:
+                x = np.maximum(x, 0)
+            activations.append(x)
+        return activations
+
+    def predict_proba(self, features) -> np.ndarray:
+        # Batched so an archive's worth of windows doesn't need one huge matrix
+        features = np.asarray(features, dtype=np.float32)
+        out = np.empty((len(features), len(self.labels)), dtype=np.float32)
+        for i in range(0, len(features), PREDICT_BATCH):
+            x = (features[i:i + PREDICT_BATCH] - self.mean) / self.scale
+            out[i:i + PREDICT_BATCH] = softmax(self._forward(x)[-1])
+        WINDOWS_CLASSIFIED.inc(len(features))
+        return out
+
+    def predict(self, features):
+        # (label index, confidence) of every row
+        proba = self.predict_proba(features)
+        index = proba.argmax(axis=1)
+        return index, proba[np.arange(len(index)), index]
+
+    def save(self, path: str):
+        arrays = {"mean": self.mean, "scale": self.scale, "labels": np.array(self.labels),
+                  "params": np.array(json.dumps(self.params))}
+        for i, (w, b) in enumerate(zip(self.weights, self.biases)):
+            arrays[f"w{i}"] = w
+            arrays[f"b{i}"] = b
+        with open(path + ".part", "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(path + ".part", path)
+
+    @classmethod
+    def load(cls, path: str):
+        with np.load(path, allow_pickle=False) as f:
+            num_layers = sum(1 for name in f.files if name.startswith("w"))
+            return cls([f[f"w{i}"] for i in range(num_layers)], [f[f"b{i}"] for i in range(num_layers)],
+                       f["mean"], f["scale"], [str(label) for label in f["labels"]],
+                       json.loads(str(f["params"])))
+
+    @classmethod
+    def fit(cls, features, targets, labels=LABELS, hidden=(32, 16), epochs: int = 40,
+            learning_rate: float = 3e-3, batch_size: int = 256, seed: int = 0, params=None):
+        """
+        Train a model with Adam on a softmax cross entropy loss.
+
+        :param features: (m, len(FEATURE_NAMES)) feature rows.
+        :param targets: (m,) label index of every row.
+        :param hidden: Units of each hidden layer.
+        :return: The trained StrokeModel.
+        """
+        rng = np.random.default_rng(seed)
+        features = np.asarray(features, dtype=np.float32)
+        targets = np.asarray(targets)
+        mean = features.mean(axis=0)
+        scale = features.std(axis=0) + 1e-6
+        x_all = (features - mean) / scale
+        sizes = [features.shape[1], *hidden, len(labels)]
+        weights = [(rng.standard_normal((a, b)) * np.sqrt(2.0 / a)).astype(np.float32)
+                   for a, b in zip(sizes[:-1], sizes[1:])]
+        biases = [np.zeros(b, dtype=np.float32) for b in sizes[1:]]
+        model = cls(weights, biases, np.zeros_like(mean), np.ones_like(scale), labels, params)
+        params_list = model.weights + model.biases
+        moments = [np.zeros_like(p) for p in params_list]
+        velocities = [np.zeros_like(p) for p in params_list]
+        # Weight rare labels (turns, pushes) up so they aren't drowned out by strokes
+        counts = np.bincount(targets, minlength=len(labels)).astype(np.float32)
+        class_weight = np.where(counts > 0, len(targets) / (len(labels) * np.maximum(counts, 1)), 0)
+        step = 0
+        for epoch in range(epochs):
+            order = rng.permutation(len(x_all))
+            for i in range(0, len(order), batch_size):
+                batch = order[i:i + batch_size]
+                activations = model._forward(x_all[batch])
+                proba = softmax(activations[-1])
+                sample_weight = class_weight[targets[batch]][:, None] / len(batch)
+                grad = proba
+                grad[np.arange(len(batch)), targets[batch]] -= 1
+                grad *= sample_weight
+                grads_w, grads_b = [], []
+                for layer in range(len(model.weights) - 1, -1, -1):
+                    grads_w.insert(0, activations[layer].T @ grad)
+                    grads_b.insert(0, grad.sum(axis=0))
+                    if layer:
+                        grad = (grad @ model.weights[layer].T) * (activations[layer] > 0)
+                step += 1
+                for p, g, m, v in zip(params_list, grads_w + grads_b, moments, velocities):
+                    m *= 0.9
+                    m += 0.1 * g
+                    v *= 0.999
+                    v += 0.001 * g * g
+                    p -= learning_rate * (m / (1 - 0.9 ** step)) / (np.sqrt(v / (1 - 0.999 ** step)) + 1e-8)
+        model.mean = mean
+        model.scale = scale
+        return model
+
+
+def softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    e = np.exp(logits)
+    return e / e.sum(axis=1, keepdims=True)
+
+
+def load_model(path: str = None) -> StrokeModel:
+    path = path or DEFAULT_MODEL_PATH
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No stroke model at {path}, train one with 'SwIMU_classify.py train' "
+                                f"or set SWIMU_CLASSIFIER_MODEL")
+    return StrokeModel.load(path)
+
+
+def _stream_rate(chunk) -> float:
+    from SwIMU_spectral import estimate_sample_rate
+    try:
+        return estimate_sample_rate(chunk[:, 0])
+    except ValueError:
+        return DEFAULT_RATE
+
+
+def session_features(path: str, params=None, chunk_rows: int = 200_000):
+    """
+    Window times and features of a whole session, streamed in chunks.
+
+    :return: ((m, 2) window times, (m, len(FEATURE_NAMES)) features, sample rate)
+    """
+    params = params or {"window_s": WINDOW_S, "hop_s": HOP_S}
+    featurizer = None
+    times, features = [], []
+    for chunk in iter_session_chunks(path, chunk_rows=chunk_rows):
+        if len(chunk) == 0:
+            continue
+        if featurizer is None:
+            featurizer = WindowFeaturizer(_stream_rate(chunk), params["window_s"], params["hop_s"])
+        chunk_times, chunk_features = featurizer.feed(chunk)
+        times.append(chunk_times)
+        features.append(chunk_features)
+    if not times:
+        return np.empty((0, 2)), np.empty((0, len(FEATURE_NAMES)), dtype=np.float32), DEFAULT_RATE
+    return np.concatenate(times), np.concatenate(features), featurizer.fs
+
+
+def merge_segments(times, index, confidence, labels) -> list:
+    # Runs of windows with the same label as {"start", "end", "label", "confidence"}
+    if len(index) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(index)) + 1
+    starts = np.r_[0, breaks]
+    stops = np.r_[breaks, len(index)]
+    mean_confidence = np.add.reduceat(confidence, starts) / (stops - starts)
+    return [{"start": float(times[a, 0]), "end": float(times[b - 1, 1]), "label": labels[index[a]],
+             "confidence": round(float(c), 3)}
+            for a, b, c in zip(starts, stops, mean_confidence)]
+
+
+def classify_session(path: str, model: StrokeModel) -> dict:
+    """
+    Label every window of a session.
+
+    :return: {"segments": [...], "totals": seconds per label, "windows": count}
+    """
+    times, features, fs = session_features(path, model.params)
+    index, confidence = model.predict(features)
+    segments = merge_segments(times, index, confidence, model.labels)
+    totals = collections.Counter()
+    for segment in segments:
+        totals[segment["label"]] += segment["end"] - segment["start"]
+    return {"file": os.path.basename(path), "sample_rate_hz": fs, "windows": len(index),
+            "segments": segments, "totals": {label: round(seconds, 2) for label, seconds in totals.items()}}
+
+
+def window_targets(times, segments: list, labels=LABELS) -> np.ndarray:
+    # Label index of each window from hand made segments, -1 where a window
+    # isn't fully inside one
+    targets = np.full(len(times), -1)
+    for segment in segments:
+        inside = (times[:, 0] >= segment["start"]) & (times[:, 1] <= segment["end"])
+        targets[inside] = labels.index(segment["label"])
+    return targets
+
+
+def training_data(paths: list, params=None):
+    # Features and targets of every labelled window of the labelled sessions
+    all_features, all_targets = [], []
+    for path in paths:
+        labels_path = os.path.splitext(path)[0] + LABELS_SUFFIX
+        if not os.path.exists(labels_path):
+            continue
+        with open(labels_path) as f:
+            segments = json.load(f)
+        times, features, _ = session_features(path, params)
+        targets = window_targets(times, segments)
+        keep = targets >= 0
+        all_features.append(features[keep])
+        all_targets.append(targets[keep])
+        print(f"{os.path.basename(path)}: {keep.sum()} labelled windows")
+    if not all_features:
+        raise ValueError(f"No labelled sessions found, add {LABELS_SUFFIX} files next to the sessions")
+    return np.concatenate(all_features), np.concatenate(all_targets)
+
+
+class LiveClassifier:
+    """
+    Classifies live data as it streams, use as a client data callback.
+
+    :param model: Trained StrokeModel.
+    :param fs: Stream sample rate [Hz].
+    :param on_label: Called with (label, confidence, end time) whenever the
+        label of the stream changes.
+    """
+
+    def __init__(self, model: StrokeModel, fs: float = DEFAULT_RATE, on_label=None):
+        self.model = model
+        self.featurizer = WindowFeaturizer(fs, model.params["window_s"], model.params["hop_s"])
+        self.on_label = on_label
+        self.label = None
+        self.confidence = 0.0
+        # Most recent (end time, label, confidence) results
+        self.history = collections.deque(maxlen=256)
+
+    def __call__(self, block):
+        with LIVE_CLASSIFY_TIME.time():
+            times, features = self.featurizer.feed(block)
+            if len(features) == 0:
+                return
+            times, features = times[-MAX_LIVE_WINDOWS:], features[-MAX_LIVE_WINDOWS:]
+            index, confidence = self.model.predict(features)
+            for (_, end), i, c in zip(times, index, confidence):
+                self.history.append((float(end), self.model.labels[i], float(c)))
+            label = self.model.labels[index[-1]]
+            self.confidence = float(confidence[-1])
+            if label != self.label:
+                self.label = label
+                if self.on_label is not None:
+                    self.on_label(label, self.confidence, float(times[-1, 1]))
+
+
+def print_label(label: str, confidence: float, end_time: float):
+    print(f"[{end_time:8.2f}s] {label} ({confidence:.0%})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Label SwIMU sessions by stroke type")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train_parser = subparsers.add_parser("train", help=f"train a model on sessions with {LABELS_SUFFIX} files")
+    train_parser.add_argument("paths", nargs="+", help="sessions or folders of them")
+    train_parser.add_argument("--model", default=DEFAULT_MODEL_PATH, help="model file to write")
+    train_parser.add_argument("--epochs", type=int, default=40)
+    label_parser = subparsers.add_parser("label", help="label sessions and print their segments")
+    label_parser.add_argument("paths", nargs="+", help="sessions or folders of them")
+    label_parser.add_argument("--model", default=DEFAULT_MODEL_PATH)
+    args = parser.parse_args(argv)
+
+    paths = []
+    for path in args.paths:
+        paths.extend(find_sessions(path) if os.path.isdir(path) else [path])
+    paths = [path for path in paths if not path.endswith(STROKES_SUFFIX)]
+
+    if args.command == "train":
+        start = time.perf_counter()
+        features, targets = training_data(paths)
+        model = StrokeModel.fit(features, targets, epochs=args.epochs)
+        accuracy = float((model.predict(features)[0] == targets).mean())
+        model.save(args.model)
+        print(f"Trained on {len(targets)} windows in {time.perf_counter() - start:.1f}s, "
+              f"training accuracy {accuracy:.1%}: {args.model}")
+        return 0
+
+    model = load_model(args.model)
+    for path in paths:
+        start = time.perf_counter()
+        result = classify_session(path, model)
+        elapsed = time.perf_counter() - start
+        print(f"{path}: {result['windows']} windows in {elapsed:.2f}s "
+              f"({result['windows'] / max(elapsed, 1e-9):.0f} windows/s)")
+        for label, seconds in sorted(result["totals"].items(), key=lambda item: -item[1]):
+            print(f"  {label:<12} {seconds:8.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,655 @@
+# PyQt-free BLE client for the SwIMU device. Holds the BLE protocol used by
+# both the GUI (SwIMU_BLE.BLEClient) and the headless service (SwIMU_headless).
+# This file is part of the SwIMU device tutorial series
+
+"""
+SwIMUClient implements the three device modes over BLE: configuring the
+device, receiving live IMU readings and receiving recorded files. It only
+depends on bleak and asyncio, so it can run on machines without a display.
+Decoded samples are handed to every function in data_callbacks; the GUI
+adds one that emits a Qt signal. The decode path itself lives in
+IMUDataPipeline so that recorded sessions can be replayed through it (see
+SwIMU_replay).
+"""
+
+# Import the necessary libraries to run the program
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import time
+import os
+from bleak import BleakScanner, BleakClient
+from SwIMU_data import clean_csv_data, decode_device_recording, is_device_recording
+import SwIMU_metrics as metrics
+from SwIMU_gattcache import GattCache, describe_services, firmware_version
+
+# Define UUID's from the BLE periphrial
+FILE_TX_SERVICE_UUID = "550e8404-e29b-41d4-a716-446655440000"
+FILE_TX_REQUEST_UUID = "550e8405-e29b-41d4-a716-446655440001"
+FILE_TX_UUID = "550e8405-e29b-41d4-a716-446655440002"
+FILE_TX_COMPLETE_UUID = "550e8405-e29b-41d4-a716-446655440003"
+FILE_TX_NAME_UUID = "550e8405-e29b-41d4-a716-446655440004"
+# Size of the announced file (uint32), on firmware that accepts SKIP
+FILE_TX_SIZE_UUID = "550e8405-e29b-41d4-a716-446655440005"
+
+CONFIG_SERVICE_UUID = "550e8400-e29b-41d4-a716-446655440000"
+DATETIME_UUID = "550e8401-e29b-41d4-a716-446655440001"
+PERSONNAME_UUID = "550e8401-e29b-41d4-a716-446655440002"
+ACTIVITY_TYPE_UUID = "550e8401-e29b-41d4-a716-446655440003"
+FILE_NAME_UUID = "550e8401-e29b-41d4-a716-446655440004"
+# Packed "datetime|name|activity" record, replaces the three writes above on
+# newer firmware
+CONFIG_RECORD_UUID = "550e8401-e29b-41d4-a716-446655440005"
+CONFIG_RECORD_SEP = "|"
+
+IMU_TX_SERVICE_UUID = "550e8402-e29b-41d4-a716-446655440000"
+IMU_REQUEST_UUID = "550e8403-e29b-41d4-a716-446655440001"
+IMU_DATA_UUID = "550e8403-e29b-41d4-a716-446655440002"
+# Clock sync round trips on newer firmware (see SwIMU_sync)
+IMU_SYNC_UUID = "550e8403-e29b-41d4-a716-446655440003"
+# From this firmware FILE_NAME_UUID holds the SD file of the live session
+# after START, older firmware leaves the name from config mode there
+LIVE_FILE_NAME_FIRMWARE = (1, 4, 0)
+
+# Define the date time format to be used in the program
+DT_FMT = "%Y_%m_%d_%H_%M_%S"
+TARGET_DEVICE = "SwIMU"
+# Folder where recieved files and live recordings are saved
+SAVE_DIR = os.path.join(os.path.expanduser("~"), "Downloads")
+
+# Hot path metrics, see SwIMU_metrics
+NOTIFY_INTERVAL = metrics.histogram("ble_notify_interval_seconds", "Time between IMU notifications")
+PARSE_TIME = metrics.histogram("imu_parse_seconds", "Time to decode one IMU notification")
+SAMPLES_RX = metrics.counter("imu_samples_received_total", "IMU samples decoded")
+SAMPLES_DROPPED = metrics.counter("imu_samples_dropped_total", "IMU notifications rejected by the decoder")
+RECORDER_QUEUE = metrics.gauge("recorder_queue_depth", "Batches waiting for the session recorder")
+FILE_TX_BYTES = metrics.counter("file_tx_bytes_total", "File transfer payload bytes received")
+FILE_TX_GOODPUT = metrics.gauge("file_tx_goodput_bytes_per_second", "Payload rate of the last file transfer")
+COMMAND_LATENCY = metrics.histogram("command_latency_seconds", "Time from a start/stop/config command to the device write completing")
+CONNECT_TIME = metrics.histogram("ble_connect_seconds", "Time to connect and resolve services")
+FIRST_BYTE_TIME = metrics.histogram("ble_connect_to_first_byte_seconds",
+                                    "Connect time plus the time from the first command to the first byte from the device")
+GATT_CACHE_HITS = metrics.counter("gatt_cache_hits_total", "Connections that reused a cached GATT layout")
+GATT_CACHE_MISSES = metrics.counter("gatt_cache_misses_total", "Cached GATT layouts found stale after connecting")
+
+# CPU heavy work (cleaning and hashing received files) runs here, off the
+# event loop, which the GUI shares (see SwIMU_qtloop)
+CPU_EXECUTOR = ThreadPoolExecutor(max_workers=1, thread_name_prefix="swimu-cpu")
+
+
+class IMUDataPipeline:
+    """
+    Decode path for live IMU notifications: parse, count, record and hand to
+    data_callbacks. Shared by SwIMUClient and the replay source.
+
+    Notifications are staged and decoded in blocks (see SwIMU_samples), so
+    recorder and data_callbacks receive (n, 7) float32 arrays rather than a
+    list per sample.
+    """
+
+    def __init__(self):
+        # Folder for recieved files and live recordings
+        self.save_dir = SAVE_DIR
+        # Host side copy of live sessions, created when data tx starts
+        self.record_live_sessions = True
+        self.recorder = None
+        self.stager = None
+        self.num_samples_rx = 0
+        # Functions called with every decoded sample block, e.g. the Qt signal
+        # emitter in BLEClient or a headless writer
+        self.data_callbacks = []
+        # Set by every command from the UI so waiting coroutines wake at once
+        # instead of on their next poll
+        self._state_changed = asyncio.Event()
+        self._command_time = None
+
+    def command_received(self):
+        self._command_time = time.perf_counter()
+        self._state_changed.set()
+
+    def command_done(self):
+        # The device write for the last command completed
+        if self._command_time is not None:
+            COMMAND_LATENCY.observe(time.perf_counter() - self._command_time)
+            self._command_time = None
+
+    async def wait_for_command(self, timeout: float):
+        # Sleep until a command changes the client state or the timeout runs
+        # out. The timeout covers state set from another thread
+        self._state_changed.clear()
+        try:
+            await asyncio.wait_for(self._state_changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def handle_IMU_data(self, data: bytes):
+        if self.stager is None:
+            self.stager = self._new_stager()
+        with PARSE_TIME.time():
+            # Payload format "time, Ax, Ay, Az, Gx, Gy, Gz", decoded per block
+            accepted = self.stager.append(data)
+        # Filter any erroneous data
+        if not accepted:
+            print(f"Length is not 7, measured length: {data.count(b',') + 1}")
+            SAMPLES_DROPPED.inc()
+
+    def dispatch_block(self, block):
+        # Called by the stager with every decoded block
+        self.num_samples_rx += len(block)
+        SAMPLES_RX.inc(len(block))
+        if self.recorder is not None:
+            self.recorder.write(block)
+            RECORDER_QUEUE.set(self.recorder.queue_depth)
+        for callback in self.data_callbacks:
+            callback(block)
+
+    def _new_stager(self):
+        from SwIMU_samples import SampleStager
+        return SampleStager(self.dispatch_block)
+
+    def open_stream(self, source: str):
+        self.num_samples_rx = 0
+        self.stager = self._new_stager()
+        if self.record_live_sessions:
+            # Open the host copy before the first sample can arrive
+            file_name = f"{datetime.now().strftime(DT_FMT)}-live"
+            from SwIMU_recorder import SessionRecorder
+            self.recorder = SessionRecorder(os.path.join(self.save_dir, file_name),
+                                            metadata={"device": source})
+            self.recorder.start()
+
+    def flush_if_stale(self):
+        # Hand on staged samples that have waited long enough
+        if self.stager is not None:
+            self.stager.flush_if_stale()
+
+    async def close_stream(self):
+        if self.stager is not None:
+            self.stager.flush()
+        if self.recorder is not None:
+            # Writer thread drains its queue and fsyncs, keep the loop free
+            await asyncio.get_running_loop().run_in_executor(None, self.recorder.close)
+            self.recorder = None
+
+
+# Define the SwIMUClient class to handle the connection and communication with the
+# BLE periphrial. This class will inherit from the BleakClient class which is
+# provided by the bleak library. This class will have the following methods:
+#     - connect: to establish a connection with the periphrial
+#     - disconnect: to close the connection with the periphrial
+#     - monitor: to check the connection status and attempt to reconnect if
+#       disconnected
+#     - config_device: to configure the periphrial with user information
+#     - rx_IMU_readings_mode: to recieve IMU data from the periphrial
+#     - file_rx_mode: to recieve a file from the periphrial
+#     - write_to_file: to write the recieved file data to a file on the local
+#       machine
+
+class SwIMUClient(IMUDataPipeline, BleakClient):
+    def __init__(self, address, timeout=10, advertisement=None):
+        """
+        :param address: BLEDevice from a scan, or its address. A BLEDevice
+            saves bleak a second scan before connecting.
+        :param advertisement: AdvertisementData from the same scan. Needed to
+            use the GATT cache (see SwIMU_gattcache).
+        """
+        self.connected = False
+        self.file_rx_setup_flag = False
+        # Saved GATT layout of this device, trusted if the advertised firmware
+        # and service match it
+        self.gatt_cache = GattCache(getattr(address, "address", address))
+        self.firmware = firmware_version(advertisement)
+        self.advertised_services = list(advertisement.service_uuids) if advertisement is not None else []
+        self.use_gatt_cache = self.gatt_cache.is_valid(self.firmware, self.advertised_services)
+        # Windows only reads its GATT cache when asked to at construction
+        backend_args = {"winrt": {"use_cached_services": True}} if self.use_gatt_cache else {}
+        BleakClient.__init__(self, address, timeout=timeout, **backend_args)
+        IMUDataPipeline.__init__(self)
+        # SD card file the device records the live session to, when it says
+        self.device_file = None
+        self._connect_seconds = None
+        self._connected_time = None
+        self._first_command_time = None
+
+        self._config_entries = None
+        self.new_config_data = False
+        self._data_tx_is_active = False
+        self._file_tx_is_active = False
+        # Seconds between clock sync bursts while streaming, 0 turns sync off
+        self.clock_sync_interval = 10.0
+        # Clock fit of the last live session (see SwIMU_sync)
+        self.clock_fit = None
+
+    @property
+    def config_entries(self):
+        return self._config_entries
+    
+    @config_entries.setter
+    def config_entries(self, entries: dict):
+        self._config_entries = entries
+        self.new_config_data = True
+        print(f"New Config Entries Received on BLE Client!: {self._config_entries}")
+        self.command_received()
+        
+    @property
+    def data_tx_is_active(self):
+        return self._data_tx_is_active
+    
+    @data_tx_is_active.setter
+    def data_tx_is_active(self, status: bool):
+        self._data_tx_is_active = status
+        self.command_received()
+        
+    @property
+    def file_tx_is_active(self):
+        return self._file_tx_is_active
+    
+    @file_tx_is_active.setter
+    def file_tx_is_active(self, status: bool):
+        self._file_tx_is_active = status
+        self.command_received()
+
+
+    async def handle_disconnect(self, client):
+        print("Disconnected from server!")
+        self.connected = False
+        # Optionally trigger a reconnection attempt here or wait for a server event.
+        
+    async def handle_connect(self, client):
+        print("Connected to Server!")
+
+    async def connect(self, **kwargs):
+        # Connect, using the backend's service cache when the saved layout is
+        # still valid, and save the layout found for the next connection
+        start = time.perf_counter()
+        cached = self.use_gatt_cache
+        await BleakClient.connect(self, dangerous_use_bleak_cache=cached, **kwargs)
+        layout = describe_services(self.services)
+        if cached and not self.gatt_cache.matches(layout, self.advertised_services):
+            # Same firmware version but a different layout, e.g. a dev build.
+            # Drop the cache and discover the services again
+            print("Cached GATT layout is stale, rediscovering services")
+            GATT_CACHE_MISSES.inc()
+            self.gatt_cache.invalidate()
+            cached = self.use_gatt_cache = False
+            await BleakClient.disconnect(self)
+            await BleakClient.connect(self, dangerous_use_bleak_cache=False, **kwargs)
+            layout = describe_services(self.services)
+        elif cached:
+            GATT_CACHE_HITS.inc()
+        self.gatt_cache.update(self.firmware, layout)
+        self._connected_time = time.perf_counter()
+        self._connect_seconds = self._connected_time - start
+        self._first_command_time = None
+        CONNECT_TIME.observe(self._connect_seconds)
+        print(f"Connected in {self._connect_seconds:.2f}s ({'cached' if cached else 'full'} service discovery)")
+
+    def command_received(self):
+        IMUDataPipeline.command_received(self)
+        if self._connected_time is not None:
+            # Time spent waiting for the user isn't part of the connect time
+            self._first_command_time = self._command_time
+
+    def first_byte_received(self):
+        # Record connect to first byte once per connection: the connect time
+        # plus the time from the first command (or connecting, if the mode
+        # needs none) to the device's first reply
+        if self._connected_time is None:
+            return
+        now = time.perf_counter()
+        FIRST_BYTE_TIME.observe(self._connect_seconds + now - (self._first_command_time or self._connected_time))
+        self._connected_time = None
+        
+
+    # async def connect(self):
+    #     try:
+    #         print("Attempting to connect...")
+    #         # self.client.set_disconnected_callback(self.handle_disconnect)
+    #         await self.client.connect()
+    #     except Exception as e:
+    #         print(f"Failed to connect: {e}")
+    #         self.connected = False
+    #     else:
+    #         self.connected = True
+    #         print(f"Connected to server: {self.address}")
+    #         # await self.handle_modes()
+
+    # async def disconnect(self):
+    #     if self.connected:
+    #         print("Disconnecting...")
+    #         await self.client.disconnect()
+    #         self.connected = False
+
+    async def monitor(self):
+        while True:
+            if not self.connected:
+                print("Waiting for server to reconnect...")
+                await self.connect()
+            else:
+                print("Client is connected.")
+            await asyncio.sleep(5)  # Adjust the polling frequency as needed
+            
+    async def config_device(self):
+        # Hold the client in a loop until the new config data flag is tripped
+        # then read new data from the attribute and send to periphrial
+        while self.config_entries is None:
+            await self.wait_for_command(0.1)
+            
+        config_name = self.config_entries["Name"]
+        config_activity = self.config_entries["Activity"]
+        
+        print(f"Sending New Config Data to Periphrial: {self.config_entries}")
+        # Update the datetime characterisitc to ensure an accurate refrence value
+        datetime_str = datetime.now().strftime(DT_FMT)
+        if self.services.get_characteristic(CONFIG_RECORD_UUID) is not None:
+            # One write for all three values, the device updates its file
+            # name once
+            record = CONFIG_RECORD_SEP.join(
+                [datetime_str] + [value.replace(CONFIG_RECORD_SEP, "_") for value in (config_name, config_activity)])
+            await self.write_gatt_char(CONFIG_RECORD_UUID, record.encode("utf-8"), response=True)
+        else:
+            # Older firmware without the packed record
+            await self.write_gatt_char(DATETIME_UUID, datetime_str.encode("utf-8"))
+            await self.write_gatt_char(PERSONNAME_UUID, config_name.encode("utf-8"))
+            await self.write_gatt_char(ACTIVITY_TYPE_UUID, config_activity.encode("utf-8"))
+        self.command_done()
+
+        # Confirm with a single read of the resulting file name, which also
+        # tells the device it can leave config mode
+        file_name = None
+        try:
+            file_name = (await self.read_gatt_char(FILE_NAME_UUID)).decode("utf-8")
+            self.first_byte_received()
+            print(f"Device configured, file name: {file_name}")
+        except Exception as e:
+            print(f"Could not confirm config: {e}")
+
+        self.config_entries = None
+        return file_name
+        
+    async def rx_IMU_readings_mode(self):
+        ### ------------------ BLE Notify Implementation ----------------- ### 
+        # The BLE Notify method involves setting up a callback function to
+        # run whenver new data is written to a characteristic on the perephrial
+        # because there is no call/reponse, there is shorter delay between
+        # instances of the program running
+         
+        # Start a loop to run for 10s to read  the IMU_DATA characteristic
+        # define a callback function to process data when it arrives
+        last_notify_time = None
+
+        async def handle_IMU_notification(sender, data):            
+            nonlocal last_notify_time
+            if metrics.enabled():
+                now = time.perf_counter()
+                if last_notify_time is not None:
+                    NOTIFY_INTERVAL.observe(now - last_notify_time)
+                last_notify_time = now
+            if self._connected_time is not None:
+                self.first_byte_received()
+            self.handle_IMU_data(data)
+            
+        # Configure the notification
+        await self.start_notify(IMU_DATA_UUID, handle_IMU_notification)
+        # put in a wait loop until the request is recieved from the User
+        while not self.data_tx_is_active:
+            await self.wait_for_command(0.1)
+            
+        start_time = await self.start_IMU_readings()
+        clock_sync = await self.start_clock_sync()
+
+        # Hold thread in loop while waiting for user input to stop tx session
+        while self.data_tx_is_active:
+            await self.wait_for_command(0.05)
+            self.flush_if_stale()
+            
+        await self.stop_IMU_readings(start_time, clock_sync)
+
+    async def start_IMU_readings(self):
+        self.open_stream(self.address)
+        start_time = time.perf_counter()
+        print("Sending Start command from Client")
+        await self.write_gatt_char(IMU_REQUEST_UUID, b"START")
+        self.command_done()
+        self.device_file = await self.read_device_file()
+        return start_time
+
+    async def read_device_file(self):
+        # Name of the SD file the device just started, None on older firmware
+        if self.firmware is None:
+            return None
+        version = tuple(int(part) for part in self.firmware.split("+")[0].split("."))
+        if version < LIVE_FILE_NAME_FIRMWARE:
+            return None
+        try:
+            return (await self.read_gatt_char(FILE_NAME_UUID)).decode("utf-8") or None
+        except Exception as e:
+            print(f"Could not read the device file name: {e}")
+            return None
+
+    async def start_clock_sync(self):
+        # Sync bursts run alongside the data notifications, firmware without
+        # the sync characteristic streams unsynced
+        if not self.clock_sync_interval or self.services.get_characteristic(IMU_SYNC_UUID) is None:
+            return None
+        from SwIMU_sync import DeviceClockSync
+        clock_sync = DeviceClockSync(self, IMU_SYNC_UUID, interval=self.clock_sync_interval)
+        await clock_sync.start()
+        return clock_sync
+
+    async def stop_IMU_readings(self, start_time, clock_sync=None):
+        # Finish syncing while the device is still on its recording clock
+        self.clock_fit = await clock_sync.stop() if clock_sync is not None else None
+        await self.write_gatt_char(IMU_REQUEST_UUID, b"END")
+        self.command_done()
+        self.tx_active = False
+
+        record_time = time.perf_counter() - start_time
+
+        if self.clock_fit is not None:
+            print(f"Clock sync: offset {self.clock_fit['offset']:.4f}s, "
+                  f"drift {self.clock_fit['drift_ppm']:.1f} ppm, "
+                  f"+/- {self.clock_fit['uncertainty'] * 1e3:.1f} ms")
+            from SwIMU_sync import save_sync
+            if self.recorder is not None:
+                save_sync(self.recorder.path, self.clock_fit, clock_sync.estimator, self.address)
+            if self.device_file is not None:
+                # Keyed on the SD file too: offloaded into save_dir it sits
+                # next to this sidecar, where ingest and merge look for it
+                save_sync(os.path.join(self.save_dir, self.device_file), self.clock_fit,
+                          clock_sync.estimator, self.address)
+
+        await self.close_stream()
+
+        print("----------------- BLE Notify Implementation ---------------")    
+        print(f"Number of data packets recieved in {record_time}s: {self.num_samples_rx}")
+        print(f"Realized Frequency [Hz]: {self.num_samples_rx / record_time}")
+        
+    
+    async def write_to_file(self, save_path, file_data):
+        # Cleaning a big file takes a while, keep the event loop free
+        await asyncio.get_running_loop().run_in_executor(
+            CPU_EXECUTOR, self.save_received_file, save_path, file_data)
+
+    def save_received_file(self, save_path, file_data):
+        if is_device_recording(save_path):
+            # Binary recordings are saved as they are, check they decode
+            header, block = decode_device_recording(file_data)
+            with open(save_path + ".part", "wb") as f:
+                f.write(file_data)
+            os.replace(save_path + ".part", save_path)
+            print(f"Recieved {len(block)} samples at {header['sample_rate']} Hz written to file: {save_path}")
+            return
+
+        # Clean data
+        
+        cleaned_data = clean_csv_data(bytes(file_data).decode("utf-8", errors="replace"))
+        
+        with open(save_path + ".part", "w") as f:
+            f.write(cleaned_data)
+        os.replace(save_path + ".part", save_path)
+        print(f"Recieved Data Written to file: {save_path}")
+        
+                
+    async def file_rx_mode(self):
+
+        # Wait for user to prompt the file tx start
+        while not self.file_tx_is_active:
+            await self.wait_for_command(0.1)
+
+        await self.write_gatt_char(FILE_TX_REQUEST_UUID, b"SEND_FILES")
+        self.command_done()
+        status = await self.read_gatt_char(FILE_TX_REQUEST_UUID)
+        self.first_byte_received()
+        status = status.decode("utf-8")
+        if (status == "READY"):
+            print("Periphrial Ready to Transmit Files")
+            first_file_flag = True
+
+        else:
+            print("Unhandled error case. Potentially no files available. Canceling transfer")
+            return   
+
+        # Host side record of what we already have from this device
+        from SwIMU_manifest import SyncManifest
+        manifest = SyncManifest(self.save_dir, self.address)
+        can_skip = self.services.get_characteristic(FILE_TX_SIZE_UUID) is not None
+        num_received = 0
+        num_skipped = 0
+        
+        # define and assign notification callbacks on first file only
+        if not self.file_rx_setup_flag:
+            
+            # Callback to accumulate packets of file data from server
+            async def handle_file_data(sender, data):
+                if data:
+                    nonlocal file_data
+                    FILE_TX_BYTES.inc(len(data))
+                    # Kept as bytes, binary recordings aren't text
+                    file_data += data
+                    # print(f"Written to file data variable: {data}")
+                else:
+                    print("Received empty data packet!")
+               
+            # Setup the notificaiton handler
+            await self.start_notify(FILE_TX_UUID, handle_file_data)
+            
+                        # Callback to handle completion notificaiton
+            def handle_transfer_complete(sender, data):
+                if data.decode("utf-8") == "TRANSFER_COMPLETE":
+                    transfer_complete.set_result(True)
+                    print("Transfer Complete")
+            
+            # config file complete notificaiton manager
+            await self.start_notify(FILE_TX_COMPLETE_UUID, handle_transfer_complete)
+            self.file_rx_setup_flag = True
+
+        while True:
+            # Wait for server to send file name
+            file_name = await self.read_gatt_char(FILE_TX_NAME_UUID)
+            # Write an acknowledgement
+            await self.write_gatt_char(FILE_TX_NAME_UUID, b"ACK")
+
+            file_name = file_name.decode("utf-8")
+            if (file_name == "ERROR"):
+                print("Error on Server accessing file!")
+                return
+            else:
+                print(f"Recieved file name: {file_name}")
+
+            file_size = None
+            if can_skip:
+                file_size = int.from_bytes(await self.read_gatt_char(FILE_TX_SIZE_UUID), "little")
+                if manifest.has(file_name, file_size):
+                    print(f"Already recieved, skipping: {file_name}")
+                    await self.write_gatt_char(FILE_TX_REQUEST_UUID, b"SKIP")
+                    num_skipped += 1
+                    if await self.more_files():
+                        continue
+                    break
+            
+            # setup variable to recieve file data
+            file_data = bytearray()
+
+            # Initialize a Future event to hold until file transfer is complete
+            transfer_complete = asyncio.Future()
+            
+            # Acknowledge file name to indicate we're ready to recieve file data 
+            await self.write_gatt_char(FILE_TX_REQUEST_UUID, b"START")
+            print("Client Acknowledged File name. Beginning Transfer")
+            file_tx_start = time.perf_counter()
+        
+            # Wait for transfer compltete notification
+            await transfer_complete
+            file_tx_time = time.perf_counter() - file_tx_start
+            print(f"File tx in {file_tx_time:.2f} s")
+            FILE_TX_GOODPUT.set(len(file_data) / file_tx_time if file_tx_time > 0 else 0.0)
+        
+            
+            if file_size is not None and len(file_data) != file_size:
+                # Don't save it, a short file would look like a complete
+                # recording. Stop before the device reaches DONE and clears
+                # its files, so it's sent again next time
+                print(f"Incomplete transfer of {file_name}: {len(file_data)} of {file_size} bytes, "
+                      f"not saved, stopping file sync")
+                break
+
+            # Write recieved contents to file
+            save_path = os.path.join(self.save_dir, file_name)
+            await self.write_to_file(save_path, file_data)
+            await asyncio.get_running_loop().run_in_executor(
+                CPU_EXECUTOR, manifest.record, file_name, file_data, save_path)
+            num_received += 1
+            
+            # Query periphrial for more files.
+            if not await self.more_files():
+                break
+
+        print(f"File sync complete: {num_received} recieved, {num_skipped} already on this host")
+
+    async def more_files(self) -> bool:
+        await self.write_gatt_char(FILE_TX_REQUEST_UUID, b"MORE_FILES?")
+        status = await self.read_gatt_char(FILE_TX_REQUEST_UUID)
+        status = status.decode("utf-8")
+        if (status == "MORE_FILES"):
+            print("Ready to recieve another file.")
+            return True
+
+        print("All files transmitted!")
+        return False
+            
+
+async def prompt_connection():
+    input("Press Enter to Initiate Connection:")
+
+async def user_input(input_msg: str) -> str:
+    input_value = input(input_msg)
+    return input_value
+    
+async def discover_devices(target_device_name: str = TARGET_DEVICE, timeout: float = 5) -> dict:
+    # Every advertising device with the target name, {address: (device, adv_data)}
+    devices = await BleakScanner.discover(timeout=timeout, return_adv=True)
+    return {address: device_info for address, device_info in devices.items()
+            if device_info[0].name is not None and target_device_name in device_info[0].name}
+
+
+async def scan(target_device_name: str):
+    # Scan for ble devices in our proximity
+    devices = await BleakScanner.discover(timeout=5, return_adv=True)
+    # print(devices)
+    address = ""
+    # When scanning is complete, see if our target device name was found
+    for device_addr, device_info in devices.items():
+        device = device_info[0]
+        print(f"{device_addr, device.name}")
+        # If so, extract the BLE address associated with the device. these
+        # adresses are unique to each device and is how we connect/
+        # communicate with them
+        if (device.name is not None) and (target_device_name in device.name):
+            device_metadata = device_info[1]
+            print(f"Target Device Metadata: {device_metadata}")
+            return device_info
+
+    if not address:
+        print("Target Device Not Found!")
+        return None
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+# Form implementation generated from reading ui file 'SwIMU_client_UI.ui'
+#
+# Created by: PyQt5 UI code generator 5.15.11
+#
+# WARNING: Any manual changes made to this file will be lost when pyuic5 is
+# run again.  Do not edit this file unless you know what you are doing.
+
+
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+
+class Ui_MainWindow(object):
+    def setupUi(self, MainWindow):
+        MainWindow.setObjectName("MainWindow")
+        MainWindow.resize(1042, 784)
+        self.centralwidget = QtWidgets.QWidget(MainWindow)
+        self.centralwidget.setObjectName("centralwidget")
+        self.verticalLayout_2 = QtWidgets.QVBoxLayout(self.centralwidget)
+        self.verticalLayout_2.setObjectName("verticalLayout_2")
+        self.horizontalLayout_2 = QtWidgets.QHBoxLayout()
+        self.horizontalLayout_2.setObjectName("horizontalLayout_2")
+        self.connect_button = QtWidgets.QPushButton(self.centralwidget)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Maximum, QtWidgets.QSizePolicy.Fixed)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.connect_button.sizePolicy().hasHeightForWidth())
+        self.connect_button.setSizePolicy(sizePolicy)
+        self.connect_button.setMaximumSize(QtCore.QSize(120, 40))
+        self.connect_button.setObjectName("connect_button")
+        self.horizontalLayout_2.addWidget(self.connect_button)
+        self.data_tx_button = QtWidgets.QPushButton(self.centralwidget)
+        self.data_tx_button.setEnabled(False)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Maximum, QtWidgets.QSizePolicy.Fixed)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.data_tx_button.sizePolicy().hasHeightForWidth())
+        self.data_tx_button.setSizePolicy(sizePolicy)
+        self.data_tx_button.setMaximumSize(QtCore.QSize(120, 40))
+        self.data_tx_button.setObjectName("data_tx_button")
+        self.horizontalLayout_2.addWidget(self.data_tx_button)
+        self.file_tx_button = QtWidgets.QPushButton(self.centralwidget)
+        self.file_tx_button.setEnabled(False)
+        self.file_tx_button.setMinimumSize(QtCore.QSize(0, 0))
+        self.file_tx_button.setMaximumSize(QtCore.QSize(120, 40))
+        self.file_tx_button.setObjectName("file_tx_button")
+        self.horizontalLayout_2.addWidget(self.file_tx_button)
+        self.config_input_frame = QtWidgets.QFrame(self.centralwidget)
+        self.config_input_frame.setEnabled(False)
+        self.config_input_frame.setObjectName("config_input_frame")
+        self.horizontalLayout = QtWidgets.QHBoxLayout(self.config_input_frame)
+        self.horizontalLayout.setObjectName("horizontalLayout")
+        self.config_field_label = QtWidgets.QLabel(self.config_input_frame)
+        sizePolicy = QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Preferred)
+        sizePolicy.setHorizontalStretch(0)
+        sizePolicy.setVerticalStretch(0)
+        sizePolicy.setHeightForWidth(self.config_field_label.sizePolicy().hasHeightForWidth())
+        self.config_field_label.setSizePolicy(sizePolicy)
+        self.config_field_label.setMinimumSize(QtCore.QSize(200, 0))
+        self.config_field_label.setMaximumSize(QtCore.QSize(200, 16777215))
+        self.config_field_label.setObjectName("config_field_label")
+        self.horizontalLayout.addWidget(self.config_field_label, 0, QtCore.Qt.AlignLeft)
+        self.config_input_field = QtWidgets.QLineEdit(self.config_input_frame)
+        self.config_input_field.setMinimumSize(QtCore.QSize(300, 0))
+        self.config_input_field.setMaximumSize(QtCore.QSize(300, 16777215))
+        self.config_input_field.setObjectName("config_input_field")
+        self.horizontalLayout.addWidget(self.config_input_field, 0, QtCore.Qt.AlignRight)
+        self.horizontalLayout_2.addWidget(self.config_input_frame)
+        self.verticalLayout_2.addLayout(self.horizontalLayout_2)
+        self.verticalLayout = QtWidgets.QVBoxLayout()
+        self.verticalLayout.setContentsMargins(10, 10, 10, 10)
+        self.verticalLayout.setObjectName("verticalLayout")
+        self.label_2 = QtWidgets.QLabel(self.centralwidget)
+        font = QtGui.QFont()
+        font.setPointSize(12)
+        font.setBold(True)
+        font.setWeight(75)
+        self.label_2.setFont(font)
+        self.label_2.setAlignment(QtCore.Qt.AlignCenter)
+        self.label_2.setObjectName("label_2")
+        self.verticalLayout.addWidget(self.label_2)
+        self.accel_plot = PlotWidget(self.centralwidget)
+        self.accel_plot.setMinimumSize(QtCore.QSize(1000, 300))
+        self.accel_plot.setObjectName("accel_plot")
+        self.verticalLayout.addWidget(self.accel_plot)
+        self.gyro_plot = PlotWidget(self.centralwidget)
+        self.gyro_plot.setMinimumSize(QtCore.QSize(1000, 300))
+        self.gyro_plot.setObjectName("gyro_plot")
+        self.verticalLayout.addWidget(self.gyro_plot)
+        self.verticalLayout_2.addLayout(self.verticalLayout)
+        MainWindow.setCentralWidget(self.centralwidget)
+        self.menubar = QtWidgets.QMenuBar(MainWindow)
+        self.menubar.setGeometry(QtCore.QRect(0, 0, 1042, 21))
+        self.menubar.setObjectName("menubar")
+        self.menuSwIMU_Client = QtWidgets.QMenu(self.menubar)
+        self.menuSwIMU_Client.setObjectName("menuSwIMU_Client")
+        MainWindow.setMenuBar(self.menubar)
+        self.statusbar = QtWidgets.QStatusBar(MainWindow)
+        self.statusbar.setObjectName("statusbar")
+        MainWindow.setStatusBar(self.statusbar)
+        self.menubar.addAction(self.menuSwIMU_Client.menuAction())
+
+        self.retranslateUi(MainWindow)
+        QtCore.QMetaObject.connectSlotsByName(MainWindow)
+
+    def retranslateUi(self, MainWindow):
+        _translate = QtCore.QCoreApplication.translate
+        MainWindow.setWindowTitle(_translate("MainWindow", "MainWindow"))
+        self.connect_button.setText(_translate("MainWindow", "Connect"))
+        self.data_tx_button.setText(_translate("MainWindow", "Start Data Tx"))
+        self.file_tx_button.setText(_translate("MainWindow", "Start File Tx"))
+        self.config_field_label.setText(_translate("MainWindow", "Connect to Configure Device:"))
+        self.label_2.setText(_translate("MainWindow", "IMU Live Readout"))
+        self.menuSwIMU_Client.setTitle(_translate("MainWindow", "SwIMU Client"))
+from pyqtgraph import PlotWidget
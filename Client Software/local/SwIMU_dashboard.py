@@ -0,0 +1,324 @@
+# Live grid view of several SwIMU devices streaming at once, drawn by one
+# shared render scheduler. This file is part of the SwIMU device tutorial series
+
+"""
+The main window plots one device. Watching a lane of swimmers meant running
+one app per sensor, each with its own plot timer redrawing all of its curves
+whether new data had arrived or not. The dashboard shows every device in one
+grid:
+
+    python SwIMU_dashboard.py                     # every SwIMU in live data mode
+    python SwIMU_dashboard.py --devices 4 --scan-timeout 20
+    python SwIMU_dashboard.py --replay a.swimu b.swimu c.csv --speed 1
+
+Each device's samples go straight from its client's data callbacks into the
+SampleRing of its panel, which marks the panel dirty. A single render timer
+redraws only the dirty panels, starting where the previous frame stopped and
+stopping once the frame's time budget is spent, so a slow frame never stalls
+the event loop the BLE coroutines run on. Curves are min/max decimated to a
+point budget that is shared by all panels: adding devices makes each panel
+coarser, not the frame longer.
+
+Every panel's title shows its sample rate, mean render time and redraw rate.
+The whole frame time goes to the dashboard_frame_seconds metric.
+"""
+
+import argparse
+import asyncio
+import collections
+import math
+import sys
+import time
+
+import numpy as np
+import pyqtgraph as pg
+from PyQt5 import QtCore, QtWidgets
+
+import SwIMU_metrics as metrics
+from SwIMU_qtloop import run_app, spawn
+from SwIMU_samples import SampleRing
+
+# Render timer interval [ms], ~30 frames per second
+FRAME_INTERVAL_MS = 33
+# Time [s] a frame may spend redrawing panels before handing the loop back.
+# Panels left over are drawn first in the next frame
+FRAME_BUDGET = 0.012
+# Points per curve shared by all panels, split evenly between them
+TOTAL_POINT_BUDGET = 4000
+# Never decimate a panel below this many points per curve
+MIN_PANEL_POINTS = 200
+# Samples kept per device, ~40 s at 100 Hz
+RING_CAPACITY = 4096
+# Render times averaged for the panel titles
+FRAME_STATS_WINDOW = 30
+# Devices connected at the same time. BLE adapters only handle a few
+# simultaneous connection attempts reliably
+CONNECT_CONCURRENCY = 3
+DEFAULT_SCAN_TIMEOUT = 10
+
+DASHBOARD_FRAME_TIME = metrics.histogram("dashboard_frame_seconds", "Time to redraw the dirty dashboard panels")
+PANELS_DEFERRED = metrics.counter("dashboard_panels_deferred_total", "Dirty panels left for the next frame")
+
+PENS = ("r", "g", "b")
+
+
+def decimate(data, max_points: int):
+    """
+    Min/max decimation of a sample block for plotting.
+
+    :param data: (n, 7) samples, time in the first column.
+    :param max_points: Points per curve at most.
+    :return: (times, values): (m,) times and (m, 6) values with m <= max_points.
+        Each bucket of samples becomes two points, its minimum and maximum,
+        so spikes survive however far the curve is reduced.
+    """
+    if len(data) <= max_points:
+        return data[:, 0], data[:, 1:]
+    bucket_size = math.ceil(len(data) / (max_points // 2))
+    num_buckets = len(data) // bucket_size
+    # Drop the oldest partial bucket so the newest samples are always shown
+    buckets = data[len(data) - num_buckets * bucket_size:].reshape(num_buckets, bucket_size, -1)
+    values = buckets[:, :, 1:]
+    times = np.empty(2 * num_buckets, dtype=data.dtype)
+    times[0::2] = buckets[:, 0, 0]
+    times[1::2] = buckets[:, -1, 0]
+    reduced = np.empty((2 * num_buckets, values.shape[2]), dtype=data.dtype)
+    reduced[0::2] = values.min(axis=1)
+    reduced[1::2] = values.max(axis=1)
+    return times, reduced
+
+
+class DevicePanel(pg.GraphicsLayoutWidget):
+    """
+    Accelerometer and gyroscope plots of one device.
+
+    :param name: Title of the panel, usually the device address.
+    :param capacity: Samples kept for plotting.
+    """
+
+    def __init__(self, name: str, capacity: int = RING_CAPACITY):
+        super().__init__()
+        self.name = name
+        self.ring = SampleRing(capacity)
+        self.dirty = False
+        self.samples_rx = 0
+        self.render_times = collections.deque(maxlen=FRAME_STATS_WINDOW)
+        self.render_stamps = collections.deque(maxlen=FRAME_STATS_WINDOW)
+        self.rx_stamps = collections.deque(maxlen=FRAME_STATS_WINDOW)
+
+        self.title = self.addLabel(name, row=0, col=0)
+        self.accel_plot = self.addPlot(row=1, col=0)
+        self.accel_plot.setLabel('left', "Accel (g)")
+        self.gyro_plot = self.addPlot(row=2, col=0)
+        self.gyro_plot.setLabel('left', "Gyro (°/s)")
+        self.gyro_plot.setXLink(self.accel_plot)
+        self.curves = []
+        for plot in (self.accel_plot, self.gyro_plot):
+            plot.showGrid(x=True, y=True, alpha=0.2)
+            for pen in PENS:
+                self.curves.append(plot.plot(pen=pen))
+
+    def extend(self, block):
+        # Data callback of the device's client, runs for every decoded block
+        self.ring.extend(block)
+        self.samples_rx += len(block)
+        self.rx_stamps.append((time.perf_counter(), self.samples_rx))
+        self.dirty = True
+
+    def render(self, max_points: int):
+        start = time.perf_counter()
+        times, values = decimate(self.ring.view(), max_points)
+        for i, curve in enumerate(self.curves):
+            curve.setData(times, values[:, i], skipFiniteCheck=True)
+        self.dirty = False
+        end = time.perf_counter()
+        self.render_times.append(end - start)
+        self.render_stamps.append(end)
+
+    def update_title(self):
+        # Sample rate, mean render time and redraw rate over the last few frames
+        parts = [self.name]
+        if len(self.rx_stamps) >= 2:
+            (t0, n0), (t1, n1) = self.rx_stamps[0], self.rx_stamps[-1]
+            if t1 > t0:
+                parts.append(f"{(n1 - n0) / (t1 - t0):.0f} Hz")
+        if self.render_times:
+            parts.append(f"{1e3 * sum(self.render_times) / len(self.render_times):.1f} ms/frame")
+        if len(self.render_stamps) >= 2 and self.render_stamps[-1] > self.render_stamps[0]:
+            fps = (len(self.render_stamps) - 1) / (self.render_stamps[-1] - self.render_stamps[0])
+            parts.append(f"{fps:.0f} fps")
+        self.title.setText("  |  ".join(parts))
+
+
+class RenderScheduler(QtCore.QObject):
+    """
+    One timer that redraws the dirty panels of a dashboard.
+
+    :param panels: List of DevicePanel, shared with the dashboard so panels
+        added later are picked up.
+    """
+
+    def __init__(self, panels: list, interval_ms: int = FRAME_INTERVAL_MS, budget: float = FRAME_BUDGET):
+        super().__init__()
+        self.panels = panels
+        self.budget = budget
+        self._next = 0
+        self._frames = 0
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.render_frame)
+
+    def start(self):
+        self.timer.start()
+
+    def stop(self):
+        self.timer.stop()
+
+    def points_per_panel(self) -> int:
+        return max(MIN_PANEL_POINTS, TOTAL_POINT_BUDGET // max(1, len(self.panels)))
+
+    def render_frame(self):
+        panels = self.panels
+        if not panels:
+            return
+        max_points = self.points_per_panel()
+        start = time.perf_counter()
+        deadline = start + self.budget
+        count = len(panels)
+        # Round robin from where the last frame ran out of time, so every
+        # panel gets drawn even when the budget can't cover them all
+        for offset in range(count):
+            index = (self._next + offset) % count
+            panel = panels[index]
+            if not panel.dirty:
+                continue
+            if time.perf_counter() >= deadline:
+                self._next = index
+                PANELS_DEFERRED.inc(sum(p.dirty for p in panels))
+                break
+            panel.render(max_points)
+        else:
+            self._next = 0
+        DASHBOARD_FRAME_TIME.observe(time.perf_counter() - start)
+        # Titles only need refreshing a few times a second
+        self._frames += 1
+        if self._frames % 10 == 0:
+            for panel in panels:
+                panel.update_title()
+
+
+class LiveDashboard(QtWidgets.QMainWindow):
+    # Grid of device panels with a shared render scheduler
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("SwIMU Live Dashboard")
+        self.panels = []
+        self.grid_widget = QtWidgets.QWidget()
+        self.grid = QtWidgets.QGridLayout(self.grid_widget)
+        self.setCentralWidget(self.grid_widget)
+        self.status = self.statusBar()
+        self.scheduler = RenderScheduler(self.panels)
+        self.scheduler.start()
+        self.clients = []
+        self.tasks = []
+
+    def add_panel(self, name: str) -> DevicePanel:
+        panel = DevicePanel(name)
+        self.panels.append(panel)
+        # Keep the grid close to square as devices join
+        columns = math.ceil(math.sqrt(len(self.panels)))
+        for i, existing in enumerate(self.panels):
+            self.grid.addWidget(existing, i // columns, i % columns)
+        self.status.showMessage(f"{len(self.panels)} devices, "
+                                f"{self.scheduler.points_per_panel()} points per curve")
+        return panel
+
+    def add_client(self, client, name: str):
+        # Feed a client's decoded blocks into a new panel and start streaming
+        panel = self.add_panel(name)
+        client.data_callbacks.append(panel.extend)
+        client.data_tx_is_active = True
+        self.clients.append(client)
+        self.tasks.append(spawn(client.rx_IMU_readings_mode()))
+
+    async def connect_devices(self, max_devices: int = None, scan_timeout: float = DEFAULT_SCAN_TIMEOUT):
+        # Connect to every SwIMU advertising live data mode and stream from each
+        from SwIMU_client import SwIMUClient, discover_devices, IMU_TX_SERVICE_UUID
+        self.status.showMessage("Scanning for SwIMU devices in live data mode...")
+        devices = await discover_devices(timeout=scan_timeout)
+        addresses = [address for address, (device, adv) in devices.items()
+                     if any(IMU_TX_SERVICE_UUID in uuid for uuid in adv.service_uuids)]
+        if max_devices:
+            addresses = addresses[:max_devices]
+        if not addresses:
+            self.status.showMessage("No SwIMU devices in live data mode found")
+            return
+        semaphore = asyncio.Semaphore(CONNECT_CONCURRENCY)
+
+        async def connect(address):
+            async with semaphore:
+                device, adv = devices[address]
+                client = SwIMUClient(device, timeout=20, advertisement=adv)
+                try:
+                    await client.connect()
+                except Exception as e:
+                    print(f"Failed to connect to {address}: {e}")
+                    return
+            self.add_client(client, address)
+
+        await asyncio.gather(*(connect(address) for address in addresses))
+
+    def add_replays(self, paths: list, speed: float = 1.0):
+        from SwIMU_replay import ReplayClient
+        for path in paths:
+            client = ReplayClient(path, speed=speed, repeat=True)
+            self.add_client(client, client.address)
+
+    async def stop_streams(self):
+        # Let every client send END and close its recording, then disconnect
+        for client in self.clients:
+            client.data_tx_is_active = False
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        for client in self.clients:
+            if hasattr(client, "disconnect"):
+                try:
+                    await client.disconnect()
+                except Exception as e:
+                    print(f"Error disconnecting {client.address}: {e}")
+
+    def closeEvent(self, event):
+        self.scheduler.stop()
+        if self.clients and not self.property("stopping"):
+            # Finish the streams before the window goes
+            self.setProperty("stopping", True)
+            event.ignore()
+            task = spawn(self.stop_streams())
+            task.add_done_callback(lambda _: self.close())
+            return
+        super().closeEvent(event)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Live grid view of several SwIMU devices")
+    parser.add_argument("--replay", nargs="+", default=None,
+                        help="stream these recorded sessions instead of connecting to devices")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, 1.0 is real time")
+    parser.add_argument("--devices", type=int, default=None, help="connect to at most this many devices")
+    parser.add_argument("--scan-timeout", type=float, default=DEFAULT_SCAN_TIMEOUT,
+                        help="seconds to scan for devices")
+    args = parser.parse_args(argv)
+
+    app = QtWidgets.QApplication(sys.argv[:1])
+    window = LiveDashboard()
+    window.resize(1400, 900)
+    window.show()
+    if args.replay:
+        window.add_replays(args.replay, args.speed)
+    else:
+        spawn(window.connect_devices(args.devices, args.scan_timeout))
+    return run_app(app)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,417 @@
+# Shared helpers for reading, cleaning and hashing recorded SwIMU sessions.
+# This file is part of the SwIMU device tutorial series
+
+"""
+Recorded sessions are the CSV files produced by BLEClient.write_to_file (or
+pulled straight off the SD card). Every line follows the format the device
+writes in DataRecorder::readIMU:
+
+    time, Ax, Ay, Az, Gx, Gy, Gz
+
+Sessions recorded live on the client are stored in a binary append-only
+format instead (see SessionRecorder in SwIMU_recorder):
+
+    8 byte magic "SWIMUSES", uint16 version, uint32 metadata length,
+    JSON metadata, then fixed size records of 7 little-endian float32
+
+Because every record has the same size, a file cut short by a crash is still
+readable: a partial record at the end is simply ignored.
+
+Devices set to record in binary write .bin files to the SD card instead of
+CSV text (see DataRecorder.h):
+
+    92 byte header: magic "SWIMUBIN", version, header size, record size,
+    sample rate, accel and gyro scale factors, start millis, file name
+    16 byte records: uint32 ms since start, 3 x int16 accel, 3 x int16 gyro
+
+read_device_recording decodes them with one numpy.frombuffer call and no
+text parsing.
+
+The helpers in this module have no PyQt or bleak dependency so they can be
+used from offline tools (batch processing, plotting, analytics) as well as
+from the live client.
+"""
+
+import hashlib
+import json
+import os
+import re
+import struct
+import time
+
+import SwIMU_metrics as metrics
+
+# Column names for a recorded session, in the order the device writes them
+HEADERS = ['elapsed_time', 'Ax', 'Ay', 'Az', 'Gx', 'Gy', 'Gz']
+NUM_FIELDS = len(HEADERS)
+
+# Binary session file layout
+BINARY_SESSION_EXTENSION = ".swimu"
+SESSION_MAGIC = b"SWIMUSES"
+SESSION_VERSION = 1
+SESSION_HEADER = struct.Struct("<8sHI")     # magic, version, metadata length
+RECORD_SIZE = NUM_FIELDS * 4                # 7 float32 values per sample
+
+# Binary recordings written by the device (DataRecorder::writeBinaryHeader)
+DEVICE_RECORDING_EXTENSION = ".bin"
+DEVICE_MAGIC = b"SWIMUBIN"
+DEVICE_VERSION = 1
+# magic, version, header size, record size, sample rate [Hz], accel scale
+# [g/count], gyro scale [dps/count], start millis, file name
+DEVICE_HEADER = struct.Struct("<8sHHHHffI64s")
+# ms since start, raw accel counts, raw gyro counts
+DEVICE_RECORD_FIELDS = [("elapsed_ms", "<u4"), ("accel", "<i2", (3,)), ("gyro", "<i2", (3,))]
+DEVICE_RECORD_SIZE = 16
+
+# File extensions recognised as recorded sessions
+SESSION_EXTENSIONS = (".csv", BINARY_SESSION_EXTENSION, DEVICE_RECORDING_EXTENSION)
+
+CLEAN_TIME = metrics.histogram("csv_clean_seconds", "Time spent in clean_csv_data")
+
+# Read files in 1 MiB pieces when hashing so memory stays flat on big sessions
+HASH_BLOCK_SIZE = 1 << 20
+# Index of content hashes kept by cached_hash in each cache folder
+HASH_INDEX_NAME = "hashes.json"
+
+
+def clean_csv_data(raw_data: str, verbose: bool = True) -> str:
+    """
+    Cleans CSV data by removing lines that do not contain exactly 7 fields.
+
+    :param raw_data: The raw CSV data as a string.
+    :param verbose: Print the time taken to clean the data.
+    :return: A cleaned CSV string with only valid lines.
+    """
+    clean_start_time = time.perf_counter()
+
+    cleaned_lines = []
+
+    for line in raw_data.splitlines():
+        fields = line.split(',')
+        if len(fields) == NUM_FIELDS:  # Ensure the line contains exactly 7 fields
+            # Check to see if data has been corrupted from adding multiple fields together
+            if (not any([len(re.findall(r"\.", field)) > 1 for field in fields]) or
+                not any([len(re.findall(r"\-", field)) > 1 for field in fields])):
+                cleaned_lines.append(line)
+
+    clean_time = time.perf_counter() - clean_start_time
+    CLEAN_TIME.observe(clean_time)
+    if verbose:
+        print(f"file cleaned in {clean_time:.2f}s")
+
+    return '\n'.join(cleaned_lines)
+
+
+def is_session_file(path: str) -> bool:
+    # Sessions are identified by extension. Skip hidden/temporary files
+    name = os.path.basename(path)
+    return not name.startswith(".") and name.lower().endswith(SESSION_EXTENSIONS)
+
+
+def find_sessions(root_dir: str, recursive: bool = True) -> list:
+    """
+    Collect every session file below a directory.
+
+    :param root_dir: Directory to search.
+    :param recursive: Descend into sub-directories.
+    :return: Sorted list of session file paths.
+    """
+    session_paths = []
+    if recursive:
+        for dir_path, dir_names, file_names in os.walk(root_dir):
+            # Don't walk into hidden folders (caches, manifests)
+            dir_names[:] = [d for d in dir_names if not d.startswith(".")]
+            for file_name in file_names:
+                path = os.path.join(dir_path, file_name)
+                if is_session_file(path):
+                    session_paths.append(path)
+    else:
+        for file_name in os.listdir(root_dir):
+            path = os.path.join(root_dir, file_name)
+            if os.path.isfile(path) and is_session_file(path):
+                session_paths.append(path)
+
+    return sorted(session_paths)
+
+
+def hash_file(path: str) -> str:
+    """
+    Content hash of a file, read in fixed size blocks.
+
+    :param path: File to hash.
+    :return: Hex digest string.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cached_hash(path: str, cache_dir: str) -> str:
+    """
+    hash_file, remembered per path in <cache_dir>/hashes.json. The file is
+    only hashed again when its size or modification time change, like the
+    manifest check of the batch tool.
+
+    :param path: File to hash.
+    :param cache_dir: Folder of the hash index.
+    :return: Hex digest string.
+    """
+    index_path = os.path.join(cache_dir, HASH_INDEX_NAME)
+    try:
+        with open(index_path, "r") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    key = os.path.abspath(path)
+    stat = os.stat(path)
+    record = index.get(key)
+    if record is not None and record["size"] == stat.st_size and record["mtime"] == stat.st_mtime:
+        return record["hash"]
+
+    content_hash = hash_file(path)
+    index[key] = {"hash": content_hash, "size": stat.st_size, "mtime": stat.st_mtime}
+    # Workers may update the index at the same time, each through its own temp
+    # file. A lost entry only costs hashing that file again
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp_path, index_path)
+    return content_hash
+
+
+def is_binary_session(path: str) -> bool:
+    return path.lower().endswith(BINARY_SESSION_EXTENSION)
+
+
+def encode_session_header(metadata: dict) -> bytes:
+    # Header written once at the start of a binary session file
+    meta_bytes = json.dumps(metadata).encode("utf-8")
+    return SESSION_HEADER.pack(SESSION_MAGIC, SESSION_VERSION, len(meta_bytes)) + meta_bytes
+
+
+def read_session_header(path: str):
+    """
+    Read the header of a binary session file.
+
+    :param path: Path to the .swimu file.
+    :return: (metadata dict, offset of the first record, number of complete records)
+    """
+    with open(path, "rb") as f:
+        magic, version, meta_length = SESSION_HEADER.unpack(f.read(SESSION_HEADER.size))
+        if magic != SESSION_MAGIC:
+            raise ValueError(f"{path} is not a SwIMU session file")
+        if version > SESSION_VERSION:
+            raise ValueError(f"Unsupported session file version {version} in {path}")
+        metadata = json.loads(f.read(meta_length).decode("utf-8"))
+
+    data_offset = SESSION_HEADER.size + meta_length
+    # Ignore a partially written record at the end of the file
+    num_records = (os.path.getsize(path) - data_offset) // RECORD_SIZE
+    return metadata, data_offset, num_records
+
+
+def read_binary_session(path: str):
+    """
+    Map the samples of a binary session file without reading it into memory.
+
+    :param path: Path to the .swimu file.
+    :return: Read-only (n, 7) float32 memmap of the complete records.
+    """
+    import numpy as np
+
+    metadata, data_offset, num_records = read_session_header(path)
+    if num_records == 0:
+        return np.empty((0, NUM_FIELDS), dtype="<f4")
+    return np.memmap(path, dtype="<f4", mode="r", offset=data_offset,
+                     shape=(num_records, NUM_FIELDS))
+
+
+def is_device_recording(path: str) -> bool:
+    return path.lower().endswith(DEVICE_RECORDING_EXTENSION)
+
+
+def read_device_header(data: bytes) -> dict:
+    """
+    Parse the header of a binary device recording.
+
+    :param data: The file contents, or at least its first DEVICE_HEADER.size bytes.
+    :return: Header fields as a dict.
+    """
+    if len(data) < DEVICE_HEADER.size:
+        raise ValueError("Too short for a SwIMU device recording")
+    (magic, version, header_size, record_size, sample_rate, accel_scale, gyro_scale,
+     start_millis, name) = DEVICE_HEADER.unpack_from(data)
+    if magic != DEVICE_MAGIC:
+        raise ValueError("Not a SwIMU device recording")
+    if version > DEVICE_VERSION:
+        raise ValueError(f"Unsupported device recording version {version}")
+    if record_size != DEVICE_RECORD_SIZE:
+        raise ValueError(f"Unexpected device record size {record_size}")
+    return {
+        "version": version,
+        "header_size": header_size,
+        "record_size": record_size,
+        "sample_rate": sample_rate,
+        "accel_scale": accel_scale,
+        "gyro_scale": gyro_scale,
+        "start_millis": start_millis,
+        "name": name.split(b"\0", 1)[0].decode("utf-8", errors="replace"),
+    }
+
+
+def decode_device_recording(data):
+    """
+    Decode a binary device recording into a sample block.
+
+    :param data: The file contents (bytes, bytearray or memmap).
+    :return: (header dict, (n, 7) float32 block in the HEADERS layout). A
+        partial record at the end is ignored.
+    """
+    import numpy as np
+
+    header = read_device_header(bytes(data[:DEVICE_HEADER.size]))
+    count = (len(data) - header["header_size"]) // DEVICE_RECORD_SIZE
+    records = np.frombuffer(data, dtype=np.dtype(DEVICE_RECORD_FIELDS), count=max(count, 0),
+                            offset=header["header_size"])
+    return header, _device_block(records, header)
+
+
+def _device_block(records, header: dict):
+    # Scale raw device records into an (n, 7) float32 block
+    import numpy as np
+
+    block = np.empty((len(records), NUM_FIELDS), dtype="<f4")
+    block[:, 0] = records["elapsed_ms"] / np.float32(1000)
+    np.multiply(records["accel"], np.float32(header["accel_scale"]), out=block[:, 1:4])
+    np.multiply(records["gyro"], np.float32(header["gyro_scale"]), out=block[:, 4:7])
+    return block
+
+
+def read_device_recording(path: str):
+    """
+    Decode a binary device recording from disk (memory mapped).
+
+    :return: (header dict, (n, 7) float32 block)
+    """
+    import numpy as np
+
+    if os.path.getsize(path) < DEVICE_HEADER.size:
+        raise ValueError(f"{path} is too short for a SwIMU device recording")
+    return decode_device_recording(np.memmap(path, dtype="u1", mode="r"))
+
+
+def read_session_rows(path: str, start: int, stop: int):
+    """
+    Rows start:stop of a binary session or device recording. Only that part
+    of the file is read.
+
+    :return: (n, 7) float array, shorter if the session ends first.
+    """
+    import numpy as np
+
+    if is_binary_session(path):
+        return np.asarray(read_binary_session(path)[start:stop], dtype=float)
+    if not is_device_recording(path):
+        raise ValueError(f"{path} is not a binary session")
+    with open(path, "rb") as f:
+        header = read_device_header(f.read(DEVICE_HEADER.size))
+        count = max((os.path.getsize(path) - header["header_size"]) // DEVICE_RECORD_SIZE, 0)
+        start, stop = min(max(start, 0), count), min(max(stop, 0), count)
+        f.seek(header["header_size"] + start * DEVICE_RECORD_SIZE)
+        data = f.read(max(stop - start, 0) * DEVICE_RECORD_SIZE)
+    records = np.frombuffer(data, dtype=np.dtype(DEVICE_RECORD_FIELDS))
+    return _device_block(records, header).astype(float)
+
+
+def load_session(path: str, clean: bool = True):
+    """
+    Load a recorded session into a pandas DataFrame with the HEADERS columns.
+
+    :param path: Path to the session CSV, binary session or device recording.
+    :param clean: Run clean_csv_data on the file first to drop corrupted rows.
+        Binary sessions don't need cleaning.
+    :return: DataFrame of float columns.
+    """
+    import io
+    import pandas as pd
+
+    if is_binary_session(path):
+        return pd.DataFrame(read_binary_session(path).astype(float), columns=HEADERS)
+    if is_device_recording(path):
+        return pd.DataFrame(read_device_recording(path)[1].astype(float), columns=HEADERS)
+
+    if clean:
+        with open(path, "r", errors="replace") as f:
+            source = io.StringIO(clean_csv_data(f.read(), verbose=False))
+    else:
+        source = path
+
+    try:
+        return pd.read_csv(source, header=None, names=HEADERS, dtype=float)
+    except ValueError:
+        # A field that doesn't parse (e.g. "0.1.2" from merged writes) fails
+        # the whole read, parse again row by row and drop those rows
+        import numpy as np
+        with open(path, "r", errors="replace") as f:
+            return pd.DataFrame(_parse_lines(f.readlines(), clean, np), columns=HEADERS)
+
+
+def iter_session_chunks(path: str, chunk_rows: int = 100_000, clean: bool = True):
+    """
+    Stream a session as numpy arrays of at most chunk_rows samples so large
+    files can be processed with bounded memory.
+
+    :param path: Path to the session CSV, binary session or device recording.
+    :param chunk_rows: Maximum number of rows per chunk.
+    :param clean: Drop corrupted rows before parsing.
+    :return: Generator of (n, 7) float arrays.
+    """
+    import numpy as np
+
+    if is_binary_session(path):
+        samples = read_binary_session(path)
+        for start in range(0, len(samples), chunk_rows):
+            yield np.asarray(samples[start:start + chunk_rows], dtype=float)
+        return
+    if is_device_recording(path):
+        samples = read_device_recording(path)[1]
+        for start in range(0, len(samples), chunk_rows):
+            yield samples[start:start + chunk_rows].astype(float)
+        return
+
+    lines = []
+    with open(path, "r", errors="replace") as f:
+        for line in f:
+            lines.append(line)
+            if len(lines) >= chunk_rows:
+                yield _parse_lines(lines, clean, np)
+                lines = []
+    if lines:
+        yield _parse_lines(lines, clean, np)
+
+
+def _parse_lines(lines: list, clean: bool, np):
+    text = "".join(lines)
+    if clean:
+        text = clean_csv_data(text, verbose=False)
+    rows = [line.split(",") for line in text.splitlines() if line.strip()]
+    if not rows:
+        return np.empty((0, NUM_FIELDS), dtype=float)
+    try:
+        return np.array(rows, dtype=float).reshape(-1, NUM_FIELDS)
+    except ValueError:
+        pass
+    # Some row has a field that doesn't parse or the wrong number of fields,
+    # drop those rows like SwIMU_ingest.parse_range does
+    values = []
+    for row in rows:
+        if len(row) != NUM_FIELDS:
+            continue
+        try:
+            values.append([float(field) for field in row])
+        except ValueError:
+            continue
+    return np.array(values, dtype=float).reshape(-1, NUM_FIELDS)
@@ -0,0 +1,124 @@
+# Host side cache of the GATT layout of each SwIMU device, so reconnects can
+# skip full service discovery. This file is part of the SwIMU device tutorial
+# series
+
+"""
+Every connection used to start with a full discovery of the device's
+services, characteristics and descriptors before the config, IMU or file
+characteristics could be used. Offload and live sessions reconnect often,
+and discovery is most of the connect time.
+
+Firmware with this feature advertises its version and GATT layout revision
+as manufacturer data (company id 0xFFFF, "SW", major, minor, patch, layout).
+After each connection the client saves the discovered layout per device
+address in ~/.swimu/gatt/<address>.json together with that version. On the
+next connection the saved layout is trusted when the device still
+advertises the same firmware version and the advertised service is part of
+the layout, and the backend is asked to use its own cache:
+
+    - BlueZ (Linux): bleak's dangerous_use_bleak_cache, services come from
+      BlueZ's database without waiting for a fresh resolve
+    - WinRT (Windows): use_cached_services, the GATT cache of Windows
+    - CoreBluetooth (macOS) caches on its own, nothing to switch on
+
+The layout found after connecting is checked against the saved one. If it
+doesn't match, the cache is dropped and services are discovered again.
+Devices without the manufacturer data are never cached.
+"""
+
+import json
+import os
+import re
+import time
+
+CACHE_DIR = os.environ.get("SWIMU_GATT_CACHE", os.path.join(os.path.expanduser("~"), ".swimu", "gatt"))
+# Manufacturer data of the SwIMU advertisement. 0xFFFF is the id reserved
+# for devices without a Bluetooth SIG company id
+COMPANY_ID = 0xFFFF
+ADV_MAGIC = b"SW"
+
+
+def firmware_version(advertisement) -> str:
+    """
+    Firmware version advertised by a SwIMU device.
+
+    :param advertisement: bleak AdvertisementData.
+    :return: "major.minor.patch+gatt<layout>", or None for older firmware.
+    """
+    data = (getattr(advertisement, "manufacturer_data", None) or {}).get(COMPANY_ID)
+    if data is None or len(data) < 6 or data[:2] != ADV_MAGIC:
+        return None
+    major, minor, patch, layout = data[2:6]
+    return f"{major}.{minor}.{patch}+gatt{layout}"
+
+
+def describe_services(services) -> dict:
+    """
+    JSON friendly copy of a bleak service collection.
+
+    :return: {service uuid: {"handle", "characteristics": {uuid: {"handle", "properties"}}}}
+    """
+    layout = {}
+    for service in services:
+        layout[service.uuid.lower()] = {
+            "handle": service.handle,
+            "characteristics": {char.uuid.lower(): {"handle": char.handle, "properties": sorted(char.properties)}
+                                for char in service.characteristics},
+        }
+    return layout
+
+
+class GattCache:
+    """
+    Saved GATT layout of one device.
+
+    :param address: Device address.
+    :param cache_dir: Folder of the per device files.
+    """
+
+    def __init__(self, address: str, cache_dir: str = CACHE_DIR):
+        self.address = address
+        # Addresses are "AA:BB:..." or a UUID on macOS, keep them file name safe
+        self.path = os.path.join(cache_dir, re.sub(r"[^\w.-]", "-", address) + ".json")
+        self.record = self._load()
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            # A damaged cache only costs a full discovery
+            print(f"Ignoring unreadable GATT cache {self.path}: {e}")
+            return None
+
+    def is_valid(self, firmware: str, advertised_services: list) -> bool:
+        # The saved layout can be used for a device advertising this
+        record = self.record
+        return (record is not None and firmware is not None and record["firmware"] == firmware
+                and all(uuid.lower() in record["services"] for uuid in advertised_services))
+
+    def matches(self, layout: dict, advertised_services: list) -> bool:
+        # The services of the current mode are where the cache says they are
+        return self.record is not None and all(
+            layout.get(uuid.lower()) == self.record["services"].get(uuid.lower())
+            for uuid in advertised_services)
+
+    def update(self, firmware: str, layout: dict):
+        # Save a freshly discovered layout, only for devices that say which
+        # firmware they run so the cache can be checked next time
+        if firmware is None or not layout:
+            return
+        if self.record is not None and self.record["firmware"] == firmware and self.record["services"] == layout:
+            return
+        self.record = {"address": self.address, "firmware": firmware, "services": layout, "saved": time.time()}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(self.record, f, indent=1)
+        os.replace(self.path + ".tmp", self.path)
+
+    def invalidate(self):
+        self.record = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
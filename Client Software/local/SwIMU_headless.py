@@ -0,0 +1,359 @@
+# Headless command line service for the SwIMU device. Connects, configures,
+# streams, records and offloads without PyQt. This file is part of the SwIMU
+# device tutorial series
+
+"""
+The GUI client needs a display, but the acquisition box on the pool deck
+doesn't have one. This service drives the same SwIMUClient as the GUI from a
+plain asyncio event loop:
+
+    python SwIMU_headless.py scan
+    python SwIMU_headless.py run --out D:/swims --name Sam --activity Freestyle
+    python SwIMU_headless.py run --out D:/swims --loop      # serve devices forever
+    python SwIMU_headless.py replay session.swimu --speed 4 --publish
+    python SwIMU_headless.py config roster.csv              # configure a squad
+
+"run" waits for a SwIMU device and handles whichever mode it advertises
+(selected with the device button, like with the GUI):
+
+    - config: writes --name/--activity and the current time to the device
+    - live data: records a .swimu session in --out, optionally echoing CSV
+      lines to stdout or a file with --csv, until --duration runs out or
+      Ctrl+C is pressed. With --publish the samples are also served to local
+      subscribers (see SwIMU_pubsub), with --shm they are shared with analytics
+      processes through shared memory (see SwIMU_shm), with --classify the
+      stroke type is printed whenever it changes (see SwIMU_classify). With
+      --profile the stream is profiled from the start; either way SIGUSR1
+      toggles the profiler (see SwIMU_profiler)
+    - file transfer: offloads all recorded files into --out
+
+"config" configures many devices at once from a roster CSV with the columns
+address, name and activity (addresses are listed by "scan"). Put the devices
+in config mode first; they are connected to a few at a time and the connect
+and config time of each one is reported.
+
+Nothing in here imports PyQt, so start up is quick and the memory footprint
+small.
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import signal
+import sys
+import time
+
+from SwIMU_client import (SwIMUClient, scan, discover_devices, TARGET_DEVICE, CONFIG_SERVICE_UUID,
+                          IMU_TX_SERVICE_UUID, FILE_TX_SERVICE_UUID)
+
+# Time [s] to keep scanning for a device before giving up (without --loop)
+DEFAULT_SCAN_TIMEOUT = 60
+# Devices configured at the same time. BLE adapters only handle a few
+# simultaneous connections reliably
+DEFAULT_CONFIG_CONCURRENCY = 3
+
+
+def advertises(device_info, service_uuid: str) -> bool:
+    return any(service_uuid in uuid for uuid in device_info[1].service_uuids)
+
+
+async def wait_for_device(timeout: float = None):
+    # Scan repeatedly until a SwIMU device advertising one of its modes shows up
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while deadline is None or time.monotonic() < deadline:
+        device_info = await scan(TARGET_DEVICE)
+        if device_info is not None and device_info[1].service_uuids:
+            return device_info
+        await asyncio.sleep(1)
+    return None
+
+
+class CSVSink:
+    # Writes decoded sample blocks as CSV lines, used as a SwIMUClient data callback
+
+    def __init__(self, path: str):
+        self.file = sys.stdout if path == "-" else open(path, "a", buffering=1 << 16)
+
+    def __call__(self, block):
+        self.file.write("\n".join(", ".join(f"{value:.3f}" for value in row) for row in block.tolist()) + "\n")
+
+    def close(self):
+        self.file.flush()
+        if self.file is not sys.stdout:
+            self.file.close()
+
+
+async def stream(client: SwIMUClient, args, stop_event: asyncio.Event):
+    # Live mode: record until the duration runs out or we're asked to stop
+    client.record_live_sessions = not args.no_record
+    if getattr(args, "sync_interval", None) is not None:
+        client.clock_sync_interval = args.sync_interval
+    csv_sink = CSVSink(args.csv) if args.csv else None
+    if csv_sink is not None:
+        client.data_callbacks.append(csv_sink)
+    publisher = None
+    if args.publish is not None or args.publish_unix:
+        from SwIMU_pubsub import IMUPublisher
+        publisher = await IMUPublisher(port=args.publish, unix_path=args.publish_unix,
+                                       drop_policy=args.drop_policy).start()
+        client.data_callbacks.append(publisher.publish)
+    ring = None
+    if args.shm:
+        from SwIMU_shm import SharedRing
+        ring = SharedRing.create(args.shm)
+        client.data_callbacks.append(ring.write)
+    if args.classify is not None:
+        # A bare --classify gives "", which load_model reads as the default model
+        from SwIMU_classify import LiveClassifier, load_model, print_label
+        client.data_callbacks.append(LiveClassifier(load_model(args.classify), on_label=print_label))
+
+    import SwIMU_profiler as profiler
+    profiler.set_session_source(lambda: os.path.basename(client.recorder.path) if client.recorder else client.address)
+    try:
+        profiler.install_signal_toggle(asyncio.get_running_loop(), args.trace_memory)
+    except (NotImplementedError, AttributeError):
+        pass
+    if args.profile:
+        profiler.start(args.trace_memory)
+
+    client.data_tx_is_active = True
+    rx_task = asyncio.create_task(client.rx_IMU_readings_mode())
+    try:
+        stop_wait = asyncio.create_task(stop_event.wait())
+        await asyncio.wait([rx_task, stop_wait], timeout=args.duration,
+                           return_when=asyncio.FIRST_COMPLETED)
+        stop_wait.cancel()
+    finally:
+        # Let rx_IMU_readings_mode send END and close the recorder
+        client.data_tx_is_active = False
+        try:
+            await rx_task
+        finally:
+            # rx_task raises again if the stream failed (e.g. a disconnect),
+            # the sinks and the shared memory block must be released anyway
+            profiler.stop()
+            if csv_sink is not None:
+                csv_sink.close()
+            if publisher is not None:
+                await publisher.stop()
+            if ring is not None:
+                client.data_callbacks.remove(ring.write)
+                ring.close()
+                ring.unlink()
+
+
+async def serve_device(device_info, args, stop_event: asyncio.Event):
+    address = device_info[0].address
+    print(f"Connecting to address: {address}")
+    connect_start = time.perf_counter()
+
+    async with SwIMUClient(device_info[0], timeout=20, advertisement=device_info[1]) as client:
+        client.save_dir = args.out
+        print(f"Device Connected in {time.perf_counter() - connect_start:.2f}s")
+
+        if advertises(device_info, CONFIG_SERVICE_UUID):
+            if not (args.name and args.activity):
+                print("Device is in config mode but --name/--activity weren't given. Skipping")
+                return
+            client.config_entries = {"Name": args.name, "Activity": args.activity}
+            await client.config_device()
+
+        elif advertises(device_info, IMU_TX_SERVICE_UUID):
+            await stream(client, args, stop_event)
+
+        elif advertises(device_info, FILE_TX_SERVICE_UUID):
+            client.file_tx_is_active = True
+            await client.file_rx_mode()
+
+
+def load_roster(path: str) -> list:
+    # Roster CSV with address, name and activity columns (any case)
+    with open(path, newline="") as f:
+        rows = [{key.strip().lower(): (value or "").strip() for key, value in row.items() if key}
+                for row in csv.DictReader(f)]
+    for row in rows:
+        missing = [column for column in ("address", "name", "activity") if not row.get(column)]
+        if missing:
+            raise ValueError(f"Roster row {row} is missing {', '.join(missing)}")
+    return rows
+
+
+async def configure_entry(device_info, entry: dict, semaphore: asyncio.Semaphore) -> dict:
+    # Configure one device from its roster entry and time each step
+    result = dict(entry, connect_s=None, config_s=None, file_name=None, error=None)
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            async with SwIMUClient(device_info[0], timeout=20, advertisement=device_info[1]) as client:
+                connected = time.perf_counter()
+                result["connect_s"] = connected - start
+                client.config_entries = {"Name": entry["name"], "Activity": entry["activity"]}
+                result["file_name"] = await client.config_device()
+                result["config_s"] = time.perf_counter() - connected
+        except Exception as e:
+            result["error"] = str(e)
+        result["total_s"] = time.perf_counter() - start
+    return result
+
+
+async def configure_roster(args):
+    roster = load_roster(args.roster)
+    wanted = {entry["address"].upper(): entry for entry in roster}
+
+    # Keep scanning until every device on the roster is advertising config mode
+    found = {}
+    deadline = time.monotonic() + args.scan_timeout
+    while len(found) < len(wanted) and time.monotonic() < deadline:
+        for address, device_info in (await discover_devices()).items():
+            if address.upper() in wanted and advertises(device_info, CONFIG_SERVICE_UUID):
+                found[address.upper()] = device_info
+    print(f"Found {len(found)}/{len(wanted)} roster devices in config mode")
+
+    start = time.perf_counter()
+    semaphore = asyncio.Semaphore(args.concurrency)
+    results = await asyncio.gather(*(configure_entry(found[address], wanted[address], semaphore)
+                                     for address in found))
+    elapsed = time.perf_counter() - start
+    results += [dict(entry, error="not found") for address, entry in wanted.items() if address not in found]
+
+    def fmt(seconds):
+        return "-" if seconds is None else f"{seconds:.2f}"
+
+    print(f"{'address':<20} {'name':<15} {'activity':<12} {'connect':>8} {'config':>8} {'total':>8}  result")
+    for result in results:
+        status = result["error"] or result["file_name"] or "unconfirmed"
+        print(f"{result['address']:<20} {result['name']:<15} {result['activity']:<12} "
+              f"{fmt(result.get('connect_s')):>8} {fmt(result.get('config_s')):>8} "
+              f"{fmt(result.get('total_s')):>8}  {status}")
+    num_ok = sum(1 for result in results if result["error"] is None)
+    print(f"Configured {num_ok}/{len(wanted)} devices in {elapsed:.2f}s")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0 if num_ok == len(wanted) else 1
+
+
+async def run(args):
+    os.makedirs(args.out, exist_ok=True)
+    stop_event = asyncio.Event()
+    try:
+        # Stop cleanly on Ctrl+C / SIGTERM so the recording gets closed
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+    except (NotImplementedError, AttributeError):
+        # Not available on Windows, KeyboardInterrupt ends the run instead
+        pass
+
+    while not stop_event.is_set():
+        device_info = await wait_for_device(None if args.loop else args.scan_timeout)
+        if device_info is None:
+            print("No SwIMU device found")
+            return 1
+        try:
+            await serve_device(device_info, args, stop_event)
+        except Exception as e:
+            print(f"Error while serving device: {e}")
+            if not args.loop:
+                return 1
+        if not args.loop:
+            break
+    return 0
+
+
+def add_stream_arguments(parser):
+    # Options for the consumers of live samples, shared by run and replay
+    parser.add_argument("--out", default=os.path.join(os.path.expanduser("~"), "Downloads"),
+                        help="folder for live recordings and offloaded files")
+    parser.add_argument("--duration", type=float, default=None,
+                        help="seconds to stream in live mode (default: until Ctrl+C)")
+    parser.add_argument("--csv", default=None,
+                        help="also write live samples as CSV to this file ('-' for stdout)")
+    parser.add_argument("--publish", type=int, nargs="?", const=8765, default=None,
+                        help="publish live samples on this local TCP port (default 8765)")
+    parser.add_argument("--publish-unix", default=None,
+                        help="publish live samples on this unix socket path")
+    parser.add_argument("--drop-policy", default="drop_oldest",
+                        choices=["drop_oldest", "drop_newest", "disconnect"],
+                        help="what to do when a subscriber falls behind")
+    parser.add_argument("--shm", nargs="?", const="swimu_live", default=None,
+                        help="share live samples in this shared memory block (default swimu_live)")
+    parser.add_argument("--classify", nargs="?", const="", default=None,
+                        help="print the stroke type as it changes, using this model (see SwIMU_classify)")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile the stream and write the results when it ends (see SwIMU_profiler)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="also trace allocations while profiling, slows streaming down")
+
+
+async def replay(args):
+    # Stream a recorded session to the same consumers as a live device
+    from SwIMU_replay import ReplayClient
+    stop_event = asyncio.Event()
+    try:
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+    except (NotImplementedError, AttributeError):
+        pass
+    async with ReplayClient(args.path, speed=args.speed, repeat=args.repeat) as client:
+        client.save_dir = args.out
+        await stream(client, args, stop_event)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless SwIMU client")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("scan", help="list nearby BLE devices")
+
+    run_parser = subparsers.add_parser("run", help="serve a SwIMU device in whatever mode it advertises")
+    add_stream_arguments(run_parser)
+    run_parser.add_argument("--name", help="swimmer name to write in config mode")
+    run_parser.add_argument("--activity", help="activity to write in config mode")
+    run_parser.add_argument("--no-record", action="store_true",
+                            help="don't write a .swimu recording in live mode")
+    run_parser.add_argument("--sync-interval", type=float, default=None,
+                            help="seconds between clock sync bursts while streaming, 0 to turn sync off")
+    run_parser.add_argument("--loop", action="store_true",
+                            help="keep serving devices until stopped")
+    run_parser.add_argument("--scan-timeout", type=float, default=DEFAULT_SCAN_TIMEOUT,
+                            help="seconds to look for a device before giving up")
+
+    config_parser = subparsers.add_parser("config", help="configure every device on a roster at once")
+    config_parser.add_argument("roster", help="CSV with address, name and activity columns")
+    config_parser.add_argument("--concurrency", type=int, default=DEFAULT_CONFIG_CONCURRENCY,
+                               help="devices configured at the same time")
+    config_parser.add_argument("--scan-timeout", type=float, default=20,
+                               help="seconds to look for the roster devices")
+    config_parser.add_argument("--report", default=None, help="write per device timings to this JSON file")
+
+    replay_parser = subparsers.add_parser("replay", help="stream a recorded session as if it were live")
+    replay_parser.add_argument("path", help="CSV or .swimu session")
+    add_stream_arguments(replay_parser)
+    replay_parser.add_argument("--speed", type=float, default=1.0,
+                               help="playback speed, 1 = real time, 0 = as fast as possible")
+    replay_parser.add_argument("--repeat", action="store_true", help="loop the session until stopped")
+    replay_parser.add_argument("--record", dest="no_record", action="store_false",
+                               help="write a .swimu recording of the replay")
+    replay_parser.set_defaults(no_record=True)
+
+    args = parser.parse_args(argv)
+    if args.command == "scan":
+        asyncio.run(scan(TARGET_DEVICE))
+        return 0
+    if args.command == "replay":
+        return asyncio.run(replay(args))
+    if args.command == "config":
+        return asyncio.run(configure_roster(args))
+    return asyncio.run(run(args))
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        sys.exit(130)
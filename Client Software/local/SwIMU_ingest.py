@@ -0,0 +1,345 @@
+# Parallel ingestion of legacy CSV recordings into binary SwIMU sessions.
+# This file is part of the SwIMU device tutorial series
+
+"""
+Converting a large backlog of text recordings (CSVs from write_to_file and
+raw dumps off the SD card) with clean_csv_data and pandas runs one Python
+line at a time. This tool splits each file into byte ranges that end on line
+boundaries, parses and validates the ranges in a process pool and writes the
+results in order into a binary .swimu session (see SwIMU_data), which the
+analysis tools can memory map. The ranges of all files share one pipeline,
+so a backlog of small files keeps every core busy too. Outputs keep the
+folders below each input folder:
+
+    python SwIMU_ingest.py <csv file or dir> [...] --out <dir> --workers 8
+
+Each range is parsed with one vectorized numpy call when all of its lines are
+valid, which is the common case. Ranges holding corrupted lines fall back to
+checking line by line. Rejected rows are counted by reason and written, with
+the throughput, to a <session>.ingest.json report next to each output.
+
+Recordings with a clock sync sidecar (<name>.sync.json, see SwIMU_sync) keep
+their clock fit in the session metadata. With --merge, the synced sessions
+of the run are then aligned onto host time and resampled onto one grid.
+Sessions that are already binary (live .swimu recordings, .bin files off the
+device) need no ingest and are passed straight to the merge:
+
+    python SwIMU_ingest.py heat1/ --out sessions/ --merge heat1.npz
+"""
+
+import argparse
+import collections
+import json
+import os
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from SwIMU_data import (BINARY_SESSION_EXTENSION, DEVICE_RECORDING_EXTENSION, NUM_FIELDS,
+                        encode_session_header)
+from SwIMU_sync import load_clock, merge_sessions
+
+# Size of the byte ranges handed to the workers
+CHUNK_BYTES = 8 << 20
+INGEST_EXTENSIONS = (".csv", ".txt")
+# Binary sessions, only used with --merge
+MERGE_EXTENSIONS = (BINARY_SESSION_EXTENSION, DEVICE_RECORDING_EXTENSION)
+REPORT_SUFFIX = ".ingest.json"
+# Reasons a row is rejected
+REJECT_REASONS = ("field_count", "parse_error")
+
+
+def split_ranges(path: str, chunk_bytes: int = CHUNK_BYTES) -> list:
+    """
+    Split a file into byte ranges that start and end on line boundaries.
+
+    :param path: Text file to split.
+    :param chunk_bytes: Approximate size of each range.
+    :return: List of (start, end) byte offsets covering the whole file.
+    """
+    size = os.path.getsize(path)
+    ranges = []
+    with open(path, "rb") as f:
+        start = 0
+        while start < size:
+            f.seek(min(start + chunk_bytes, size))
+            # Move the end forward to just past the next newline
+            f.readline()
+            end = min(f.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def parse_range(path: str, start: int, end: int):
+    """
+    Parse and validate the lines in one byte range.
+
+    :return: ((n, 7) float32 array, {reason: rejected row count}, number of lines)
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    lines = [line for line in data.replace(b"\r", b"").split(b"\n") if line.strip()]
+    rejected = dict.fromkeys(REJECT_REASONS, 0)
+
+    # Rows glued together or cut short by a dropped write have the wrong
+    # number of fields
+    good = [line for line in lines if line.count(b",") == NUM_FIELDS - 1]
+    rejected["field_count"] = len(lines) - len(good)
+
+    values = None
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            values = np.fromstring(b",".join(good), dtype="<f4", sep=",") if good else np.empty(0, "<f4")
+        if len(values) != len(good) * NUM_FIELDS:
+            values = None
+    except (ValueError, DeprecationWarning):
+        values = None
+
+    if values is None:
+        # Fields merged by corruption (e.g. "1.23-0.4.5") don't parse,
+        # check line by line
+        rows = []
+        for line in good:
+            try:
+                rows.append([float(x) for x in line.split(b",")])
+            except ValueError:
+                rejected["parse_error"] += 1
+        values = np.array(rows, dtype="<f4")
+
+    return values.reshape(-1, NUM_FIELDS), rejected, len(lines)
+
+
+def output_path(rel_path: str, out_dir: str) -> str:
+    # Keep the folders below the input, so sessions with the same name in
+    # different folders don't overwrite each other
+    return os.path.join(out_dir, os.path.splitext(rel_path)[0] + ".swimu")
+
+
+class _Ingest:
+    # Output side of one file in the pipeline
+
+    def __init__(self, src_path: str, dst_path: str, ranges: list):
+        self.src_path = src_path
+        self.dst_path = dst_path
+        self.ranges = ranges
+        self.start_time = time.perf_counter()
+        self.metadata = {"source": os.path.basename(src_path), "ingested": time.time()}
+        self.clock = load_clock(src_path)
+        if self.clock is not None:
+            self.metadata["clock"] = self.clock
+        self.rejected = dict.fromkeys(REJECT_REASONS, 0)
+        self.num_lines = 0
+        self.num_samples = 0
+        self.file = None
+
+    def write(self, samples, chunk_rejected: dict, chunk_lines: int):
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.dst_path) or ".", exist_ok=True)
+            self.file = open(self.dst_path + ".part", "wb", buffering=1 << 20)
+            self.file.write(encode_session_header(self.metadata))
+        self.file.write(samples.tobytes())
+        self.num_samples += len(samples)
+        self.num_lines += chunk_lines
+        for reason, count in chunk_rejected.items():
+            self.rejected[reason] += count
+
+    def finish(self) -> dict:
+        if self.file is None:
+            # Empty source, no ranges
+            self.write(np.empty((0, NUM_FIELDS), "<f4"), {}, 0)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.dst_path + ".part", self.dst_path)
+
+        elapsed = time.perf_counter() - self.start_time
+        size = os.path.getsize(self.src_path)
+        return {
+            "source": self.src_path,
+            "output": self.dst_path,
+            "lines": self.num_lines,
+            "samples": self.num_samples,
+            "rejected": self.rejected,
+            "rejected_fraction": (self.num_lines - self.num_samples) / self.num_lines if self.num_lines else 0.0,
+            "ranges": len(self.ranges),
+            "seconds": elapsed,
+            "mb_per_second": size / 1e6 / elapsed if elapsed > 0 else None,
+            "synced": self.clock is not None,
+        }
+
+
+def ingest_files(jobs: list, executor, chunk_bytes: int = CHUNK_BYTES, window: int = 16):
+    """
+    Convert text recordings into binary sessions through one pipeline.
+
+    The ranges of all files go through the pool back to back, so a backlog
+    of small files keeps every worker busy, not just the ranges of the file
+    being written. Results are written in order as they come back.
+
+    :param jobs: List of (source path, .swimu path to write).
+    :param executor: Process pool that parses the ranges.
+    :param chunk_bytes: Approximate size of each range.
+    :param window: Ranges in flight at once, bounds memory use.
+    :return: Generator of report dicts, one per file in the order of jobs,
+        with row counts, rejected rows by reason and timing.
+    """
+    # (file, range) pairs in write order, split lazily so the first results
+    # don't wait for every file to be scanned
+    def ranges():
+        for src_path, dst_path in jobs:
+            ingest = _Ingest(src_path, dst_path, split_ranges(src_path, chunk_bytes))
+            if not ingest.ranges:
+                yield ingest, None
+            for byte_range in ingest.ranges:
+                yield ingest, byte_range
+
+    pending = ranges()
+    futures = collections.deque()
+    while True:
+        while len(futures) < window:
+            item = next(pending, None)
+            if item is None:
+                break
+            ingest, byte_range = item
+            future = executor.submit(parse_range, ingest.src_path, *byte_range) if byte_range else None
+            futures.append((ingest, byte_range, future))
+        if not futures:
+            return
+        ingest, byte_range, future = futures.popleft()
+        if future is not None:
+            ingest.write(*future.result())
+        if byte_range is None or byte_range == ingest.ranges[-1]:
+            yield ingest.finish()
+
+
+def ingest_file(src_path: str, dst_path: str, executor, chunk_bytes: int = CHUNK_BYTES,
+                window: int = 16) -> dict:
+    """
+    Convert one text recording into a binary session.
+
+    :return: Report dict, see ingest_files.
+    """
+    return next(ingest_files([(src_path, dst_path)], executor, chunk_bytes, window))
+
+
+def collect_sources(paths: list, extensions: tuple = INGEST_EXTENSIONS) -> list:
+    """
+    Recordings in the given files and folders. Raw dumps aren't always named
+    .csv, so files named on the command line are taken as they are.
+
+    :return: Sorted list of (path, path relative to the folder it was found
+        in, or the file name).
+    """
+    sources = {}
+    for path in paths:
+        if not os.path.isdir(path):
+            sources[path] = os.path.basename(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in files:
+                if name.lower().endswith(extensions) and not name.startswith("."):
+                    full_path = os.path.join(root, name)
+                    sources[full_path] = os.path.relpath(full_path, path)
+    return sorted(sources.items())
+
+
+def write_merged(session_paths: list, merge_path: str, rate: float = None):
+    # Align the synced sessions of a run and write them as one dataset
+    synced = [path for path in session_paths if load_clock(path) is not None]
+    if len(synced) < 2:
+        print(f"Need at least 2 synced sessions to merge, found {len(synced)}")
+        return None
+    merged = merge_sessions(synced, rate)
+    np.savez(merge_path, time=merged["time"], samples=merged["samples"],
+             devices=np.array(merged["devices"]), channels=np.array(merged["channels"]))
+    print(f"Merged {len(synced)} synced sessions into {len(merged['time'])} samples at "
+          f"{merged['rate']:.1f} Hz: {merge_path}")
+    return merged
+
+
+def run_ingest(paths: list, out_dir: str, workers: int = None, chunk_bytes: int = CHUNK_BYTES,
+               force: bool = False, merge_path: str = None) -> list:
+    os.makedirs(out_dir, exist_ok=True)
+    sources = collect_sources(paths, INGEST_EXTENSIONS + (MERGE_EXTENSIONS if merge_path else ()))
+    # Binary sessions are already in their final form, they only join the merge
+    binary = [path for path, rel_path in sources if path.lower().endswith(MERGE_EXTENSIONS)]
+    sources = [(path, rel_path) for path, rel_path in sources if path not in binary]
+    # A recording offloaded both ways is merged once, from the text copy
+    text_stems = {os.path.splitext(path)[0] for path, rel_path in sources}
+    binary = [path for path in binary if os.path.splitext(path)[0] not in text_stems]
+
+    # Two inputs can still map to one output, e.g. the same file name given
+    # from two folders, or a.csv next to a.txt. Refuse rather than overwrite
+    claimed = {}
+    for src_path, rel_path in sources:
+        dst_path = output_path(rel_path, out_dir)
+        if dst_path in claimed:
+            raise ValueError(f"{src_path} and {claimed[dst_path]} would both be written to {dst_path}")
+        claimed[dst_path] = src_path
+
+    jobs = []
+    for dst_path, src_path in claimed.items():
+        if (not force and os.path.exists(dst_path)
+                and os.path.getmtime(dst_path) >= os.path.getmtime(src_path)):
+            print(f"Up to date, skipping: {src_path}")
+            continue
+        jobs.append((src_path, dst_path))
+    outputs = binary + list(claimed)
+    workers = workers or os.cpu_count()
+    print(f"Ingesting {len(jobs)} files with {workers} workers")
+
+    reports = []
+    total_start = time.perf_counter()
+    total_bytes = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for report in ingest_files(jobs, executor, chunk_bytes, 2 * workers):
+            with open(report["output"] + REPORT_SUFFIX, "w") as f:
+                json.dump(report, f, indent=2)
+            reports.append(report)
+            total_bytes += os.path.getsize(report["source"])
+            rejected = ", ".join(f"{reason} {count}" for reason, count in report["rejected"].items())
+            print(f"{os.path.basename(report['source'])}: {report['samples']}/{report['lines']} rows kept "
+                  f"(rejected: {rejected}) in {report['seconds']:.2f}s, "
+                  f"{report['mb_per_second']:.1f} MB/s")
+
+    elapsed = time.perf_counter() - total_start
+    if reports:
+        lines = sum(r["lines"] for r in reports)
+        samples = sum(r["samples"] for r in reports)
+        print(f"Done: {len(reports)} files, {samples}/{lines} rows kept, "
+              f"{total_bytes / 1e6 / elapsed:.1f} MB/s overall")
+    if merge_path:
+        write_merged(outputs, merge_path)
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert CSV recordings to binary SwIMU sessions in parallel")
+    parser.add_argument("paths", nargs="+", help="CSV files, raw dumps or folders of them")
+    parser.add_argument("--out", required=True, help="folder for the .swimu sessions")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--chunk-mb", type=float, default=CHUNK_BYTES / (1 << 20),
+                        help="size of the pieces each file is split into")
+    parser.add_argument("--force", action="store_true", help="rebuild outputs that are up to date")
+    parser.add_argument("--merge", default=None,
+                        help="also align the synced sessions onto host time and write them to this .npz")
+    args = parser.parse_args(argv)
+
+    try:
+        run_ingest(args.paths, args.out, args.workers, int(args.chunk_mb * (1 << 20)), args.force, args.merge)
+    except ValueError as e:
+        print(e)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+# Host side record of the files received from each SwIMU device, so file
+# offload only transfers what the host doesn't have yet. This file is part of
+# the SwIMU device tutorial series
+
+"""
+The device decides what to send from its whiteList.txt and only clears it
+once every file has gone out. If the host crashes half way through, the next
+offload starts from the top and sends everything again. The client now keeps
+its own manifest per device in <save_dir>/.swimu_sync/<device>.json:
+
+    {file name: {"size": bytes, "hash": blake2b, "path": saved file, "received": time}}
+
+During file_rx_mode the device announces each file's name and size. Files
+the manifest already has with the same size, and whose saved copy is still
+on disk, are answered with SKIP instead of START, so re-syncing a docked
+device with nothing new only costs a few round trips per file. A transfer
+that comes back shorter than the announced size is not recorded and is sent
+again next time.
+
+    python SwIMU_manifest.py show ~/Downloads
+    python SwIMU_manifest.py verify ~/Downloads
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+MANIFEST_DIR = ".swimu_sync"
+
+
+def hash_bytes(data) -> str:
+    # Same digest as SwIMU_data.hash_file, over the bytes as received
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+class SyncManifest:
+    """
+    Files received from one device.
+
+    :param save_dir: Folder the received files are saved in.
+    :param device: Device address.
+    """
+
+    def __init__(self, save_dir: str, device: str):
+        self.save_dir = save_dir
+        self.device = device
+        # Addresses are "AA:BB:..." or a UUID on macOS, keep them file name safe
+        safe_name = re.sub(r"[^\w.-]", "-", device)
+        self.path = os.path.join(save_dir, MANIFEST_DIR, f"{safe_name}.json")
+        self.files = self._load()
+
+    def _load(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f).get("files", {})
+        except (OSError, ValueError) as e:
+            # A damaged manifest only costs a full transfer
+            print(f"Ignoring unreadable sync manifest {self.path}: {e}")
+            return {}
+
+    def save(self):
+        # Write to a temporary file and swap it in so a crash never leaves a
+        # half written manifest behind
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"device": self.device, "files": self.files}, f, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def has(self, file_name: str, size: int) -> bool:
+        # True if we already hold a complete copy of this file, or held one
+        # that retention has since compacted (see SwIMU_retention)
+        record = self.files.get(file_name)
+        return (record is not None and record["size"] == size
+                and (os.path.exists(record["path"]) or bool(record.get("archived"))))
+
+    def record(self, file_name: str, data, path: str):
+        """
+        Add a received file and save the manifest.
+
+        :param file_name: Name the device sent the file under.
+        :param data: The bytes as received.
+        :param path: Where the file was saved.
+        """
+        self.files[file_name] = {
+            "size": len(data),
+            "hash": hash_bytes(data),
+            "path": os.path.abspath(path),
+            "received": time.time(),
+        }
+        self.save()
+
+
+def load_manifests(save_dir: str) -> list:
+    manifest_dir = os.path.join(save_dir, MANIFEST_DIR)
+    if not os.path.isdir(manifest_dir):
+        return []
+    manifests = []
+    for name in sorted(os.listdir(manifest_dir)):
+        if name.endswith(".json"):
+            with open(os.path.join(manifest_dir, name), "r") as f:
+                device = json.load(f).get("device", name[:-5])
+            manifests.append(SyncManifest(save_dir, device))
+    return manifests
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect the record of files received from SwIMU devices")
+    parser.add_argument("command", choices=["show", "verify"])
+    parser.add_argument("save_dir", nargs="?", default=os.path.join(os.path.expanduser("~"), "Downloads"))
+    args = parser.parse_args(argv)
+
+    manifests = load_manifests(args.save_dir)
+    if not manifests:
+        print(f"No devices synced into {args.save_dir}")
+    for manifest in manifests:
+        total = sum(record["size"] for record in manifest.files.values())
+        print(f"{manifest.device}: {len(manifest.files)} files, {total / 1e6:.1f} MB")
+        if args.command == "show":
+            for file_name, record in sorted(manifest.files.items()):
+                received = time.strftime("%Y-%m-%d %H:%M", time.localtime(record["received"]))
+                print(f"  {file_name}  {record['size']} bytes  {received}")
+            continue
+        # Saved CSVs are cleaned, so only binary recordings can be checked
+        # against the received hash
+        for file_name, record in sorted(manifest.files.items()):
+            if record.get("archived"):
+                continue
+            if not os.path.exists(record["path"]):
+                print(f"  missing: {record['path']}")
+            elif record["path"].lower().endswith(".bin"):
+                with open(record["path"], "rb") as f:
+                    if hash_bytes(f.read()) != record["hash"]:
+                        print(f"  changed since received: {record['path']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+# Lightweight counters, gauges, histograms and timers for the SwIMU client.
+# This file is part of the SwIMU device tutorial series
+
+"""
+A small instrumentation layer for the hot paths of the client: BLE
+notifications, parsing, the Qt signal queue, plotting, file transfers and
+disk writes. Metrics are created once at module level and updated in place:
+
+    import SwIMU_metrics as metrics
+
+    PARSE_TIME = metrics.histogram("imu_parse_seconds", "Time to decode one notification")
+
+    with PARSE_TIME.time():
+        ...
+
+Collection is off by default. While disabled every update returns after a
+single flag check, so leaving the calls in the hot paths costs next to
+nothing. Enable with the SWIMU_METRICS=1 environment variable, the
+Diagnostics panel in MainWindow, or metrics.enable().
+
+The current values can be exported as JSON or in the Prometheus text
+exposition format for scraping by a monitoring system.
+"""
+
+import bisect
+import json
+import math
+import os
+import threading
+import time
+
+# Default histogram buckets [s], from 10 us up to 10 s
+TIME_BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 10.0)
+
+
+class _State:
+    # Shared switch checked by every metric update
+    enabled = os.environ.get("SWIMU_METRICS", "0") == "1"
+
+
+class _NullTimer:
+    # Returned by Histogram.time() while metrics are disabled
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text=""):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+
+    def inc(self, amount=1):
+        if _State.enabled:
+            self.value += amount
+
+    def reset(self):
+        self.value = 0
+
+    def snapshot(self):
+        return {"value": self.value}
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, help_text=""):
+        self.name = name
+        self.help = help_text
+        self.value = 0.0
+
+    def set(self, value):
+        if _State.enabled:
+            self.value = value
+
+    def reset(self):
+        self.value = 0.0
+
+    def snapshot(self):
+        return {"value": self.value}
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text="", buckets=TIME_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def observe(self, value):
+        if not _State.enabled:
+            return
+        # Observations come from the BLE, GUI and writer threads
+        with self._lock:
+            self.bucket_counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self.min = min(self.min, value)
+            self.max = max(self.max, value)
+
+    def time(self):
+        """Context manager observing the time spent in its block [s]."""
+        return _Timer(self) if _State.enabled else _NULL_TIMER
+
+    def reset(self):
+        # The last bucket counts values above the largest bound (+Inf)
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th quantile
+        if self.count == 0:
+            return math.nan
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), self.bucket_counts):
+            cumulative += count
+            if cumulative >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "p50": self.quantile(0.5) if self.count else None,
+            "p99": self.quantile(0.99) if self.count else None,
+            "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.bucket_counts)),
+        }
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, **kwargs):
+        # Return the existing metric so modules can declare the same name
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = cls(name, help_text, **kwargs)
+                self.metrics[name] = metric
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric {name} already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, help_text=""):
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name, help_text=""):
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name, help_text="", buckets=TIME_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def reset(self):
+        for metric in self.metrics.values():
+            metric.reset()
+
+    def snapshot(self) -> dict:
+        return {name: {"type": metric.kind, **metric.snapshot()}
+                for name, metric in sorted(self.metrics.items())}
+
+    def to_json(self, **labels) -> str:
+        return json.dumps({"timestamp": time.time(), "enabled": _State.enabled,
+                           "labels": labels, "metrics": self.snapshot()}, indent=2)
+
+    def to_prometheus(self, prefix="swimu_") -> str:
+        # Prometheus text exposition format
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            full_name = prefix + name
+            if metric.help:
+                lines.append(f"# HELP {full_name} {metric.help}")
+            lines.append(f"# TYPE {full_name} {metric.kind}")
+            if metric.kind == "histogram":
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (math.inf,), metric.bucket_counts):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else repr(bound)
+                    lines.append(f'{full_name}_bucket{{le="{le}"}} {cumulative}')
+                lines.append(f"{full_name}_sum {metric.sum}")
+                lines.append(f"{full_name}_count {metric.count}")
+            else:
+                lines.append(f"{full_name} {metric.value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+
+def enabled() -> bool:
+    return _State.enabled
+
+
+def enable():
+    _State.enabled = True
+
+
+def disable():
+    _State.enabled = False
+
+
+CTX_SWITCHES_VOLUNTARY = gauge("process_context_switches_voluntary", "Voluntary context switches of the client process")
+CTX_SWITCHES_INVOLUNTARY = gauge("process_context_switches_involuntary", "Involuntary context switches of the client process")
+PROCESS_THREADS = gauge("process_threads", "Threads in the client process")
+
+
+def sample_process_stats():
+    # Context switch and thread counts, taken when metrics are shown or
+    # exported. psutil is optional, getrusage covers Linux and macOS
+    try:
+        import psutil
+        process = psutil.Process()
+        switches = process.num_ctx_switches()
+        voluntary, involuntary = switches.voluntary, switches.involuntary
+        threads = process.num_threads()
+    except ImportError:
+        try:
+            import resource
+        except ImportError:
+            return
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        voluntary, involuntary = usage.ru_nvcsw, usage.ru_nivcsw
+        threads = threading.active_count()
+    CTX_SWITCHES_VOLUNTARY.set(voluntary)
+    CTX_SWITCHES_INVOLUNTARY.set(involuntary)
+    PROCESS_THREADS.set(threads)
+
+
+def export(path: str, fmt: str = None, **labels):
+    """
+    Write the current metrics to a file.
+
+    :param path: Output path.
+    :param fmt: "json" or "prometheus", taken from the extension if None.
+    :param labels: Extra labels stored with a JSON export, e.g. session name.
+    """
+    fmt = fmt or ("json" if path.lower().endswith(".json") else "prometheus")
+    sample_process_stats()
+    text = REGISTRY.to_json(**labels) if fmt == "json" else REGISTRY.to_prometheus()
+    with open(path, "w") as f:
+        f.write(text)
@@ -0,0 +1,348 @@
+# On demand stack sampling and allocation tracing for the SwIMU client.
+# This file is part of the SwIMU device tutorial series
+
+"""
+When the plots stutter during a live session the metrics (SwIMU_metrics)
+show that a frame was slow, not where the time went: decoding notifications,
+the signal queue, redrawing or the recorder. The profiler answers that while
+the client keeps running:
+
+    import SwIMU_profiler as profiler
+
+    profiler.start()                   # or the Diagnostics panel, or SIGUSR1
+    ...
+    profiler.stop()                    # writes the results to profiler.OUT_DIR
+
+A sampling thread takes the stack of every other thread (GUI/BLE loop,
+recorder, CPU executor) a few hundred times a second and counts identical
+stacks. Nothing is hooked into the profiled code, so the cost is the sampling
+itself: tens of microseconds per sample, well under 1% of a core, reported in
+the profiler_sample_seconds metric.
+
+With memory=True tracemalloc runs alongside and compares the allocations at
+stop with those at start. It hooks every allocation and slows the client
+down several times over, enough to make live samples late, so it is off
+unless asked for.
+
+Each run writes to OUT_DIR (~/Downloads/swimu_profiles by default):
+
+    <time>-<session>.collapsed.txt   stacks in the collapsed format read by
+                                     flamegraph.pl, speedscope and inferno
+    <time>-<session>.alloc.txt       top allocation growth by source line
+    <time>-<session>.tracemalloc     the snapshot at stop, for later diffs
+                                     (these two with memory=True only)
+
+<session> is the active session when the run started. Its name is also the
+root frame of every stack, so runs that span several sessions split cleanly in
+a flamegraph. From the command line:
+
+    python main.py --profile                       # GUI, profile from start up
+    python SwIMU_headless.py run --profile --trace-memory
+    kill -USR1 <pid>                               # toggle a headless client
+    python SwIMU_profiler.py top run.collapsed.txt
+    python SwIMU_profiler.py diff old.tracemalloc new.tracemalloc
+"""
+
+import argparse
+import collections
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+import SwIMU_metrics as metrics
+
+DT_FMT = "%Y_%m_%d_%H_%M_%S"
+
+OUT_DIR = os.environ.get("SWIMU_PROFILE_DIR",
+                         os.path.join(os.path.expanduser("~"), "Downloads", "swimu_profiles"))
+# Time between stack samples [s]. Odd so it doesn't lock step with the
+# 50 ms plot timer
+SAMPLE_INTERVAL = 0.0047
+# Frames kept per stack, deeper stacks lose their outermost frames
+MAX_DEPTH = 64
+# Frames tracemalloc keeps per allocation
+TRACE_FRAMES = 8
+# Lines written to the allocation report
+ALLOC_TOP = 40
+
+SAMPLE_TIME = metrics.histogram("profiler_sample_seconds", "Time to sample the stacks of all threads")
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Counts the stacks of every thread in the process from a background thread.
+
+    :param interval: Time between samples [s].
+    :param session_source: Callable returning the active session name, or None.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL, session_source=None):
+        self.interval = interval
+        self.session_source = session_source
+        # (session, thread name, code objects root first) -> samples
+        self.counts = collections.Counter()
+        self.num_samples = 0
+        self.sample_time = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="StackSampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _session(self) -> str:
+        try:
+            return (self.session_source() if self.session_source else None) or "idle"
+        except Exception:
+            # The source reads client state that may be half torn down
+            return "idle"
+
+    def sample(self):
+        start = time.perf_counter()
+        own_id = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        session = self._session()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            # Code objects are hashable and cheap to collect, labels are only
+            # made when the results are written
+            stack = []
+            while frame is not None and len(stack) < MAX_DEPTH:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            stack.reverse()
+            self.counts[(session, names.get(thread_id, str(thread_id)), tuple(stack))] += 1
+        self.num_samples += 1
+        elapsed = time.perf_counter() - start
+        self.sample_time += elapsed
+        SAMPLE_TIME.observe(elapsed)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def collapsed(self) -> list:
+        # One "frame;frame;frame count" line per distinct stack
+        lines = collections.Counter()
+        for (session, thread_name, stack), count in self.counts.items():
+            frames = [session, thread_name] + [_frame_label(code) for code in stack]
+            lines[";".join(frame.replace(";", ":") for frame in frames)] += count
+        return [f"{stack} {count}" for stack, count in sorted(lines.items())]
+
+
+def _clean_snapshot(snapshot):
+    # Leave out the profiler's own and the import machinery's allocations
+    return snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ))
+
+
+def allocation_report(old, new, top: int = ALLOC_TOP) -> list:
+    """
+    Largest allocation growth between two tracemalloc snapshots.
+
+    :return: Report lines, biggest growth first.
+    """
+    stats = _clean_snapshot(new).compare_to(_clean_snapshot(old), "lineno")
+    total = sum(stat.size_diff for stat in stats)
+    lines = [f"Total growth: {total / 1024:.1f} KiB"]
+    for stat in stats[:top]:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size_diff / 1024:+10.1f} KiB {stat.count_diff:+8d} blocks  "
+                     f"{frame.filename}:{frame.lineno}")
+    return lines
+
+
+class Profiler:
+    """
+    Stack sampling plus allocation tracing, started and stopped on demand.
+
+    :param out_dir: Folder the results are written to.
+    :param session_source: Callable returning the active session name.
+    """
+
+    def __init__(self, out_dir: str = OUT_DIR, session_source=None):
+        self.out_dir = out_dir
+        self.session_source = session_source
+        self.sampler = None
+        self._baseline = None
+        self._started_tracing = False
+        self._tag = None
+        self._start_time = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self.sampler is not None
+
+    def start(self, memory: bool = False):
+        """
+        :param memory: Also trace allocations. Slows the whole client down.
+        """
+        with self._lock:
+            if self.running:
+                return
+            self.sampler = StackSampler(session_source=self.session_source)
+            self._tag = self.sampler._session()
+            self._start_time = time.perf_counter()
+            if memory:
+                # Leave tracing alone if someone else (PYTHONTRACEMALLOC) started it
+                self._started_tracing = not tracemalloc.is_tracing()
+                if self._started_tracing:
+                    tracemalloc.start(TRACE_FRAMES)
+                self._baseline = tracemalloc.take_snapshot()
+            self.sampler.start()
+            print(f"Profiling started ({self._tag}{', tracing allocations' if memory else ''})")
+
+    def stop(self) -> str:
+        """
+        Stop profiling and write the results.
+
+        :return: Common path prefix of the written files, None if not running.
+        """
+        with self._lock:
+            if not self.running:
+                return None
+            self.sampler.stop()
+            snapshot = None
+            if self._baseline is not None:
+                snapshot = tracemalloc.take_snapshot()
+                if self._started_tracing:
+                    tracemalloc.stop()
+                    self._started_tracing = False
+            sampler, self.sampler = self.sampler, None
+            duration = time.perf_counter() - self._start_time
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        tag = "".join(c if c.isalnum() or c in "-_" else "_" for c in self._tag)
+        prefix = os.path.join(self.out_dir, f"{datetime.now().strftime(DT_FMT)}-{tag}")
+        with open(prefix + ".collapsed.txt", "w") as f:
+            f.write("\n".join(sampler.collapsed()) + "\n")
+        if snapshot is not None:
+            with open(prefix + ".alloc.txt", "w") as f:
+                f.write(f"# session {self._tag}, {duration:.1f} s\n")
+                f.write("\n".join(allocation_report(self._baseline, snapshot)) + "\n")
+            snapshot.dump(prefix + ".tracemalloc")
+            self._baseline = None
+        overhead = sampler.sample_time / duration if duration > 0 else 0.0
+        print(f"Profiled {duration:.1f} s, {sampler.num_samples} samples "
+              f"({100 * overhead:.1f}% of one core), written to {prefix}.*")
+        return prefix
+
+    def toggle(self, memory: bool = False):
+        if self.running:
+            self.stop()
+        else:
+            self.start(memory)
+
+
+PROFILER = Profiler()
+
+
+def set_session_source(source):
+    # Callable returning the name of the active session, used to tag runs
+    PROFILER.session_source = source
+
+
+def running() -> bool:
+    return PROFILER.running
+
+
+def start(memory: bool = False):
+    PROFILER.start(memory)
+
+
+def stop() -> str:
+    return PROFILER.stop()
+
+
+def toggle(memory: bool = False):
+    PROFILER.toggle(memory)
+
+
+def install_signal_toggle(loop=None, memory: bool = False) -> bool:
+    """
+    Toggle the profiler with SIGUSR1, for clients without a window.
+
+    :param memory: Trace allocations in runs started by the signal.
+    :param loop: Running asyncio loop to handle the signal on, so the results
+        are written between callbacks rather than inside one.
+    :return: False where SIGUSR1 doesn't exist (Windows).
+    """
+    import signal
+    if not hasattr(signal, "SIGUSR1"):
+        return False
+    if loop is not None:
+        loop.add_signal_handler(signal.SIGUSR1, toggle, memory)
+    else:
+        signal.signal(signal.SIGUSR1, lambda signum, frame: toggle(memory))
+    return True
+
+
+def top_functions(path: str, top: int = 25) -> list:
+    """
+    Functions with the most samples in a collapsed stack file.
+
+    :return: List of (function, self samples, total samples), most self time first.
+    """
+    self_counts = collections.Counter()
+    total_counts = collections.Counter()
+    for line in open(path, "r"):
+        stack, _, count = line.rstrip("\n").rpartition(" ")
+        if not stack:
+            continue
+        # The session and thread name are the first two frames
+        frames = stack.split(";")[2:]
+        if not frames:
+            continue
+        count = int(count)
+        self_counts[frames[-1]] += count
+        for frame in set(frames):
+            total_counts[frame] += count
+    return [(frame, count, total_counts[frame]) for frame, count in self_counts.most_common(top)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read SwIMU profiler results")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    top_parser = subparsers.add_parser("top", help="functions with the most samples in a .collapsed.txt file")
+    top_parser.add_argument("path")
+    top_parser.add_argument("--count", type=int, default=25)
+    diff_parser = subparsers.add_parser("diff", help="allocation growth between two .tracemalloc snapshots")
+    diff_parser.add_argument("old")
+    diff_parser.add_argument("new")
+    diff_parser.add_argument("--count", type=int, default=ALLOC_TOP)
+    args = parser.parse_args(argv)
+
+    if args.command == "top":
+        rows = top_functions(args.path, args.count)
+        print(f"{'self':>7} {'total':>7}  function")
+        for frame, count, total_count in rows:
+            print(f"{count:7d} {total_count:7d}  {frame}")
+        return 0
+    old = tracemalloc.Snapshot.load(args.old)
+    new = tracemalloc.Snapshot.load(args.new)
+    print("\n".join(allocation_report(old, new, args.count)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
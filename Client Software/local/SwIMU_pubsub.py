@@ -0,0 +1,290 @@
+# Local publish/subscribe server for live SwIMU data, so several consumers
+# (coach view, recorder, analytics) can share one BLE stream.
+# This file is part of the SwIMU device tutorial series
+
+"""
+IMUPublisher is added to a SwIMUClient as a data callback. Samples are
+collected into batches (every FLUSH_INTERVAL seconds or MAX_BATCH samples),
+encoded once into a compact binary frame and the same bytes object is queued
+for every subscriber, so adding subscribers adds no decode or encode work.
+
+Frame layout (little-endian):
+
+    magic "SWIM" | version u8 | channels u8 | n_samples u16 | seq u32 |
+    host time [ns] u64 | n_samples x channels float32
+
+Batches of more than MAX_FRAME_SAMPLES samples are sent as several frames.
+
+Subscribers connect over TCP (default 127.0.0.1:8765) or a Unix socket.
+Each one has its own bounded queue so a slow consumer never holds up the BLE
+loop or the other subscribers. When a queue is full the drop policy decides
+what happens:
+
+    drop_oldest - discard the oldest queued frame (live views)
+    drop_newest - discard the new frame
+    disconnect  - close the subscriber (consumers that must see everything)
+
+Dropped frames show up as gaps in seq on the subscriber side.
+
+    python SwIMU_pubsub.py listen --port 8765     # print what arrives
+"""
+
+import argparse
+import asyncio
+import struct
+import sys
+import time
+
+import numpy as np
+
+import SwIMU_metrics as metrics
+from SwIMU_data import NUM_FIELDS
+
+FRAME_MAGIC = b"SWIM"
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("<4sBBHIQ")
+# Most samples the u16 count of one frame can hold
+MAX_FRAME_SAMPLES = 0xFFFF
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+FLUSH_INTERVAL = 0.02       # longest time a sample waits before being published [s]
+MAX_BATCH = 64              # samples per frame
+MAX_QUEUE = 256             # frames buffered per subscriber
+STOP_TIMEOUT = 1.0          # time subscribers get to receive their queued frames on stop [s]
+DROP_POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+
+FRAMES_PUBLISHED = metrics.counter("pubsub_frames_published_total", "Frames encoded by the publisher")
+FRAMES_DROPPED = metrics.counter("pubsub_frames_dropped_total", "Frames dropped for slow subscribers")
+SUBSCRIBERS = metrics.gauge("pubsub_subscribers", "Connected subscribers")
+
+
+def encode_frame(seq: int, samples) -> bytes:
+    records = np.asarray(samples, dtype="<f4").reshape(-1, NUM_FIELDS)
+    if len(records) > MAX_FRAME_SAMPLES:
+        raise ValueError(f"A frame holds at most {MAX_FRAME_SAMPLES} samples, got {len(records)}")
+    header = FRAME_HEADER.pack(FRAME_MAGIC, FRAME_VERSION, NUM_FIELDS, len(records),
+                               seq & 0xFFFFFFFF, time.time_ns())
+    return header + records.tobytes()
+
+
+def decode_frame_header(header: bytes):
+    magic, version, channels, num_samples, seq, host_time_ns = FRAME_HEADER.unpack(header)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise ValueError("Not a SwIMU frame")
+    return channels, num_samples, seq, host_time_ns
+
+
+class _Subscriber:
+    def __init__(self, writer, max_queue):
+        self.writer = writer
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.peer = writer.get_extra_info("peername") or "unix socket"
+        # Task running _handle_subscriber, awaited on stop
+        self.task = None
+
+
+class IMUPublisher:
+    """
+    Fan out live samples to local subscribers.
+
+    Usage (on the event loop running the BLE client):
+        publisher = IMUPublisher(port=8765)
+        await publisher.start()
+        client.data_callbacks.append(publisher.publish)
+        ...
+        await publisher.stop()
+    """
+
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, unix_path: str = None,
+                 max_queue: int = MAX_QUEUE, drop_policy: str = "drop_oldest",
+                 flush_interval: float = FLUSH_INTERVAL, max_batch: int = MAX_BATCH):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"drop_policy must be one of {DROP_POLICIES}")
+        self.host = host
+        self.port = port
+        self.unix_path = unix_path
+        self.max_queue = max_queue
+        self.drop_policy = drop_policy
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.seq = 0
+        self.subscribers = set()
+        self._pending = []
+        self._pending_samples = 0
+        self._server = None
+        self._flush_task = None
+
+    async def start(self):
+        if self.unix_path:
+            self._server = await asyncio.start_unix_server(self._handle_subscriber, path=self.unix_path)
+            print(f"Publishing live data on unix socket {self.unix_path}")
+        else:
+            self._server = await asyncio.start_server(self._handle_subscriber, self.host, self.port)
+            print(f"Publishing live data on {self.host}:{self.port}")
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        return self
+
+    async def stop(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        self.flush()
+        if self._server is not None:
+            # Stop accepting, then end every subscriber before wait_closed:
+            # from Python 3.12 it also waits for the open connections
+            self._server.close()
+            subscribers = list(self.subscribers)
+            for subscriber in subscribers:
+                # None after the queued frames ends the handler once they're
+                # sent. Always queued, a full queue loses its oldest frame
+                if subscriber.queue.full():
+                    subscriber.queue.get_nowait()
+                subscriber.queue.put_nowait(None)
+            tasks = [subscriber.task for subscriber in subscribers if subscriber.task is not None]
+            if tasks:
+                done, pending = await asyncio.wait(tasks, timeout=STOP_TIMEOUT)
+                # Subscribers too slow to take their last frames are cut off
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+            for subscriber in subscribers:
+                subscriber.writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    def publish(self, block):
+        """
+        Add a sample block (n x 7). Must be called from the publisher's event
+        loop, e.g. as a SwIMUClient data callback.
+        """
+        if not self.subscribers:
+            return
+        self._pending.append(block)
+        self._pending_samples += len(block)
+        if self._pending_samples >= self.max_batch:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        # Taken off before encoding, so a bad block can't wedge every later flush
+        pending = self._pending
+        self._pending = []
+        self._pending_samples = 0
+        samples = pending[0] if len(pending) == 1 else np.concatenate(pending)
+        # Encode once, every subscriber gets the same bytes object. A backlog
+        # bigger than one frame can hold goes out as several frames
+        for start in range(0, len(samples), MAX_FRAME_SAMPLES):
+            frame = encode_frame(self.seq, samples[start:start + MAX_FRAME_SAMPLES])
+            self.seq += 1
+            FRAMES_PUBLISHED.inc()
+            for subscriber in list(self.subscribers):
+                self._enqueue(subscriber, frame)
+
+    def _enqueue(self, subscriber, frame):
+        try:
+            subscriber.queue.put_nowait(frame)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        subscriber.dropped += 1
+        FRAMES_DROPPED.inc()
+        if self.drop_policy == "drop_oldest":
+            subscriber.queue.get_nowait()
+            subscriber.queue.put_nowait(frame)
+        elif self.drop_policy == "disconnect":
+            print(f"Disconnecting slow subscriber {subscriber.peer}")
+            self.subscribers.discard(subscriber)
+            subscriber.writer.close()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            self.flush()
+
+    async def _handle_subscriber(self, reader, writer):
+        subscriber = _Subscriber(writer, self.max_queue)
+        subscriber.task = asyncio.current_task()
+        self.subscribers.add(subscriber)
+        SUBSCRIBERS.set(len(self.subscribers))
+        print(f"Subscriber connected: {subscriber.peer}")
+        try:
+            while subscriber in self.subscribers:
+                frame = await subscriber.queue.get()
+                if frame is None:
+                    # Publisher stopping
+                    break
+                writer.write(frame)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.subscribers.discard(subscriber)
+            SUBSCRIBERS.set(len(self.subscribers))
+            writer.close()
+            print(f"Subscriber disconnected: {subscriber.peer} ({subscriber.dropped} frames dropped)")
+
+
+async def subscribe(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT, unix_path: str = None):
+    """
+    Connect to a publisher and yield (seq, host_time_ns, samples) for every
+    frame, where samples is an (n, 7) float32 array.
+    """
+    if unix_path:
+        reader, writer = await asyncio.open_unix_connection(unix_path)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while True:
+            header = await reader.readexactly(FRAME_HEADER.size)
+            channels, num_samples, seq, host_time_ns = decode_frame_header(header)
+            payload = await reader.readexactly(num_samples * channels * 4)
+            samples = np.frombuffer(payload, dtype="<f4").reshape(num_samples, channels)
+            yield seq, host_time_ns, samples
+    except asyncio.IncompleteReadError:
+        print("Publisher closed the connection")
+    finally:
+        writer.close()
+
+
+async def listen(args):
+    # Print the rate and any sequence gaps of a live stream
+    last_seq = None
+    num_samples = 0
+    start = last_report = time.perf_counter()
+    async for seq, host_time_ns, samples in subscribe(args.host, args.port, args.unix):
+        if last_seq is not None and seq != (last_seq + 1) & 0xFFFFFFFF:
+            print(f"Gap in stream: {seq - last_seq - 1} frames missed")
+        last_seq = seq
+        num_samples += len(samples)
+        now = time.perf_counter()
+        if now - last_report >= 1.0:
+            latency = (time.time_ns() - host_time_ns) / 1e6
+            print(f"{num_samples / (now - start):.1f} samples/s, last frame latency {latency:.1f} ms, "
+                  f"last sample {samples[-1].round(3).tolist()}")
+            last_report = now
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Subscribe to a live SwIMU stream")
+    parser.add_argument("command", choices=["listen"])
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", default=None, help="unix socket path instead of TCP")
+    args = parser.parse_args(argv)
+    asyncio.run(listen(args))
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        sys.exit(130)
@@ -0,0 +1,310 @@
+# Multi-resolution summary pyramids for fast whole-session overviews.
+# This file is part of the SwIMU device tutorial series
+
+"""
+Plotting every sample of a long recording is slow and pointless: a screen
+is only a couple of thousand pixels wide. A summary pyramid stores the
+min/max/mean of every channel over buckets of 10, 100 and 1000 samples
+(by default) in a small .npz file saved alongside the session:
+
+    2025_01_01_09_00_00-name-swim.csv
+    2025_01_01_09_00_00-name-swim.csv.pyramid.npz
+
+A viewer asks SessionPyramid.view() for a time range and a pixel budget and
+gets back the coarsest level that still fills the budget, so drawing a full
+session costs the same whether it is 5 minutes or 5 hours long. Only when the
+requested range holds fewer raw samples than the budget are raw samples
+read, and only those of the range: binary sessions by row, found through the
+finest level, CSV files by a binary search on the timestamps for the byte
+offset of the range.
+"""
+
+import os
+
+import numpy as np
+
+from SwIMU_data import (HEADERS, NUM_FIELDS, _parse_lines, is_binary_session, is_device_recording,
+                        iter_session_chunks, read_session_rows)
+
+# Decimation factors stored in a pyramid. Each level must be a multiple of the first
+DEFAULT_LEVELS = (10, 100, 1000)
+PYRAMID_SUFFIX = ".pyramid.npz"
+CHANNELS = HEADERS[1:]
+# The binary search for a CSV range stops at this many bytes and reads on from there
+CSV_SEARCH_BYTES = 64 << 10
+
+
+def pyramid_path(session_path: str) -> str:
+    # Pyramid lives next to the session it summarises. The extension stays in
+    # the name, a .csv and a .bin of one recording each get their own
+    return session_path + PYRAMID_SUFFIX
+
+
+def _reduce_buckets(data, bucket_size):
+    # Summarise raw samples in buckets of bucket_size rows. Only called with
+    # a whole number of buckets
+    buckets = data.reshape(-1, bucket_size, NUM_FIELDS)
+    values = buckets[:, :, 1:]
+    return {
+        "t": buckets[:, 0, 0],
+        "min": values.min(axis=1),
+        "max": values.max(axis=1),
+        "sum": values.sum(axis=1),
+        "count": np.full(len(buckets), bucket_size, dtype=np.int64),
+    }
+
+
+def _reduce_level(base, factor):
+    # Build a coarser level from a finer one using reduceat, so a partial
+    # bucket at the end of the session is summarised as well
+    starts = np.arange(0, len(base["t"]), factor)
+    if len(starts) == 0:
+        return {key: value[:0] for key, value in base.items()}
+    return {
+        "t": base["t"][starts],
+        "min": np.minimum.reduceat(base["min"], starts, axis=0),
+        "max": np.maximum.reduceat(base["max"], starts, axis=0),
+        "sum": np.add.reduceat(base["sum"], starts, axis=0),
+        "count": np.add.reduceat(base["count"], starts),
+    }
+
+
+def build_pyramid(chunks, levels=DEFAULT_LEVELS) -> dict:
+    """
+    Build a summary pyramid from a stream of raw sample chunks.
+
+    :param chunks: Iterable of (n, 7) arrays in session order, e.g. from
+        iter_session_chunks. Only one chunk is held in memory at a time.
+    :param levels: Increasing decimation factors, each a multiple of the first.
+    :return: Dictionary of arrays ready to be saved with save_pyramid.
+    """
+    levels = tuple(sorted(levels))
+    base_size = levels[0]
+    if any(level % base_size for level in levels):
+        raise ValueError(f"Pyramid levels {levels} must be multiples of {base_size}")
+
+    base_parts = []
+    carry = np.empty((0, NUM_FIELDS))
+    num_samples = 0
+    t_start = t_end = None
+
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        num_samples += len(chunk)
+        if t_start is None:
+            t_start = float(chunk[0, 0])
+        t_end = float(chunk[-1, 0])
+
+        # Join the left over samples from the last chunk and summarise every
+        # full bucket. The remainder waits for the next chunk
+        data = np.concatenate([carry, chunk]) if len(carry) else chunk
+        num_full = len(data) // base_size * base_size
+        if num_full:
+            base_parts.append(_reduce_buckets(data[:num_full], base_size))
+        carry = data[num_full:]
+
+    if len(carry):
+        # Final partial bucket
+        values = carry[:, 1:]
+        base_parts.append({
+            "t": carry[:1, 0],
+            "min": values.min(axis=0, keepdims=True),
+            "max": values.max(axis=0, keepdims=True),
+            "sum": values.sum(axis=0, keepdims=True),
+            "count": np.array([len(carry)], dtype=np.int64),
+        })
+
+    if base_parts:
+        base = {key: np.concatenate([part[key] for part in base_parts]) for key in base_parts[0]}
+    else:
+        num_channels = NUM_FIELDS - 1
+        base = {
+            "t": np.empty(0), "min": np.empty((0, num_channels)), "max": np.empty((0, num_channels)),
+            "sum": np.empty((0, num_channels)), "count": np.empty(0, dtype=np.int64),
+        }
+
+    pyramid = {
+        "levels": np.array(levels),
+        "num_samples": np.array(num_samples),
+        "t_start": np.array(t_start if t_start is not None else 0.0),
+        "t_end": np.array(t_end if t_end is not None else 0.0),
+    }
+    for level in levels:
+        summary = _reduce_level(base, level // base_size)
+        count = np.maximum(summary["count"], 1)[:, None]
+        # Values are stored as float32, plenty for plotting and 2x smaller
+        pyramid[f"L{level}_t"] = summary["t"]
+        pyramid[f"L{level}_min"] = summary["min"].astype(np.float32)
+        pyramid[f"L{level}_max"] = summary["max"].astype(np.float32)
+        pyramid[f"L{level}_mean"] = (summary["sum"] / count).astype(np.float32)
+        pyramid[f"L{level}_count"] = summary["count"]
+
+    return pyramid
+
+
+def save_pyramid(path: str, pyramid: dict):
+    # Write through a file object so numpy doesn't append its own extension
+    with open(path, "wb") as f:
+        np.savez_compressed(f, **pyramid)
+
+
+def build_session_pyramid(session_path: str, out_path: str = None, levels=DEFAULT_LEVELS) -> str:
+    """
+    Build and save the pyramid for a recorded session.
+
+    :param session_path: Session to summarise.
+    :param out_path: Where to write the pyramid, defaults to next to the session.
+    :param levels: Decimation factors to store.
+    :return: Path of the written pyramid.
+    """
+    out_path = out_path or pyramid_path(session_path)
+    pyramid = build_pyramid(iter_session_chunks(session_path), levels=levels)
+    save_pyramid(out_path, pyramid)
+    return out_path
+
+
+class SessionPyramid:
+    """
+    Read side of a summary pyramid. Picks the right resolution for a view
+    and falls back to the raw session when zoomed in close.
+    """
+
+    def __init__(self, pyramid: dict, session_path: str = None):
+        self.session_path = session_path
+        self.levels = [int(level) for level in pyramid["levels"]]
+        self.num_samples = int(pyramid["num_samples"])
+        self.t_start = float(pyramid["t_start"])
+        self.t_end = float(pyramid["t_end"])
+        self._levels = {}
+        for level in self.levels:
+            self._levels[level] = {key: pyramid[f"L{level}_{key}"]
+                                   for key in ("t", "min", "max", "mean", "count")}
+
+    @classmethod
+    def load(cls, session_path: str, build: bool = True):
+        """
+        Open the pyramid for a session, building it first if it is missing
+        or older than the session.
+        """
+        path = pyramid_path(session_path)
+        if build and (not os.path.exists(path) or
+                      os.path.getmtime(path) < os.path.getmtime(session_path)):
+            print(f"Building summary pyramid for {os.path.basename(session_path)}")
+            build_session_pyramid(session_path, path)
+
+        with np.load(path) as pyramid:
+            return cls(dict(pyramid), session_path=session_path)
+
+    def _raw_window(self, t0: float, t1: float, i0: int, i1: int):
+        # Raw samples of buckets i0..i1 of the finest level, which hold the range
+        path = self.session_path
+        if is_binary_session(path) or is_device_recording(path):
+            base = self.levels[0]
+            return read_session_rows(path, i0 * base, (i1 + 1) * base)
+        return read_csv_window(path, t0, t1)
+
+    def view(self, t0: float = None, t1: float = None, max_points: int = 2000) -> dict:
+        """
+        Summary of a time range at the finest resolution that fits max_points.
+
+        :param t0: Start of the range [s], defaults to the session start.
+        :param t1: End of the range [s], defaults to the session end.
+        :param max_points: Maximum number of points to return per channel.
+        :return: Dictionary with "level" (1 for raw data), "t" and per channel
+            (n, 6) "min", "max" and "mean" arrays. For raw data all three hold
+            the samples themselves.
+        """
+        t0 = self.t_start if t0 is None else t0
+        t1 = self.t_end if t1 is None else t1
+
+        # Estimate how many raw samples fall in the range from the finest level
+        finest = self._levels[self.levels[0]]
+        i0, i1 = np.searchsorted(finest["t"], [t0, t1])
+        i0 = max(i0 - 1, 0)
+        raw_count = int(finest["count"][i0:i1 + 1].sum())
+
+        if raw_count <= max_points and self.session_path is not None:
+            raw = self._raw_window(t0, t1, i0, i1)
+            j0, j1 = np.searchsorted(raw[:, 0], [t0, t1])
+            window = raw[j0:j1 + 1]
+            values = window[:, 1:]
+            return {"level": 1, "t": window[:, 0], "min": values, "max": values, "mean": values}
+
+        # Coarsest level is the fallback when even it exceeds the budget
+        chosen = self.levels[-1]
+        for level in self.levels:
+            if raw_count / level <= max_points:
+                chosen = level
+                break
+
+        summary = self._levels[chosen]
+        k0, k1 = np.searchsorted(summary["t"], [t0, t1])
+        k0 = max(k0 - 1, 0)
+        window = slice(k0, k1 + 1)
+        return {
+            "level": chosen,
+            "t": summary["t"][window],
+            "min": summary["min"][window],
+            "max": summary["max"][window],
+            "mean": summary["mean"][window],
+        }
+
+
+def _first_time(f, position: int):
+    # Timestamp of the first whole, valid line after position, None at the end
+    f.seek(position)
+    if position:
+        f.readline()
+    for line in f:
+        fields = line.split(b",")
+        if len(fields) == NUM_FIELDS:
+            try:
+                return float(fields[0])
+            except ValueError:
+                continue
+    return None
+
+
+def read_csv_window(path: str, t0: float, t1: float):
+    """
+    Cleaned samples of a CSV session from the last one before t0 to the first
+    one after t1, found by a binary search on the timestamps so only that
+    part of the file is read.
+
+    :return: (n, 7) float array.
+    """
+    with open(path, "rb") as f:
+        low, high = 0, os.path.getsize(path)
+        while high - low > CSV_SEARCH_BYTES:
+            middle = (low + high) // 2
+            t = _first_time(f, middle)
+            if t is None or t >= t0:
+                high = middle
+            else:
+                low = middle
+        f.seek(low)
+        if low:
+            f.readline()
+        lines = []
+        for line in f:
+            lines.append(line.decode("utf-8", errors="replace"))
+            fields = line.split(b",")
+            if len(fields) == NUM_FIELDS:
+                try:
+                    if float(fields[0]) > t1:
+                        break
+                except ValueError:
+                    pass
+    return _parse_lines(lines, True, np)
+
+
+def compare_sessions(session_paths, max_points: int = 1000) -> dict:
+    """
+    Whole-session overviews of several sessions for side-by-side plotting.
+
+    :param session_paths: Sessions to compare.
+    :param max_points: Point budget per session.
+    :return: Dictionary of session path -> view dictionary.
+    """
+    return {path: SessionPyramid.load(path).view(max_points=max_points) for path in session_paths}
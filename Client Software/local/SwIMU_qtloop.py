@@ -0,0 +1,159 @@
+# One event loop for Qt and asyncio in the SwIMU GUI. This file is part of
+# the SwIMU device tutorial series
+
+"""
+The GUI used to run every BLE session in a QThread with its own asyncio
+loop, and pass each command and data block across threads with paired Qt
+signals. Now the BLE coroutines run on the GUI thread, on an asyncio loop
+driven by the Qt event loop, so UI callbacks can touch the client directly
+and live data reaches the plots without a thread hop.
+
+qasync (part of the SwIMU environment) is used when it is installed: its
+QEventLoop is an asyncio loop implemented on top of Qt. Without it, a small
+driver runs a standard asyncio loop in slices from a Qt timer, using only the
+loop's public API. While coroutines started with spawn() are running, every
+time Qt has handled its pending events the loop runs for SLICE seconds,
+waiting in select() for socket data or timers rather than being polled.
+While the window is idle it only runs one zero timeout iteration now and
+then for housekeeping.
+
+    app = QtWidgets.QApplication(sys.argv)
+    window = MainWindow()
+    window.show()
+    sys.exit(run_app(app))
+
+Coroutines are started from UI code with spawn(). CPU heavy work (cleaning
+a received file, hashing) still has to go to an executor, or it blocks the
+UI while it runs: await loop.run_in_executor(...).
+"""
+
+import asyncio
+
+from PyQt5 import QtCore, QtWidgets
+
+# Time [s] the fallback driver runs the asyncio loop for in each step while
+# coroutines are running, before Qt gets a turn. Bounds how long UI events wait
+SLICE = 0.004
+# Step interval [ms] while nothing is running, for library housekeeping
+IDLE_TICK_MS = 100
+
+_loop = None
+_driver = None
+
+
+class QtLoopDriver(QtCore.QObject):
+    """
+    Runs an asyncio loop in slices from a Qt timer.
+
+    A step schedules loop.stop() and runs the loop until it gets there:
+    SLICE seconds later while tasks are active, otherwise right after one
+    iteration that polls sockets and pipes without blocking.
+    """
+
+    def __init__(self, loop):
+        super().__init__()
+        self.loop = loop
+        self.timer = QtCore.QTimer(self)
+        self.timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self.timer.timeout.connect(self.step)
+        self.timer.start(IDLE_TICK_MS)
+        self.active_tasks = 0
+
+    def step(self):
+        loop = self.loop
+        if loop.is_closed():
+            self.timer.stop()
+            return
+        if loop.is_running():
+            # Re-entered from processEvents() inside a callback
+            return
+        if self.active_tasks > 0:
+            # Callbacks scheduled along the way (the next step of a coroutine)
+            # run in the same slice, the loop sleeps in select() in between
+            stop = loop.call_later(SLICE, loop.stop)
+        else:
+            stop = loop.call_soon(loop.stop)
+        try:
+            loop.run_forever()
+        finally:
+            stop.cancel()
+
+    def task_started(self):
+        self.active_tasks += 1
+        # 0 ms: step again as soon as Qt has no events waiting
+        self.timer.start(0)
+
+    def task_done(self, task):
+        self.active_tasks -= 1
+        if self.active_tasks <= 0:
+            self.timer.start(IDLE_TICK_MS)
+
+
+def get_loop():
+    """
+    The asyncio loop shared with Qt, created on first use.
+
+    :return: qasync's QEventLoop if qasync is installed, otherwise a standard
+        loop stepped by QtLoopDriver.
+    """
+    global _loop, _driver
+    if _loop is not None and not _loop.is_closed():
+        return _loop
+    try:
+        # Already inside a running loop (IPython/Spyder), share it
+        _loop = asyncio.get_running_loop()
+        return _loop
+    except RuntimeError:
+        pass
+    app = QtWidgets.QApplication.instance()
+    try:
+        import qasync
+        _loop = qasync.QEventLoop(app)
+    except ImportError:
+        _loop = asyncio.new_event_loop()
+        _driver = QtLoopDriver(_loop)
+    asyncio.set_event_loop(_loop)
+    return _loop
+
+
+def spawn(coro) -> asyncio.Task:
+    """
+    Start a coroutine on the shared loop from UI code.
+
+    :param coro: Coroutine to run.
+    :return: The task, which can be cancelled.
+    """
+    loop = get_loop()
+    task = loop.create_task(coro)
+    if _driver is not None and loop is _driver.loop:
+        _driver.task_started()
+        task.add_done_callback(_driver.task_done)
+    return task
+
+
+def run_app(app) -> int:
+    """
+    Run the Qt application with the shared loop until the last window closes.
+
+    :return: The application's exit code.
+    """
+    loop = get_loop()
+    if loop.is_running():
+        # Hosted by an interactive session that already runs the loop
+        return app.exec_()
+    if _driver is None:
+        # qasync runs Qt from inside the asyncio loop
+        with loop:
+            app.aboutToQuit.connect(loop.stop)
+            loop.run_forever()
+        return 0
+    code = app.exec_()
+    # Cancel what's still running (e.g. a connection) and let it clean up
+    tasks = asyncio.all_tasks(loop)
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+    return code
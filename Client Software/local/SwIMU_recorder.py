@@ -0,0 +1,154 @@
+# Background recorder that writes live IMU samples to a binary session file
+# on the client. This file is part of the SwIMU device tutorial series
+
+"""
+The device keeps its own copy of a live session on the SD card, but getting
+it onto the computer takes a separate file transfer. SessionRecorder keeps a
+host copy as the samples arrive.
+
+The BLE notification callback runs on the asyncio event loop, so it must
+never wait on the disk. write() only puts the samples on a queue; a
+background thread packs them into float32 records and writes them through a
+large buffer, flushing and fsync-ing every few seconds. The binary session
+layout (see SwIMU_data) is append-only with fixed size records, so if the
+app dies mid-session everything up to the last fsync can still be read.
+"""
+
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+import SwIMU_metrics as metrics
+from SwIMU_data import (BINARY_SESSION_EXTENSION, HEADERS, NUM_FIELDS, RECORD_SIZE,
+                        encode_session_header, read_session_header)
+
+# Large writes keep the number of system calls low at high sample rates
+WRITE_BUFFER_SIZE = 1 << 20
+# Longest time [s] that received samples may sit in OS buffers before an fsync
+FSYNC_INTERVAL = 2.0
+
+_STOP = object()
+
+WRITE_LATENCY = metrics.histogram("recorder_write_seconds", "Time to hand one batch to the session file")
+FSYNC_LATENCY = metrics.histogram("recorder_fsync_seconds", "Time to flush and fsync the session file")
+
+
+class SessionRecorder:
+    """
+    Append-only binary session writer with a background writer thread.
+
+    Usage:
+        recorder = SessionRecorder(path, metadata={"device": address})
+        recorder.start()
+        recorder.write(block)  # (n, 7) samples, from the BLE callback
+        recorder.close()
+    """
+
+    def __init__(self, path: str, metadata: dict = None, buffer_size: int = WRITE_BUFFER_SIZE,
+                 fsync_interval: float = FSYNC_INTERVAL):
+        if not path.endswith(BINARY_SESSION_EXTENSION):
+            path += BINARY_SESSION_EXTENSION
+        self.path = path
+        self.metadata = {"fields": HEADERS, "created": time.time(), **(metadata or {})}
+        self.buffer_size = buffer_size
+        self.fsync_interval = fsync_interval
+        self.num_samples = 0
+        self.error = None
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._file = None
+
+    @property
+    def is_recording(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def queue_depth(self) -> int:
+        # Number of batches waiting for the writer thread
+        return self._queue.qsize()
+
+    def start(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+            # Resuming a session cut short by a crash: drop any partial record
+            # so new records stay aligned
+            _, data_offset, num_records = read_session_header(self.path)
+            os.truncate(self.path, data_offset + num_records * RECORD_SIZE)
+        # "ab" so an existing session (e.g. after a reconnect) is never overwritten
+        self._file = open(self.path, "ab", buffering=self.buffer_size)
+        if self._file.tell() == 0:
+            self._file.write(encode_session_header(self.metadata))
+            self._sync()
+        self._thread = threading.Thread(target=self._run, name="SessionRecorder", daemon=True)
+        self._thread.start()
+        print(f"Recording live session to: {self.path}")
+        return self
+
+    def write(self, samples):
+        """
+        Queue one sample (7 values) or a batch of samples (n x 7) for writing.
+        Never blocks, safe to call from the BLE event loop.
+        """
+        # A failed writer won't drain the queue, don't let it grow forever
+        if self.error is None:
+            self._queue.put(samples)
+
+    def close(self):
+        # Let the writer drain the queue, then make everything durable
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+        print(f"Live session recording closed: {self.num_samples} samples in {self.path}")
+        if self.error is not None:
+            print(f"Recorder error during session: {self.error}")
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def _run(self):
+        last_sync = time.monotonic()
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.fsync_interval)
+                except queue.Empty:
+                    item = None
+
+                if item is _STOP:
+                    break
+
+                if item is not None:
+                    records = np.asarray(item, dtype="<f4").reshape(-1, NUM_FIELDS)
+                    # Buffered file object: this only hits the disk once the
+                    # buffer fills, so small batches are cheap
+                    with WRITE_LATENCY.time():
+                        self._file.write(records.tobytes())
+                    self.num_samples += len(records)
+
+                if time.monotonic() - last_sync >= self.fsync_interval:
+                    with FSYNC_LATENCY.time():
+                        self._sync()
+                    last_sync = time.monotonic()
+
+        except Exception as e:
+            # Keep the error for the owner and stop writing rather than
+            # taking down the BLE loop
+            self.error = e
+
+        finally:
+            try:
+                self._sync()
+            finally:
+                self._file.close()
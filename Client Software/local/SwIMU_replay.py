@@ -0,0 +1,193 @@
+# Replay recorded SwIMU sessions through the live data path at real time,
+# N x speed or as fast as possible. This file is part of the SwIMU device
+# tutorial series
+
+"""
+Tuning the live plot or live analytics shouldn't need a swimmer in the
+water. ReplayClient reads a recorded session (a CSV written by
+write_to_file or a binary .swimu session) and turns every sample back into
+the notification payload the device sends, so it goes through the same
+IMUDataPipeline.handle_IMU_data decode as real BLE data. It has the same
+data_tx_is_active / rx_IMU_readings_mode interface as SwIMUClient, so the
+GUI worker and the headless service can drive it in place of a device.
+
+Sessions are read in chunks (memory mapped for binary sessions). Pacing uses
+perf_counter deadlines computed from the recorded timestamps: the source
+sleeps until the next deadline, then delivers every sample that is due in
+one burst. It never spins, the event loop is shared with the GUI and the
+dashboard. At speed 0 it runs flat out, which
+makes a throughput stress test for everything downstream of the decode:
+
+    python SwIMU_replay.py session.swimu --speed 0
+    python SwIMU_headless.py replay session.csv --speed 4 --publish
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+
+import SwIMU_metrics as metrics
+from SwIMU_client import IMUDataPipeline
+from SwIMU_data import iter_session_chunks
+
+# Same line format as the device (DataRecorder.cpp)
+NOTIFICATION_FMT = "%.3f, %.3f, %.3f, %.3f, %.2f, %.2f, %.2f"
+# Samples delivered more than this long [s] after their deadline count as late
+LATE_THRESHOLD = 0.002
+# At full speed, give the event loop a turn after this many samples
+MAX_SPEED_BATCH = 256
+CHUNK_ROWS = 16_384
+
+REPLAY_LAG = metrics.histogram("replay_lag_seconds", "Delay between a replayed sample's deadline and its delivery")
+
+
+def encode_notifications(samples) -> list:
+    # Turn decoded samples back into device notification payloads
+    return [(NOTIFICATION_FMT % tuple(row)).encode("utf-8") for row in samples.tolist()]
+
+
+class ReplayClient(IMUDataPipeline):
+    """
+    Stand-in for SwIMUClient that streams a recorded session.
+
+    :param path: CSV or binary session file.
+    :param speed: Playback speed, 1.0 is real time, 0 as fast as possible.
+    :param repeat: Start over at the end of the session until stopped.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0, repeat: bool = False):
+        IMUDataPipeline.__init__(self)
+        self.path = path
+        self.speed = speed
+        self.repeat = repeat
+        self.address = f"replay:{os.path.basename(path)}"
+        # Replaying an existing recording, don't make another copy by default
+        self.record_live_sessions = False
+        self._data_tx_is_active = False
+        self.late_samples = 0
+
+    @property
+    def data_tx_is_active(self):
+        return self._data_tx_is_active
+
+    @data_tx_is_active.setter
+    def data_tx_is_active(self, status: bool):
+        self._data_tx_is_active = status
+        self.command_received()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+    async def rx_IMU_readings_mode(self):
+        # Same hand shake as a device: wait for the start request
+        while not self.data_tx_is_active:
+            await self.wait_for_command(0.1)
+
+        self.open_stream(self.address)
+        self.command_done()
+        start_time = time.perf_counter()
+        try:
+            while self.data_tx_is_active:
+                await self.replay()
+                if not self.repeat:
+                    break
+        finally:
+            await self.close_stream()
+
+        record_time = time.perf_counter() - start_time
+        print("----------------- Replay ---------------")
+        print(f"Number of samples replayed in {record_time:.2f}s: {self.num_samples_rx}")
+        print(f"Realized Frequency [Hz]: {self.num_samples_rx / record_time:.1f}")
+        if self.speed:
+            print(f"Samples delivered more than {LATE_THRESHOLD * 1000:.0f} ms late: {self.late_samples}")
+
+    async def replay(self):
+        # One pass over the session, stops early if data tx is switched off
+        start = time.perf_counter()
+        first_time = None
+        last_time = -np.inf
+        for chunk in iter_session_chunks(self.path, chunk_rows=CHUNK_ROWS):
+            if not self.data_tx_is_active:
+                return
+            if len(chunk) == 0:
+                continue
+            payloads = encode_notifications(chunk)
+
+            if not self.speed:
+                for i in range(0, len(payloads), MAX_SPEED_BATCH):
+                    for payload in payloads[i:i + MAX_SPEED_BATCH]:
+                        self.handle_IMU_data(payload)
+                    await asyncio.sleep(0)
+                    if not self.data_tx_is_active:
+                        return
+                continue
+
+            # Recorded timestamps may reset or step back after a glitch,
+            # never let the schedule run backwards
+            times = np.maximum.accumulate(np.maximum(chunk[:, 0], last_time))
+            last_time = times[-1]
+            if first_time is None:
+                first_time = times[0]
+            deadlines = start + (times - first_time) / self.speed
+
+            i = 0
+            while i < len(payloads):
+                if not self.data_tx_is_active:
+                    return
+                delay = deadlines[i] - time.perf_counter()
+                if delay > 0:
+                    self.flush_if_stale()
+                    await asyncio.sleep(delay)
+                # Deliver everything that's due, in one burst when samples are
+                # closer together than the loop wakes up or we fell behind.
+                # The loop may wake a little early, the next sample goes anyway
+                now = time.perf_counter()
+                end = max(i + 1, int(np.searchsorted(deadlines, now, side="right")))
+                for j in range(i, end):
+                    lag = now - deadlines[j]
+                    REPLAY_LAG.observe(lag)
+                    if lag > LATE_THRESHOLD:
+                        self.late_samples += 1
+                    self.handle_IMU_data(payloads[j])
+                i = end
+                await asyncio.sleep(0)
+
+
+async def run_replay(path: str, speed: float, repeat: bool = False, duration: float = None):
+    # Stand alone replay without consumers, reports decode throughput
+    client = ReplayClient(path, speed=speed, repeat=repeat)
+    client.data_tx_is_active = True
+    rx_task = asyncio.create_task(client.rx_IMU_readings_mode())
+    try:
+        await asyncio.wait_for(asyncio.shield(rx_task), timeout=duration)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        client.data_tx_is_active = False
+        await rx_task
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a recorded SwIMU session through the live decode path")
+    parser.add_argument("path", help="CSV or .swimu session")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="playback speed, 1 = real time, 0 = as fast as possible")
+    parser.add_argument("--repeat", action="store_true", help="loop the session until stopped")
+    parser.add_argument("--duration", type=float, default=None, help="stop after this many seconds")
+    args = parser.parse_args(argv)
+    asyncio.run(run_replay(args.path, args.speed, args.repeat, args.duration))
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        sys.exit(130)
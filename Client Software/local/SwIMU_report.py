@@ -0,0 +1,248 @@
+# Headless per-session PDF/PNG reports for coaches, rendered in parallel.
+# This file is part of the SwIMU device tutorial series
+
+"""
+Quick_Viz opens one file at a time through a dialog and shows it in an
+interactive window. After a squad session the coach wants a report per swim
+without anyone clicking through files:
+
+    python SwIMU_report.py <session_dir> <report_dir>
+    python SwIMU_report.py <session_dir> <report_dir> --format pdf png --workers 8
+
+Each report is one page with:
+
+    - acceleration and gyro overviews (mean with the min/max envelope) with
+      lap boundaries and, when available, the stroke type of each segment
+    - session metrics: duration, laps, stroke cycles and rate, dominant
+      stroke and kick frequencies
+    - lap splits: a table and a chart of lap time and stroke rate
+    - the acceleration and gyro PSDs
+
+Reports are rendered with matplotlib's Agg backend, no display needed, by
+the "report" (PDF) and "report_png" tasks of SwIMU_batch. Sessions are spread
+over a process pool and only changed sessions are rendered again.
+The inputs are read from the caches the other tools keep next to the
+sessions, and computed once if they are missing: the summary pyramid
+(SwIMU_pyramid), the spectra (SwIMU_spectral), the session and lap statistics
+(SwIMU_aggregate) and the stroke segments (.strokes.json from the "classify"
+task, or the model in SWIMU_CLASSIFIER_MODEL).
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from SwIMU_batch import TASKS, run_batch
+
+# Points per curve in the overview plots
+OVERVIEW_POINTS = 1500
+# A4 portrait [in]
+PAGE_SIZE = (8.27, 11.69)
+PNG_DPI = 110
+# Lap rows that fit in the table, longer sessions show the first ones
+MAX_TABLE_LAPS = 24
+
+STROKE_COLORS = {
+    "freestyle": "tab:blue", "backstroke": "tab:green", "breaststroke": "tab:orange",
+    "butterfly": "tab:purple", "turn": "tab:red", "wall_push": "tab:brown", "rest": "0.85",
+}
+
+
+def load_strokes(src_path: str, dst_path: str = None):
+    """
+    Stroke segments of a session.
+
+    :param dst_path: Report path, the "classify" task's sidecar is looked for
+        next to it as well as next to the session.
+    :return: List of segments, None if there's no sidecar and no model.
+    """
+    from SwIMU_classify import DEFAULT_MODEL_PATH, STROKES_SUFFIX, classify_session, load_model
+    candidates = [src_path + STROKES_SUFFIX]
+    if dst_path:
+        # dst_path is <stem><suffix>.part while the batch runs
+        stem = dst_path[:-len(".part")] if dst_path.endswith(".part") else dst_path
+        for task in TASKS.values():
+            if stem.endswith(task.suffix):
+                candidates.append(stem[:-len(task.suffix)] + STROKES_SUFFIX)
+    for path in candidates:
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                return json.load(f)["segments"]
+    if os.path.exists(DEFAULT_MODEL_PATH):
+        return classify_session(src_path, load_model())["segments"]
+    return None
+
+
+def session_metrics(session_row: dict, laps: list, spectra) -> list:
+    # (label, value) rows of the metrics box
+    duration = session_row["duration_s"] or 0.0
+    minutes, seconds = divmod(round(duration, 1), 60)
+    strokes = sum(lap["stroke_cycles"] for lap in laps)
+    rows = [
+        ("Duration", f"{int(minutes)}:{seconds:04.1f}"),
+        ("Sample rate", f"{session_row['sample_rate_hz']:.1f} Hz"),
+        ("Laps", f"{len(laps)}"),
+        ("Stroke cycles", f"{strokes}"),
+        ("Mean stroke rate", f"{strokes / duration * 60:.1f} /min" if duration > 0 else "-"),
+        ("Mean |a|", f"{session_row['Amag_mean']:.2f} g"),
+        ("Peak |a|", f"{session_row['Amag_max']:.2f} g"),
+    ]
+    if laps:
+        fastest = min(laps, key=lambda lap: lap["duration_s"])
+        rows.append(("Fastest lap", f"{fastest['duration_s']:.1f} s (lap {fastest['lap']})"))
+    if spectra is not None:
+        rows.append(("Stroke frequency (Gy)", f"{spectra.dominant_frequency('Gy', 'stroke'):.2f} Hz"))
+        rows.append(("Kick frequency (Az)", f"{spectra.dominant_frequency('Az', 'kick'):.2f} Hz"))
+    return rows
+
+
+def _plot_overview(ax, view, columns, labels, ylabel, laps, strokes):
+    t = view["t"]
+    for column, label, color in zip(columns, labels, ("r", "g", "b")):
+        if view["level"] > 1:
+            # Rasterised so the PDF stays small however long the session
+            ax.fill_between(t, view["min"][:, column], view["max"][:, column], color=color,
+                            alpha=0.2, linewidth=0, rasterized=True)
+        ax.plot(t, view["mean"][:, column], color=color, linewidth=0.6, label=label)
+    # One collection for all lap lines and one per stroke type, a separate
+    # artist per lap or segment makes long sessions slow to draw
+    x_transform = ax.get_xaxis_transform()
+    if len(laps) > 1:
+        ax.vlines([lap["start_s"] for lap in laps[1:]], 0, 1, transform=x_transform,
+                  color="k", linewidth=0.5, alpha=0.5)
+    for label, color in STROKE_COLORS.items():
+        spans = [(segment["start"], segment["end"] - segment["start"])
+                 for segment in strokes or [] if segment["label"] == label]
+        if spans:
+            ax.broken_barh(spans, (0.96, 0.04), transform=x_transform, color=color, linewidth=0)
+    ax.set_ylabel(ylabel)
+    ax.set_xlim(t[0] if len(t) else 0, t[-1] if len(t) else 1)
+    ax.legend(loc="upper right", fontsize=7, ncol=3)
+    ax.grid(alpha=0.2)
+
+
+def render_report(src_path: str, dst_path: str, fmt: str = "pdf"):
+    """
+    Render the report of one session.
+
+    :param fmt: "pdf" or "png".
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.patches import Patch
+
+    from SwIMU_aggregate import cached_summary
+    from SwIMU_pyramid import SessionPyramid
+    from SwIMU_spectral import CHANNELS, session_spectra
+
+    session_row, laps = cached_summary(src_path)
+    if session_row["error"]:
+        raise ValueError(session_row["error"])
+    view = SessionPyramid.load(src_path).view(max_points=OVERVIEW_POINTS)
+    try:
+        spectra = session_spectra(src_path)
+    except ValueError:
+        # Session shorter than one FFT segment
+        spectra = None
+    strokes = load_strokes(src_path, dst_path)
+
+    # Figure rather than pyplot: no global state and no GUI backend
+    fig = Figure(figsize=PAGE_SIZE)
+    grid = fig.add_gridspec(5, 2, height_ratios=[1.1, 1.1, 1.0, 1.0, 0.9], hspace=0.45, wspace=0.3,
+                            left=0.08, right=0.92, top=0.93, bottom=0.05)
+    name = session_row["session"]
+    title = name if not session_row["swimmer"] else (
+        f"{session_row['swimmer']} - {session_row['activity'] or ''}   "
+        f"{session_row['start']:%Y-%m-%d %H:%M}")
+    fig.suptitle(title, fontsize=13)
+
+    accel_ax = fig.add_subplot(grid[0, :])
+    _plot_overview(accel_ax, view, (0, 1, 2), ("Ax", "Ay", "Az"), "Acceleration (g)", laps, strokes)
+    gyro_ax = fig.add_subplot(grid[1, :], sharex=accel_ax)
+    _plot_overview(gyro_ax, view, (3, 4, 5), ("Gx", "Gy", "Gz"), "Gyro (°/s)", laps, None)
+    gyro_ax.set_xlabel("Time (s)")
+    if strokes:
+        present = [label for label in STROKE_COLORS if any(s["label"] == label for s in strokes)]
+        accel_ax.legend(handles=accel_ax.get_legend_handles_labels()[0] +
+                        [Patch(color=STROKE_COLORS[label], label=label) for label in present],
+                        loc="upper right", fontsize=6, ncol=5)
+
+    metrics_ax = fig.add_subplot(grid[2, 0])
+    metrics_ax.axis("off")
+    metrics_ax.set_title("Session", fontsize=10, loc="left")
+    table = metrics_ax.table(cellText=session_metrics(session_row, laps, spectra), loc="upper left",
+                             colWidths=[0.55, 0.45], edges="horizontal")
+    table.auto_set_font_size(False)
+    table.set_fontsize(8)
+
+    splits_ax = fig.add_subplot(grid[2, 1])
+    splits_ax.set_title("Lap splits", fontsize=10, loc="left")
+    if laps:
+        numbers = [lap["lap"] for lap in laps]
+        splits_ax.bar(numbers, [lap["duration_s"] for lap in laps], color="tab:blue", alpha=0.7)
+        splits_ax.set_xlabel("Lap")
+        splits_ax.set_ylabel("Time (s)", color="tab:blue")
+        rate_ax = splits_ax.twinx()
+        rate_ax.plot(numbers, [lap["stroke_rate_spm"] for lap in laps], "o-", color="tab:red", markersize=3)
+        rate_ax.set_ylabel("Stroke rate (/min)", color="tab:red")
+    else:
+        splits_ax.text(0.5, 0.5, "No laps detected", ha="center", va="center", transform=splits_ax.transAxes)
+
+    laps_ax = fig.add_subplot(grid[3, :])
+    laps_ax.axis("off")
+    if laps:
+        rows = [[lap["lap"], f"{lap['start_s']:.1f}", f"{lap['duration_s']:.1f}", lap["stroke_cycles"],
+                 f"{lap['stroke_rate_spm']:.1f}", f"{lap['Amag_mean']:.2f}", f"{lap['Amag_max']:.2f}"]
+                for lap in laps[:MAX_TABLE_LAPS]]
+        columns = ["Lap", "Start (s)", "Time (s)", "Strokes", "Rate (/min)", "Mean |a|", "Peak |a|"]
+        # Two tables side by side so up to MAX_TABLE_LAPS rows fit
+        half = (len(rows) + 1) // 2
+        for part, bbox in ((rows[:half], [0.0, 0.0, 0.48, 1.0]), (rows[half:], [0.52, 0.0, 0.48, 1.0])):
+            if part:
+                lap_table = laps_ax.table(cellText=part, colLabels=columns, bbox=bbox)
+                lap_table.auto_set_font_size(False)
+                lap_table.set_fontsize(6)
+        if len(laps) > MAX_TABLE_LAPS:
+            laps_ax.set_title(f"First {MAX_TABLE_LAPS} of {len(laps)} laps", fontsize=8, loc="left")
+
+    for col, (channels, ylabel) in enumerate(((("Ax", "Ay", "Az"), "Accel PSD (g²/Hz)"),
+                                              (("Gx", "Gy", "Gz"), "Gyro PSD ((°/s)²/Hz)"))):
+        psd_ax = fig.add_subplot(grid[4, col])
+        if spectra is not None:
+            band = spectra.freqs <= 5.0
+            for channel, color in zip(channels, ("r", "g", "b")):
+                psd_ax.semilogy(spectra.freqs[band], spectra.psd[CHANNELS.index(channel)][band],
+                                color=color, linewidth=0.7, label=channel)
+            psd_ax.legend(fontsize=6)
+        psd_ax.set_xlabel("Frequency (Hz)")
+        psd_ax.set_ylabel(ylabel, fontsize=8)
+        psd_ax.grid(alpha=0.2)
+
+    fig.savefig(dst_path, format=fmt, dpi=PNG_DPI)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a report for every SwIMU session in a folder")
+    parser.add_argument("src_dir", help="directory containing recorded sessions")
+    parser.add_argument("out_dir", help="directory to write the reports to")
+    parser.add_argument("--format", nargs="+", default=["pdf"], choices=["pdf", "png"])
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="render reports that are up to date too")
+    args = parser.parse_args(argv)
+
+    failed = 0
+    # One format at a time: the first run fills the caches the second one
+    # reads, and no two workers build the same cache file at once
+    for fmt in args.format:
+        counts = run_batch(args.src_dir, args.out_dir, ["report" if fmt == "pdf" else "report_png"],
+                           workers=args.workers, force=args.force)
+        failed += counts["failed"]
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        sys.exit(130)
@@ -0,0 +1,513 @@
+# Tiered retention for the archive of received SwIMU sessions: full rate
+# data for recent sessions, compact forms for older ones. This file is part
+# of the SwIMU device tutorial series
+
+"""
+Every file_rx_mode offload adds full rate sessions to the save folder and
+nothing ever leaves it. This tool moves sessions down three tiers by age:
+
+    raw       the session as received (CSV, .bin or .swimu), full rate
+    reduced   downsampled to --reduced-rate (bucket means, so no aliasing),
+              quantized to int16 per channel and compressed
+    summary   only the summary pyramid and the analytics
+
+Before a session's raw data goes, the analytics are computed from it at full
+rate and kept in the archive: session statistics and laps (SwIMU_aggregate),
+the dominant stroke and kick frequencies (SwIMU_spectral) and the min/max/
+mean summary pyramid (SwIMU_pyramid). A session's age comes from the date in
+its device file name, or its modification time.
+
+    python SwIMU_retention.py plan ~/Downloads       # what would change
+    python SwIMU_retention.py run ~/Downloads --raw-days 30 --reduced-days 365
+    python SwIMU_retention.py show ~/Downloads
+
+Compaction runs in a pool of low priority worker processes. Compacted files
+live in <save_dir>/.swimu_archive/ next to index.json, which records the
+tier, sizes and files of every session. Raw files are only deleted once
+their compact forms have been written and read back, together with the files
+derived from them at full rate: the session's pyramid sidecar and its
+entries in the spectral and summary caches (.swimu_cache). Sync manifests
+(see SwIMU_manifest) are updated so the files aren't downloaded again.
+
+ArchiveReader gives the best resolution that's still there:
+
+    reader = ArchiveReader("~/Downloads")
+    data, info = reader.load(name)     # raw, reduced or pyramid means
+    view = reader.view(name, t0, t1, max_points=2000)
+    reader.analytics(name)
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import date, datetime
+
+import numpy as np
+
+from SwIMU_data import NUM_FIELDS, SESSION_EXTENSIONS, find_sessions, hash_file, iter_session_chunks
+
+ARCHIVE_DIR = ".swimu_archive"
+INDEX_NAME = "index.json"
+TIERS = ("raw", "reduced", "summary")
+REDUCED_SUFFIX = ".reduced.npz"
+PYRAMID_SUFFIX = ".pyramid.npz"
+ANALYTICS_SUFFIX = ".analytics.json"
+
+# Default policy
+RAW_DAYS = 30
+REDUCED_DAYS = 365
+REDUCED_RATE = 25.0
+# Pyramid levels kept in the archive. Zooming in closer than the first level
+# is served from the reduced data while a session still has it
+ARCHIVE_LEVELS = (100, 1000)
+# How often to save the index while compacting [s]
+SAVE_INTERVAL = 5.0
+
+
+def _to_json(value):
+    # numpy scalars, timestamps and NaN from the analytics
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Can't store {type(value).__name__} in the archive index")
+
+
+def session_recorded(path: str) -> float:
+    # Start time from the device's file name, else the file's modification time
+    from SwIMU_aggregate import parse_session_name
+    start = parse_session_name(path)["start"]
+    return start.timestamp() if start is not None else os.path.getmtime(path)
+
+
+def session_age_days(path: str, now: float = None) -> float:
+    now = time.time() if now is None else now
+    return (now - session_recorded(path)) / 86400
+
+
+def target_tier(age_days: float, raw_days: float = RAW_DAYS, reduced_days: float = REDUCED_DAYS) -> str:
+    if age_days < raw_days:
+        return "raw"
+    if age_days < reduced_days:
+        return "reduced"
+    return "summary"
+
+
+# --------------------------- Reduced tier ----------------------------- #
+
+def reduce_chunks(chunks, factor: int):
+    """
+    Downsample a stream of sample chunks by averaging buckets of samples.
+
+    :param chunks: Iterable of (n, 7) arrays in session order.
+    :param factor: Samples per bucket.
+    :return: (m, 7) float64 array of bucket means.
+    """
+    parts = []
+    carry = np.empty((0, NUM_FIELDS))
+    for chunk in chunks:
+        data = np.concatenate([carry, chunk]) if len(carry) else np.asarray(chunk, dtype=np.float64)
+        num_full = len(data) // factor * factor
+        if num_full:
+            parts.append(data[:num_full].reshape(-1, factor, NUM_FIELDS).mean(axis=1))
+        carry = data[num_full:]
+    if len(carry):
+        parts.append(carry.mean(axis=0, keepdims=True))
+    return np.concatenate(parts) if parts else np.empty((0, NUM_FIELDS))
+
+
+def save_reduced(path: str, reduced, factor: int, rate: float):
+    # Millisecond times as differences (nearly constant, so they compress to
+    # almost nothing) and int16 values with a scale per channel
+    t_ms = np.rint(reduced[:, 0] * 1000).astype(np.int64)
+    values = reduced[:, 1:]
+    scale = np.abs(values).max(axis=0) / 32000 if len(values) else np.ones(NUM_FIELDS - 1)
+    scale = np.where(scale > 0, scale, 1.0)
+    with open(path + ".part", "wb") as f:
+        np.savez_compressed(f, t0_ms=t_ms[:1], dt_ms=np.diff(t_ms).astype(np.int32),
+                            values=np.rint(values / scale).astype(np.int16), scale=scale,
+                            factor=np.array(factor), rate=np.array(rate))
+    os.replace(path + ".part", path)
+
+
+def load_reduced(path: str):
+    """
+    Read a reduced session.
+
+    :return: ((m, 7) float32 samples, {"factor", "rate"})
+    """
+    with np.load(path) as f:
+        t_ms = np.concatenate([f["t0_ms"], f["t0_ms"][0] + np.cumsum(f["dt_ms"], dtype=np.int64)]) \
+            if len(f["t0_ms"]) else np.empty(0, dtype=np.int64)
+        data = np.empty((len(t_ms), NUM_FIELDS), dtype="<f4")
+        data[:, 0] = t_ms / 1000
+        data[:, 1:] = f["values"] * f["scale"]
+        return data, {"factor": int(f["factor"]), "rate": float(f["rate"])}
+
+
+# ----------------------------- Worker --------------------------------- #
+
+def _lower_priority():
+    # Compaction is background work, let live sessions and the GUI go first
+    try:
+        os.nice(10)
+    except (AttributeError, OSError):
+        pass
+
+
+def archive_paths(root: str, rel_path: str) -> dict:
+    # Keep the extension, a .csv and a .bin of one recording often sit side by side
+    stem = os.path.join(root, ARCHIVE_DIR, rel_path)
+    return {"reduced": stem + REDUCED_SUFFIX, "pyramid": stem + PYRAMID_SUFFIX,
+            "analytics": stem + ANALYTICS_SUFFIX}
+
+
+def derived_paths(src_path: str, content_hash: str) -> list:
+    """
+    Files made from a raw session at full rate that go with it.
+
+    :param content_hash: hash_file of the session, the caches are keyed on it.
+    :return: Existing paths of the pyramid sidecar and the cache entries.
+    """
+    from SwIMU_aggregate import CACHE_DIR_NAME as SUMMARY_CACHE
+    from SwIMU_pyramid import PYRAMID_SUFFIX as SIDECAR_SUFFIX, pyramid_path
+    from SwIMU_spectral import CACHE_DIR_NAME as SPECTRAL_CACHE
+
+    paths = [pyramid_path(src_path)]
+    # Older sidecars were named by stem only, shared by every copy of the
+    # recording. Only remove one when no other copy is left
+    stem = os.path.splitext(src_path)[0]
+    if not any(os.path.exists(stem + ext) for ext in SESSION_EXTENSIONS if stem + ext != src_path):
+        paths.append(stem + SIDECAR_SUFFIX)
+    folder = os.path.dirname(os.path.abspath(src_path))
+    for cache in (SPECTRAL_CACHE, SUMMARY_CACHE):
+        paths.extend(glob.glob(os.path.join(folder, cache, content_hash + "*")))
+    return [path for path in paths if os.path.exists(path)]
+
+
+def cache_bytes(root: str) -> int:
+    # Size of every .swimu_cache folder below root
+    total = 0
+    for folder, dirs, files in os.walk(root):
+        if os.path.basename(folder) == ".swimu_cache":
+            for sub_folder, _, sub_files in os.walk(folder):
+                total += sum(os.path.getsize(os.path.join(sub_folder, name)) for name in sub_files)
+            dirs[:] = []
+    return total
+
+
+def preserve_analytics(src_path: str, paths: dict) -> dict:
+    # Full rate analytics and pyramid of a session, before its raw data goes
+    from SwIMU_aggregate import summarise_session
+    from SwIMU_pyramid import build_pyramid, save_pyramid
+    from SwIMU_spectral import session_spectra
+
+    session_row, laps = summarise_session(src_path)
+    if session_row["error"]:
+        raise ValueError(f"Can't summarise {src_path}: {session_row['error']}")
+    analytics = {"session": session_row, "laps": laps}
+    try:
+        analytics["dominant_frequencies"] = session_spectra(src_path, use_cache=False).dominant_frequencies()
+    except ValueError:
+        # Too short for a spectrum
+        analytics["dominant_frequencies"] = None
+    os.makedirs(os.path.dirname(paths["pyramid"]), exist_ok=True)
+    save_pyramid(paths["pyramid"] + ".part", build_pyramid(iter_session_chunks(src_path), ARCHIVE_LEVELS))
+    os.replace(paths["pyramid"] + ".part", paths["pyramid"])
+    with open(paths["analytics"] + ".part", "w") as f:
+        json.dump(analytics, f, indent=1, default=_to_json)
+    os.replace(paths["analytics"] + ".part", paths["analytics"])
+    return analytics
+
+
+def compact_session(root: str, rel_path: str, record: dict, target: str,
+                    reduced_rate: float = REDUCED_RATE) -> dict:
+    """
+    Move one session down to a lower tier. Runs in a worker process.
+
+    :param record: The session's index record, or None if it isn't indexed yet.
+    :param target: "reduced" or "summary".
+    :return: The updated index record, with "error" set if compaction failed.
+    """
+    record = dict(record or {"tier": "raw"})
+    src_path = os.path.join(root, rel_path)
+    paths = archive_paths(root, rel_path)
+    start_time = time.perf_counter()
+    try:
+        if record["tier"] == "raw":
+            record["raw_bytes"] = os.path.getsize(src_path)
+            record["hash"] = hash_file(src_path)
+            analytics = preserve_analytics(src_path, paths)["session"]
+            record["samples"] = int(analytics["num_samples"])
+            record["rate"] = float(analytics["sample_rate_hz"])
+            record["recorded"] = session_recorded(src_path)
+            if target == "reduced":
+                factor = max(1, int(round(record["rate"] / reduced_rate)))
+                reduced = reduce_chunks(iter_session_chunks(src_path), factor)
+                save_reduced(paths["reduced"], reduced, factor, record["rate"] / factor)
+                # Read it back before the raw data goes
+                if len(load_reduced(paths["reduced"])[0]) != -(-record["samples"] // factor):
+                    raise ValueError("Reduced session doesn't match the raw sample count")
+            derived = derived_paths(src_path, record["hash"])
+            os.remove(src_path)
+            # The archive has its own pyramid and analytics now
+            record["derived_bytes"] = 0
+            for path in derived:
+                record["derived_bytes"] += os.path.getsize(path)
+                os.remove(path)
+        if target == "summary" and os.path.exists(paths["reduced"]):
+            os.remove(paths["reduced"])
+        record["tier"] = target
+        record["files"] = {kind: os.path.relpath(path, root) for kind, path in paths.items()
+                           if os.path.exists(path)}
+        record["stored_bytes"] = sum(os.path.getsize(path) for path in paths.values() if os.path.exists(path))
+        record["compacted"] = time.time()
+        record["error"] = None
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = time.perf_counter() - start_time
+    return record
+
+
+# ------------------------------ Index --------------------------------- #
+
+def index_path(root: str) -> str:
+    return os.path.join(root, ARCHIVE_DIR, INDEX_NAME)
+
+
+def load_index(root: str) -> dict:
+    path = index_path(root)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_index(root: str, index: dict):
+    path = index_path(root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(index, f, indent=1, default=_to_json)
+    os.replace(path + ".tmp", path)
+
+
+def plan(root: str, raw_days: float = RAW_DAYS, reduced_days: float = REDUCED_DAYS, now: float = None) -> list:
+    """
+    Sessions that are due to move down a tier.
+
+    :return: List of (relative path, current tier, target tier).
+    """
+    index = load_index(root)
+    moves = []
+    for path in find_sessions(root):
+        rel_path = os.path.relpath(path, root)
+        tier = index.get(rel_path, {}).get("tier", "raw")
+        target = target_tier(session_age_days(path, now), raw_days, reduced_days)
+        if TIERS.index(target) > TIERS.index(tier):
+            moves.append((rel_path, tier, target))
+    for rel_path, record in index.items():
+        if record["tier"] == "reduced" and record.get("recorded"):
+            age = ((now or time.time()) - record["recorded"]) / 86400
+            if target_tier(age, raw_days, reduced_days) == "summary":
+                moves.append((rel_path, "reduced", "summary"))
+    return moves
+
+
+def _mark_manifests(root: str, rel_path: str, tier: str):
+    # Files compacted away still count as received
+    from SwIMU_manifest import load_manifests
+    src_path = os.path.abspath(os.path.join(root, rel_path))
+    for manifest in load_manifests(root):
+        changed = False
+        for record in manifest.files.values():
+            if record["path"] == src_path:
+                record["archived"] = tier
+                changed = True
+        if changed:
+            manifest.save()
+
+
+def run_retention(root: str, raw_days: float = RAW_DAYS, reduced_days: float = REDUCED_DAYS,
+                  reduced_rate: float = REDUCED_RATE, workers: int = None) -> dict:
+    """
+    Compact every session that is due, in parallel.
+
+    :return: Counts of compacted and failed sessions.
+    """
+    moves = plan(root, raw_days, reduced_days)
+    index = load_index(root)
+    counts = {"compacted": 0, "failed": 0}
+    if not moves:
+        print("Nothing to compact")
+        return counts
+    workers = workers or os.cpu_count() or 1
+    print(f"Compacting {len(moves)} sessions on {workers} workers")
+    start_time = time.perf_counter()
+    last_save = start_time
+    with ProcessPoolExecutor(max_workers=workers, initializer=_lower_priority) as executor:
+        pending = {executor.submit(compact_session, root, rel_path, index.get(rel_path), target,
+                                   reduced_rate): rel_path
+                   for rel_path, tier, target in moves}
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    rel_path = pending.pop(future)
+                    record = future.result()
+                    if record["error"]:
+                        counts["failed"] += 1
+                        print(f"Failed to compact {rel_path}: {record['error']}")
+                        continue
+                    counts["compacted"] += 1
+                    index[rel_path] = record
+                    _mark_manifests(root, rel_path, record["tier"])
+                    print(f"{rel_path}: {record['tier']}, {record['raw_bytes'] / 1e6:.1f} MB "
+                          f"(+{record.get('derived_bytes', 0) / 1e6:.1f} MB derived) -> "
+                          f"{record['stored_bytes'] / 1e6:.2f} MB in {record['seconds']:.1f}s")
+                if time.perf_counter() - last_save > SAVE_INTERVAL:
+                    last_save = time.perf_counter()
+                    save_index(root, index)
+        finally:
+            save_index(root, index)
+    print(f"Compacted {counts['compacted']} sessions in {time.perf_counter() - start_time:.1f}s, "
+          f"{counts['failed']} failed")
+    return counts
+
+
+# ------------------------------ Reader -------------------------------- #
+
+class ArchiveReader:
+    """
+    Reads sessions at the best resolution the archive still holds.
+
+    :param root: Save folder holding the sessions and the archive.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.expanduser(root)
+        self.index = load_index(self.root)
+
+    def sessions(self) -> dict:
+        # Every known session and its tier, indexed or not
+        tiers = {rel_path: record["tier"] for rel_path, record in self.index.items()}
+        for path in find_sessions(self.root):
+            tiers.setdefault(os.path.relpath(path, self.root), "raw")
+        return dict(sorted(tiers.items()))
+
+    def tier(self, rel_path: str) -> str:
+        if os.path.exists(os.path.join(self.root, rel_path)):
+            return "raw"
+        if rel_path not in self.index:
+            raise KeyError(f"{rel_path} isn't in the archive")
+        return self.index[rel_path]["tier"]
+
+    def _pyramid(self, rel_path: str):
+        from SwIMU_pyramid import SessionPyramid
+        with np.load(archive_paths(self.root, rel_path)["pyramid"]) as pyramid:
+            return SessionPyramid(dict(pyramid))
+
+    def load(self, rel_path: str):
+        """
+        Samples of a session at the best available resolution.
+
+        :return: ((n, 7) float32 samples, {"tier", "rate"}). At the summary
+            tier the samples are the means of the finest pyramid level.
+        """
+        tier = self.tier(rel_path)
+        if tier == "raw":
+            path = os.path.join(self.root, rel_path)
+            data = np.concatenate(list(iter_session_chunks(path)) or [np.empty((0, NUM_FIELDS))]).astype("<f4")
+            duration = float(data[-1, 0] - data[0, 0]) if len(data) > 1 else 0.0
+            return data, {"tier": tier, "rate": (len(data) - 1) / duration if duration > 0 else None}
+        if tier == "reduced":
+            data, info = load_reduced(archive_paths(self.root, rel_path)["reduced"])
+            return data, {"tier": tier, "rate": info["rate"]}
+        pyramid = self._pyramid(rel_path)
+        level = pyramid.levels[0]
+        summary = pyramid._levels[level]
+        data = np.column_stack([summary["t"], summary["mean"]]).astype("<f4")
+        return data, {"tier": tier, "rate": self.index[rel_path]["rate"] / level}
+
+    def view(self, rel_path: str, t0: float = None, t1: float = None, max_points: int = 2000) -> dict:
+        """
+        Like SessionPyramid.view, served from whatever tier the session is at.
+        """
+        tier = self.tier(rel_path)
+        if tier == "raw":
+            from SwIMU_pyramid import SessionPyramid
+            return SessionPyramid.load(os.path.join(self.root, rel_path)).view(t0, t1, max_points)
+        pyramid = self._pyramid(rel_path)
+        if tier == "reduced":
+            data, info = load_reduced(archive_paths(self.root, rel_path)["reduced"])
+            t0 = pyramid.t_start if t0 is None else t0
+            t1 = pyramid.t_end if t1 is None else t1
+            j0, j1 = np.searchsorted(data[:, 0], [t0, t1])
+            if j1 - j0 <= max_points:
+                values = data[j0:j1 + 1, 1:]
+                return {"level": info["factor"], "t": data[j0:j1 + 1, 0], "min": values, "max": values,
+                        "mean": values}
+        return pyramid.view(t0, t1, max_points)
+
+    def analytics(self, rel_path: str) -> dict:
+        # Analytics preserved at compaction, computed now for raw sessions
+        path = archive_paths(self.root, rel_path)["analytics"]
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                return json.load(f)
+        from SwIMU_aggregate import summarise_session
+        session_row, laps = summarise_session(os.path.join(self.root, rel_path))
+        return {"session": session_row, "laps": laps}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tiered retention for the SwIMU session archive")
+    parser.add_argument("command", choices=["plan", "run", "show"])
+    parser.add_argument("root", nargs="?", default=os.path.join(os.path.expanduser("~"), "Downloads"),
+                        help="save folder of the received sessions")
+    parser.add_argument("--raw-days", type=float, default=RAW_DAYS, help="keep full rate data this many days")
+    parser.add_argument("--reduced-days", type=float, default=REDUCED_DAYS,
+                        help="keep downsampled data this many days, only summaries after that")
+    parser.add_argument("--reduced-rate", type=float, default=REDUCED_RATE, help="rate of reduced sessions [Hz]")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    if args.command == "plan":
+        moves = plan(args.root, args.raw_days, args.reduced_days)
+        for rel_path, tier, target in moves:
+            print(f"{rel_path}: {tier} -> {target}")
+        print(f"{len(moves)} sessions due")
+        return 0
+    if args.command == "run":
+        counts = run_retention(args.root, args.raw_days, args.reduced_days, args.reduced_rate, args.workers)
+        return 1 if counts["failed"] else 0
+
+    reader = ArchiveReader(args.root)
+    totals = {tier: [0, 0, 0] for tier in TIERS}
+    freed = 0
+    for rel_path, tier in reader.sessions().items():
+        record = reader.index.get(rel_path, {})
+        path = os.path.join(args.root, rel_path)
+        raw_bytes = record.get("raw_bytes") or os.path.getsize(path)
+        if tier == "raw":
+            # With its pyramid sidecar, the caches are counted below
+            from SwIMU_pyramid import pyramid_path
+            stored = raw_bytes + (os.path.getsize(pyramid_path(path)) if os.path.exists(pyramid_path(path)) else 0)
+        else:
+            stored = record.get("stored_bytes", raw_bytes)
+            freed += record.get("derived_bytes", 0)
+        totals[tier][0] += 1
+        totals[tier][1] += raw_bytes
+        totals[tier][2] += stored
+    for tier, (count, raw_bytes, stored) in totals.items():
+        print(f"{tier:<8} {count:5d} sessions, {raw_bytes / 1e6:9.1f} MB raw, {stored / 1e6:9.1f} MB stored")
+    print(f"caches   {cache_bytes(args.root) / 1e6:9.1f} MB in .swimu_cache, "
+          f"{freed / 1e6:.1f} MB of derived files removed with compacted sessions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
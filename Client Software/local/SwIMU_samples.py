@@ -0,0 +1,171 @@
+# Compact sample blocks for live SwIMU data: batched decoding and fixed size
+# ring buffers. This file is part of the SwIMU device tutorial series
+
+"""
+Live samples used to travel as a new list of seven Python floats per
+notification (well over 200 bytes each once the float objects are counted),
+and the plots kept growing per-channel lists. Everything downstream of the
+BLE decode now works on sample blocks instead: (n, 7) float32 arrays, 28
+bytes per sample, with the same layout as a binary session record.
+
+SampleStager collects raw notification payloads in one preallocated
+bytearray and decodes them in a single vectorized parse when the block is
+full or its oldest sample is max_latency old, so no Python objects are
+created per sample. SampleRing keeps the most recent samples for plotting in
+a fixed buffer, so memory stays flat however long a session runs.
+
+Blocks can be viewed as structured records to access channels by name:
+
+    records(block)["Ax"]
+"""
+
+import time
+import warnings
+
+import numpy as np
+
+from SwIMU_data import HEADERS, NUM_FIELDS
+
+SAMPLE_DTYPE = np.dtype([(name, "<f4") for name in HEADERS])
+
+# Longest time [s] a received sample is held before its block is handed on
+MAX_LATENCY = 0.05
+# Samples per block at most, a few hundred ms at the device rate
+MAX_BLOCK_SAMPLES = 64
+# Notification payloads are "t, Ax, Ay, Az, Gx, Gy, Gz" text, ~60 bytes
+PAYLOAD_SIZE_HINT = 64
+
+
+def records(block) -> np.ndarray:
+    # Structured view of an (n, 7) float32 block, no copy
+    return np.ascontiguousarray(block, dtype="<f4").view(SAMPLE_DTYPE).reshape(-1)
+
+
+def parse_payloads(raw: bytes, num_samples: int) -> np.ndarray:
+    """
+    Parse comma joined notification payloads into a block.
+
+    :param raw: Payloads joined with commas.
+    :param num_samples: Number of payloads in raw.
+    :return: (n, 7) float32 block, corrupted samples are left out.
+    """
+    try:
+        with warnings.catch_warnings():
+            # Older numpy only warns when it stops at bad data
+            warnings.simplefilter("error")
+            values = np.fromstring(raw, dtype="<f4", sep=",")
+        if len(values) == num_samples * NUM_FIELDS:
+            return values.reshape(num_samples, NUM_FIELDS)
+    except (ValueError, DeprecationWarning):
+        pass
+    # Something in the block didn't parse, decode line by line and drop the
+    # bad samples
+    fields = raw.split(b",")
+    rows = []
+    for i in range(0, len(fields) - NUM_FIELDS + 1, NUM_FIELDS):
+        try:
+            rows.append([float(x) for x in fields[i:i + NUM_FIELDS]])
+        except ValueError:
+            continue
+    return np.array(rows, dtype="<f4").reshape(-1, NUM_FIELDS)
+
+
+class SampleStager:
+    """
+    Stages notification payloads and emits decoded blocks.
+
+    :param sink: Called with every (n, 7) float32 block.
+    :param max_samples: Flush when this many samples are staged.
+    :param max_latency: Flush when the oldest staged sample is this old [s].
+    """
+
+    __slots__ = ("sink", "max_samples", "max_latency", "_raw", "_length", "_count", "_first_time")
+
+    def __init__(self, sink, max_samples: int = MAX_BLOCK_SAMPLES, max_latency: float = MAX_LATENCY):
+        self.sink = sink
+        self.max_samples = max_samples
+        self.max_latency = max_latency
+        # Written in place, only grows if payloads are longer than expected
+        self._raw = bytearray(max_samples * PAYLOAD_SIZE_HINT)
+        self._length = 0
+        self._count = 0
+        self._first_time = 0.0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, payload: bytes) -> bool:
+        # Returns False for a payload without 7 fields, which is dropped
+        if payload.count(b",") != NUM_FIELDS - 1:
+            return False
+        if self._count == 0:
+            self._first_time = time.perf_counter()
+            start = 0
+        else:
+            self._raw[self._length] = 44  # ","
+            start = self._length + 1
+        end = start + len(payload)
+        if end >= len(self._raw):
+            self._raw.extend(bytes(end + 1 - len(self._raw)))
+        self._raw[start:end] = payload
+        self._length = end
+        self._count += 1
+        if self._count >= self.max_samples or time.perf_counter() - self._first_time >= self.max_latency:
+            self.flush()
+        return True
+
+    def flush_if_stale(self):
+        # Called periodically so the tail of a burst doesn't wait for the next sample
+        if self._count and time.perf_counter() - self._first_time >= self.max_latency:
+            self.flush()
+
+    def flush(self):
+        if self._count == 0:
+            return
+        block = parse_payloads(bytes(memoryview(self._raw)[:self._length]), self._count)
+        self._length = 0
+        self._count = 0
+        if len(block):
+            self.sink(block)
+
+
+class SampleRing:
+    """
+    Fixed capacity buffer of the most recent samples.
+
+    Every sample is stored twice, capacity apart, so the latest samples are
+    always one contiguous slice and view() never copies.
+    """
+
+    __slots__ = ("capacity", "_buffer", "_head", "_size")
+
+    def __init__(self, capacity: int, channels: int = NUM_FIELDS):
+        self.capacity = capacity
+        self._buffer = np.zeros((2 * capacity, channels), dtype="<f4")
+        self._head = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def clear(self):
+        self._head = 0
+        self._size = 0
+
+    def extend(self, block):
+        block = np.asarray(block, dtype="<f4").reshape(-1, self._buffer.shape[1])
+        if len(block) > self.capacity:
+            block = block[-self.capacity:]
+        n = len(block)
+        start = self._head
+        first = min(n, self.capacity - start)
+        for offset in (0, self.capacity):
+            self._buffer[offset + start:offset + start + first] = block[:first]
+            self._buffer[offset:offset + n - first] = block[first:]
+        self._head = (start + n) % self.capacity
+        self._size = min(self.capacity, self._size + n)
+
+    def view(self) -> np.ndarray:
+        # Oldest to newest, valid until the next extend()
+        end = self._head + self.capacity
+        return self._buffer[end - self._size:end]
@@ -0,0 +1,253 @@
+# Shared-memory ring buffer for handing live SwIMU data to analytics
+# processes. This file is part of the SwIMU device tutorial series
+
+"""
+Heavy analytics in the same interpreter as the BLE loop and the GUI compete
+for the GIL and can cause dropped notifications. The BLE process writes
+decoded samples into a ring buffer in shared memory instead, and any number
+of worker processes read them without copying or pickling.
+
+Layout of the shared block:
+
+    header: magic "SWIMURNG" | capacity u32 | channels u32 | write seq u64
+    data:   capacity x channels float32 records
+
+The write sequence counts every sample ever written; sample n lives in slot
+n % capacity. There is one writer, readers never write to the block. A
+reader keeps its own read sequence; if the writer gets more than capacity
+samples ahead the reader has been overrun and skips forward, reporting how
+many samples it lost.
+
+Writer (BLE process):
+    ring = SharedRing.create("swimu_live")
+    client.data_callbacks.append(ring.write)
+    ...
+    ring.close(); ring.unlink()
+
+Reader (worker process):
+    reader = RingReader("swimu_live")
+    while True:
+        samples, lost = reader.read()     # (n, 7) view into shared memory
+        ... use samples ...
+        if not reader.still_valid():      # only needed when processing is slow
+            ...                           # the writer overwrote samples in use
+
+    python SwIMU_shm.py monitor swimu_live
+"""
+
+import argparse
+import struct
+import sys
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import SwIMU_metrics as metrics
+from SwIMU_data import NUM_FIELDS
+
+RING_MAGIC = b"SWIMURNG"
+RING_HEADER = struct.Struct("<8sIIQ")
+DEFAULT_NAME = "swimu_live"
+# ~10 minutes at 100 Hz, 1.8 MB
+DEFAULT_CAPACITY = 1 << 16
+
+# Blocks created by this process, which stay registered for clean up
+_CREATED = set()
+
+SAMPLES_LOST = metrics.counter("shm_samples_lost_total", "Samples overwritten before a reader got to them")
+
+
+def _attach(name: str):
+    # Readers must not unlink the block when they exit, which the resource
+    # tracker does by default before Python 3.13
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        if name in _CREATED:
+            return shm
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        except Exception:
+            pass
+        return shm
+
+
+class _RingView:
+    # numpy views on the header fields and data of a shared block
+
+    def __init__(self, shm):
+        self.shm = shm
+        magic, capacity, channels, _ = RING_HEADER.unpack_from(shm.buf, 0)
+        if magic != RING_MAGIC:
+            raise ValueError(f"{shm.name} is not a SwIMU ring buffer")
+        self.capacity = capacity
+        self.channels = channels
+        # Aligned 8 byte counter, updated with a single store by the writer
+        self._seq = np.ndarray((1,), dtype="<u8", buffer=shm.buf, offset=16)
+        self.data = np.ndarray((capacity, channels), dtype="<f4", buffer=shm.buf,
+                               offset=RING_HEADER.size)
+
+    @property
+    def write_seq(self) -> int:
+        return int(self._seq[0])
+
+    def release(self):
+        # Views must be dropped before the block can be closed
+        self._seq = None
+        self.data = None
+        self.shm.close()
+
+
+class SharedRing(_RingView):
+    """Single writer side of the ring buffer, usable as a data callback."""
+
+    @classmethod
+    def create(cls, name: str = DEFAULT_NAME, capacity: int = DEFAULT_CAPACITY,
+               channels: int = NUM_FIELDS):
+        size = RING_HEADER.size + capacity * channels * 4
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # Left behind by a crashed run, start over
+            stale = shared_memory.SharedMemory(name=name)
+            stale.close()
+            stale.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        RING_HEADER.pack_into(shm.buf, 0, RING_MAGIC, capacity, channels, 0)
+        _CREATED.add(name)
+        print(f"Sharing live data in shared memory block: {name}")
+        return cls(shm)
+
+    def write(self, samples):
+        """
+        Append one sample (7 values) or a batch (n x 7). The sequence number is
+        published after the data so readers never see unwritten slots.
+        """
+        records = np.asarray(samples, dtype="<f4").reshape(-1, self.channels)
+        n = len(records)
+        seq = self.write_seq
+        if n > self.capacity:
+            # Only the newest capacity samples fit
+            seq += n - self.capacity
+            records = records[-self.capacity:]
+            n = self.capacity
+        start = seq % self.capacity
+        first = min(n, self.capacity - start)
+        self.data[start:start + first] = records[:first]
+        self.data[:n - first] = records[first:]
+        self._seq[0] = seq + n
+
+    __call__ = write
+
+    def close(self):
+        self.release()
+
+    def unlink(self):
+        self.shm.unlink()
+
+
+class RingReader(_RingView):
+    """
+    Reader side of the ring buffer. Starts at the newest sample unless
+    from_start is set.
+    """
+
+    def __init__(self, name: str = DEFAULT_NAME, from_start: bool = False):
+        super().__init__(_attach(name))
+        self.read_seq = max(0, self.write_seq - self.capacity) if from_start else self.write_seq
+        self._block_start = self.read_seq
+        self.lost = 0
+
+    def available(self) -> int:
+        return self.write_seq - self.read_seq
+
+    def read(self, max_samples: int = None):
+        """
+        Return (samples, lost): a zero-copy (n, 7) view of the unread samples
+        and the number of samples overwritten since the last read. The view
+        stops at the end of the ring, the next call returns the rest. It stays
+        valid until the writer wraps around onto it, see still_valid().
+        """
+        write_seq = self.write_seq
+        lost = 0
+        if write_seq - self.read_seq > self.capacity:
+            lost = write_seq - self.capacity - self.read_seq
+            self.read_seq += lost
+            self.lost += lost
+            SAMPLES_LOST.inc(lost)
+
+        start = self.read_seq % self.capacity
+        n = min(write_seq - self.read_seq, self.capacity - start)
+        if max_samples is not None:
+            n = min(n, max_samples)
+        self._block_start = self.read_seq
+        self.read_seq += n
+        return self.data[start:start + n], lost
+
+    def read_copy(self, max_samples: int = None):
+        # Copy out, then check the writer didn't overwrite the block meanwhile
+        samples, lost = self.read(max_samples)
+        samples = samples.copy()
+        if not self.still_valid():
+            overwritten = min(len(samples), self.write_seq - self.capacity - self._block_start)
+            samples = samples[overwritten:]
+            lost += overwritten
+        return samples, lost
+
+    def still_valid(self) -> bool:
+        # True if the last block returned by read() hasn't been overwritten
+        return self.write_seq - self._block_start <= self.capacity
+
+    def wait(self, timeout: float = None, poll_interval: float = 0.001) -> bool:
+        # Poll until new samples arrive
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.available() == 0:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(poll_interval)
+        return True
+
+    def close(self):
+        self.release()
+
+
+def monitor(args):
+    # Example worker: report the incoming rate and any overruns
+    reader = RingReader(args.name)
+    print(f"Attached to {args.name}: capacity {reader.capacity} samples")
+    num_samples = 0
+    start = last_report = time.perf_counter()
+    try:
+        while True:
+            if not reader.wait(timeout=1.0):
+                continue
+            samples, lost = reader.read()
+            num_samples += len(samples)
+            if lost:
+                print(f"Overrun: {lost} samples lost")
+            now = time.perf_counter()
+            if now - last_report >= 1.0 and len(samples):
+                print(f"{num_samples / (now - start):.1f} samples/s, "
+                      f"last sample {samples[-1].round(3).tolist()}")
+                last_report = now
+    finally:
+        reader.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read live SwIMU data from shared memory")
+    parser.add_argument("command", choices=["monitor"])
+    parser.add_argument("name", nargs="?", default=DEFAULT_NAME)
+    args = parser.parse_args(argv)
+    monitor(args)
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        sys.exit(130)
@@ -0,0 +1,283 @@
+# Spectral analysis (Welch PSD and short-time FFT spectrograms) of recorded
+# SwIMU sessions. This file is part of the SwIMU device tutorial series
+
+"""
+Swimming is periodic: every arm stroke and every kick shows up as a peak in
+the frequency content of the IMU channels. This module computes, for each of
+the six IMU channels:
+
+    - a Welch power spectral density over the whole session
+    - a short-time FFT spectrogram (power per segment over time)
+    - the dominant stroke and kick frequency
+
+Sessions are read in blocks with iter_session_chunks and cut into
+overlapping, Hann-windowed segments. The Welch PSD is a running sum and the
+spectrogram keeps at most max_segments columns: once it is full, neighbouring
+columns are averaged in pairs and later segments are averaged in groups of
+the same size, so memory is bounded by the block size and max_segments
+rather than the session length. The FFTs of the six channels run on a
+thread pool. Results are cached on disk keyed by the session's content hash
+and the analysis parameters, so re-opening a session for interactive
+exploration doesn't recompute anything. The hash is only recomputed when the
+session's size or modification time change.
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from SwIMU_data import HEADERS, cached_hash, iter_session_chunks
+
+CHANNELS = HEADERS[1:]
+CACHE_DIR_NAME = os.path.join(".swimu_cache", "spectral")
+
+# Frequency bands [Hz] searched for the dominant stroke and kick frequency
+BANDS = {
+    "stroke": (0.3, 1.2),
+    "kick": (1.2, 3.5),
+}
+
+DEFAULT_PARAMS = {
+    "nperseg": 512,     # samples per FFT segment
+    "noverlap": 256,    # samples shared between neighbouring segments
+    "fs": None,         # sample rate [Hz], estimated from the timestamps if None
+    "max_segments": 2048,   # spectrogram columns kept, longer sessions are averaged down
+}
+
+
+def estimate_sample_rate(t) -> float:
+    # Median spacing is robust against the odd dropped or duplicated sample
+    dt = np.diff(t)
+    dt = dt[dt > 0]
+    if len(dt) == 0:
+        raise ValueError("Can't estimate the sample rate from fewer than two timestamps")
+    return float(1.0 / np.median(dt))
+
+
+def _segment_power(x, window, step):
+    # Power spectrum of every full overlapping segment of one channel
+    nperseg = len(window)
+    segments = np.lib.stride_tricks.sliding_window_view(x, nperseg)[::step]
+    # Remove the mean of each segment so gravity doesn't swamp the low bins
+    segments = segments - segments.mean(axis=1, keepdims=True)
+    spectrum = np.fft.rfft(segments * window, axis=1)
+    return (spectrum.real**2 + spectrum.imag**2).astype(np.float32)
+
+
+class _Spectrogram:
+    # Spectrogram columns of a stream of segments, averaged down in pairs
+    # whenever max_segments would be exceeded
+
+    def __init__(self, num_channels, num_freqs, max_segments):
+        if max_segments < 2:
+            raise ValueError("max_segments must be at least 2")
+        self.columns = np.zeros((num_channels, max_segments - max_segments % 2, num_freqs), dtype=np.float32)
+        self.times = np.zeros(self.columns.shape[1])
+        self.count = 0
+        # Segments averaged into each column
+        self.factor = 1
+        self._power = np.zeros((num_channels, num_freqs))
+        self._time = 0.0
+        self._pending = 0
+
+    def add(self, power, times):
+        i = 0
+        while i < len(times):
+            if self._pending == 0 and len(times) - i >= self.factor:
+                # Whole columns at once
+                groups = min((len(times) - i) // self.factor, self.columns.shape[1] - self.count)
+                end = i + groups * self.factor
+                shape = (power.shape[0], groups, self.factor, power.shape[2])
+                self.columns[:, self.count:self.count + groups] = power[:, i:end].reshape(shape).mean(axis=2)
+                self.times[self.count:self.count + groups] = times[i:end].reshape(groups, self.factor).mean(axis=1)
+                self.count += groups
+                i = end
+            else:
+                take = min(self.factor - self._pending, len(times) - i)
+                self._power += power[:, i:i + take].sum(axis=1)
+                self._time += times[i:i + take].sum()
+                self._pending += take
+                i += take
+                if self._pending == self.factor:
+                    self._emit()
+            if self.count == self.columns.shape[1]:
+                self._halve()
+
+    def _emit(self):
+        self.columns[:, self.count] = self._power / self._pending
+        self.times[self.count] = self._time / self._pending
+        self.count += 1
+        self._power[:] = 0
+        self._time = 0.0
+        self._pending = 0
+
+    def _halve(self):
+        half = self.count // 2
+        self.columns[:, :half] = (self.columns[:, 0:self.count:2] + self.columns[:, 1:self.count:2]) / 2
+        self.times[:half] = (self.times[0:self.count:2] + self.times[1:self.count:2]) / 2
+        self.count = half
+        self.factor *= 2
+
+    def finish(self):
+        # A last, partly filled column still shows the end of the session
+        if self._pending:
+            if self.count == self.columns.shape[1]:
+                self._halve()
+            self._emit()
+        return self.columns[:, :self.count].copy(), self.times[:self.count].copy()
+
+
+class SpectralResult:
+    """
+    Spectra of one session. psd is (6, n_freqs), spectrogram is
+    (6, n_columns, n_freqs), spec_t holds the centre time of each column.
+    Each column is the mean of params["spec_decimation"] segments.
+    """
+
+    def __init__(self, freqs, psd, spec_t, spectrogram, fs, params):
+        self.freqs = freqs
+        self.psd = psd
+        self.spec_t = spec_t
+        self.spectrogram = spectrogram
+        self.fs = fs
+        self.params = params
+
+    def dominant_frequency(self, channel, band) -> float:
+        """
+        Frequency of the largest PSD peak of a channel within a band.
+
+        :param channel: Channel name, e.g. "Gy".
+        :param band: Name of a band in BANDS or a (low, high) tuple in Hz.
+        """
+        low, high = BANDS[band] if isinstance(band, str) else band
+        mask = (self.freqs >= low) & (self.freqs <= high)
+        if not mask.any():
+            return float("nan")
+        power = self.psd[CHANNELS.index(channel)][mask]
+        return float(self.freqs[mask][np.argmax(power)])
+
+    def dominant_frequencies(self) -> dict:
+        # Table of channel -> band -> frequency
+        return {channel: {band: self.dominant_frequency(channel, band) for band in BANDS}
+                for channel in CHANNELS}
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            np.savez_compressed(f, freqs=self.freqs, psd=self.psd, spec_t=self.spec_t,
+                                spectrogram=self.spectrogram, fs=np.array(self.fs),
+                                params=np.array(json.dumps(self.params)))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as f:
+            return cls(f["freqs"], f["psd"], f["spec_t"], f["spectrogram"],
+                       float(f["fs"]), json.loads(str(f["params"])))
+
+
+def compute_spectra(chunks, nperseg=DEFAULT_PARAMS["nperseg"], noverlap=DEFAULT_PARAMS["noverlap"],
+                    fs=None, max_segments=DEFAULT_PARAMS["max_segments"],
+                    workers=len(CHANNELS)) -> SpectralResult:
+    """
+    Welch PSD and spectrogram of a stream of raw sample chunks.
+
+    :param chunks: Iterable of (n, 7) arrays in session order.
+    :param nperseg: Samples per FFT segment.
+    :param noverlap: Samples of overlap between segments.
+    :param fs: Sample rate [Hz], estimated from the first chunk if None.
+    :param max_segments: Most spectrogram columns to keep.
+    :param workers: Threads used to process the channels in parallel.
+    :return: SpectralResult
+    """
+    step = nperseg - noverlap
+    if step <= 0:
+        raise ValueError("noverlap must be smaller than nperseg")
+
+    window = np.hanning(nperseg)
+    num_channels = len(CHANNELS)
+    psd_sum = np.zeros((num_channels, nperseg // 2 + 1))
+    spectrogram = _Spectrogram(num_channels, nperseg // 2 + 1, max_segments)
+    num_segments = 0
+    carry = np.empty((0, len(HEADERS)))
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for chunk in chunks:
+            if len(chunk) == 0:
+                continue
+            if fs is None:
+                fs = estimate_sample_rate(chunk[:, 0])
+
+            # Samples left over from the previous block belong to the first
+            # segments of this one, keeping the overlap continuous
+            data = np.concatenate([carry, chunk]) if len(carry) else chunk
+            segments = (len(data) - nperseg) // step + 1 if len(data) >= nperseg else 0
+            if segments == 0:
+                carry = data
+                continue
+
+            futures = [executor.submit(_segment_power, data[:, i + 1], window, step)
+                       for i in range(num_channels)]
+            power = np.stack([future.result() for future in futures])
+            psd_sum += power.sum(axis=1)
+            starts = np.arange(segments) * step
+            spectrogram.add(power, data[starts + nperseg // 2, 0])
+            num_segments += segments
+
+            carry = data[segments * step:]
+
+    if fs is None:
+        raise ValueError("No samples to analyse")
+
+    freqs = np.fft.rfftfreq(nperseg, d=1.0 / fs)
+    # Scale to a one-sided power spectral density like scipy.signal.welch
+    scale = 1.0 / (fs * (window**2).sum())
+    one_sided = np.full(len(freqs), 2.0)
+    one_sided[0] = 1.0
+    if nperseg % 2 == 0:
+        one_sided[-1] = 1.0
+    psd = psd_sum / max(num_segments, 1) * scale * one_sided
+
+    columns, spec_t = spectrogram.finish()
+    columns *= np.float32(scale) * one_sided.astype(np.float32)
+
+    params = {"nperseg": nperseg, "noverlap": noverlap, "fs": fs, "max_segments": max_segments,
+              "spec_decimation": spectrogram.factor}
+    return SpectralResult(freqs, psd, spec_t, columns, fs, params)
+
+
+def cache_path(session_path, params, cache_dir=None) -> str:
+    # Key on the session contents (not the name) and the parameters. The
+    # contents are only hashed again when the size or mtime changed
+    cache_dir = cache_dir or os.path.join(os.path.dirname(os.path.abspath(session_path)), CACHE_DIR_NAME)
+    param_key = hashlib.blake2b(json.dumps(params, sort_keys=True).encode("utf-8"),
+                                digest_size=8).hexdigest()
+    return os.path.join(cache_dir, f"{cached_hash(session_path, cache_dir)}_{param_key}.npz")
+
+
+def session_spectra(session_path, cache_dir=None, use_cache=True, **params) -> SpectralResult:
+    """
+    Spectra of a recorded session, loaded from the on-disk cache when the
+    same session was analysed with the same parameters before.
+
+    :param session_path: Path to the session.
+    :param cache_dir: Cache directory, defaults to .swimu_cache/spectral next
+        to the session.
+    :param use_cache: Read and write the cache.
+    :param params: Overrides for DEFAULT_PARAMS.
+    :return: SpectralResult
+    """
+    params = {**DEFAULT_PARAMS, **params}
+    path = cache_path(session_path, params, cache_dir) if use_cache else None
+    if path and os.path.exists(path):
+        return SpectralResult.load(path)
+
+    result = compute_spectra(iter_session_chunks(session_path), **params)
+
+    if path:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".part"
+        result.save(tmp_path)
+        os.replace(tmp_path, path)
+    return result
@@ -0,0 +1,115 @@
+# Startup benchmark for the SwIMU client: import time per module and time to
+# first window. This file is part of the SwIMU device tutorial series
+
+"""
+Runs the client entry points in fresh interpreters with "python -X importtime"
+and reports where the start up time goes, so regressions (a heavy import
+creeping back onto the start up path) are easy to spot:
+
+    python SwIMU_startup.py                  # main_window, headless, client
+    python SwIMU_startup.py --top 30 --runs 5
+    python SwIMU_startup.py --window         # also time until the window is built
+
+Times are the median over --runs cold starts. "self" is the time spent in a
+module's own import, "cumulative" includes everything it imported.
+"""
+
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TARGETS = ("main_window", "SwIMU_headless", "SwIMU_client")
+# Modules the GUI shouldn't import until the feature using them is
+GUI_DEFERRED = ("bleak", "pandas", "nest_asyncio", "SwIMU_BLE", "matplotlib")
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+WINDOW_SNIPPET = """
+import time
+start = time.perf_counter()
+from PyQt5 import QtWidgets
+from main_window import MainWindow
+app = QtWidgets.QApplication([])
+window = MainWindow()
+window.show()
+app.processEvents()
+print(f"WINDOW {time.perf_counter() - start}")
+"""
+
+
+def import_times(module: str) -> dict:
+    """
+    Import a module in a fresh interpreter with -X importtime.
+
+    :param module: Module to import.
+    :return: {module name: (self [s], cumulative [s], depth)}
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=HERE, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr[-2000:]}")
+    times = {}
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            times[name] = (int(self_us) / 1e6, int(cumulative_us) / 1e6, len(indent) // 2)
+    return times
+
+
+def median_import_times(module: str, runs: int) -> dict:
+    samples = [import_times(module) for _ in range(runs)]
+    names = set().union(*samples)
+    return {name: (statistics.median(s[name][0] for s in samples if name in s),
+                   statistics.median(s[name][1] for s in samples if name in s),
+                   samples[0].get(name, (0, 0, 0))[2])
+            for name in names}
+
+
+def window_time(runs: int) -> float:
+    # Cold start until the main window is built and shown (offscreen)
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get("QT_QPA_PLATFORM", "offscreen"))
+    times = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", WINDOW_SNIPPET], cwd=HERE, env=env,
+                                capture_output=True, text=True)
+        match = re.search(r"WINDOW ([\d.]+)", result.stdout)
+        if match is None:
+            raise RuntimeError(f"Window start up failed:\n{result.stderr[-2000:]}")
+        times.append(float(match.group(1)))
+    return statistics.median(times)
+
+
+def report(module: str, times: dict, top: int):
+    total = times.get(module, (0, 0, 0))[1]
+    print(f"\n=== import {module}: {total * 1e3:.1f} ms ===")
+    print(f"{'cumulative [ms]':>16} {'self [ms]':>10}  module")
+    ranked = sorted(times.items(), key=lambda item: item[1][1], reverse=True)
+    for name, (self_s, cumulative_s, depth) in ranked[:top]:
+        print(f"{cumulative_s * 1e3:16.1f} {self_s * 1e3:10.1f}  {'  ' * depth}{name}")
+    loaded = sorted(name for name in GUI_DEFERRED if name in times) if module == "main_window" else []
+    if loaded:
+        print(f"Imported at start up but should be deferred: {', '.join(loaded)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure SwIMU client start up time")
+    parser.add_argument("modules", nargs="*", default=list(TARGETS))
+    parser.add_argument("--runs", type=int, default=3, help="cold starts per module, the median is reported")
+    parser.add_argument("--top", type=int, default=20, help="number of modules listed")
+    parser.add_argument("--window", action="store_true", help="also time until the main window is shown")
+    args = parser.parse_args(argv)
+
+    for module in args.modules:
+        report(module, median_import_times(module, args.runs), args.top)
+    if args.window:
+        print(f"\nTime to first window: {window_time(args.runs) * 1e3:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,347 @@
+# Clock synchronization between the host and SwIMU devices, and time aligned
+# merging of multi-device sessions. This file is part of the SwIMU device
+# tutorial series
+
+"""
+Each device timestamps its samples in seconds since its own imuStartMillis,
+and the wall clock it gets in config mode only has one second resolution.
+To line up several sensors on one swimmer (or several swimmers in one heat)
+the client runs round trip exchanges with the device while it streams:
+
+    host writes seq n            at host time t_send
+    device notifies n, ms        ms = its recording clock when it answered
+    host receives the reply      at host time t_recv
+
+Assuming the reply was sampled half way through the round trip, the device
+clock reads ms while the host clock reads (t_send + t_recv) / 2. BLE delays
+are quantized to connection events and often asymmetric, so each burst of
+exchanges keeps only the one with the smallest round trip, and a line fitted
+through the kept offsets over the session gives offset and drift. The error
+is bounded by half the smallest round trip, which is stored with the fit.
+
+The fit is saved next to the live recording as <session>.sync.json, and on
+firmware that reports the SD file of the session (1.4.0 on) also as
+<SD file>.sync.json in the client's save folder, where the file lands when
+it's offloaded. Ingest copies it into the binary session's metadata, and
+merge_sessions maps every
+device onto host time and resamples all of them onto one common time grid in
+a single vectorized pass per device:
+
+    python SwIMU_sync.py merge left_wrist.swimu right_wrist.swimu --out heat1.npz
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+from SwIMU_data import HEADERS, is_binary_session, load_session, read_binary_session, read_session_header
+
+SYNC_REQUEST = struct.Struct("<I")      # sequence number
+SYNC_REPLY = struct.Struct("<IIB")      # sequence number, recording ms, recording flag
+SYNC_SUFFIX = ".sync.json"
+# Exchanges per burst, the one with the smallest round trip is kept
+BURST_EXCHANGES = 8
+# Seconds between bursts while streaming
+SYNC_INTERVAL = 10.0
+REPLY_TIMEOUT = 1.0
+# Shortest span of bursts [s] worth fitting a drift to
+MIN_DRIFT_SPAN = 20.0
+
+
+class HostClock:
+    # Wall clock time [s since epoch] with perf_counter resolution. Pinned
+    # once, so it doesn't step if the system clock is adjusted mid session
+
+    def __init__(self):
+        self._wall = time.time()
+        self._perf = time.perf_counter()
+
+    def now(self) -> float:
+        return self._wall + (time.perf_counter() - self._perf)
+
+
+HOST_CLOCK = HostClock()
+
+
+class ClockEstimator:
+    """
+    Collects round trip exchanges and fits the device clock against host time.
+
+    The fit is device_time = host_time + offset + drift * (host_time - host_ref).
+    """
+
+    def __init__(self):
+        # (burst, host send, host receive, device time) per exchange
+        self.exchanges = []
+
+    def add(self, burst: int, host_send: float, host_recv: float, device_time: float):
+        self.exchanges.append((burst, host_send, host_recv, device_time))
+
+    def best_exchanges(self) -> np.ndarray:
+        # Smallest round trip exchange of every burst, as (host mid, offset, rtt) rows
+        if not self.exchanges:
+            return np.empty((0, 3))
+        burst, send, recv, device = np.array(self.exchanges, dtype=float).T
+        rtt = recv - send
+        mid = (send + recv) / 2
+        # Sort by burst, then round trip, and take the first of each burst
+        order = np.lexsort((rtt, burst))
+        first = order[np.r_[True, np.diff(burst[order]) != 0]]
+        return np.column_stack([mid[first], device[first] - mid[first], rtt[first]])
+
+    def fit(self) -> dict:
+        best = self.best_exchanges()
+        if len(best) == 0:
+            return None
+        mid, offset, rtt = best.T
+        host_ref = float(mid[0])
+        if len(best) >= 2 and mid[-1] - mid[0] >= MIN_DRIFT_SPAN:
+            drift, intercept = np.polyfit(mid - host_ref, offset, 1)
+            residual = offset - (intercept + drift * (mid - host_ref))
+        else:
+            drift, intercept = 0.0, float(offset[np.argmin(rtt)])
+            residual = offset - intercept
+        return {
+            "host_ref": host_ref,
+            "offset": float(intercept),
+            "drift": float(drift),
+            "drift_ppm": float(drift * 1e6),
+            "uncertainty": float(rtt.min() / 2),
+            "residual_rms": float(np.sqrt(np.mean(residual ** 2))),
+            "bursts": len(best),
+            "exchanges": len(self.exchanges),
+        }
+
+
+def to_host_time(device_time, fit: dict) -> np.ndarray:
+    """
+    Map device timestamps onto host time.
+
+    :param device_time: Device times [s], e.g. the elapsed_time column.
+    :param fit: Clock fit from ClockEstimator.fit().
+    :return: float64 host times [s since epoch].
+    """
+    device_time = np.asarray(device_time, dtype=float)
+    drift = fit["drift"]
+    # Solve device = host + offset + drift * (host - host_ref) for host
+    return (device_time - fit["offset"] + drift * fit["host_ref"]) / (1.0 + drift)
+
+
+class DeviceClockSync:
+    """
+    Runs sync bursts against a connected device while it streams.
+
+    :param client: Connected BleakClient.
+    :param uuid: Sync characteristic of the device.
+    :param interval: Seconds between bursts.
+    :param exchanges: Round trips per burst.
+    """
+
+    def __init__(self, client, uuid: str, interval: float = SYNC_INTERVAL,
+                 exchanges: int = BURST_EXCHANGES):
+        self.client = client
+        self.uuid = uuid
+        self.interval = interval
+        self.exchanges = exchanges
+        self.estimator = ClockEstimator()
+        self._seq = 0
+        self._burst = 0
+        self._pending = None
+        self._task = None
+
+    def _handle_reply(self, sender, data):
+        # Timestamp first, everything else can wait
+        host_recv = HOST_CLOCK.now()
+        if self._pending is None or len(data) < SYNC_REPLY.size:
+            return
+        seq, device_ms, recording = SYNC_REPLY.unpack_from(bytes(data))
+        expected, future = self._pending
+        # Late replies to an exchange that timed out are ignored
+        if seq == expected and not future.done():
+            future.set_result((host_recv, device_ms / 1000, bool(recording)))
+
+    async def start(self):
+        await self.client.start_notify(self.uuid, self._handle_reply)
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await self.burst()
+            except Exception as e:
+                # A failed write loses one burst, not the rest of the session
+                print(f"Clock sync burst failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def burst(self):
+        loop = asyncio.get_running_loop()
+        try:
+            for _ in range(self.exchanges):
+                self._seq += 1
+                future = loop.create_future()
+                self._pending = (self._seq, future)
+                host_send = HOST_CLOCK.now()
+                try:
+                    await self.client.write_gatt_char(self.uuid, SYNC_REQUEST.pack(self._seq), response=False)
+                    host_recv, device_time, recording = await asyncio.wait_for(future, REPLY_TIMEOUT)
+                except asyncio.TimeoutError:
+                    continue
+                finally:
+                    self._pending = None
+                # Before START the device clock isn't the recording clock
+                if recording:
+                    self.estimator.add(self._burst, host_send, host_recv, device_time)
+        finally:
+            # Exchanges kept from a burst that failed part way stay in it
+            self._burst += 1
+
+    async def stop(self) -> dict:
+        # One last burst so the fit spans the whole session
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                # The sync task died, the exchanges it kept still count
+                print(f"Clock sync stopped early: {e}")
+            self._task = None
+        try:
+            await self.burst()
+            await self.client.stop_notify(self.uuid)
+        except Exception as e:
+            print(f"Final clock sync failed: {e}")
+        return self.estimator.fit()
+
+
+def sync_path(session_path: str) -> str:
+    return os.path.splitext(session_path)[0] + SYNC_SUFFIX
+
+
+def save_sync(session_path: str, fit: dict, estimator: ClockEstimator = None, device: str = None) -> str:
+    # Write the fit (and the raw exchanges) next to a session, atomically
+    path = sync_path(session_path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    record = {"device": device, "session": os.path.basename(session_path), "clock": fit}
+    if estimator is not None:
+        record["exchanges"] = estimator.exchanges
+    with open(path + ".part", "w") as f:
+        json.dump(record, f, indent=2)
+    os.replace(path + ".part", path)
+    return path
+
+
+def load_clock(session_path: str) -> dict:
+    """
+    Find the clock fit for a session: the binary session's metadata first,
+    then a .sync.json sidecar.
+
+    :return: Fit dict, or None if the session was never synced.
+    """
+    if is_binary_session(session_path):
+        metadata = read_session_header(session_path)[0]
+        if metadata.get("clock"):
+            return metadata["clock"]
+    path = sync_path(session_path)
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f).get("clock")
+    return None
+
+
+def _session_samples(path: str) -> np.ndarray:
+    if is_binary_session(path):
+        return read_binary_session(path)
+    return load_session(path).to_numpy(dtype="<f4")
+
+
+def merge_sessions(paths: list, rate: float = None) -> dict:
+    """
+    Align sessions from several devices onto host time and resample them
+    onto one common grid.
+
+    :param paths: Session files, each with a clock fit (see load_clock).
+    :param rate: Grid rate [Hz], default the median device rate.
+    :return: {"time": (m,) host times, "samples": (m, devices, 6) float32
+        with NaN where a device has no data, "devices": session names}
+    """
+    host_times = []
+    channels = []
+    for path in paths:
+        fit = load_clock(path)
+        if fit is None:
+            raise ValueError(f"No clock sync for {path}, record it with sync enabled or add {sync_path(path)}")
+        samples = _session_samples(path)
+        times = to_host_time(samples[:, 0], fit)
+        # Recordings can hold glitched timestamps, keep them in order
+        order = np.argsort(times, kind="stable")
+        host_times.append(times[order])
+        channels.append(np.asarray(samples[order, 1:]))
+
+    if rate is None:
+        rate = float(np.median([(len(t) - 1) / (t[-1] - t[0]) for t in host_times if len(t) > 1 and t[-1] > t[0]]))
+    start = max(t[0] for t in host_times if len(t))
+    stop = min(t[-1] for t in host_times if len(t))
+    if stop <= start:
+        # No overlap, keep the union so nothing is dropped
+        start = min(t[0] for t in host_times if len(t))
+        stop = max(t[-1] for t in host_times if len(t))
+    grid = start + np.arange(int((stop - start) * rate) + 1) / rate
+
+    merged = np.full((len(grid), len(paths), len(HEADERS) - 1), np.nan, dtype="<f4")
+    for i, (times, values) in enumerate(zip(host_times, channels)):
+        if len(times) < 2:
+            continue
+        # Linear interpolation of all channels at once: one searchsorted per device
+        right = np.clip(np.searchsorted(times, grid), 1, len(times) - 1)
+        left = right - 1
+        span = times[right] - times[left]
+        weight = np.divide(grid - times[left], span, out=np.zeros_like(grid), where=span > 0)
+        inside = (grid >= times[0]) & (grid <= times[-1])
+        interpolated = values[left] + (values[right] - values[left]) * weight[:, None]
+        merged[inside, i] = interpolated[inside]
+
+    return {"time": grid, "samples": merged,
+            "devices": [os.path.splitext(os.path.basename(p))[0] for p in paths],
+            "channels": HEADERS[1:], "rate": rate}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Align and merge SwIMU sessions from several devices")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    merge_parser = subparsers.add_parser("merge", help="resample synced sessions onto one host time grid")
+    merge_parser.add_argument("paths", nargs="+", help="sessions with a clock sync")
+    merge_parser.add_argument("--out", required=True, help=".npz file to write")
+    merge_parser.add_argument("--rate", type=float, default=None, help="grid rate [Hz] (default: median device rate)")
+    show_parser = subparsers.add_parser("show", help="print the clock fit of sessions")
+    show_parser.add_argument("paths", nargs="+")
+    args = parser.parse_args(argv)
+
+    if args.command == "show":
+        for path in args.paths:
+            fit = load_clock(path)
+            if fit is None:
+                print(f"{path}: not synced")
+            else:
+                print(f"{path}: offset {fit['offset']:.4f}s, drift {fit['drift_ppm']:.1f} ppm, "
+                      f"+/- {fit['uncertainty'] * 1e3:.1f} ms over {fit['bursts']} bursts")
+        return 0
+
+    start = time.perf_counter()
+    merged = merge_sessions(args.paths, args.rate)
+    np.savez(args.out, time=merged["time"], samples=merged["samples"],
+             devices=np.array(merged["devices"]), channels=np.array(merged["channels"]))
+    print(f"Merged {len(args.paths)} sessions into {len(merged['time'])} samples at "
+          f"{merged['rate']:.1f} Hz in {time.perf_counter() - start:.2f}s: {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,449 @@
+# Synthetic six-axis swim sessions for benchmarks and pipeline tests.
+# This file is part of the SwIMU device tutorial series
+
+"""
+Real sessions only exist on the devices, so every benchmark used to start
+with "first go swimming". This module generates plausible ones instead:
+
+    python SwIMU_synth.py out/ --swimmers 8 --duration 3600 --format csv swimu bin
+    python SwIMU_synth.py out/ --swimmers 4 --duration 7200 --corruption 0.001 --labels
+
+Each swimmer gets a workout plan of sets of laps: a wall push, a stroke
+(freestyle, backstroke, breaststroke or butterfly) at the swimmer's own pace
+and stroke rate, a turn at the wall, and rest between sets. Signals are
+built for whole blocks of samples at once from the plan:
+
+    - gravity in the sensor frame from the body orientation (prone, supine,
+      upright on the wall) with the body roll of freestyle and backstroke
+      and the rotation of flip turns
+    - stroke accelerations and rotation rates as harmonics of a stroke
+      phase whose rate wanders slowly from cycle to cycle
+    - push off surges and turn rotation bursts
+    - white noise, a random walk gyro bias and device clock drift, rounded
+      to the precision the device writes
+
+CSV text is formatted with numpy digit arithmetic rather than per row string
+formatting, so output runs at disk speed. Text outputs (CSV and live
+notification payloads) can be corrupted at a given row rate with the
+patterns clean_csv_data rejects: rows glued together by a lost newline,
+fields merged by a lost comma and rows cut short. With --labels the plan is
+written as a <session>.labels.json sidecar, ready for SwIMU_classify.
+
+From code:
+
+    synth = SessionSynth(duration=600, rate=100, seed=3)
+    for block in synth.chunks():
+        ...
+    payloads = encode_notifications(block)    # what handle_IMU_data receives
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from SwIMU_data import (DEVICE_HEADER, DEVICE_MAGIC, DEVICE_RECORD_FIELDS, DEVICE_RECORD_SIZE,
+                        DEVICE_VERSION, NUM_FIELDS, encode_session_header)
+
+DT_FMT = "%Y_%m_%d_%H_%M_%S"
+FORMATS = ("csv", "swimu", "bin")
+STROKES = ("freestyle", "backstroke", "breaststroke", "butterfly")
+# Same names as SwIMU_classify.LABELS
+LABEL_CODES = {label: i for i, label in enumerate(STROKES + ("turn", "wall_push", "rest"))}
+LABELS_SUFFIX = ".labels.json"
+
+CHUNK_ROWS = 1 << 20
+POOL_LENGTH = 25.0          # [m]
+PUSH_DURATION = 1.5         # [s]
+TURN_DURATION = 2.0         # [s]
+TURN_RATE = 400.0           # peak rotation rate of a flip turn [deg/s]
+
+# Per stroke: stroke cycles/s, speed relative to freestyle, body roll
+# amplitude [rad], accel harmonic amplitudes per axis [g], gyro amplitude
+# per axis [deg/s], gravity direction in the sensor frame when swimming
+STROKE_MODELS = {
+    "freestyle":    dict(rate=0.80, speed=1.00, roll=0.70, accel=(0.9, 0.4, 0.5), gyro=(180, 90, 220), gravity=(0.2, 0.0, -1.0)),
+    "backstroke":   dict(rate=0.70, speed=0.90, roll=0.60, accel=(0.8, 0.5, 0.4), gyro=(160, 80, 200), gravity=(0.2, 0.0, 1.0)),
+    "breaststroke": dict(rate=0.60, speed=0.75, roll=0.05, accel=(1.4, 0.2, 0.6), gyro=(60, 140, 40), gravity=(0.4, 0.0, -0.9)),
+    "butterfly":    dict(rate=0.85, speed=0.95, roll=0.05, accel=(1.8, 0.2, 0.9), gyro=(50, 260, 40), gravity=(0.3, 0.0, -1.0)),
+}
+UPRIGHT = (-1.0, 0.0, 0.1)
+
+ACCEL_NOISE = 0.02          # [g]
+GYRO_NOISE = 1.5            # [deg/s]
+GYRO_BIAS_WALK = 0.02       # gyro bias random walk per sample [deg/s]
+BIAS_STEP = 50              # samples between gyro bias steps
+
+# Device line format "%.3f, %.3f, %.3f, %.3f, %.2f, %.2f, %.2f": decimals
+# and largest number of integer digits of each column
+TEXT_COLUMNS = ((3, 7), (3, 3), (3, 3), (3, 3), (2, 5), (2, 5), (2, 5))
+CORRUPTIONS = ("glued", "merged_field", "truncated")
+
+# Binary device recordings, LSM6DS3 at +/-16 g and +/-2000 deg/s
+ACCEL_SCALE = 16 / 32768
+GYRO_SCALE = 2000 / 32768
+
+
+def workout_plan(duration: float, rng, strokes=STROKES, speed: float = 1.4) -> list:
+    """
+    Sets of laps with pushes, turns and rest filling a session.
+
+    :param duration: Session length [s].
+    :param speed: Freestyle speed of the swimmer [m/s].
+    :return: List of {"start", "end", "label"} segments covering the session.
+    """
+    segments = []
+    t = 0.0
+
+    def add(length, label):
+        nonlocal t
+        length = min(length, duration - t)
+        if length > 0:
+            segments.append({"start": t, "end": t + length, "label": label})
+            t += length
+
+    add(rng.uniform(5, 20), "rest")
+    while t < duration:
+        stroke = strokes[rng.integers(len(strokes))]
+        lap_time = POOL_LENGTH / (speed * STROKE_MODELS[stroke]["speed"])
+        for lap in range(int(rng.choice([2, 4, 8]))):
+            add(PUSH_DURATION, "wall_push")
+            add(lap_time * rng.uniform(0.95, 1.05) - PUSH_DURATION - TURN_DURATION / 2, stroke)
+            add(TURN_DURATION, "turn")
+        add(rng.uniform(10, 60), "rest")
+    return segments
+
+
+class SessionSynth:
+    """
+    One swimmer's session, generated block by block.
+
+    :param duration: Session length [s].
+    :param rate: Sample rate [Hz].
+    :param seed: Random seed, the same seed gives the same session.
+    :param strokes: Strokes the workout picks from.
+    """
+
+    def __init__(self, duration: float, rate: float = 100.0, seed: int = 0, strokes=STROKES):
+        self.duration = duration
+        self.rate = rate
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        # The swimmer: pace, stroke rate and how the device drifts
+        self.speed = rng.uniform(1.1, 1.7)
+        self.cadence = rng.uniform(0.85, 1.15)
+        self.clock_drift_ppm = rng.uniform(-40, 40)
+        self.segments = workout_plan(duration, rng, strokes, self.speed)
+        self.num_samples = int(duration * rate)
+
+        # Per segment parameters, looked up per sample by segment index
+        labels = [segment["label"] for segment in self.segments]
+        self._seg_start = np.array([int(round(s["start"] * rate)) for s in self.segments])
+        self._seg_length = np.diff(np.r_[self._seg_start, self.num_samples]).clip(min=1)
+        self._seg_code = np.array([LABEL_CODES[label] for label in labels])
+        self._seg_stroke = np.array([STROKES.index(label) if label in STROKES else -1 for label in labels])
+        models = [STROKE_MODELS[stroke] for stroke in STROKES]
+        self._stroke_rate = np.array([m["rate"] for m in models]) * self.cadence
+        self._roll = np.array([m["roll"] for m in models])
+        self._accel_amp = np.array([m["accel"] for m in models])
+        self._gyro_amp = np.array([m["gyro"] for m in models])
+        gravity = np.array([m["gravity"] for m in models])
+        self._gravity = gravity / np.linalg.norm(gravity, axis=1, keepdims=True)
+
+    def labels(self) -> list:
+        return [dict(segment) for segment in self.segments]
+
+    def chunks(self, chunk_rows: int = CHUNK_ROWS):
+        """
+        The session as (n, 7) float32 blocks in the HEADERS layout.
+        """
+        rng = np.random.default_rng(self.seed + 1)
+        phase = 0.0
+        bias = np.zeros(3)
+        for start in range(0, self.num_samples, chunk_rows):
+            index = np.arange(start, min(start + chunk_rows, self.num_samples))
+            block, phase, bias = self._block(index, rng, phase, bias)
+            yield block
+
+    def _block(self, index, rng, phase, bias):
+        n = len(index)
+        rate = self.rate
+        seg = np.searchsorted(self._seg_start, index, side="right") - 1
+        code = self._seg_code[seg]
+        stroke = self._seg_stroke[seg]
+        swimming = stroke >= 0
+        stroke_index = np.where(swimming, stroke, 0)
+        # Position within the segment, 0..1
+        progress = (index - self._seg_start[seg]) / self._seg_length[seg]
+
+        # Stroke phase with a slowly wandering stroke rate, carried across blocks
+        wander = 1 + 0.04 * np.sin(2 * np.pi * index / (rate * 37.0)) + 0.02 * np.sin(2 * np.pi * index / (rate * 11.3))
+        freq = np.where(swimming, self._stroke_rate[stroke_index] * wander, 0)
+        phi = phase + np.cumsum(2 * np.pi * freq / rate)
+        phase = phi[-1] % (2 * np.pi)
+
+        # Harmonics of the stroke phase from one sin/cos pair
+        s1, c1 = np.sin(phi), np.cos(phi)
+        s2, c2 = 2 * s1 * c1, 1 - 2 * s1 * s1
+
+        # Gravity: stroke orientation with body roll, upright at rest, a
+        # forward roll during turns, prone on the push off
+        gravity = np.where(swimming[:, None], self._gravity[stroke_index], 0)
+        roll = np.where(swimming, self._roll[stroke_index], 0) * s1
+        sin_roll, cos_roll = np.sin(roll), np.cos(roll)
+        gy = gravity[:, 1] * cos_roll - gravity[:, 2] * sin_roll
+        gz = gravity[:, 1] * sin_roll + gravity[:, 2] * cos_roll
+        gravity[:, 1], gravity[:, 2] = gy, gz
+        gravity[code == LABEL_CODES["rest"]] = UPRIGHT
+        turn = np.flatnonzero(code == LABEL_CODES["turn"])
+        turn_angle = 2 * np.pi * (3 * progress[turn] ** 2 - 2 * progress[turn] ** 3)
+        gravity[turn] = np.column_stack([np.sin(turn_angle), np.zeros(len(turn)), -np.cos(turn_angle)])
+        push = np.flatnonzero(code == LABEL_CODES["wall_push"])
+        gravity[push] = (0.1, 0.0, -1.0)
+
+        # Dynamic acceleration and rotation of the stroke
+        accel_amp = np.where(swimming[:, None], self._accel_amp[stroke_index], 0)
+        gyro_amp = np.where(swimming[:, None], self._gyro_amp[stroke_index], 0)
+        accel = np.column_stack([s1 + 0.3 * (s2 * np.cos(0.5) + c2 * np.sin(0.5)),
+                                 s1 * np.cos(1.0) + c1 * np.sin(1.0),
+                                 0.6 * s2 + 0.4 * c1])
+        accel *= accel_amp
+        accel += gravity
+        gyro = np.column_stack([c1, s2 * np.cos(0.3) + c2 * np.sin(0.3), c1 * np.cos(0.8) - s1 * np.sin(0.8)])
+        gyro *= gyro_amp
+
+        # Push off surge and turn rotation, bell shaped over the segment
+        accel[push, 0] += 2.5 * np.exp(-((progress[push] - 0.4) / 0.18) ** 2)
+        gyro[turn, 1] += TURN_RATE * np.exp(-((progress[turn] - 0.4) / 0.18) ** 2)
+        gyro[turn, 0] += 40 * np.sin(2 * np.pi * progress[turn])
+
+        # Sensor noise, and a gyro bias random walk that steps every
+        # BIAS_STEP samples (drawing it per sample doubled the cost)
+        noise = rng.standard_normal((n, 6), dtype=np.float32)
+        accel += ACCEL_NOISE * noise[:, 0:3]
+        gyro += GYRO_NOISE * noise[:, 3:6]
+        steps = rng.standard_normal((-(-n // BIAS_STEP), 3)) * (GYRO_BIAS_WALK * np.sqrt(BIAS_STEP))
+        bias_walk = bias + np.cumsum(steps, axis=0)
+        gyro += np.repeat(bias_walk, BIAS_STEP, axis=0)[:n]
+        bias = bias_walk[-1]
+
+        block = np.empty((n, NUM_FIELDS), dtype="<f4")
+        # Device clock: drifts, and counts whole milliseconds
+        block[:, 0] = np.floor(index / rate * (1 + self.clock_drift_ppm * 1e-6) * 1000) / 1000
+        block[:, 1:4] = accel
+        block[:, 4:7] = gyro
+        return block, phase, bias
+
+
+# --------------------------- Text encoding ---------------------------- #
+
+def _format_column(out, values, decimals: int, int_digits: int):
+    # Write the fixed point digits of one column into out, a (width, n)
+    # uint8 slice of the line matrix. 0 marks padding that is dropped when
+    # the lines are joined
+    limit = 10 ** (int_digits + decimals) - 1
+    remainder = np.minimum(np.rint(np.abs(values) * 10 ** decimals), limit).astype(np.int64)
+    for j in range(decimals):
+        remainder, digit = np.divmod(remainder, 10)
+        out[int_digits + 1 + decimals - j] = digit + 48
+    out[int_digits + 1] = 46                                   # "."
+    num_digits = np.ones(len(values), dtype=np.int64)
+    for j in range(int_digits):
+        remainder, digit = np.divmod(remainder, 10)
+        # Leading zeros are padding, except the units digit
+        out[int_digits - j] = (digit + 48) * (j < num_digits)
+        if j + 1 < int_digits:
+            num_digits += remainder > 0
+    # Like printf, small negative values keep their sign ("-0.00")
+    rows = np.flatnonzero(values < 0)
+    out[int_digits - num_digits[rows], rows] = 45             # "-"
+
+
+def _line_matrix(block):
+    # Every row in the device line format, padded to a common width. Built
+    # column by column in a (width, n) matrix so every write is contiguous,
+    # returned transposed as (n, width)
+    widths = [1 + int_digits + 1 + decimals for decimals, int_digits in TEXT_COLUMNS]
+    lines = np.zeros((sum(widths) + 2 * (len(widths) - 1) + 1, len(block)), dtype=np.uint8)
+    values = np.asarray(block, dtype=np.float64).T
+    separators = []
+    position = 0
+    for i, ((decimals, int_digits), width) in enumerate(zip(TEXT_COLUMNS, widths)):
+        _format_column(lines[position:position + width], values[i], decimals, int_digits)
+        position += width
+        if i < len(TEXT_COLUMNS) - 1:
+            separators.append(position)
+            lines[position] = 44                               # ","
+            lines[position + 1] = 32                           # " "
+            position += 2
+    lines[position] = 10                                       # "\n"
+    return lines.T, separators
+
+
+def _corrupt(lines, separators, rate: float, rng) -> dict:
+    # Damage rows in place the way dropped BLE/SD writes do
+    counts = dict.fromkeys(CORRUPTIONS, 0)
+    if rate <= 0 or len(lines) == 0:
+        return counts
+    rows = np.flatnonzero(rng.random(len(lines)) < rate)
+    kinds = rng.integers(len(CORRUPTIONS), size=len(rows))
+    width = lines.shape[1]
+    # Lost newline: this row and the next become one line with 13 fields
+    glued = rows[kinds == 0]
+    lines[glued, width - 1] = 0
+    # Lost comma: two fields run together, e.g. "1.234-0.56"
+    merged = rows[kinds == 1]
+    comma = np.array(separators)[rng.integers(len(separators), size=len(merged))]
+    lines[merged, comma] = 0
+    lines[merged, comma + 1] = 0
+    # Cut short after a random field
+    truncated = rows[kinds == 2]
+    cut = np.array(separators)[rng.integers(len(separators), size=len(truncated))]
+    keep = np.arange(width - 1)[None, :] < cut[:, None]
+    lines[truncated, :width - 1] = np.where(keep, lines[truncated, :width - 1], 0)
+    for kind, selected in zip(CORRUPTIONS, (glued, merged, truncated)):
+        counts[kind] = len(selected)
+    return counts
+
+
+def encode_csv(block, corruption: float = 0.0, rng=None):
+    """
+    Device format CSV lines of a block.
+
+    :param block: (n, 7) samples.
+    :param corruption: Fraction of rows to damage.
+    :return: (bytes, {corruption kind: rows})
+    """
+    lines, separators = _line_matrix(block)
+    if corruption > 0:
+        counts = _corrupt(lines, separators, corruption, rng or np.random.default_rng())
+    else:
+        counts = dict.fromkeys(CORRUPTIONS, 0)
+    flat = lines.ravel()
+    return flat[flat != 0].tobytes(), counts
+
+
+def encode_notifications(block, corruption: float = 0.0, rng=None) -> list:
+    # Live notification payloads, one per sample (glued rows become one)
+    text, _ = encode_csv(block, corruption, rng)
+    return text.rstrip(b"\n").split(b"\n")
+
+
+def encode_device_records(block) -> bytes:
+    # Records of a binary SD card recording (see DataRecorder.h)
+    records = np.empty(len(block), dtype=np.dtype(DEVICE_RECORD_FIELDS))
+    records["elapsed_ms"] = np.rint(block[:, 0].astype(np.float64) * 1000)
+    records["accel"] = np.clip(np.rint(block[:, 1:4] / ACCEL_SCALE), -32768, 32767)
+    records["gyro"] = np.clip(np.rint(block[:, 4:7] / GYRO_SCALE), -32768, 32767)
+    return records.tobytes()
+
+
+def device_header(rate: float, name: str) -> bytes:
+    return DEVICE_HEADER.pack(DEVICE_MAGIC, DEVICE_VERSION, DEVICE_HEADER.size, DEVICE_RECORD_SIZE,
+                              int(rate), ACCEL_SCALE, GYRO_SCALE, 0, name.encode("utf-8")[:63])
+
+
+# ------------------------------ Sessions ------------------------------ #
+
+def session_name(swimmer: int, start: datetime) -> str:
+    # Device style name, so SwIMU_aggregate can parse swimmer and date
+    return f"{start.strftime(DT_FMT)}-Swimmer{swimmer + 1:02d}-Synthetic"
+
+
+def write_session(out_dir: str, swimmer: int, duration: float, rate: float = 100.0, formats=("csv",),
+                  corruption: float = 0.0, labels: bool = False, seed: int = 0,
+                  start: datetime = None, chunk_rows: int = CHUNK_ROWS) -> dict:
+    """
+    Generate one swimmer's session and write it in the given formats.
+
+    :param swimmer: Swimmer number, also varies the seed.
+    :param formats: Any of "csv", "swimu" and "bin".
+    :param corruption: Fraction of CSV rows to damage.
+    :param labels: Also write the plan as a .labels.json sidecar.
+    :return: Report with the paths, sizes, corrupted rows and timing.
+    """
+    start_time = time.perf_counter()
+    synth = SessionSynth(duration, rate, seed=seed * 1000 + swimmer)
+    start = start or datetime(2025, 1, 1, 9, 0, 0)
+    name = session_name(swimmer, start + timedelta(minutes=swimmer))
+    paths = {fmt: os.path.join(out_dir, f"{name}.{fmt}") for fmt in formats}
+    corrupted = dict.fromkeys(CORRUPTIONS, 0)
+    rng = np.random.default_rng(synth.seed + 2)
+
+    files = {fmt: open(path + ".part", "wb") for fmt, path in paths.items()}
+    try:
+        if "swimu" in files:
+            files["swimu"].write(encode_session_header({
+                "device": f"synthetic:{name}", "synthetic": {"seed": synth.seed, "rate": rate,
+                                                            "clock_drift_ppm": synth.clock_drift_ppm}}))
+        if "bin" in files:
+            files["bin"].write(device_header(rate, name + ".bin"))
+        for block in synth.chunks(chunk_rows):
+            if "csv" in files:
+                text, counts = encode_csv(block, corruption, rng)
+                files["csv"].write(text)
+                for kind, count in counts.items():
+                    corrupted[kind] += count
+            if "swimu" in files:
+                files["swimu"].write(block.tobytes())
+            if "bin" in files:
+                files["bin"].write(encode_device_records(block))
+    finally:
+        for f in files.values():
+            f.close()
+    for fmt, path in paths.items():
+        os.replace(path + ".part", path)
+    if labels:
+        with open(os.path.join(out_dir, name + LABELS_SUFFIX), "w") as f:
+            json.dump(synth.labels(), f, indent=1)
+
+    return {
+        "session": name,
+        "samples": synth.num_samples,
+        "paths": paths,
+        "bytes": sum(os.path.getsize(path) for path in paths.values()),
+        "corrupted_rows": corrupted,
+        "seconds": time.perf_counter() - start_time,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic SwIMU swim sessions")
+    parser.add_argument("out_dir", help="folder to write the sessions to")
+    parser.add_argument("--swimmers", type=int, default=1, help="sessions to generate, one per swimmer")
+    parser.add_argument("--duration", type=float, default=1800, help="session length [s]")
+    parser.add_argument("--rate", type=float, default=100, help="sample rate [Hz]")
+    parser.add_argument("--format", nargs="+", default=["csv"], choices=FORMATS)
+    parser.add_argument("--corruption", type=float, default=0.0,
+                        help="fraction of CSV rows to damage like dropped writes do")
+    parser.add_argument("--labels", action="store_true", help="write .labels.json sidecars of the workout plan")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    start = time.perf_counter()
+    workers = min(args.workers or os.cpu_count() or 1, args.swimmers)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(write_session, args.out_dir, swimmer, args.duration, args.rate,
+                                   args.format, args.corruption, args.labels, args.seed)
+                   for swimmer in range(args.swimmers)]
+        reports = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+    total_bytes = sum(report["bytes"] for report in reports)
+    for report in reports:
+        corrupted = sum(report["corrupted_rows"].values())
+        print(f"{report['session']}: {report['samples']} samples, {report['bytes'] / 1e6:.1f} MB, "
+              f"{corrupted} corrupted rows")
+    print(f"Wrote {len(reports)} sessions, {total_bytes / 1e6:.1f} MB in {elapsed:.2f}s "
+          f"({total_bytes / 1e6 / elapsed:.0f} MB/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,29 @@
+import argparse
 from main_window import MainWindow
 from PyQt5 import QtWidgets
+from SwIMU_qtloop import run_app
 import sys
 
 
 if __name__ == '__main__':
-    app = QtWidgets.QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="SwIMU client")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile from start up, stop from the Diagnostics panel (see SwIMU_profiler)")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="also trace allocations while profiling, slows the client down")
+    # Qt takes the remaining arguments
+    args, qt_args = parser.parse_known_args()
+    if args.profile:
+        import SwIMU_profiler as profiler
+        profiler.start(args.trace_memory)
+    app = QtWidgets.QApplication(sys.argv[:1] + qt_args)
     window = MainWindow()
     # window.resize(800, 600)
     window.setWindowTitle("BLE Accelerometer and Gyro Visualizer")
     window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    # Qt and the BLE coroutines share one event loop
+    code = run_app(app)
+    if args.profile:
+        # Write what was collected if the run is still going
+        profiler.stop()
+    sys.exit(code)
\ No newline at end of file
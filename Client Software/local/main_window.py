@@ -22,14 +22,135 @@ program using asyncio in spyder including an async "main" function and nesting.
 This will be notated in the code below. For more info on asyncio, see here ->
 https://realpython.com/async-io-python/
 """
+import os
 import sys
-from SwIMU_BLE import BLEWorker
-from PyQt5 import QtWidgets, QtCore, uic
+import time
+import SwIMU_metrics as metrics
+from PyQt5 import QtWidgets, QtCore, QtGui
 from PyQt5.QtWidgets import QMainWindow
 from PyQt5.QtCore import QObject, QThread, pyqtSignal, pyqtSlot
+# Generated from SwIMU_client_UI.ui with:
+#     pyuic5 SwIMU_client_UI.ui -o SwIMU_client_UI.py
+# Re-run after editing the layout in Qt Designer
+from SwIMU_client_UI import Ui_MainWindow
+from SwIMU_samples import SampleRing
 
+# SwIMU_BLE (bleak) is imported when the user first connects, see
+# run_BLE_worker, so the window comes up without it. Its coroutines run on
+# the asyncio loop shared with Qt (SwIMU_qtloop), so the slots below can
+# touch the client directly
 
-class MainWindow(QMainWindow):
+PLOT_LATENCY = metrics.histogram("plot_latency_seconds", "Time from a decoded sample block to the frame that draws it")
+PLOT_FRAME_TIME = metrics.histogram("plot_frame_seconds", "Time to redraw the live plots")
+
+
+class DiagnosticsDock(QtWidgets.QDockWidget):
+    # Dockable panel showing the live metrics with export buttons
+
+    def __init__(self, parent=None):
+        super().__init__("Diagnostics", parent)
+        self.setObjectName("diagnostics_dock")
+        widget = QtWidgets.QWidget()
+        layout = QtWidgets.QVBoxLayout(widget)
+
+        controls = QtWidgets.QHBoxLayout()
+        self.enable_checkbox = QtWidgets.QCheckBox("Collect metrics")
+        self.enable_checkbox.setChecked(metrics.enabled())
+        self.enable_checkbox.toggled.connect(self.set_metrics_enabled)
+        self.reset_button = QtWidgets.QPushButton("Reset")
+        self.reset_button.clicked.connect(metrics.REGISTRY.reset)
+        self.export_json_button = QtWidgets.QPushButton("Export JSON")
+        self.export_json_button.clicked.connect(lambda: self.export_metrics("json"))
+        self.export_prom_button = QtWidgets.QPushButton("Export Prometheus")
+        self.export_prom_button.clicked.connect(lambda: self.export_metrics("prometheus"))
+        for control in (self.enable_checkbox, self.reset_button, self.export_json_button, self.export_prom_button):
+            controls.addWidget(control)
+        layout.addLayout(controls)
+
+        # Stack sampling and allocation tracing, see SwIMU_profiler
+        profile_controls = QtWidgets.QHBoxLayout()
+        self.profile_button = QtWidgets.QPushButton("Start Profiling")
+        self.profile_button.setCheckable(True)
+        self.profile_button.toggled.connect(self.set_profiling)
+        self.trace_memory_checkbox = QtWidgets.QCheckBox("Trace allocations (slow)")
+        self.profile_label = QtWidgets.QLabel("")
+        profile_controls.addWidget(self.profile_button)
+        profile_controls.addWidget(self.trace_memory_checkbox)
+        profile_controls.addWidget(self.profile_label, 1)
+        layout.addLayout(profile_controls)
+
+        self.metrics_view = QtWidgets.QPlainTextEdit()
+        self.metrics_view.setReadOnly(True)
+        self.metrics_view.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        layout.addWidget(self.metrics_view)
+        self.setWidget(widget)
+
+        # Refresh once a second, only while the panel is visible
+        self.refresh_timer = QtCore.QTimer(self)
+        self.refresh_timer.setInterval(1000)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.visibilityChanged.connect(self.on_visibility_changed)
+
+    def set_metrics_enabled(self, state: bool):
+        if state:
+            metrics.enable()
+        else:
+            metrics.disable()
+
+    def set_profiling(self, state: bool):
+        import SwIMU_profiler as profiler
+        if state:
+            profiler.start(self.trace_memory_checkbox.isChecked())
+            self.trace_memory_checkbox.setEnabled(False)
+            self.profile_button.setText("Stop Profiling")
+            self.profile_label.setText("Profiling...")
+        else:
+            prefix = profiler.stop()
+            self.trace_memory_checkbox.setEnabled(True)
+            self.profile_button.setText("Start Profiling")
+            if prefix:
+                self.profile_label.setText(f"Saved {prefix}.*")
+
+    def sync_profiling(self):
+        # Profiling may have been started from the command line
+        import SwIMU_profiler as profiler
+        self.profile_button.blockSignals(True)
+        self.profile_button.setChecked(profiler.running())
+        self.profile_button.setText("Stop Profiling" if profiler.running() else "Start Profiling")
+        self.trace_memory_checkbox.setEnabled(not profiler.running())
+        self.profile_button.blockSignals(False)
+
+    def on_visibility_changed(self, visible: bool):
+        if visible:
+            self.sync_profiling()
+            self.refresh()
+            self.refresh_timer.start()
+        else:
+            self.refresh_timer.stop()
+
+    def refresh(self):
+        metrics.sample_process_stats()
+        lines = []
+        for name, values in metrics.REGISTRY.snapshot().items():
+            if values["type"] == "histogram":
+                if values["count"]:
+                    lines.append(f"{name:<36} n={values['count']:<8} mean={values['mean'] * 1e3:8.3f} ms "
+                                 f"p99<={values['p99'] * 1e3:8.3f} ms max={values['max'] * 1e3:8.3f} ms")
+                else:
+                    lines.append(f"{name:<36} n=0")
+            else:
+                lines.append(f"{name:<36} {values['value']:.6g}")
+        self.metrics_view.setPlainText("\n".join(lines))
+
+    def export_metrics(self, fmt: str):
+        default_name = "swimu_metrics.json" if fmt == "json" else "swimu_metrics.prom"
+        path, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Export Metrics", default_name)
+        if path:
+            metrics.export(path, fmt)
+            print(f"Metrics exported to: {path}")
+
+
+class MainWindow(QMainWindow, Ui_MainWindow):
     def __init__(self):
         super().__init__()
         self.init_ui()
@@ -42,7 +163,10 @@ class MainWindow(QMainWindow):
         self.graph_update_timer.setInterval(50)  # update every 50 ms
         self.graph_update_timer.timeout.connect(self.update_plots)
         # self.timer.start()
-        self.graph_slices = [[], [], [], [], [], [], []]
+        # Most recent samples for the plots, fixed size however long the session
+        self.plot_buffer = SampleRing(self.max_points)
+        # perf_counter time of the oldest block not drawn yet
+        self.first_undrawn_time = None
         
         # initialize a client attribute, update when BLEWorker emits connected signal
         self.client = None
@@ -59,9 +183,7 @@ class MainWindow(QMainWindow):
         # Initilize elements of layout and create connections to slots and signals
 
         # layout = QtWidgets.QVBoxLayout()
-        import os
-        ui_path = os.path.join(os.getcwd(), "SwIMU_client_UI.ui")
-        uic.loadUi(ui_path, self)
+        self.setupUi(self)
 
         # Accelerometer Plot
         # self.accel_plot = pg.PlotWidget(title="Accelerometer Data")
@@ -88,6 +210,15 @@ class MainWindow(QMainWindow):
         self.file_tx_button.clicked.connect(self.start_stop_file_tx)
         self.config_input_field.returnPressed.connect(self.collect_config_data)
 
+        # Diagnostics panel, hidden until opened from the menu
+        self.diagnostics_dock = DiagnosticsDock(self)
+        self.addDockWidget(QtCore.Qt.RightDockWidgetArea, self.diagnostics_dock)
+        self.diagnostics_dock.hide()
+        self.menuSwIMU_Client.addAction(self.diagnostics_dock.toggleViewAction())
+        # Profiler runs are tagged with the session being streamed
+        import SwIMU_profiler as profiler
+        profiler.set_session_source(self.active_session)
+
     @pyqtSlot()
     def start_stop_data_tx(self):
         # Start Data Transmission. This method will be inaccessible until the client is connected,
@@ -155,6 +286,7 @@ class MainWindow(QMainWindow):
             
     
     def run_BLE_worker(self):
+        from SwIMU_BLE import BLEWorker
         self.worker = BLEWorker()
         self.worker.connected.connect(self.update_connection_status)
         self.worker.finished.connect(self.worker.deleteLater)
@@ -195,31 +327,42 @@ class MainWindow(QMainWindow):
             # Resit client attribute
             self.client = None
             
-    def update_data(self, data):
-        for i, value in enumerate(data):
-            self.graph_slices[i].append(value)
+    def active_session(self):
+        # Name of the live recording, else the connected device
+        if self.client is None:
+            return None
+        recorder = getattr(self.client, "recorder", None)
+        if recorder is not None:
+            return os.path.basename(recorder.path)
+        return getattr(self.client, "address", None)
+
+    def update_data(self, block, emit_time):
+        # Oldest block the next frame will draw, for PLOT_LATENCY
+        if self.first_undrawn_time is None:
+            self.first_undrawn_time = emit_time
+        self.plot_buffer.extend(block)
         
     def update_plots(self):
-        
-        # Limit data to the most recent max_points
-        for i, data_list in enumerate(self.graph_slices):
-            # print(f"Data List: {data_list}")
-            if len(data_list) > self.max_points:
-                self.graph_slices[i] = data_list[-self.max_points:]
-            else:
-                self.graph_slices[i] = data_list
-        # Generate x-axis values (sample indices)
-        x_axis = self.graph_slices[0]
+        with PLOT_FRAME_TIME.time():
+            self.redraw_plots()
+        if self.first_undrawn_time is not None:
+            PLOT_LATENCY.observe(time.perf_counter() - self.first_undrawn_time)
+            self.first_undrawn_time = None
+
+    def redraw_plots(self):
+        # Columns of the most recent max_points samples, views into the ring
+        data = self.plot_buffer.view()
+        x_axis = data[:, 0]
 
         # Update accelerometer curves
-        self.accel_x_curve.setData(x_axis, self.graph_slices[1])
-        self.accel_y_curve.setData(x_axis, self.graph_slices[2])
-        self.accel_z_curve.setData(x_axis, self.graph_slices[3])
+        self.accel_x_curve.setData(x_axis, data[:, 1])
+        self.accel_y_curve.setData(x_axis, data[:, 2])
+        self.accel_z_curve.setData(x_axis, data[:, 3])
         
         # Update gyroscope curves
-        self.gyro_x_curve.setData(x_axis, self.graph_slices[4])
-        self.gyro_y_curve.setData(x_axis, self.graph_slices[5])
-        self.gyro_z_curve.setData(x_axis, self.graph_slices[6])
+        self.gyro_x_curve.setData(x_axis, data[:, 4])
+        self.gyro_y_curve.setData(x_axis, data[:, 5])
+        self.gyro_z_curve.setData(x_axis, data[:, 6])
         
     # def closeEvent():
     #     # Kill all Coroutines
@@ -0,0 +1,18 @@
+# Shared fixtures for the SwIMU client tests. The client modules are flat
+# scripts in the folder above, run with: python -m pytest tests
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from SwIMU_synth import SessionSynth  # noqa: E402
+
+
+@pytest.fixture
+def block():
+    # 30 s of synthetic swimming at 100 Hz, (3000, 7) float32
+    return np.concatenate(list(SessionSynth(duration=30, rate=100, seed=7).chunks()))
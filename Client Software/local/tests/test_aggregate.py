@@ -0,0 +1,45 @@
+import glob
+import json
+import os
+
+from SwIMU_aggregate import CACHE_DIR_NAME, aggregate_sessions
+from SwIMU_synth import LABELS_SUFFIX, write_session
+
+
+def test_laps_match_synthetic_plan(tmp_path):
+    report = write_session(str(tmp_path), 0, duration=900, formats=("swimu",), labels=True)
+    sessions, laps = aggregate_sessions([report["paths"]["swimu"]], workers=1, use_cache=False)
+    with open(tmp_path / (report["session"] + LABELS_SUFFIX)) as f:
+        plan = json.load(f)
+    assert sessions.loc[0, "swimmer"] == "Swimmer01"
+    # One lap per push off the wall
+    assert sessions.loc[0, "num_laps"] == sum(segment["label"] == "wall_push" for segment in plan)
+    assert len(laps) == sessions.loc[0, "num_laps"]
+    swum = laps[laps["stroke_cycles"] > 0]
+    assert len(swum) >= 0.9 * len(laps)
+    # Laps ending in a rest between sets have a lower average rate
+    assert swum["stroke_rate_spm"].between(15, 70).mean() >= 0.8
+
+
+def test_repeated_runs_use_the_summary_cache(tmp_path):
+    paths = [write_session(str(tmp_path), swimmer, duration=120, formats=("swimu",))["paths"]["swimu"]
+             for swimmer in range(2)]
+    # A generator of paths, like find_sessions results filtered lazily
+    sessions, _ = aggregate_sessions((path for path in paths), workers=1)
+    assert len(sessions) == 2
+    cached = glob.glob(os.path.join(tmp_path, CACHE_DIR_NAME, "*_v*.json"))
+    assert len(cached) == 2
+
+    # Served from the cache: a marked cache entry comes back unchanged
+    for path in cached:
+        with open(path) as f:
+            entry = json.load(f)
+        entry["session"]["num_laps"] = 99
+        with open(path, "w") as f:
+            json.dump(entry, f)
+    again, _ = aggregate_sessions(iter(paths), workers=1)
+    assert list(again["num_laps"]) == [99, 99]
+    assert list(again["path"]) == paths
+    assert (again["session"] == sessions["session"]).all()
+    fresh, _ = aggregate_sessions(paths, workers=1, use_cache=False)
+    assert list(fresh["num_laps"]) == list(sessions["num_laps"])
@@ -0,0 +1,33 @@
+import json
+
+import numpy as np
+
+from SwIMU_batch import run_batch
+from SwIMU_data import load_session
+from SwIMU_synth import write_session
+
+
+def test_clean_converts_every_session_format(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    src.mkdir()
+    report = write_session(str(src), 0, duration=20, formats=("csv", "swimu", "bin"), corruption=0.01)
+    counts = run_batch(str(src), str(out), ["clean", "summary"], workers=1)
+    assert counts["done"] == 6 and counts["failed"] == 0
+
+    cleaned = {fmt: load_session(str(out / (path.split("/")[-1] + ".clean.csv")), clean=False)
+               for fmt, path in report["paths"].items()}
+    assert len(cleaned["swimu"]) == len(cleaned["bin"]) == report["samples"]
+    assert report["samples"] - 2 * sum(report["corrupted_rows"].values()) <= len(cleaned["csv"]) < report["samples"]
+    assert np.allclose(cleaned["swimu"].to_numpy(), cleaned["bin"].to_numpy(), atol=0.07)
+    for fmt, path in report["paths"].items():
+        with open(out / (path.split("/")[-1] + ".summary.json")) as f:
+            assert json.load(f)["file"].endswith("." + fmt)
+
+
+def test_batch_skips_up_to_date_outputs(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    src.mkdir()
+    write_session(str(src), 0, duration=5, formats=("csv", "bin"))
+    assert run_batch(str(src), str(out), ["clean"], workers=1)["done"] == 2
+    counts = run_batch(str(src), str(out), ["clean"], workers=1)
+    assert counts["done"] == 0 and counts["failed"] == 0
@@ -0,0 +1,55 @@
+import numpy as np
+
+from SwIMU_classify import (FEATURE_NAMES, LABELS, StrokeModel, WindowFeaturizer, merge_segments,
+                            training_data, window_features, window_targets)
+from SwIMU_synth import write_session
+
+
+def test_window_features_match_direct_statistics(block):
+    times, features = window_features(block, window=200, hop=50, fs=100.0)
+    assert features.shape == ((len(block) - 200) // 50 + 1, len(FEATURE_NAMES))
+    for i in (0, 7, len(features) - 1):
+        window = block[i * 50:i * 50 + 200].astype(np.float64)
+        assert times[i, 0] == window[0, 0] and times[i, 1] == window[-1, 0]
+        row = dict(zip(FEATURE_NAMES, features[i]))
+        np.testing.assert_allclose(row["Ax_mean"], window[:, 1].mean(), rtol=1e-4, atol=1e-4)
+        np.testing.assert_allclose(row["Gz_std"], window[:, 6].std(), rtol=1e-3, atol=1e-3)
+        np.testing.assert_allclose(row["Ay_max"], window[:, 2].max(), rtol=1e-5)
+        np.testing.assert_allclose(row["Ay_min"], window[:, 2].min(), rtol=1e-5)
+
+
+def test_featurizer_is_independent_of_block_size(block):
+    expected_times, expected = window_features(block, 200, 50, 100.0)
+    featurizer = WindowFeaturizer(100.0)
+    parts = [featurizer.feed(chunk) for chunk in np.array_split(block, 23)]
+    assert np.array_equal(np.concatenate([p[0] for p in parts]), expected_times)
+    np.testing.assert_allclose(np.concatenate([p[1] for p in parts]), expected, rtol=1e-5, atol=1e-5)
+
+
+def test_merge_segments_and_window_targets():
+    times = np.column_stack([np.arange(6) * 0.5, np.arange(6) * 0.5 + 2.0])
+    index = np.array([0, 0, 0, 4, 4, 6])
+    confidence = np.array([0.9, 0.7, 0.8, 0.6, 0.4, 1.0], dtype=np.float32)
+    segments = merge_segments(times, index, confidence, LABELS)
+    assert [(s["label"], s["start"], s["end"]) for s in segments] == [
+        ("freestyle", 0.0, 3.0), ("turn", 1.5, 4.0), ("rest", 2.5, 4.5)]
+    assert segments[0]["confidence"] == 0.8
+    assert merge_segments(times[:0], index[:0], confidence[:0], LABELS) == []
+
+    targets = window_targets(times, [{"start": 0.0, "end": 3.0, "label": "backstroke"}])
+    assert targets.tolist() == [1, 1, 1, -1, -1, -1]
+
+
+def test_model_learns_synthetic_labels(tmp_path):
+    paths = [write_session(str(tmp_path), swimmer, duration=600, formats=("swimu",), labels=True,
+                           seed=swimmer)["paths"]["swimu"] for swimmer in (1, 2)]
+    features, targets = training_data(paths)
+    model = StrokeModel.fit(features, targets, epochs=10)
+    index, confidence = model.predict(features)
+    assert (index == targets).mean() > 0.8
+    assert np.all((confidence > 0) & (confidence <= 1))
+
+    model.save(str(tmp_path / "model.npz"))
+    loaded = StrokeModel.load(str(tmp_path / "model.npz"))
+    assert loaded.labels == model.labels
+    assert np.array_equal(loaded.predict(features)[0], index)
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("bleak")
+
+from SwIMU_client import (ACTIVITY_TYPE_UUID, CONFIG_RECORD_UUID, DATETIME_UUID, FILE_NAME_UUID,
+                          PERSONNAME_UUID, SwIMUClient)
+
+
+class FakeServices:
+    def __init__(self, uuids):
+        self.uuids = uuids
+
+    def get_characteristic(self, uuid):
+        return uuid if uuid in self.uuids else None
+
+
+class FakeClient(SwIMUClient):
+    # Records GATT writes instead of talking to a device
+    services = None
+
+    def __init__(self, uuids):
+        SwIMUClient.__init__(self, "AA:BB:CC:DD:EE:FF")
+        self.services = FakeServices(uuids)
+        self.writes = []
+
+    async def write_gatt_char(self, uuid, data, response=False):
+        self.writes.append((uuid, data.decode("utf-8")))
+
+    async def read_gatt_char(self, uuid):
+        assert uuid == FILE_NAME_UUID
+        return b"2026_10_19_11_00_00-Sam-Freestyle"
+
+
+def configure(client):
+    client.config_entries = {"Name": "Sam|Lee", "Activity": "Freestyle"}
+    return asyncio.run(client.config_device())
+
+
+def test_config_is_one_packed_write():
+    client = FakeClient({CONFIG_RECORD_UUID})
+    assert configure(client) == "2026_10_19_11_00_00-Sam-Freestyle"
+    assert len(client.writes) == 1
+    uuid, record = client.writes[0]
+    assert uuid == CONFIG_RECORD_UUID
+    # The separator can't appear inside a value
+    datetime_str, name, activity = record.split("|")
+    assert (name, activity) == ("Sam_Lee", "Freestyle")
+    assert len(datetime_str) == 19
+    assert client.config_entries is None
+
+
+def test_config_falls_back_on_older_firmware():
+    client = FakeClient(set())
+    configure(client)
+    assert [uuid for uuid, _ in client.writes] == [DATETIME_UUID, PERSONNAME_UUID, ACTIVITY_TYPE_UUID]
+    assert client.writes[1][1] == "Sam|Lee"
@@ -0,0 +1,73 @@
+import os
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+pytest.importorskip("pyqtgraph")
+QtWidgets = pytest.importorskip("PyQt5.QtWidgets")
+
+import SwIMU_dashboard  # noqa: E402
+from SwIMU_dashboard import DevicePanel, RenderScheduler, decimate  # noqa: E402
+
+
+def test_decimate_keeps_extremes_and_newest_samples(block):
+    times, values = decimate(block, 170)
+    # 3000 samples in 83 buckets of 36, the oldest 12 samples are dropped
+    assert len(times) == 166 and values.shape == (166, 6)
+    assert times[0] == block[12, 0] and times[-1] == block[-1, 0]
+    # Spikes survive: the extremes of every kept sample are in the curve
+    kept = block[12:]
+    assert np.array_equal(values.max(axis=0), kept[:, 1:].max(axis=0))
+    assert np.array_equal(values.min(axis=0), kept[:, 1:].min(axis=0))
+    small_times, small_values = decimate(block[:50], 200)
+    assert np.array_equal(small_times, block[:50, 0])
+
+
+class FakePanel:
+    def __init__(self, clock, cost):
+        self.clock = clock
+        self.cost = cost
+        self.dirty = True
+        self.renders = 0
+
+    def render(self, max_points):
+        self.clock.now += self.cost
+        self.dirty = False
+        self.renders += 1
+
+    def update_title(self):
+        pass
+
+
+def test_scheduler_spreads_panels_over_frames(monkeypatch):
+    QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    clock = SimpleNamespace(now=0.0)
+    monkeypatch.setattr(SwIMU_dashboard, "time", SimpleNamespace(perf_counter=lambda: clock.now))
+    panels = [FakePanel(clock, cost=0.005) for _ in range(5)]
+    scheduler = RenderScheduler(panels, budget=0.012)
+
+    scheduler.render_frame()
+    assert [p.renders for p in panels] == [1, 1, 1, 0, 0]
+    # The next frame starts with the panels left over
+    panels[0].dirty = True
+    scheduler.render_frame()
+    assert [p.renders for p in panels] == [2, 1, 1, 1, 1]
+    # Clean panels cost nothing
+    scheduler.render_frame()
+    assert [p.renders for p in panels] == [2, 1, 1, 1, 1]
+
+
+def test_panel_render_uses_shared_point_budget(block):
+    QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    panels = [DevicePanel(f"dev{i}") for i in range(4)]
+    scheduler = RenderScheduler(panels)
+    points = scheduler.points_per_panel()
+    assert points == SwIMU_dashboard.TOTAL_POINT_BUDGET // 4
+    panels[0].extend(block)
+    scheduler.render_frame()
+    assert not panels[0].dirty
+    x, y = panels[0].curves[0].getData()
+    assert 0 < len(x) <= points
+    assert x[-1] == block[-1, 0]
@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+from SwIMU_data import (DEVICE_HEADER, DEVICE_RECORD_SIZE, HEADERS, NUM_FIELDS, _parse_lines, clean_csv_data,
+                        decode_device_recording, load_session)
+from SwIMU_synth import ACCEL_SCALE, GYRO_SCALE, device_header, encode_csv, encode_device_records
+
+GOOD = "1.001, 0.012, -0.980, 0.100, 1.50, -2.25, 0.75"
+
+
+def test_clean_csv_data_drops_wrong_field_counts():
+    raw = "\n".join([GOOD, "1.002, 0.013, -0.981", GOOD + ", " + GOOD, "", GOOD])
+    assert clean_csv_data(raw, verbose=False).splitlines() == [GOOD, GOOD]
+
+
+def test_clean_csv_data_drops_doubly_merged_fields():
+    merged = "1.003, 0.0-1.2-0.3, -0.982, 0.100, 1.50, -2.25, 0.75"
+    assert clean_csv_data("\n".join([GOOD, merged]), verbose=False).splitlines() == [GOOD]
+
+
+def test_parse_lines_drops_unparsable_rows():
+    lines = [GOOD + "\n", "1.003, 0.1.2, -0.982, 0.100, 1.50, -2.25, 0.75\n",
+             "1.004, 0.012\n", "\n", GOOD + "\n"]
+    for clean in (True, False):
+        values = _parse_lines(lines, clean, np)
+        assert values.shape == (2, NUM_FIELDS)
+        assert values[0, 2] == pytest.approx(-0.98)
+
+
+def test_parse_lines_empty():
+    assert _parse_lines(["\n", "  \n"], True, np).shape == (0, NUM_FIELDS)
+
+
+def test_parse_lines_synthetic_corruption(block):
+    text, counts = encode_csv(block, corruption=0.01, rng=np.random.default_rng(1))
+    values = _parse_lines(text.decode().splitlines(keepends=True), False, np)
+    damaged = sum(counts.values())
+    assert damaged > 0
+    # A glued row also takes the next row with it
+    assert len(block) - 2 * damaged <= len(values) <= len(block) - damaged
+    # Every kept row is a sample of the session, as written
+    ms = np.rint(block[:, 0].astype(float) * 1000)
+    rows = np.searchsorted(ms, np.rint(values[:, 0] * 1000))
+    assert np.array_equal(ms[rows], np.rint(values[:, 0] * 1000))
+    assert np.allclose(values[:, 1:4], block[rows, 1:4], atol=1e-3)
+
+
+
+def test_load_session_drops_unparsable_rows(tmp_path):
+    path = tmp_path / "session.csv"
+    path.write_text("\n".join([GOOD, "1.003, 0.1.2, -0.982, 0.100, 1.50, -2.25, 0.75", GOOD]) + "\n")
+    for clean in (True, False):
+        df = load_session(str(path), clean=clean)
+        assert list(df.columns) == HEADERS
+        assert len(df) == 2
+
+
+def test_decode_device_recording_layout(block):
+    records = encode_device_records(block)
+    assert len(records) == len(block) * DEVICE_RECORD_SIZE
+    # A record cut short at the end of the file is ignored
+    data = device_header(100, "session.bin") + records + b"\x01\x02\x03"
+    header, decoded = decode_device_recording(data)
+    assert header["header_size"] == DEVICE_HEADER.size
+    assert header["sample_rate"] == 100
+    assert header["name"] == "session.bin"
+    assert decoded.shape == block.shape and decoded.dtype == np.float32
+    assert np.allclose(decoded[:, 0], block[:, 0], atol=1e-3)
+    assert np.allclose(decoded[:, 1:4], block[:, 1:4], atol=ACCEL_SCALE)
+    assert np.allclose(decoded[:, 4:7], block[:, 4:7], atol=GYRO_SCALE)
+
+
+def test_decode_device_recording_header_only():
+    header, decoded = decode_device_recording(device_header(100, "empty.bin"))
+    assert decoded.shape == (0, NUM_FIELDS)
+
+
+def test_decode_device_recording_rejects_other_files():
+    with pytest.raises(ValueError):
+        decode_device_recording(b"SWIMUSES" + bytes(DEVICE_HEADER.size))
+    with pytest.raises(ValueError):
+        decode_device_recording(b"SWIMUBIN")
@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+from SwIMU_gattcache import COMPANY_ID, GattCache, describe_services, firmware_version
+
+SERVICE = "550E8402-E29B-41D4-A716-446655440000"
+
+
+def advertisement(data):
+    return SimpleNamespace(manufacturer_data={COMPANY_ID: data} if data is not None else {})
+
+
+def services(handle=10):
+    char = SimpleNamespace(uuid="550E8403-E29B-41D4-A716-446655440002", handle=handle + 1,
+                           properties=["notify", "read"])
+    return [SimpleNamespace(uuid=SERVICE, handle=handle, characteristics=[char])]
+
+
+def test_firmware_version():
+    assert firmware_version(advertisement(b"SW\x01\x04\x02\x03")) == "1.4.2+gatt3"
+    assert firmware_version(advertisement(b"XX\x01\x04\x02\x03")) is None
+    assert firmware_version(advertisement(b"SW\x01")) is None
+    assert firmware_version(advertisement(None)) is None
+    assert firmware_version(None) is None
+
+
+def test_cache_round_trip(tmp_path):
+    layout = describe_services(services())
+    assert list(layout) == [SERVICE.lower()]
+    cache = GattCache("AA:BB:CC:DD:EE:FF", cache_dir=str(tmp_path))
+    assert not cache.is_valid("1.4.2+gatt3", [SERVICE])
+
+    cache.update("1.4.2+gatt3", layout)
+    cache = GattCache("AA:BB:CC:DD:EE:FF", cache_dir=str(tmp_path))
+    assert cache.path.endswith("AA-BB-CC-DD-EE-FF.json")
+    assert cache.is_valid("1.4.2+gatt3", [SERVICE])
+    assert not cache.is_valid("1.4.3+gatt3", [SERVICE])
+    assert not cache.is_valid(None, [SERVICE])
+    assert not cache.is_valid("1.4.2+gatt3", ["550e8404-e29b-41d4-a716-446655440000"])
+    assert cache.matches(layout, [SERVICE])
+    assert not cache.matches(describe_services(services(handle=20)), [SERVICE])
+
+    cache.invalidate()
+    assert not cache.is_valid("1.4.2+gatt3", [SERVICE])
+    assert GattCache("AA:BB:CC:DD:EE:FF", cache_dir=str(tmp_path)).record is None
+
+
+def test_cache_skips_devices_without_version(tmp_path):
+    cache = GattCache("AA:BB", cache_dir=str(tmp_path))
+    cache.update(None, describe_services(services()))
+    assert cache.record is None
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,59 @@
+import argparse
+import asyncio
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from SwIMU_headless import stream
+
+
+class FakeClient:
+    # Streams a few blocks to the data callbacks, then fails like a dropped connection
+
+    def __init__(self, block, fail: bool):
+        self.block = block
+        self.fail = fail
+        self.data_callbacks = []
+        self.recorder = None
+        self.address = "AA:BB:CC:DD:EE:FF"
+        self.data_tx_is_active = False
+
+    async def rx_IMU_readings_mode(self):
+        for start in range(0, 300, 100):
+            for callback in self.data_callbacks:
+                callback(self.block[start:start + 100])
+            await asyncio.sleep(0)
+        if self.fail:
+            raise ConnectionError("disconnected")
+        while self.data_tx_is_active:
+            await asyncio.sleep(0.01)
+
+
+def stream_args(tmp_path, **kwargs):
+    args = dict(no_record=True, sync_interval=None, csv=str(tmp_path / "live.csv"), publish=None,
+                publish_unix=None, drop_policy="drop_oldest", shm=f"swimu_headless_{os.getpid()}",
+                classify=None, trace_memory=False, profile=False, duration=0.2)
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+
+@pytest.mark.parametrize("fail", [False, True])
+def test_stream_releases_sinks(tmp_path, block, fail):
+    args = stream_args(tmp_path)
+    client = FakeClient(block, fail)
+
+    async def run():
+        await stream(client, args, asyncio.Event())
+
+    if fail:
+        with pytest.raises(ConnectionError):
+            asyncio.run(run())
+    else:
+        asyncio.run(run())
+    # Only the CSV sink is left as a callback, closed
+    assert [callback.file.closed for callback in client.data_callbacks] == [True]
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=args.shm)
+    assert len((tmp_path / "live.csv").read_text().splitlines()) == 300
@@ -0,0 +1,60 @@
+import numpy as np
+
+from SwIMU_data import NUM_FIELDS, _parse_lines
+from SwIMU_ingest import parse_range, split_ranges
+from SwIMU_synth import encode_csv
+
+
+def write_csv(path, block, corruption=0.0):
+    text, counts = encode_csv(block, corruption, np.random.default_rng(3))
+    path.write_bytes(text)
+    return text, counts
+
+
+def test_split_ranges_cover_file_on_line_boundaries(tmp_path, block):
+    path = tmp_path / "session.csv"
+    text, _ = write_csv(path, block)
+    ranges = split_ranges(str(path), chunk_bytes=1000)
+    assert len(ranges) > 10
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(text)
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start and text[end - 1:end] == b"\n"
+
+
+def test_split_ranges_without_trailing_newline(tmp_path, block):
+    path = tmp_path / "session.csv"
+    text, _ = write_csv(path, block[:50])
+    path.write_bytes(text.rstrip(b"\n"))
+    ranges = split_ranges(str(path), chunk_bytes=256)
+    assert ranges[-1][1] == len(text) - 1
+    values = np.concatenate([parse_range(str(path), *r)[0] for r in ranges])
+    assert len(values) == 50
+
+
+def test_split_ranges_empty_file(tmp_path):
+    path = tmp_path / "empty.csv"
+    path.write_bytes(b"")
+    assert split_ranges(str(path)) == []
+
+
+def test_parse_range_matches_whole_file(tmp_path, block):
+    path = tmp_path / "session.csv"
+    text, counts = write_csv(path, block, corruption=0.01)
+    parts = [parse_range(str(path), *r) for r in split_ranges(str(path), chunk_bytes=4096)]
+    values = np.concatenate([p[0] for p in parts])
+    assert values.dtype == np.float32 and values.shape[1] == NUM_FIELDS
+    lines = text.decode().splitlines(keepends=True)
+    assert np.allclose(values, _parse_lines(lines, False, np), atol=1e-4)
+    assert sum(p[2] for p in parts) == len([line for line in lines if line.strip()])
+    rejected = sum(p[1]["field_count"] + p[1]["parse_error"] for p in parts)
+    assert rejected == sum(p[2] for p in parts) - len(values)
+    assert rejected >= sum(counts.values()) - counts["glued"]
+
+
+def test_parse_range_counts_parse_errors(tmp_path):
+    path = tmp_path / "session.csv"
+    path.write_bytes(b"1.0,2,3,4,5,6,7\r\n1.1,2,3.3.3,4,5,6,7\n1.2,2,3\n1.3,2,3,4,5,6,7\n")
+    values, rejected, lines = parse_range(str(path), 0, path.stat().st_size)
+    assert np.array_equal(values[:, 0], np.float32([1.0, 1.3]))
+    assert rejected == {"field_count": 1, "parse_error": 1}
+    assert lines == 4
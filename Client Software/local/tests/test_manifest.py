@@ -0,0 +1,34 @@
+from SwIMU_manifest import SyncManifest, hash_bytes, load_manifests
+from SwIMU_data import hash_file
+
+
+def test_manifest_round_trip(tmp_path):
+    save_dir = str(tmp_path)
+    data = b"0.0, 1.0, 2.0\n" * 100
+    path = tmp_path / "session.csv"
+    path.write_bytes(data)
+
+    manifest = SyncManifest(save_dir, "AA:BB:CC:DD:EE:FF")
+    assert not manifest.has("session.csv", len(data))
+    manifest.record("session.csv", data, str(path))
+    assert manifest.files["session.csv"]["hash"] == hash_file(str(path)) == hash_bytes(data)
+
+    [loaded] = load_manifests(save_dir)
+    assert loaded.device == "AA:BB:CC:DD:EE:FF"
+    assert loaded.has("session.csv", len(data))
+    # A different size is a different file
+    assert not loaded.has("session.csv", len(data) + 1)
+    # Removed locally, so it has to be received again
+    path.unlink()
+    assert not loaded.has("session.csv", len(data))
+    # Unless retention archived it
+    loaded.files["session.csv"]["archived"] = True
+    assert loaded.has("session.csv", len(data))
+
+
+def test_damaged_manifest_is_ignored(tmp_path):
+    manifest = SyncManifest(str(tmp_path), "AA:BB")
+    manifest.save()
+    with open(manifest.path, "w") as f:
+        f.write("{not json")
+    assert SyncManifest(str(tmp_path), "AA:BB").files == {}
@@ -0,0 +1,68 @@
+import math
+
+import pytest
+
+import SwIMU_metrics as metrics
+from SwIMU_metrics import Registry
+
+
+@pytest.fixture
+def enabled():
+    was_enabled = metrics.enabled()
+    metrics.enable()
+    yield
+    if not was_enabled:
+        metrics.disable()
+
+
+def test_disabled_metrics_do_not_update():
+    registry = Registry()
+    counter = registry.counter("c")
+    histogram = registry.histogram("h")
+    metrics.disable()
+    counter.inc()
+    histogram.observe(0.1)
+    with histogram.time():
+        pass
+    assert counter.value == 0
+    assert histogram.count == 0
+
+
+def test_registry_returns_same_metric_and_rejects_kind_clash():
+    registry = Registry()
+    assert registry.counter("x") is registry.counter("x")
+    with pytest.raises(ValueError):
+        registry.gauge("x")
+
+
+def test_histogram_quantile(enabled):
+    histogram = Registry().histogram("h", buckets=(1, 2, 5, 10))
+    assert math.isnan(histogram.quantile(0.5))
+    for value in (0.5,) * 50 + (3,) * 40 + (7,) * 9 + (20,):
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 1
+    assert histogram.quantile(0.9) == 5
+    assert histogram.quantile(0.99) == 10
+    # The +Inf bucket reports the largest observation
+    assert histogram.quantile(1.0) == 20
+    assert histogram.snapshot()["count"] == 100
+
+
+def test_prometheus_export(enabled):
+    registry = Registry()
+    registry.counter("frames", "Frames received").inc(3)
+    registry.gauge("depth").set(2)
+    histogram = registry.histogram("latency", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(value)
+    lines = registry.to_prometheus().splitlines()
+    assert "# HELP swimu_frames Frames received" in lines
+    assert "# TYPE swimu_frames counter" in lines
+    assert "swimu_frames 3" in lines
+    assert "swimu_depth 2" in lines
+    # Bucket counts are cumulative
+    assert 'swimu_latency_bucket{le="0.1"} 1' in lines
+    assert 'swimu_latency_bucket{le="1.0"} 3' in lines
+    assert 'swimu_latency_bucket{le="+Inf"} 4' in lines
+    assert "swimu_latency_count 4" in lines
+    assert "swimu_latency_sum 4.05" in lines
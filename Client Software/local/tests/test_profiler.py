@@ -0,0 +1,54 @@
+import os
+import threading
+import time
+
+from SwIMU_profiler import Profiler, StackSampler, top_functions
+
+
+def _wait_for(event):
+    event.wait()
+
+
+def _spin(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_sampler_collapses_stacks_per_session_and_thread():
+    event = threading.Event()
+    thread = threading.Thread(target=_wait_for, args=(event,), name="waiter")
+    thread.start()
+    sessions = iter(["Swimmer;01", "Swimmer;01", None])
+    sampler = StackSampler(session_source=lambda: next(sessions))
+    try:
+        for _ in range(3):
+            sampler.sample()
+    finally:
+        event.set()
+        thread.join()
+    assert sampler.num_samples == 3
+    waiter = [line for line in sampler.collapsed() if ";waiter;" in line]
+    counts = {line.split(";")[0]: int(line.rpartition(" ")[2]) for line in waiter}
+    # ";" separates frames, so it can't appear inside one
+    assert counts == {"Swimmer:01": 2, "idle": 1}
+    assert all("_wait_for (test_profiler.py:" in line for line in waiter)
+
+
+def test_profiler_run_writes_results(tmp_path):
+    profiler = Profiler(out_dir=str(tmp_path), session_source=lambda: "Swimmer 01/live")
+    profiler.start(memory=True)
+    assert profiler.running
+    thread = threading.Thread(target=_spin, args=(0.3,), name="busy")
+    thread.start()
+    thread.join()
+    prefix = profiler.stop()
+    assert not profiler.running
+    assert profiler.stop() is None
+    assert os.path.basename(prefix).endswith("-Swimmer_01_live")
+    assert os.path.exists(prefix + ".alloc.txt")
+    assert os.path.exists(prefix + ".tracemalloc")
+
+    functions = {name: (own, total) for name, own, total in top_functions(prefix + ".collapsed.txt")}
+    spin = [counts for name, counts in functions.items() if name.startswith("_spin (test_profiler.py:")]
+    assert spin and spin[0][0] > 10
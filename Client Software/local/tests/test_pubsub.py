@@ -0,0 +1,57 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from SwIMU_pubsub import (FRAME_HEADER, MAX_FRAME_SAMPLES, IMUPublisher, decode_frame_header, encode_frame,
+                          subscribe)
+
+
+def test_frame_round_trip(block):
+    frame = encode_frame(2**32 + 5, block[:64])
+    assert len(frame) == FRAME_HEADER.size + 64 * 7 * 4
+    channels, num_samples, seq, host_time_ns = decode_frame_header(frame[:FRAME_HEADER.size])
+    assert (channels, num_samples, seq) == (7, 64, 5)
+    samples = np.frombuffer(frame[FRAME_HEADER.size:], dtype="<f4").reshape(num_samples, channels)
+    assert np.array_equal(samples, block[:64])
+    with pytest.raises(ValueError):
+        decode_frame_header(b"XXXX" + frame[4:FRAME_HEADER.size])
+    with pytest.raises(ValueError):
+        encode_frame(0, np.zeros((MAX_FRAME_SAMPLES + 1, 7)))
+
+
+async def publish_and_collect(path, blocks, **kwargs):
+    publisher = await IMUPublisher(unix_path=path, **kwargs).start()
+    frames = []
+
+    async def collect():
+        async for frame in subscribe(unix_path=path):
+            frames.append(frame)
+
+    subscriber = asyncio.create_task(collect())
+    while not publisher.subscribers:
+        await asyncio.sleep(0.01)
+    for samples in blocks:
+        publisher.publish(samples)
+        await asyncio.sleep(0)
+    await asyncio.wait_for(publisher.stop(), 5)
+    await asyncio.wait_for(subscriber, 5)
+    return frames
+
+
+def test_subscriber_gets_every_sample_in_order(tmp_path, block):
+    blocks = np.array_split(block, 100)
+    frames = asyncio.run(publish_and_collect(str(tmp_path / "pub.sock"), blocks, max_queue=1024))
+    assert [seq for seq, _, _ in frames] == list(range(len(frames)))
+    assert all(len(samples) <= 64 + len(blocks[0]) for _, _, samples in frames)
+    assert np.array_equal(np.concatenate([samples for _, _, samples in frames]), block)
+
+
+def test_oversized_batch_is_split(tmp_path):
+    big = np.arange((150_000) * 7, dtype="<f4").reshape(-1, 7)
+    blocks = [big, big[:10]]
+    frames = asyncio.run(publish_and_collect(str(tmp_path / "pub.sock"), blocks,
+                                             max_batch=10**6, flush_interval=60))
+    assert [len(samples) for _, _, samples in frames] == [MAX_FRAME_SAMPLES, MAX_FRAME_SAMPLES,
+                                                          150_000 - 2 * MAX_FRAME_SAMPLES + 10]
+    assert np.array_equal(np.concatenate([samples for _, _, samples in frames]), np.concatenate(blocks))
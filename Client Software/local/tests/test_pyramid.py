@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+import SwIMU_pyramid
+from SwIMU_data import load_session, read_session_rows
+from SwIMU_pyramid import SessionPyramid, build_pyramid, pyramid_path
+from SwIMU_synth import write_session
+
+
+@pytest.fixture(scope="module")
+def sessions(tmp_path_factory):
+    # 30 minutes at 100 Hz, with some corrupted CSV rows
+    out = tmp_path_factory.mktemp("pyramid")
+    report = write_session(str(out), 0, duration=1800, formats=("csv", "swimu", "bin"), corruption=0.001)
+    return report["paths"]
+
+
+def test_levels_summarise_raw_samples(block):
+    pyramid = build_pyramid(np.array_split(block, 7), levels=(10, 100))
+    assert int(pyramid["num_samples"]) == len(block)
+    assert np.array_equal(pyramid["L10_t"], block[::10, 0])
+    assert np.allclose(pyramid["L100_max"], block[:, 1:].reshape(-1, 100, 6).max(axis=1))
+    assert np.allclose(pyramid["L100_mean"], block[:, 1:].reshape(-1, 100, 6).mean(axis=1), atol=1e-5)
+
+
+@pytest.mark.parametrize("fmt", ["csv", "swimu", "bin"])
+def test_view_picks_level_for_budget(sessions, fmt):
+    pyramid = SessionPyramid.load(sessions[fmt])
+    assert pyramid_path(sessions[fmt]).endswith("." + fmt + ".pyramid.npz")
+    view = pyramid.view(max_points=2000)
+    assert view["level"] == 100 and len(view["t"]) <= 2000 + 1
+    assert pyramid.view(600, 900, max_points=2000)["level"] == 100
+    assert pyramid.view(600, 650, max_points=1000)["level"] == 10
+
+
+@pytest.mark.parametrize("fmt", ["csv", "swimu", "bin"])
+def test_zoomed_view_reads_only_the_window(sessions, fmt, monkeypatch):
+    raw = load_session(sessions[fmt]).to_numpy()
+    pyramid = SessionPyramid.load(sessions[fmt])
+    # Close zooms don't go through a whole session load
+    monkeypatch.setattr(SwIMU_pyramid, "iter_session_chunks", None)
+    for t0, t1 in [(0, 5), (900.004, 912.5), (1790, 1800), (1795, 2000)]:
+        view = pyramid.view(t0, t1, max_points=2000)
+        assert view["level"] == 1
+        j0, j1 = np.searchsorted(raw[:, 0], [t0, t1])
+        assert np.array_equal(view["t"], raw[j0:j1 + 1, 0])
+        assert np.array_equal(view["mean"], raw[j0:j1 + 1, 1:])
+
+
+def test_read_session_rows(sessions):
+    for fmt in ("swimu", "bin"):
+        raw = load_session(sessions[fmt]).to_numpy()
+        assert np.array_equal(read_session_rows(sessions[fmt], 1000, 1200), raw[1000:1200])
+        assert np.array_equal(read_session_rows(sessions[fmt], len(raw) - 5, len(raw) + 100), raw[-5:])
+        assert read_session_rows(sessions[fmt], len(raw) + 10, len(raw) + 20).shape == (0, 7)
+    with pytest.raises(ValueError):
+        read_session_rows(sessions["csv"], 0, 10)
@@ -0,0 +1,57 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+QtWidgets = pytest.importorskip("PyQt5.QtWidgets")
+from PyQt5 import QtCore  # noqa: E402
+
+import SwIMU_qtloop  # noqa: E402
+
+
+def test_fallback_driver_shares_the_thread(tmp_path, monkeypatch):
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    monkeypatch.setattr(SwIMU_qtloop, "_loop", None)
+    monkeypatch.setattr(SwIMU_qtloop, "_driver", None)
+    # The fallback driver, also where qasync is installed
+    monkeypatch.setitem(sys.modules, "qasync", None)
+    path = str(tmp_path / "echo.sock")
+    qt_ticks = []
+    result = {}
+
+    async def echo(reader, writer):
+        while data := await reader.read(100):
+            writer.write(data)
+            await writer.drain()
+        writer.close()
+
+    async def session():
+        server = await asyncio.start_unix_server(echo, path=path)
+        reader, writer = await asyncio.open_unix_connection(path)
+        start = time.perf_counter()
+        for i in range(50):
+            writer.write(b"%d" % i)
+            assert await reader.read(100) == b"%d" % i
+            await asyncio.sleep(0.002)
+        result["seconds"] = time.perf_counter() - start
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        app.quit()
+
+    timer = QtCore.QTimer()
+    timer.timeout.connect(lambda: qt_ticks.append(time.perf_counter()))
+    timer.start(10)
+    QtCore.QTimer.singleShot(0, lambda: SwIMU_qtloop.spawn(session()))
+    QtCore.QTimer.singleShot(5000, app.quit)
+    assert SwIMU_qtloop.run_app(app) == 0
+    timer.stop()
+
+    # Round trips on the shared thread complete about as fast as the sleeps
+    # allow, while Qt timers keep firing
+    assert result["seconds"] < 0.5
+    assert len(qt_ticks) >= result["seconds"] / 0.01 * 0.5
+    assert SwIMU_qtloop._driver.active_tasks == 0
@@ -0,0 +1,32 @@
+import numpy as np
+
+from SwIMU_data import load_session, read_binary_session, read_session_header
+from SwIMU_recorder import SessionRecorder
+
+
+def test_recorder_round_trip(tmp_path, block):
+    path = str(tmp_path / "live")
+    with SessionRecorder(path, metadata={"device": "AA:BB"}) as recorder:
+        recorder.write(block[0])
+        for chunk in np.array_split(block[1:], 7):
+            recorder.write(chunk)
+    assert recorder.path.endswith(".swimu")
+    assert recorder.error is None
+    assert recorder.num_samples == len(block)
+    metadata, _, num_records = read_session_header(recorder.path)
+    assert metadata["device"] == "AA:BB"
+    assert num_records == len(block)
+    assert np.array_equal(read_binary_session(recorder.path), block)
+
+
+def test_recorder_resume_drops_partial_record(tmp_path, block):
+    path = str(tmp_path / "live.swimu")
+    with SessionRecorder(path) as recorder:
+        recorder.write(block[:100])
+    # A crash part way through a record
+    with open(path, "ab") as f:
+        f.write(b"\x00" * 5)
+    with SessionRecorder(path) as recorder:
+        recorder.write(block[100:200])
+    assert np.array_equal(read_binary_session(path), block[:200])
+    assert len(load_session(path)) == 200
@@ -0,0 +1,42 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+from SwIMU_replay import ReplayClient
+from SwIMU_synth import write_session
+
+
+async def replay(path, speed):
+    client = ReplayClient(path, speed=speed)
+    blocks = []
+    client.data_callbacks.append(blocks.append)
+    client.data_tx_is_active = True
+    await client.rx_IMU_readings_mode()
+    return client, np.concatenate(blocks)
+
+
+@pytest.fixture
+def session(tmp_path):
+    # 5 s at 100 Hz
+    return write_session(str(tmp_path), 0, duration=5, formats=("swimu", "csv"))
+
+
+@pytest.mark.parametrize("fmt", ["swimu", "csv"])
+def test_replay_delivers_every_sample(session, fmt):
+    _, samples = asyncio.run(replay(session["paths"][fmt], speed=0))
+    assert len(samples) == session["samples"]
+    assert np.all(np.diff(samples[:, 0]) > 0)
+
+
+def test_replay_paces_without_spinning(session):
+    # 1 ms between samples at 10x, shorter than the loop's timer resolution
+    wall, cpu = time.perf_counter(), time.process_time()
+    client, samples = asyncio.run(replay(session["paths"]["swimu"], speed=10))
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    assert len(samples) == session["samples"]
+    assert 0.45 < wall < 1.0
+    # Spinning kept the CPU busy for the whole replay
+    assert cpu < 0.5 * wall
+    assert client.late_samples < 0.1 * len(samples)
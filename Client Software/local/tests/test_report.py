@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+pytest.importorskip("matplotlib")
+
+from SwIMU_classify import STROKES_SUFFIX  # noqa: E402
+from SwIMU_report import load_strokes, main, render_report, session_metrics  # noqa: E402
+from SwIMU_synth import write_session  # noqa: E402
+
+
+def test_session_metrics_rows():
+    row = {"duration_s": 125.0, "sample_rate_hz": 100.0, "Amag_mean": 1.234, "Amag_max": 5.0}
+    laps = [{"lap": 1, "duration_s": 40.0, "stroke_cycles": 20},
+            {"lap": 2, "duration_s": 35.5, "stroke_cycles": 30}]
+    rows = dict(session_metrics(row, laps, None))
+    assert rows["Duration"] == "2:05.0"
+    assert rows["Laps"] == "2"
+    assert rows["Stroke cycles"] == "50"
+    assert rows["Mean stroke rate"] == "24.0 /min"
+    assert rows["Fastest lap"] == "35.5 s (lap 2)"
+    assert "Kick frequency (Az)" not in rows
+    assert dict(session_metrics({**row, "duration_s": None}, [], None))["Mean stroke rate"] == "-"
+
+
+def test_render_report_png(tmp_path):
+    path = write_session(str(tmp_path), 3, duration=300, formats=("swimu",), seed=3)["paths"]["swimu"]
+    segments = [{"start": 0.0, "end": 60.0, "label": "freestyle", "confidence": 0.9}]
+    with open(path + STROKES_SUFFIX, "w") as f:
+        json.dump({"segments": segments}, f)
+    assert load_strokes(path) == segments
+
+    dst = str(tmp_path / "report.png")
+    render_report(path, dst, "png")
+    with open(dst, "rb") as f:
+        assert f.read(8) == b"\x89PNG\r\n\x1a\n"
+
+
+def test_report_cli_renders_every_session(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    src.mkdir()
+    for swimmer in (1, 2):
+        write_session(str(src), swimmer, duration=120, formats=("csv",), seed=swimmer)
+    assert main([str(src), str(out), "--workers", "1"]) == 0
+    assert len(list(out.glob("*.pdf"))) == 2
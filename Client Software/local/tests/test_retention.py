@@ -0,0 +1,68 @@
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from SwIMU_aggregate import summarise_session
+from SwIMU_data import load_session
+from SwIMU_pyramid import SessionPyramid, pyramid_path
+from SwIMU_retention import ArchiveReader, cache_bytes, load_index, plan, reduce_chunks, run_retention
+from SwIMU_spectral import session_spectra
+from SwIMU_synth import write_session
+
+
+def test_reduce_chunks_bucket_means(block):
+    reduced = reduce_chunks(np.array_split(block[:1003], 6), 4)
+    assert len(reduced) == 251
+    assert np.allclose(reduced[:250], block[:1000].astype(float).reshape(-1, 4, 7).mean(axis=1))
+    assert np.allclose(reduced[-1], block[1000:1003].astype(float).mean(axis=0))
+
+
+def test_retention_round_trip(tmp_path):
+    root = str(tmp_path)
+    today = datetime.now().replace(microsecond=0)
+    fresh = write_session(root, 0, duration=60, formats=("csv",), start=today - timedelta(days=2))
+    old = write_session(root, 1, duration=300, formats=("bin",), start=today - timedelta(days=100))
+    ancient = write_session(root, 2, duration=300, formats=("swimu",), start=today - timedelta(days=800))
+    paths = {"fresh": fresh["paths"]["csv"], "old": old["paths"]["bin"], "ancient": ancient["paths"]["swimu"]}
+    originals = {name: load_session(path).to_numpy() for name, path in paths.items()}
+    analytics = summarise_session(paths["ancient"])[0]
+    # Files derived at full rate, which go with the raw data
+    for path in paths.values():
+        SessionPyramid.load(path)
+        session_spectra(path)
+
+    moves = plan(root)
+    assert {os.path.basename(rel): target for rel, _, target in moves} == {
+        os.path.basename(paths["old"]): "reduced", os.path.basename(paths["ancient"]): "summary"}
+    assert run_retention(root, workers=1) == {"compacted": 2, "failed": 0}
+    assert plan(root) == []
+
+    assert os.path.exists(paths["fresh"]) and os.path.exists(pyramid_path(paths["fresh"]))
+    for name in ("old", "ancient"):
+        assert not os.path.exists(paths[name])
+        assert not os.path.exists(pyramid_path(paths[name]))
+    index = load_index(root)
+    assert index[os.path.basename(paths["old"])]["derived_bytes"] > 0
+    # Only the fresh session's spectra and hashes stay cached
+    assert cache_bytes(root) < 200_000
+
+    reader = ArchiveReader(root)
+    assert set(reader.sessions().values()) == {"raw", "reduced", "summary"}
+    data, info = reader.load(os.path.basename(paths["fresh"]))
+    assert info["tier"] == "raw" and len(data) == len(originals["fresh"])
+
+    data, info = reader.load(os.path.basename(paths["old"]))
+    assert info["tier"] == "reduced" and round(info["rate"]) == 25
+    expected = originals["old"].reshape(-1, 4, 7).mean(axis=1)
+    assert np.allclose(data[:, 0], expected[:, 0], atol=1e-3)
+    # int16 per channel, relative to the channel's range
+    span = np.abs(expected[:, 1:]).max(axis=0)
+    assert (np.abs(data[:, 1:] - expected[:, 1:]).max(axis=0) <= span / 16000).all()
+
+    rel = os.path.basename(paths["ancient"])
+    data, info = reader.load(rel)
+    assert info["tier"] == "summary" and len(data) == -(-len(originals["ancient"]) // 100)
+    assert reader.analytics(rel)["session"]["num_laps"] == analytics["num_laps"]
+    view = reader.view(rel, max_points=500)
+    assert view["level"] == 100 and np.allclose(view["max"].max(axis=0), originals["ancient"][:, 1:].max(axis=0))
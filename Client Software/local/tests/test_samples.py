@@ -0,0 +1,47 @@
+import numpy as np
+
+from SwIMU_samples import SampleRing, SampleStager, parse_payloads
+from SwIMU_synth import encode_notifications
+
+
+def test_sample_ring_wraps_around(block):
+    ring = SampleRing(100)
+    for start in range(0, 1000, 37):
+        ring.extend(block[start:start + 37])
+        end = start + 37
+        assert np.array_equal(ring.view(), block[max(0, end - 100):end])
+    assert len(ring) == 100
+
+
+def test_sample_ring_view_does_not_copy(block):
+    ring = SampleRing(64)
+    ring.extend(block[:50])
+    ring.extend(block[50:90])
+    view = ring.view()
+    assert view.base is not None and np.shares_memory(view, ring._buffer)
+    assert np.array_equal(view, block[26:90])
+
+
+def test_sample_ring_block_larger_than_capacity(block):
+    ring = SampleRing(10)
+    ring.extend(block[:3])
+    ring.extend(block[3:50])
+    assert np.array_equal(ring.view(), block[40:50])
+    ring.clear()
+    assert len(ring) == 0 and len(ring.view()) == 0
+
+
+def test_stager_decodes_notifications(block):
+    blocks = []
+    stager = SampleStager(blocks.append, max_samples=16, max_latency=60)
+    for payload in encode_notifications(block[:100]):
+        assert stager.append(payload)
+    stager.flush()
+    decoded = np.concatenate(blocks)
+    assert [len(b) for b in blocks[:-1]] == [16] * 6
+    assert np.allclose(decoded, block[:100], atol=1e-2)
+
+
+def test_parse_payloads_drops_bad_samples():
+    raw = b"1.0,2,3,4,5,6,7,1.1,2,3.3.3,4,5,6,7,1.2,2,3,4,5,6,7"
+    assert np.array_equal(parse_payloads(raw, 3)[:, 0], np.float32([1.0, 1.2]))
@@ -0,0 +1,76 @@
+import os
+
+import numpy as np
+import pytest
+
+from SwIMU_shm import RingReader, SharedRing
+
+
+@pytest.fixture
+def ring():
+    ring = SharedRing.create(f"swimu_test_{os.getpid()}", capacity=64)
+    yield ring
+    ring.close()
+    ring.unlink()
+
+
+def test_reader_gets_samples_in_order(ring, block):
+    reader = RingReader(ring.shm.name)
+    out = []
+    for chunk in (block[:40], block[40:100], block[100:120]):
+        ring.write(chunk)
+        while reader.available():
+            samples, lost = reader.read()
+            assert lost == 0
+            out.append(samples.copy())
+    assert np.array_equal(np.concatenate(out), block[:120])
+    reader.close()
+
+
+def test_reader_overrun_skips_and_counts(ring, block):
+    reader = RingReader(ring.shm.name)
+    ring.write(block[:10])
+    samples, lost = reader.read(5)
+    assert lost == 0 and np.array_equal(samples, block[:5])
+    # The writer laps the reader
+    ring.write(block[10:200])
+    samples, lost = reader.read()
+    assert lost == 200 - 64 - 5
+    assert reader.lost == lost
+    rest = [samples.copy()]
+    while reader.available():
+        samples, lost = reader.read()
+        assert lost == 0
+        rest.append(samples.copy())
+    assert np.array_equal(np.concatenate(rest), block[200 - 64:200])
+    reader.close()
+
+
+def test_write_larger_than_capacity(ring, block):
+    reader = RingReader(ring.shm.name, from_start=True)
+    ring.write(block[:150])
+    assert ring.write_seq == 150
+    samples, lost = reader.read_copy()
+    assert lost == 150 - 64
+    assert np.array_equal(samples, block[150 - 64:150][:len(samples)])
+    reader.close()
+
+
+def test_read_copy_drops_samples_overwritten_while_copying(ring, block):
+    reader = RingReader(ring.shm.name)
+    ring.write(block[:60])
+    read = reader.read
+
+    def read_then_write(max_samples=None):
+        # The writer gets 40 samples in between the read and the copy
+        samples = read(max_samples)
+        ring.write(block[60:100])
+        return samples
+
+    reader.read = read_then_write
+    copied, lost = reader.read_copy()
+    # Slots of the first 36 samples were reused by the second write
+    assert not reader.still_valid()
+    assert lost == 36
+    assert np.array_equal(copied, block[36:60])
+    reader.close()
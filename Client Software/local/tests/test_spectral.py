@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import pytest
+
+import SwIMU_data
+from SwIMU_spectral import compute_spectra, session_spectra
+from SwIMU_synth import SessionSynth, write_session
+
+
+def synth_chunks(duration=600, chunk_rows=20_000):
+    return SessionSynth(duration=duration, rate=100, seed=4).chunks(chunk_rows)
+
+
+def test_spectrogram_is_averaged_down_to_max_segments():
+    full = compute_spectra(synth_chunks(), max_segments=10_000)
+    small = compute_spectra(synth_chunks(), max_segments=64)
+    # 600 s at 100 Hz in steps of 256 samples
+    assert full.spectrogram.shape[1] == 233 and full.params["spec_decimation"] == 1
+    factor = small.params["spec_decimation"]
+    assert factor == 4 and small.spectrogram.shape[1] == -(-233 // factor) <= 64
+    assert np.allclose(small.psd, full.psd)
+    whole = 233 // factor * factor
+    expected = full.spectrogram[:, :whole].reshape(6, -1, factor, full.spectrogram.shape[2]).mean(axis=2)
+    assert np.allclose(small.spectrogram[:, :whole // factor], expected, rtol=1e-4)
+    assert np.allclose(small.spectrogram[:, -1], full.spectrogram[:, whole:].mean(axis=1), rtol=1e-4)
+    assert np.allclose(small.spec_t[:whole // factor], full.spec_t[:whole].reshape(-1, factor).mean(axis=1))
+    assert np.all(np.diff(small.spec_t) > 0)
+
+
+def test_spectrogram_does_not_depend_on_chunking():
+    data = np.concatenate(list(synth_chunks()))
+    a = compute_spectra(np.array_split(data, 9), max_segments=50)
+    b = compute_spectra(np.array_split(data, 2), max_segments=50)
+    assert np.allclose(a.spectrogram, b.spectrogram, rtol=1e-4)
+    assert np.allclose(a.spec_t, b.spec_t)
+
+
+def test_dominant_stroke_frequency():
+    result = compute_spectra(synth_chunks())
+    assert 0.3 <= result.dominant_frequency("Ax", "stroke") <= 1.2
+
+
+def test_cache_hashes_a_session_once(tmp_path, monkeypatch):
+    path = write_session(str(tmp_path), 0, duration=60, formats=("swimu",))["paths"]["swimu"]
+    hashed = []
+    hash_file = SwIMU_data.hash_file
+    monkeypatch.setattr(SwIMU_data, "hash_file", lambda p: hashed.append(p) or hash_file(p))
+
+    first = session_spectra(path)
+    second = session_spectra(path)
+    assert hashed == [path]
+    assert np.array_equal(first.psd, second.psd)
+
+    # A changed session is hashed again and not served from the cache
+    with open(path, "ab") as f:
+        f.write(np.zeros((500, 7), "<f4").tobytes())
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+    third = session_spectra(path)
+    assert len(hashed) == 2
+    assert not np.array_equal(third.psd, first.psd)
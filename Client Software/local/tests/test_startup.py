@@ -0,0 +1,19 @@
+import pytest
+
+from SwIMU_startup import GUI_DEFERRED, import_times
+
+pytest.importorskip("PyQt5")
+
+
+def test_main_window_defers_heavy_imports():
+    times = import_times("main_window")
+    assert "main_window" in times
+    assert [name for name in GUI_DEFERRED if name in times] == []
+
+
+def test_import_times_parses_nesting():
+    times = import_times("json")
+    self_s, cumulative_s, depth = times["json"]
+    assert 0 <= self_s <= cumulative_s
+    assert depth == 0
+    assert times["json.decoder"][2] > 0
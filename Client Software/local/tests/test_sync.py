@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from SwIMU_sync import ClockEstimator, to_host_time
+
+
+def simulate(offset, drift, bursts, spacing, seed=0):
+    # Exchanges against a device clock device = host + offset + drift * (host - start),
+    # with BLE delays quantized to 7.5 ms connection events and asymmetric
+    rng = np.random.default_rng(seed)
+    start = 1_700_000_000.0
+    estimator = ClockEstimator()
+    for burst in range(bursts):
+        for _ in range(8):
+            send = start + burst * spacing + rng.uniform(0, 0.5)
+            up, down = 0.0075 * rng.integers(1, 4, size=2) + rng.uniform(0, 0.002, size=2)
+            device = send + up + offset + drift * (send + up - start)
+            estimator.add(burst, send, send + up + down, device)
+    return estimator, start
+
+
+def test_fit_recovers_offset_and_drift():
+    estimator, start = simulate(offset=-12.5, drift=30e-6, bursts=30, spacing=10)
+    fit = estimator.fit()
+    assert fit["bursts"] == 30 and fit["exchanges"] == 240
+    assert fit["drift_ppm"] == pytest.approx(30, abs=2)
+    # Error is bounded by half the smallest round trip
+    at = fit["host_ref"]
+    assert fit["offset"] == pytest.approx(-12.5 + 30e-6 * (at - start), abs=fit["uncertainty"] + 1e-3)
+    assert fit["uncertainty"] < 0.01
+
+
+def test_fit_short_session_has_no_drift():
+    estimator, _ = simulate(offset=3.0, drift=50e-6, bursts=2, spacing=5)
+    fit = estimator.fit()
+    assert fit["drift"] == 0.0
+    assert fit["offset"] == pytest.approx(3.0, abs=fit["uncertainty"] + 1e-3)
+
+
+def test_fit_without_exchanges():
+    assert ClockEstimator().fit() is None
+
+
+def test_to_host_time_inverts_fit():
+    fit = {"host_ref": 1000.0, "offset": -950.0, "drift": 40e-6}
+    host = np.array([1000.0, 1100.0, 4600.0])
+    device = host + fit["offset"] + fit["drift"] * (host - fit["host_ref"])
+    assert np.allclose(to_host_time(device, fit), host, rtol=0, atol=1e-9)
+    assert to_host_time(list(device), fit).dtype == np.float64
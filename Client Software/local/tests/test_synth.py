@@ -0,0 +1,63 @@
+import json
+
+import numpy as np
+
+from SwIMU_data import load_session
+from SwIMU_synth import (ACCEL_SCALE, GYRO_SCALE, LABELS_SUFFIX, SessionSynth, encode_csv, encode_notifications,
+                         write_session)
+
+DEVICE_FMT = "%.3f, %.3f, %.3f, %.3f, %.2f, %.2f, %.2f"
+
+
+def test_encode_csv_matches_device_format():
+    rng = np.random.default_rng(0)
+    block = np.column_stack([np.sort(rng.uniform(0, 9000, 500)),
+                             rng.normal(0, 2, (500, 3)),
+                             rng.normal(0, 300, (500, 3))]).astype("<f4")
+    block[:5, 1:] = [[-0.0004, 0.0, 15.9996, -0.001, -0.004, 1999.999],
+                     [0.0005, -15.99, 1.5, -0.006, 99999, -0.0001],
+                     [1, 2, 3, 4, 5, 6], [-1, -2, -3, -4, -5, -6], [0.1, 0.01, 0.001, 0.1, 0.01, 0.001]]
+    text, counts = encode_csv(block)
+    expected = "".join(DEVICE_FMT % tuple(row) + "\n" for row in block.astype(np.float64).tolist())
+    assert text.decode() == expected
+    assert sum(counts.values()) == 0
+    assert encode_notifications(block) == expected.encode().rstrip(b"\n").split(b"\n")
+
+
+def test_encode_csv_corruption(block):
+    text, counts = encode_csv(block, corruption=0.02, rng=np.random.default_rng(5))
+    lines = text.decode().splitlines()
+    field_counts = np.array([line.count(",") + 1 for line in lines])
+    assert counts["glued"] > 0 and counts["merged_field"] > 0 and counts["truncated"] > 0
+    # A lost newline joins two rows into one line
+    assert len(lines) == len(block) - counts["glued"]
+    assert (field_counts != 7).sum() <= sum(counts.values())
+    assert (field_counts != 7).sum() >= sum(counts.values()) - counts["glued"]
+
+
+def test_session_is_deterministic():
+    a = np.concatenate(list(SessionSynth(60, seed=3).chunks(1000)))
+    b = np.concatenate(list(SessionSynth(60, seed=3).chunks(1000)))
+    c = np.concatenate(list(SessionSynth(60, seed=4).chunks(1000)))
+    assert np.array_equal(a, b) and not np.array_equal(a, c)
+    assert a.shape == (6000, 7) and a.dtype == np.float32
+    assert np.all(np.diff(a[:, 0]) > 0)
+
+
+def test_write_session_formats_agree(tmp_path):
+    report = write_session(str(tmp_path), 3, duration=120, formats=("csv", "swimu", "bin"), labels=True)
+    assert report["session"].endswith("-Swimmer04-Synthetic")
+    swimu = load_session(report["paths"]["swimu"]).to_numpy()
+    csv = load_session(report["paths"]["csv"]).to_numpy()
+    device = load_session(report["paths"]["bin"]).to_numpy()
+    assert len(swimu) == len(csv) == len(device) == report["samples"] == 12000
+    assert np.allclose(csv[:, :4], swimu[:, :4], atol=5e-4)
+    assert np.allclose(csv[:, 4:], swimu[:, 4:], atol=5e-3)
+    assert np.allclose(device[:, 1:4], swimu[:, 1:4], atol=ACCEL_SCALE)
+    assert np.allclose(device[:, 4:], swimu[:, 4:], atol=GYRO_SCALE)
+
+    with open(tmp_path / (report["session"] + LABELS_SUFFIX)) as f:
+        segments = json.load(f)
+    assert segments[0]["start"] == 0 and segments[-1]["end"] == 120
+    assert all(a["end"] == b["start"] for a, b in zip(segments, segments[1:]))
+    assert not list(tmp_path.glob("*.part"))
@@ -1,15 +1,52 @@
 import matplotlib.pyplot as plt
 from PyQt5.QtWidgets import QApplication, QFileDialog
-import pandas as pd
 import numpy as np
 import os
 import sys
 
+# The summary pyramid helpers live with the client software
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "Client Software", "local"))
+from SwIMU_pyramid import SessionPyramid
+
+# Number of points to draw across the width of the plot
+MAX_POINTS = 2000
+
+
 def select_file():
     app = QApplication(sys.argv)
     file_path, _ = QFileDialog.getOpenFileName(None, "Select a file")
     return file_path
 
+
+def acceleration_magnitude(view):
+    # Magnitude from the mean of each bucket (or raw samples when zoomed in)
+    accel = view['mean'][:, 0:3]
+    return np.sqrt((accel**2).sum(axis=1))
+
+
+def draw_view(ax, view, file_name, artists):
+    # Update the existing lines in place. Axes.clear() would also drop the
+    # zoom callback, so only the envelope patches are removed and redrawn
+    for patch in artists.pop('envelopes', []):
+        patch.remove()
+    t = view['t']
+    lines = artists.setdefault('lines', {})
+    series = [('Amag', 'k', acceleration_magnitude(view))]
+    series += [(label, color, view['mean'][:, i]) for i, (label, color) in enumerate(zip(['Ax', 'Ay', 'Az'], ['r', 'g', 'b']))]
+    for label, color, values in series:
+        if label in lines:
+            lines[label].set_data(t, values)
+        else:
+            lines[label], = ax.plot(t, values, color=color, label=label)
+
+    if view['level'] > 1:
+        # Shade the min/max envelope so spikes hidden by the mean stay visible
+        artists['envelopes'] = [ax.fill_between(t, view['min'][:, i], view['max'][:, i], color=color, alpha=0.2, linewidth=0)
+                                for i, color in enumerate(['r', 'g', 'b'])]
+    resolution = "raw samples" if view['level'] == 1 else f"{view['level']}x summary"
+    ax.set_title(f'Acceleration for file {file_name} ({resolution})')
+
+
 if __name__ == "__main__":
     selected_file = select_file()
     file_name = os.path.split(selected_file)[1]
@@ -18,20 +55,29 @@ if __name__ == "__main__":
         print(f"You selected: {selected_file}")
     else:
         print("No file selected")
-    # import contents of file to a pandas dataframe and plot it
-    headers = ['elapsed_time','Ax', 'Ay', 'Az', 'Gx', 'Gy', 'Gz']
-    data = pd.read_csv(selected_file, header=None, names=headers, dtype=float)
-    # create a new column with the magnitude of the acceleration
-    data['Amag'] = np.sqrt(data['Ax']**2 + data['Ay']**2 + data['Az']**2)
-    # plot the magnitude of acceleration
-    plt.figure(figsize=(8,10))
-    plt.plot(data['elapsed_time'], data['Amag'])
-    plt.plot(data['elapsed_time'], data['Ax'], label='Ax')
-    plt.plot(data['elapsed_time'], data['Ay'], label='Ay')
-    plt.plot(data['elapsed_time'], data['Az'], label='Az')
-    plt.legend()
-    plt.xlabel('Time (s)')
-    plt.ylabel('Acceleration (m/s^2)')
-    plt.title(f'Acceleration for file {file_name}')
-    plt.show()
+        sys.exit()
+    # Load the summary pyramid for the file (built on first open) and plot
+    # the whole session from it
+    pyramid = SessionPyramid.load(selected_file)
+    fig, ax = plt.subplots(figsize=(8, 10))
+    artists = {}
+    draw_view(ax, pyramid.view(max_points=MAX_POINTS), file_name, artists)
+    ax.legend()
+    ax.set_xlabel('Time (s)')
+    ax.set_ylabel('Acceleration (m/s^2)')
 
+    # Re-query the pyramid when the user zooms or pans, dropping to raw data
+    # once the visible range is short enough
+    redrawing = False
+
+    def on_xlim_changed(axes):
+        global redrawing
+        if redrawing:
+            return
+        redrawing = True
+        t0, t1 = axes.get_xlim()
+        draw_view(axes, pyramid.view(t0, t1, max_points=MAX_POINTS), file_name, artists)
+        redrawing = False
+
+    ax.callbacks.connect('xlim_changed', on_xlim_changed)
+    plt.show()
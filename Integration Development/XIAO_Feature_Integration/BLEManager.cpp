@@ -24,6 +24,14 @@ config name
 #include "BLEManager.h"
 
 const int fileTxBufferSize = 244; // Oddly enough 244 bytes seems to be the bandwidth of the BLE char
+const int syncReplySize = 9;  // u32 sequence, u32 recording ms, u8 recording flag
+
+// Advertised as manufacturer data so clients know when the GATT layout they
+// cached for this device is out of date: company id 0xFFFF (no company, LE),
+// "SW", firmware major/minor/patch and the GATT layout revision. Bump
+// gattLayoutRevision whenever a service or characteristic changes
+const byte firmwareVersion[3] = {1, 4, 0};
+const byte gattLayoutRevision = 1;
 
 static std::map<const char*, BLEManager*> characteristicToInstanceMap;
 
@@ -43,6 +51,13 @@ static void staticOnIMURequest(BLEDevice central, BLECharacteristic characterist
   }
 }
 
+static void staticOnIMUSyncRequest(BLEDevice central, BLECharacteristic characteristic) {
+  BLEManager* instance = characteristicToInstanceMap[characteristic.uuid()];
+  if (instance) {
+      instance->onIMUSyncRequest(central, characteristic);
+  }
+}
+
 static void staticOnDateTimeCharWritten(BLEDevice central, BLECharacteristic characteristic) {
   BLEManager* instance = characteristicToInstanceMap[characteristic.uuid()];
   if (instance) {
@@ -71,6 +86,20 @@ static void staticOnActivityTypeCharWritten(BLEDevice central, BLECharacteristic
   }  
 }
 
+static void staticOnConfigRecordCharWritten(BLEDevice central, BLECharacteristic characteristic) {
+  BLEManager* instance = characteristicToInstanceMap[characteristic.uuid()];
+  if (instance) {
+      instance->onConfigRecordCharWritten(central, characteristic);
+  }  
+}
+
+static void staticOnFileNameConfigCharRead(BLEDevice central, BLECharacteristic characteristic) {
+  BLEManager* instance = characteristicToInstanceMap[characteristic.uuid()];
+  if (instance) {
+      instance->onFileNameConfigCharRead(central, characteristic);
+  }  
+}
+
 static void staticOnFileTxRequest(BLEDevice central, BLECharacteristic characteristic) {
   BLEManager* instance = characteristicToInstanceMap[characteristic.uuid()];
   if (instance) {
@@ -101,26 +130,32 @@ BLEManager::BLEManager(DataRecorder& dataRecorder): dataRecorder(dataRecorder),
       personNameConfigChar(personNameConfigCharUuid, BLEWrite, 25),
       activityTypeConfigChar(activityTypeConfigCharUuid, BLEWrite, 25),
       fileNameConfigChar(fileNameConfigCharUuid, BLERead, 80),
+      configRecordChar(configRecordCharUuid, BLEWrite, 80),
 
       // Initialize BLE IMU Transfer Service and Characteristics
       imuTxService(IMUServiceUuid),
       imuRequestChar(IMURequestCharUuid, BLEWrite, 10),
       imuDataChar(IMUDataCharUuid, BLERead | BLENotify, 100),
+      imuSyncChar(IMUSyncCharUuid, BLEWrite | BLEWriteWithoutResponse | BLENotify, syncReplySize, true),
 
       // Initialize BLE File Transfer Service and Characteristics
       fileTxService(fileTxServiceUuid),
       fileTxRequestChar(fileTxRequestCharUuid, BLEWrite | BLERead, 20),
       fileTxCompleteChar(fileTxCompleteCharUuid, BLENotify, 30),
       fileTxDataChar(fileTxDataCharUuid, BLERead | BLENotify, fileTxBufferSize, false),
-      fileNameTxChar(fileNameTxCharUuid, BLERead, 60) {
+      fileNameTxChar(fileNameTxCharUuid, BLERead, 60),
+      fileSizeTxChar(fileSizeTxCharUuid, BLERead) {
 
   // Needs to be defined in the body due to needing value of fileTxBufferSize
  
   // Map characteristics that will be used for event handlers
   characteristicToInstanceMap[imuRequestChar.uuid()] = this;
+  characteristicToInstanceMap[imuSyncChar.uuid()] = this;
   characteristicToInstanceMap[dateTimeConfigChar.uuid()] = this;
   characteristicToInstanceMap[personNameConfigChar.uuid()] = this;
   characteristicToInstanceMap[activityTypeConfigChar.uuid()] = this;
+  characteristicToInstanceMap[configRecordChar.uuid()] = this;
+  characteristicToInstanceMap[fileNameConfigChar.uuid()] = this;
   characteristicToInstanceMap[fileTxRequestChar.uuid()] = this;
   // Keep these open for onConnect and onDisconnect;
   // characteristicToInstanceMap[&imuRequestChar] = this;
@@ -131,20 +166,26 @@ BLEManager::BLEManager(DataRecorder& dataRecorder): dataRecorder(dataRecorder),
   configInfoService.addCharacteristic(personNameConfigChar);
   configInfoService.addCharacteristic(activityTypeConfigChar);
   configInfoService.addCharacteristic(fileNameConfigChar);
+  configInfoService.addCharacteristic(configRecordChar);
   dateTimeConfigChar.setEventHandler(BLEWritten, staticOnDateTimeCharWritten);
   personNameConfigChar.setEventHandler(BLEWritten, staticOnPersonNameCharWritten);
   activityTypeConfigChar.setEventHandler(BLEWritten, staticOnActivityTypeCharWritten);
+  configRecordChar.setEventHandler(BLEWritten, staticOnConfigRecordCharWritten);
+  fileNameConfigChar.setEventHandler(BLERead, staticOnFileNameConfigCharRead);
 
   // IMU Transfer Service
   imuTxService.addCharacteristic(imuRequestChar);
   imuTxService.addCharacteristic(imuDataChar);
+  imuTxService.addCharacteristic(imuSyncChar);
   imuRequestChar.setEventHandler(BLEWritten, staticOnIMURequest);
+  imuSyncChar.setEventHandler(BLEWritten, staticOnIMUSyncRequest);
 
   // File Transfer Service
   fileTxService.addCharacteristic(fileTxRequestChar);
   fileTxService.addCharacteristic(fileTxDataChar);
   fileTxService.addCharacteristic(fileTxCompleteChar);
   fileTxService.addCharacteristic(fileNameTxChar);
+  fileTxService.addCharacteristic(fileSizeTxChar);
   fileTxRequestChar.setEventHandler(BLEWritten, staticOnFileTxRequest);
 
   // Connection Handlers
@@ -166,6 +207,11 @@ void BLEManager::startBLE() {
   BLE.addService(configInfoService);
   BLE.addService(imuTxService);
   BLE.addService(fileTxService);
+  // Flags, one 128 bit service and these 8 bytes fill the 31 byte
+  // advertisement, the name goes in the scan response
+  const byte advData[8] = {0xFF, 0xFF, 'S', 'W', firmwareVersion[0], firmwareVersion[1],
+                           firmwareVersion[2], gattLayoutRevision};
+  BLE.setManufacturerData(advData, sizeof(advData));
   BLE.setAdvertisedService(configInfoService);
   // Set event handlers
   // BLE.setEventHandler(BLEConnected, staticOnConnect);
@@ -179,7 +225,7 @@ void BLEManager::startBLE() {
 // ------------------ Getters and Setters -------------------- //
 
 String BLEManager::updateFileName() {
-  dataFileName = (getDateTimeStr() + "-" + personName + "-" + activityType + ".csv");
+  dataFileName = (getDateTimeStr() + "-" + personName + "-" + activityType + dataRecorder.fileExtension());
   return dataFileName;
 }
 
@@ -277,6 +323,7 @@ void BLEManager::pairCentral() {
 void BLEManager::enterConfigMode(int timeout) {
   // Set Flag that we're accepting new config values
   fileConfigedFlag = false;
+  fileNameConfirmed = false;
   BLE.setAdvertisedService(configInfoService);
   BLE.advertise();
   enterPairingMode(timeout);
@@ -327,6 +374,45 @@ void BLEManager::onActivityTypeCharWritten(BLEDevice central, BLECharacteristic
   fileNameConfigChar.writeValue(fileName);
   // delay(1000);
   fileConfigedFlag = true;
+  configuredMillis = millis();
+}
+
+void BLEManager::onConfigRecordCharWritten(BLEDevice central, BLECharacteristic characteristic) {
+  // Handle event for central writing the packed "datetime|name|activity" record.
+  // Sets all three config values and the file name once instead of after every field
+  int length = characteristic.valueLength();
+  byte data[length];
+  characteristic.readValue(data, length);
+  String record = bytesToString(data, length);
+  int firstSep = record.indexOf('|');
+  int secondSep = record.indexOf('|', firstSep + 1);
+  if (firstSep < 0 || secondSep < 0) {
+    Serial.println("Invalid config record recieved: " + record);
+    return;
+  }
+  dateTimeStr = record.substring(0, firstSep);
+  dateTimeRefrenceMillis = millis();
+  personName = record.substring(firstSep + 1, secondSep);
+  activityType = record.substring(secondSep + 1);
+  Serial.println("New Config Record Recieved: " + record);
+  fileName = dateTimeStr + "-" + personName + "-" + activityType;
+  Serial.println("New File Name: " + fileName);
+  fileNameConfigChar.writeValue(fileName);
+  fileConfigedFlag = true;
+  configuredMillis = millis();
+}
+
+void BLEManager::onFileNameConfigCharRead(BLEDevice central, BLECharacteristic characteristic) {
+  // Central confirmed the resulting file name, config mode can be left
+  if (fileConfigedFlag) {
+    fileNameConfirmed = true;
+  }
+}
+
+bool BLEManager::configComplete() {
+  // Leave config mode once the central has read back the file name, or after a
+  // short wait for clients that don't read it
+  return fileConfigedFlag && (fileNameConfirmed || (millis() - configuredMillis) > configConfirmTimeout);
 }
 
 BLEDevice BLEManager::getCentral() {
@@ -368,6 +454,9 @@ void BLEManager::onIMUTxRequest(BLEDevice central, BLECharacteristic characteris
       imuTxActive = true;
       String dataFileName = updateFileName();
       dataRecorder.startDataRecording(dataFileName.c_str());
+      // Tell the client which SD file this live session goes to, so its
+      // clock sync can be matched to the file after offload (from 1.4.0)
+      fileNameConfigChar.writeValue(dataFileName);
     }
 
     else if (imuRequest.equals("END")) {
@@ -377,6 +466,19 @@ void BLEManager::onIMUTxRequest(BLEDevice central, BLECharacteristic characteris
     }
 }
 
+void BLEManager::onIMUSyncRequest(BLEDevice central, BLECharacteristic characteristic) {
+  // Answer a clock sync exchange as fast as possible: sample the clock first,
+  // then notify "seq | recording ms | recording flag" (little endian).
+  // Recording ms uses the same origin as the data timestamps (imuStartMillis)
+  unsigned long elapsedMillis = dataRecorder.getElapsedMillis();
+  byte reply[syncReplySize] = {0};
+  int length = min(characteristic.valueLength(), 4);
+  characteristic.readValue(reply, length);
+  memcpy(reply + 4, &elapsedMillis, 4);
+  reply[8] = dataRecorder.isRecording() ? 1 : 0;
+  imuSyncChar.writeValue(reply, syncReplySize);
+}
+
 bool BLEManager::imuRecordandTx() {
   // Function to read, record and transmit line of imu data to SD card and characteristic
   // Returns a true or false. This communicates a change in mode to the main program if
@@ -475,10 +577,24 @@ void BLEManager::onFileTxRequest(BLEDevice central, BLECharacteristic characteri
     fileDataTxActive = true;
   }
 
+  // The client already has this file (from an earlier, interrupted sync).
+  // Move on to the next one without sending it
+  else if (fileTxRequest.equals("SKIP")) {
+    Serial.println("Client already has file, skipping");
+    if (fileSetup) {
+      txFile.close();
+    }
+    fileSetup = false;
+    fileDataTxActive = false;
+    fileTxActive = false;
+    txFileListIndex++;
+  }
+
   else if (fileTxRequest.equals("MORE_FILES?")) {
     // If the index value is less than the length of file lists to transmit
     // If the list has been exhausted, exit transmit mode. Confirm file deletion
-    if (txFileListIndex < (whiteListFileNames.size() - 1)) {
+    // (txFileListIndex already points past the file just sent or skipped)
+    if (txFileListIndex < whiteListFileNames.size()) {
       Serial.println("Notifying Central of more files!");
       // Serial.print("Number of files: ");
       // Serial.println(whiteListFileNames.size());
@@ -554,6 +670,8 @@ bool BLEManager::txFileData() {
       }
 
       txFile.open(txFilePath.c_str(), O_READ | O_BINARY);
+      // Size first, it must be current by the time the client sees the name
+      fileSizeTxChar.writeValue(txFile.fileSize());
       fileNameTxChar.writeValue(txFileName);
       
       // Create a time counter for funsies
@@ -32,9 +32,12 @@ String bytesToString(byte* data, const int length);
 
 // Static BLE Callbacks
 static void staticOnIMUTxRequest(BLEDevice central, BLECharacteristic characteristic);
+static void staticOnIMUSyncRequest(BLEDevice central, BLECharacteristic characteristic);
 static void staticOnDateTimeCharWritten(BLEDevice central, BLECharacteristic characteristic);
 static void staticOnPersonNameCharWritten(BLEDevice central, BLECharacteristic characteristic);
 static void staticOnActivityTypeCharWritten(BLEDevice central, BLECharacteristic characteristic);
+static void staticOnConfigRecordCharWritten(BLEDevice central, BLECharacteristic characteristic);
+static void staticOnFileNameConfigCharRead(BLEDevice central, BLECharacteristic characteristic);
 static void staticOnFileTxRequest(BLEDevice central, BLECharacteristic characteristic);
 static void staticOnConnect(BLEDevice central);
 static void staticOnDisconnect(BLEDevice central);
@@ -50,11 +53,16 @@ class BLEManager {
     const char* personNameConfigCharUuid = "550e8401-e29b-41d4-a716-446655440002";
     const char* activityTypeConfigCharUuid = "550e8401-e29b-41d4-a716-446655440003";
     const char* fileNameConfigCharUuid = "550e8401-e29b-41d4-a716-446655440004";
+    // Packed "datetime|name|activity" record, sets all three in one write
+    const char* configRecordCharUuid = "550e8401-e29b-41d4-a716-446655440005";
 
     // IMU Data Stream Service and Characteristics
     const char* IMUServiceUuid = "550e8402-e29b-41d4-a716-446655440000";
     const char* IMURequestCharUuid = "550e8403-e29b-41d4-a716-446655440001";
     const char* IMUDataCharUuid = "550e8403-e29b-41d4-a716-446655440002";
+    // Clock sync: the client writes a sequence number, we notify it back with
+    // the recording clock so the client can measure offset and drift
+    const char* IMUSyncCharUuid = "550e8403-e29b-41d4-a716-446655440003";
 
     // File Tx Service and Characteristics
     const char* fileTxServiceUuid = "550e8404-e29b-41d4-a716-446655440000";
@@ -62,6 +70,8 @@ class BLEManager {
     const char* fileTxDataCharUuid = "550e8405-e29b-41d4-a716-446655440002";
     const char* fileTxCompleteCharUuid = "550e8405-e29b-41d4-a716-446655440003";
     const char* fileNameTxCharUuid = "550e8405-e29b-41d4-a716-446655440004";
+    // Size of the announced file, lets the client SKIP files it already has
+    const char* fileSizeTxCharUuid = "550e8405-e29b-41d4-a716-446655440005";
     // Init Characteristics and Services:
         // BLE Configuration Service and Characteristics
     BLEService configInfoService;
@@ -69,11 +79,13 @@ class BLEManager {
     BLEStringCharacteristic personNameConfigChar;
     BLEStringCharacteristic activityTypeConfigChar;
     BLEStringCharacteristic fileNameConfigChar;
+    BLEStringCharacteristic configRecordChar;
 
     // BLE IMU Data Transmission Service and Characteristics
     BLEService imuTxService;
     BLEStringCharacteristic imuRequestChar;
     BLECharacteristic imuDataChar;
+    BLECharacteristic imuSyncChar;
 
     // BLE File Transmission Service and Characteristics
     BLEService fileTxService;
@@ -81,6 +93,7 @@ class BLEManager {
     BLECharacteristic fileTxDataChar;
     BLEStringCharacteristic fileTxCompleteChar;
     BLEStringCharacteristic fileNameTxChar;
+    BLEUnsignedIntCharacteristic fileSizeTxChar;
         
     // Other functions
     void findFilestoTx();
@@ -104,6 +117,10 @@ class BLEManager {
     bool fileEndFlag;
     bool fileSetup = false;
     bool exitFileTxModeFlag = false;
+    bool fileNameConfirmed = false; // Central read back the file name after configuring
+    unsigned long configuredMillis;
+    // Time to wait for the central to read back the file name before leaving config mode
+    const unsigned long configConfirmTimeout = 2000;
 
     int txFileListIndex = 0;
     int txStartTime;
@@ -131,9 +148,12 @@ class BLEManager {
     void pairCentral();
     // BLE Callbacks;
     void onIMUTxRequest(BLEDevice central, BLECharacteristic characteristic);
+    void onIMUSyncRequest(BLEDevice central, BLECharacteristic characteristic);
     void onDateTimeCharWritten(BLEDevice central, BLECharacteristic characteristic);
     void onPersonNameCharWritten(BLEDevice central, BLECharacteristic characteristic);
     void onActivityTypeCharWritten(BLEDevice central, BLECharacteristic characteristic);
+    void onConfigRecordCharWritten(BLEDevice central, BLECharacteristic characteristic);
+    void onFileNameConfigCharRead(BLEDevice central, BLECharacteristic characteristic);
     void onFileTxRequest(BLEDevice central, BLECharacteristic characteristic);
     void onConnect(BLEDevice central);
     void onDisconnect(BLEDevice central);
@@ -143,6 +163,7 @@ class BLEManager {
     bool inPairingMode = false;    
     bool reachedTimeout = false;
     bool fileConfigedFlag = false;
+    bool configComplete();
     // Read Values from the onboard IMU
     // void updateDateTimeStr();
     void startBLE();
@@ -74,20 +74,35 @@ void DataRecorder::displayDirectory(const char* dirName, int numTabs) {
 // Function to read IMU Data
 char* DataRecorder::readIMU() {
   static char imuBuffer[40];
-
-  imuTime = (float)(millis() - imuStartMillis) / 1000;
-  float accelX = imuSensor.readFloatAccelX();
-  float accelY = imuSensor.readFloatAccelY();
-  float accelZ = imuSensor.readFloatAccelZ();
-  float gyroX = imuSensor.readFloatGyroX();
-  float gyroY = imuSensor.readFloatGyroY();
-  float gyroZ = imuSensor.readFloatGyroZ();
+  static BinaryRecord record;
+
+  unsigned long elapsedMillis = millis() - imuStartMillis;
+  imuTime = (float)elapsedMillis / 1000;
+  // Read raw counts once, the binary file stores them as they are
+  record.elapsedMillis = elapsedMillis;
+  record.accel[0] = imuSensor.readRawAccelX();
+  record.accel[1] = imuSensor.readRawAccelY();
+  record.accel[2] = imuSensor.readRawAccelZ();
+  record.gyro[0] = imuSensor.readRawGyroX();
+  record.gyro[1] = imuSensor.readRawGyroY();
+  record.gyro[2] = imuSensor.readRawGyroZ();
+  float accelX = imuSensor.calcAccel(record.accel[0]);
+  float accelY = imuSensor.calcAccel(record.accel[1]);
+  float accelZ = imuSensor.calcAccel(record.accel[2]);
+  float gyroX = imuSensor.calcGyro(record.gyro[0]);
+  float gyroY = imuSensor.calcGyro(record.gyro[1]);
+  float gyroZ = imuSensor.calcGyro(record.gyro[2]);
   numSamples++;
   // Format in a string that will follow a CSV format
   sprintf(imuBuffer, "%.3f, %.3f, %.3f, %.3f, %.2f, %.2f, %.2f", imuTime, accelX, accelY, accelZ, gyroX, gyroY, gyroZ);
   // Print data line to serial monitor
   if (recording) {
-    imuDataFile.println(imuBuffer);
+    if (binaryRecording) {
+      imuDataFile.write((const uint8_t*)&record, sizeof(record));
+    }
+    else {
+      imuDataFile.println(imuBuffer);
+    }
   }
   return imuBuffer;
 }
@@ -111,10 +126,33 @@ void DataRecorder::startDataRecording(const char* fileName) {
   Serial.println(filePath);
 
   imuStartMillis = millis();
+  if (binaryRecording) {
+    writeBinaryHeader(fileName);
+  }
   numSamples = 0;
   recording = true;
 }
 
+void DataRecorder::writeBinaryHeader(const char* fileName) {
+  // Written once at the start of a binary recording
+  BinaryFileHeader header;
+  memset(&header, 0, sizeof(header));
+  memcpy(header.magic, binaryFileMagic, sizeof(header.magic));
+  header.version = binaryFileVersion;
+  header.headerSize = sizeof(BinaryFileHeader);
+  header.recordSize = sizeof(BinaryRecord);
+  header.sampleRateHz = imuSensor.settings.accelSampleRate;
+  header.accelScale = imuSensor.calcAccel(1);
+  header.gyroScale = imuSensor.calcGyro(1);
+  header.startMillis = imuStartMillis;
+  strncpy(header.metadata, fileName, sizeof(header.metadata) - 1);
+  imuDataFile.write((const uint8_t*)&header, sizeof(header));
+}
+
+const char* DataRecorder::fileExtension() {
+  return binaryRecording ? ".bin" : ".csv";
+}
+
 void DataRecorder::stopDataRecording(const char* fileName) {
   if (imuDataFile.isOpen()) {
     // imuDataFile.sync();
@@ -150,6 +188,19 @@ void DataRecorder::stopDataRecording(const char* fileName) {
   recording = false;
 }
 
+unsigned long DataRecorder::getElapsedMillis() {
+  // Milliseconds since recording started, the time base of the data lines.
+  // Milliseconds since boot when we aren't recording
+  if (!recording) {
+    return millis();
+  }
+  return millis() - imuStartMillis;
+}
+
+bool DataRecorder::isRecording() {
+  return recording;
+}
+
 void DataRecorder::updateWhiteList(const char* fileName) {
   // This function updates the whitelist file that records files that haven't yet been transmitted
 
@@ -24,6 +24,30 @@ Contains:
 // Global Variables
 const unsigned long microsOverflowValue = 4294967295;
 
+// Binary recording layout (little endian, decoded by SwIMU_data.py on the client).
+// Records hold the raw sensor counts, the header has the scale factors to
+// convert them to g and dps. 16 bytes per sample instead of ~48 as text
+const char binaryFileMagic[9] = "SWIMUBIN";
+const uint16_t binaryFileVersion = 1;
+
+struct __attribute__((packed)) BinaryFileHeader {
+  char magic[8];            // "SWIMUBIN"
+  uint16_t version;
+  uint16_t headerSize;      // bytes before the first record
+  uint16_t recordSize;
+  uint16_t sampleRateHz;    // configured accelerometer output rate
+  float accelScale;         // g per count
+  float gyroScale;          // dps per count
+  uint32_t startMillis;     // millis() when recording started
+  char metadata[64];        // file name: "datetime-name-activity"
+};
+
+struct __attribute__((packed)) BinaryRecord {
+  uint32_t elapsedMillis;   // since startMillis, same time base as the text format
+  int16_t accel[3];
+  int16_t gyro[3];
+};
+
 // Functions
 
 // Classes
@@ -43,6 +67,7 @@ class DataRecorder {
 
     // char whiteListPath[25] = "accelDir/whitelist.txt";
     bool recording = false;
+    void writeBinaryHeader(const char* fileName);
     // SD Card file variables
     // int currentCount;
     File32 imuDataFile;                   // data file object to be used for writing during record mode
@@ -62,6 +87,10 @@ class DataRecorder {
     void initDevices(int chipSelect);
     char whiteListFilePath[100]; // Make sure this is large enough
     int getFileNameLength();
+    bool binaryRecording = false;  // Record compact binary .bin files instead of .csv text
+    const char* fileExtension();
+    unsigned long getElapsedMillis();  // Recording clock, same origin as the data timestamps
+    bool isRecording();
     void clearAccelDir();        // Delete all contents of the SD card
 
 };
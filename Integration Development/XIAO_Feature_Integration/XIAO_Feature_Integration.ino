@@ -70,6 +70,9 @@ const int RED_LED = 12;
 const int GREEN_LED = 13;
 const int BLUE_LED = 14;
 const int chipSelect = 4;  // Digital I/O pin needed for the SPI breakout
+// Record compact binary .bin files (raw sensor counts, ~3x smaller and much
+// faster to offload and decode) instead of .csv text
+const bool recordBinary = false;
 
 // Create instance of a DataRecorder class to encapsulate data reading and file recording
 DataRecorder dataRecorder = DataRecorder();
@@ -284,6 +287,7 @@ void setup() {
 
   delay(1000);
   dataRecorder.initDevices(chipSelect);
+  dataRecorder.binaryRecording = recordBinary;
   bleManager.startBLE();
   delay(1000);
   dataRecorder.displayDirectory("accelDir");
@@ -307,7 +311,7 @@ void loop() {
 
     else {
       bleManager.poll();
-      if (bleManager.fileConfigedFlag) {
+      if (bleManager.configComplete()) {
         bleManager.exitConfigMode();
         returnToStandbyMode();
       }